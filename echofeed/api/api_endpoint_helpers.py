@@ -1,14 +1,23 @@
 """File containing helper functions for the endpoints of the API service."""
-from typing import List
+import itertools
+import json
+from typing import List, Optional
 
 from echofeed.common import config_info, api_request_classes as api_req_cls
-from echofeed.common.config_info import Entity
+from echofeed.common.config_info import Entity, KeywordModes
+from echofeed.common.config_info import QueryModes, SearchModes
 from echofeed.common.config_info import ElasticsearchIndexes as esIndexes
 from echofeed.common import es_interactions_helpers as es_helpers
 from echofeed.api import api_google_search as api_search, api_gpt_interactions as api_gpt
+from echofeed.api import api_keyword_clustering, api_keyword_extraction
+from echofeed.api import api_keyword_trie, api_query_builder as api_query
+from echofeed.api import api_session_tokens, api_view_buffer
 from echofeed.common import api_classes as api_cls
+from echofeed.common.keyword_normalization import clean_keyword
+from echofeed.common.keyword_normalization import deduplicate_keywords
+from echofeed.common.keyword_normalization import fold_keyword, keyword_key
 
-logger = config_info.get_logger()
+logger = config_info.get_logger(__name__)
 
 
 def create_article(request: api_req_cls.CreateArticleRequest) -> dict:
@@ -37,7 +46,10 @@ def create_article(request: api_req_cls.CreateArticleRequest) -> dict:
         entity_type=Entity.ARTICLE,
         entity_info=request.article_info.model_dump()
     )
-    logger.info(f"Created article: {response}")
+    if response["result"]:
+        api_keyword_trie.KEYWORD_TRIE.add_many(request.article_info.keywords)
+        add_article_to_keyword_corpora(request.article_info.model_dump())
+    logger.info("Created article: %s", response)
     return response
 
 
@@ -72,7 +84,9 @@ def create_user(request: api_req_cls.CreateUserRequest) -> dict:
         entity_type=Entity.USER,
         entity_info=request.user_info.model_dump()
     )
-    logger.info(f"Created user: {response}")
+    if response["result"]:
+        api_keyword_trie.KEYWORD_TRIE.add_many(request.user_info.interests)
+    logger.info("Created user: %s", response)
     return response
 
 
@@ -100,7 +114,9 @@ def update_article(request: api_req_cls.UpdateArticleRequest) -> dict:
         entity_id=request.article_id,
         entity_info=request.article_info.model_dump()
     )
-    logger.info(f"Updated article: {response}")
+    if response["result"]:
+        api_keyword_trie.KEYWORD_TRIE.add_many(request.article_info.keywords)
+    logger.info("Updated article: %s", response)
     return response
 
 
@@ -120,19 +136,26 @@ def update_user(request: api_req_cls.UpdateUserRequest) -> dict:
                 viewed_articles(List[str]): The viewed articles of the user.
                 liked_articles(List[str]): The liked articles of the user.
                 is_admin(bool): The admin status of the user.
+            if_seq_no(int): The sequence number the user was read at.
+            if_primary_term(int): The primary term the user was read at.
 
     Returns:
         message(str): a message that contains information about
                       the operation.
-        code(int): the result code of the operation.
+        code(int): the result code of the operation, 409 if the user
+                   was modified since it was read.
         result(bool): the result of the operation.
+        seq_no(int): the sequence number of the updated user.
+        primary_term(int): the primary term of the updated user.
     """
     response = es_helpers.update_entity(
         entity_type=Entity.USER,
         entity_id=request.user_id,
-        entity_info=request.user_info.model_dump()
+        entity_info=request.user_info.model_dump(),
+        if_seq_no=request.if_seq_no,
+        if_primary_term=request.if_primary_term
     )
-    logger.info(f"Updated user: {response}")
+    logger.info("Updated user: %s", response)
     return response
 
 
@@ -153,7 +176,7 @@ def delete_user(user_id: str) -> dict:
         entity_type=Entity.USER,
         entity_id=user_id
     )
-    logger.info(f"Deleted user: {response}")
+    logger.info("Deleted user: %s", response)
     return response
 
 
@@ -174,7 +197,7 @@ def delete_article(article_id: str) -> dict:
         entity_type=Entity.ARTICLE,
         entity_id=article_id
     )
-    logger.info(f"Deleted article: {response}")
+    logger.info("Deleted article: %s", response)
     return response
 
 
@@ -197,7 +220,7 @@ def get_article(article_id: str) -> dict:
         entity_type=Entity.ARTICLE,
         entity_id=article_id
     )
-    logger.info(f"Retrieved article: {response}")
+    logger.debug("Retrieved article: %s", response)
     return response
 
 
@@ -228,23 +251,22 @@ def get_user(user_id: str) -> dict:
             "user_info": None
         }
 
-    logger.info(f"Retrieved user: {response}")
-    logger.info(
-        f"Hashed password: {response.get('user_info', {}).get('password', 'N/A')}")
-    return response
+    # views still waiting in the write-behind buffer
+    viewed_articles = response["user_info"].setdefault("viewed_articles", [])
+    viewed_articles.extend(
+        article_id for article_id
+        in api_view_buffer.VIEW_BUFFER.pending_views(user_id)
+        if article_id not in viewed_articles)
 
-
-GET_ENTITY_BY_TYPE = {
-    Entity.ARTICLE: get_article,
-    Entity.USER: get_user
-}
+    logger.debug("Retrieved user %s", user_id)
+    return response
 
 
 def get_all_entities_from_list(entity_type: str, entity_ids: List[str])\
         -> dict:
     """
     Retrieves all Entity of a certain type from the database
-    based on their ids.
+    based on their ids, in a single request.
 
     Args:
         entity_type (str): The type of the Entity to be retrieved.
@@ -258,18 +280,9 @@ def get_all_entities_from_list(entity_type: str, entity_ids: List[str])\
         Entity_info(dict): the information of the Entity, if the operation
                              was successful.
     """
-    response = {
-        "message": f"Successfully retrieved information about"
-                   f" requested {esIndexes.INDEXES[entity_type]}",
-        "code": 200,
-        "result": True,
-        f"{esIndexes.INDEXES[entity_type]}_info": {}
-    }
-    for entity_id in entity_ids:
-        response[f"{esIndexes.INDEXES[entity_type]}_info"][entity_id] = (
-            GET_ENTITY_BY_TYPE[entity_type](entity_id)[f"{entity_type}_info"]
-        )
-    logger.info(f"Returned response: {response}")
+    response = es_helpers.get_entities(entity_type, entity_ids)
+    logger.info("Retrieved %d %s from a list", len(entity_ids),
+                esIndexes.INDEXES[entity_type])
     return response
 
 
@@ -294,7 +307,6 @@ def get_all_users_from_list(request: api_req_cls.GetAllFromList) -> dict:
         entity_type=Entity.USER,
         entity_ids=user_ids_list
     )
-    logger.info(f"Retrieved users: {response}")
     return response
 
 
@@ -319,7 +331,6 @@ def get_all_articles_from_list(request: api_req_cls.GetAllFromList) -> dict:
         entity_type=Entity.ARTICLE,
         entity_ids=article_ids_list
     )
-    logger.info(f"Retrieved articles: {response}")
     return response
 
 
@@ -336,13 +347,18 @@ def get_all_users() -> dict:
                           was successful.
     """
     response = es_helpers.get_all_entities(entity_type=Entity.USER)
-    logger.info(f"Retrieved users: {response}")
     return response
 
 
-def get_all_articles() -> dict:
+def get_all_articles(date_from: Optional[str] = None,
+                     date_to: Optional[str] = None) -> dict:
     """
-    Retrieves all articles from the database.
+    Retrieves all articles from the database, optionally only the ones
+    published in a date range.
+
+    Args:
+        date_from (str): The earliest publication date (YYYY-MM-DD).
+        date_to (str): The latest publication date (YYYY-MM-DD).
 
     Returns:
         message(str): a message that contains information about
@@ -352,26 +368,55 @@ def get_all_articles() -> dict:
         articles_info(dict): the information of the articles, if the operation
                              was successful.
     """
-    response = es_helpers.get_all_entities(entity_type=Entity.ARTICLE)
-    logger.info(f"Retrieved articles: {response}")
+    response = es_helpers.get_all_entities(
+        entity_type=Entity.ARTICLE,
+        query=es_helpers.build_date_range_query("date", date_from, date_to)
+    )
+    return response
+
+
+def rehash_user_password(username: str, password: str) -> dict:
+    """
+    Replaces the stored password hash of a user with one generated at
+    the configured bcrypt work factor.
+
+    Args:
+        username (str): The username of the user.
+        password (str): The plain password the user logged in with.
+
+    Returns:
+        message(str): a message that contains information about
+                      the operation.
+        code(int): the result code of the operation.
+        result(bool): the result of the operation.
+    """
+    response = es_helpers.update_entity(
+        entity_type=Entity.USER,
+        entity_id=username,
+        entity_info={"password": config_info.hash_password(password)}
+    )
+    logger.info("Upgraded password hash of user %s: %s", username,
+                response["result"])
     return response
 
 
 def login(username: str, password: str) -> dict:
     try:
-        print(f"Received password before hashing: {password}")  # for logging
         response = get_user(username)
         user = response.get('user_info', None)
 
         if user:
             stored_password = user['password']
-            print(f"Stored password: {stored_password}")  # for logging
             if config_info.check_password(password, stored_password):
+                if config_info.password_needs_rehash(stored_password):
+                    rehash_user_password(username, password)
                 return {
                     "user_info": user,
                     "message": "Login successful",
                     "code": 200,
-                    "result": True
+                    "result": True,
+                    **api_session_tokens.create_session_tokens(
+                        username, user.get("is_admin", False))
                 }
             else:
                 return {
@@ -393,19 +438,341 @@ def login(username: str, password: str) -> dict:
         }
 
 
+def refresh_session(refresh_token: str) -> dict:
+    """
+    Exchanges a refresh token for a new pair of session tokens.
+    The user is read again, so deleted users can not refresh and
+    admin status changes are picked up.
+
+    Args:
+        refresh_token (str): The refresh token received at login.
+
+    Returns:
+        message(str): a message that contains information about
+                      the operation.
+        code(int): the result code of the operation.
+        result(bool): the result of the operation.
+        access_token(str): the new access token.
+        refresh_token(str): the new refresh token.
+        token_type(str): the authorization scheme of the tokens.
+        expires_in(int): the lifetime of the access token in seconds.
+    """
+    try:
+        claims = api_session_tokens.verify_token(
+            refresh_token, api_session_tokens.REFRESH_TOKEN)
+    except api_session_tokens.InvalidSessionToken as exception:
+        return {
+            "message": f"Invalid refresh token: {exception}",
+            "code": 401,
+            "result": False
+        }
+
+    user = get_user(claims["sub"]).get("user_info")
+    if not user:
+        return {
+            "message": "User doesn't exist anymore",
+            "code": 401,
+            "result": False
+        }
+    return {
+        "message": "Session refreshed",
+        "code": 200,
+        "result": True,
+        **api_session_tokens.create_session_tokens(
+            claims["sub"], user.get("is_admin", False))
+    }
+
+
+def autocomplete_keywords(prefix: str, limit: int) -> dict:
+    """
+    Suggests the most frequent known keywords starting with a prefix.
+    The suggestions are read from the in-memory keyword trie, so the
+    database is not queried.
+
+    Args:
+        prefix (str): The text typed by the user.
+        limit (int): The maximum number of suggestions.
+
+    Returns:
+        message(str): a message that contains information about
+                      the operation.
+        code(int): the result code of the operation.
+        result(bool): the result of the operation.
+        suggestions(List[dict]): the keywords and their frequency.
+    """
+    suggestions = api_keyword_trie.KEYWORD_TRIE.suggest(prefix, limit)
+    return {
+        "message": f"Found {len(suggestions)} suggestions",
+        "code": 200,
+        "result": True,
+        "suggestions": [{"keyword": keyword, "count": count}
+                        for keyword, count in suggestions]
+    }
+
+
+LOCAL_SEARCH_FIELDS = {
+    "Romanian": ["title.ro^3", "keywords.text^2", "content.ro",
+                 "title", "content"],
+    "English": ["title^3", "keywords.text^2", "content",
+                "title.ro", "content.ro"]
+}
+
+LOCAL_SEARCH_SORT = [
+    "_score",
+    {"date": {"order": "desc", "missing": "_last"}},
+    {"url": {"order": "asc"}}
+]
+
+LOCAL_SEARCH_HIGHLIGHT = {
+    "fields": {"title": {}, "content": {}},
+    "fragment_size": 150,
+    "number_of_fragments": 1
+}
+
+
+def build_keyword_tiers_query(
+        important_keywords: List[str], relevant_keywords: List[str],
+        irrelevant_keywords: List[str], language: str, min_keywords: int,
+        date: Optional[str] = None, date_to: Optional[str] = None) -> dict:
+    """
+    Builds the bool query used to search the stored articles.
+    Important keywords must match, relevant keywords should match and
+    irrelevant keywords must not match. min_keywords is the minimum
+    number of matching keywords, so the relevant keywords that must
+    match are the ones left after the important keywords.
+    """
+    fields = LOCAL_SEARCH_FIELDS.get(language, LOCAL_SEARCH_FIELDS["English"])
+
+    def keyword_clause(keyword: str) -> dict:
+        return {
+            "multi_match": {
+                "query": keyword,
+                "fields": fields,
+                "type": "best_fields",
+                "operator": "and"
+            }
+        }
+
+    bool_query = {
+        "must": [keyword_clause(keyword) for keyword in important_keywords],
+        "should": [keyword_clause(keyword) for keyword in relevant_keywords],
+        "must_not": [keyword_clause(keyword)
+                     for keyword in irrelevant_keywords],
+        "filter": []
+    }
+    if relevant_keywords:
+        minimum_should_match = max(int(min_keywords or 0)
+                                   - len(important_keywords),
+                                   0 if important_keywords else 1)
+        bool_query["minimum_should_match"] = min(minimum_should_match,
+                                                 len(relevant_keywords))
+    date_range_query = es_helpers.build_date_range_query("date", date,
+                                                         date_to)
+    if date_range_query:
+        bool_query["filter"].append(date_range_query)
+    return {"bool": bool_query}
+
+
+def handle_local_article_search(
+        important_keywords: List[str], relevant_keywords: List[str],
+        irrelevant_keywords: List[str], language: str, min_keywords: int,
+        num_articles: int, date: Optional[str] = None,
+        date_to: Optional[str] = None,
+        search_after: Optional[list] = None) -> dict:
+    """
+    Searches the stored articles with BM25 over title, content and
+    keywords, without calling any external service.
+
+    Returns:
+        message(str): a message that contains information about
+                      the operation.
+        code(int): the result code of the operation.
+        result(bool): the result of the operation.
+        articles(List[dict]): the articles, with their score and
+                              highlighted fragments.
+        search_after(list): the cursor of the next page, None if this
+                            is the last page.
+    """
+    query = build_keyword_tiers_query(
+        important_keywords, relevant_keywords, irrelevant_keywords,
+        language, min_keywords, date, date_to
+    )
+    search_response = es_helpers.search_entities(
+        entity_type=Entity.ARTICLE,
+        query=query,
+        size=num_articles,
+        sort=LOCAL_SEARCH_SORT,
+        search_after=search_after,
+        highlight=LOCAL_SEARCH_HIGHLIGHT,
+        source=["title", "content", "url", "date", "keywords"]
+    )
+    return {
+        "message": search_response["message"],
+        "code": search_response["code"],
+        "result": search_response["result"],
+        "articles": search_response[
+            f"{esIndexes.INDEXES[Entity.ARTICLE]}_info"],
+        "search_after": search_response["search_after"]
+    }
+
+
+def search_external_articles(
+        important_keywords: List[str], relevant_keywords: List[str],
+        irrelevant_keywords: List[str], langauge: str, min_keywords: int,
+        num_articles: int, date: str, date_to: Optional[str] = None,
+        query_mode: str = QueryModes.TEMPLATE) -> List[api_cls.Article]:
+    """
+    Searches articles through Google Search API, with a query built
+    from the keyword tiers, or composed by OpenAI in the llm query mode
+    (falling back to the built query when OpenAI fails).
+    Results whose publication date is known and falls outside
+    [date, date_to] are dropped.
+    """
+    query = ""
+    if query_mode == QueryModes.LLM:
+        query = api_gpt.extract_queries(important_keywords, relevant_keywords, irrelevant_keywords, langauge, min_keywords)
+    if query:
+        query = " ".join([query, *api_query.build_date_operators(date, date_to)])
+    else:
+        query = api_query.build_search_query(
+            important_keywords, relevant_keywords, irrelevant_keywords,
+            min_keywords, date, date_to
+        )
+
+    keywords = important_keywords + relevant_keywords
+    articles = api_search.create_articles_from_search(
+        query, keywords, num_articles,
+        api_query.get_language_restrict(langauge)
+    )
+    return api_search.filter_articles_by_date(articles, date, date_to)
+
+
+def search_local_articles(
+        important_keywords: List[str], relevant_keywords: List[str],
+        irrelevant_keywords: List[str], langauge: str, min_keywords: int,
+        num_articles: int, date: str, date_to: Optional[str] = None) \
+        -> List[api_cls.Article]:
+    """
+    Searches the stored articles and keeps the good hits, the ones
+    scoring at least HYBRID_SEARCH_MIN_RELATIVE_SCORE of the best hit.
+    """
+    response = handle_local_article_search(
+        important_keywords, relevant_keywords, irrelevant_keywords,
+        langauge, min_keywords, num_articles, date, date_to
+    )
+    hits = response["articles"]
+    if not hits:
+        return []
+    min_score = ((hits[0].get("score") or 0)
+                 * config_info.HYBRID_SEARCH_MIN_RELATIVE_SCORE)
+    return [api_cls.Article(**hit) for hit in hits
+            if (hit.get("score") or 0) >= min_score]
+
+
+def get_article_key(article: api_cls.Article) -> str:
+    """
+    Returns the key used to recognize the same article coming from
+    different sources: its url without scheme, www, query and trailing
+    slash, or its title when the url is missing.
+    """
+    url = article.url.strip().lower()
+    if not url:
+        return article.title.strip().casefold()
+    url = url.split("://", 1)[-1].split("#", 1)[0].split("?", 1)[0]
+    if url.startswith("www."):
+        url = url[len("www."):]
+    return url.rstrip("/")
+
+
+def rank_articles(articles: List[api_cls.Article],
+                  important_keywords: List[str],
+                  relevant_keywords: List[str],
+                  irrelevant_keywords: List[str]) -> List[api_cls.Article]:
+    """
+    Ranks articles from all sources on the same scale: important
+    keywords found in the title or content count twice, relevant ones
+    once and irrelevant ones subtract one. Ties are broken by the
+    publication date, newest first, and then by the original order.
+    """
+    important_keywords = [fold_keyword(keyword)
+                          for keyword in important_keywords]
+    relevant_keywords = [fold_keyword(keyword)
+                         for keyword in relevant_keywords]
+    irrelevant_keywords = [fold_keyword(keyword)
+                           for keyword in irrelevant_keywords]
+
+    def keyword_score(article: api_cls.Article) -> int:
+        text = fold_keyword(f"{article.title} {article.content}")
+        return (2 * sum(keyword in text for keyword in important_keywords)
+                + sum(keyword in text for keyword in relevant_keywords)
+                - sum(keyword in text for keyword in irrelevant_keywords))
+
+    scores = {id(article): keyword_score(article) for article in articles}
+    ranked = sorted(articles, key=lambda article: article.date or "",
+                    reverse=True)
+    ranked.sort(key=lambda article: scores[id(article)], reverse=True)
+    return ranked
+
+
+def merge_articles(*article_lists: List[api_cls.Article]) \
+        -> List[api_cls.Article]:
+    """
+    Concatenates article lists, keeping only the first occurrence of
+    every article.
+    """
+    seen_keys = set()
+    merged = []
+    for articles in article_lists:
+        for article in articles:
+            key = get_article_key(article)
+            if key not in seen_keys:
+                seen_keys.add(key)
+                merged.append(article)
+    return merged
+
+
 def handle_article_search(
         important_keywords: List[str], relevant_keywords: List[str],
         irrelevant_keywords: List[str], langauge: str, min_keywords: int,
-        num_articles: int, date: str):
+        num_articles: int, date: str, date_to: Optional[str] = None,
+        mode: str = SearchModes.HYBRID,
+        query_mode: str = QueryModes.TEMPLATE):
     """
     Handles the search for articles based on the given keywords.
-    """
-    query = api_gpt.extract_queries(important_keywords, relevant_keywords, irrelevant_keywords, langauge, min_keywords)
 
-    keywords = important_keywords + relevant_keywords
-    query = f"{query} after:{date}"
+    In hybrid mode the stored articles are searched first and OpenAI
+    and Google are only called for the articles still missing, then
+    both result sets are merged, deduplicated and ranked together.
+    The local mode never calls external services and the external mode
+    always does. query_mode tells how the Google query is built.
+    """
+    important_keywords = deduplicate_keywords(important_keywords)
+    relevant_keywords = deduplicate_keywords(relevant_keywords)
+    irrelevant_keywords = deduplicate_keywords(irrelevant_keywords)
+
+    local_articles = []
+    if mode in (SearchModes.LOCAL, SearchModes.HYBRID):
+        local_articles = search_local_articles(
+            important_keywords, relevant_keywords, irrelevant_keywords,
+            langauge, min_keywords, num_articles, date, date_to
+        )
+
+    external_articles = []
+    missing_articles = num_articles - len(local_articles)
+    if mode != SearchModes.LOCAL and missing_articles > 0:
+        external_articles = search_external_articles(
+            important_keywords, relevant_keywords, irrelevant_keywords,
+            langauge, min_keywords, missing_articles, date, date_to,
+            query_mode
+        )
+
+    articles = rank_articles(
+        merge_articles(local_articles, external_articles),
+        important_keywords, relevant_keywords, irrelevant_keywords
+    )[:num_articles]
+    logger.info("Article search (%s): %d local and %d external results",
+                mode, len(local_articles), len(external_articles))
 
-    articles = api_search.create_articles_from_search(query, keywords, num_articles)
     articles_dict = [article.dict() for article in articles]
     response = {
         "message": "Successfully created articles from search",
@@ -416,13 +783,25 @@ def handle_article_search(
     return response
 
 
-def handle_recommandation_search(keywords: List[str], language: str, date:str):
+def handle_recommandation_search(keywords: List[str], language: str, date:str,
+                                 query_mode: str = QueryModes.TEMPLATE):
     """
     Handles the recommandation of articles based on the given keywords.
-    """
-    query = api_gpt.extract_recommandation_queries(keywords, language)
-    query = f"{query} after:{date}"
-    articles = api_search.create_articles_from_search(query, keywords)
+    The Google query is built from the keywords, or composed by OpenAI
+    in the llm query mode.
+    """
+    keywords = deduplicate_keywords(keywords)
+    query = ""
+    if query_mode == QueryModes.LLM:
+        query = api_gpt.extract_recommandation_queries(keywords, language)
+    if query:
+        query = f"{query} after:{date}"
+    else:
+        query = api_query.build_recommendation_query(keywords, date)
+    articles = api_search.create_articles_from_search(
+        query, keywords,
+        language_restrict=api_query.get_language_restrict(language)
+    )
     articles_dict = [article.dict() for article in articles]
     response = {
         "message": "Successfully created articles from search",
@@ -433,11 +812,23 @@ def handle_recommandation_search(keywords: List[str], language: str, date:str):
     return response
 
 
-def handle_keywords_generation(user_input: str, language: str):
+def handle_keywords_generation(user_input: str, language: str,
+                               mode: str = KeywordModes.LOCAL):
     """
     Handles the generation of keywords based on the user input.
-    """
-    keywords = api_gpt.generate_keywords(user_input, language)
+
+    The local mode extracts the keywords statistically, without calling
+    OpenAI, and keeps the words of the input. The llm mode asks GPT for
+    them, and the hybrid mode asks GPT to refine the local keywords,
+    falling back to them when GPT fails.
+    """
+    if mode == KeywordModes.LLM:
+        keywords = api_gpt.generate_keywords(user_input, language)
+    else:
+        keywords = api_keyword_extraction.extract_keywords(user_input)
+        if mode == KeywordModes.HYBRID and keywords:
+            keywords = api_gpt.refine_keywords(user_input, keywords, language)
+    keywords = deduplicate_keywords(keywords)
     response = {
         "message": "Successfully generated keywords",
         "code": 200,
@@ -447,11 +838,104 @@ def handle_keywords_generation(user_input: str, language: str):
     return response
 
 
-def handle_keywords_categorization(keywords: list):
+def stream_keywords_generation(user_input: str, language: str,
+                               mode: str = KeywordModes.LOCAL):
     """
-    Handles the categorization of keywords.
+    Streaming variant of handle_keywords_generation: every keyword is
+    yielded as soon as it is known, without duplicates.
+
+    The llm mode streams the GPT keywords as they are generated. The
+    hybrid mode yields the local keywords first, then the keywords
+    added by GPT while refining them.
+
+    Yields:
+        str: The keywords, without variants of earlier ones.
+    """
+    if mode == KeywordModes.LLM:
+        keywords = api_gpt.stream_keywords(user_input, language)
+    else:
+        local_keywords = api_keyword_extraction.extract_keywords(user_input)
+        keywords = iter(local_keywords)
+        if mode == KeywordModes.HYBRID and local_keywords:
+            keywords = itertools.chain(
+                local_keywords,
+                api_gpt.stream_refined_keywords(user_input, local_keywords,
+                                                language))
+
+    sent_keys = set()
+    for keyword in keywords:
+        keyword = clean_keyword(keyword)
+        key = keyword_key(keyword)
+        if key and key not in sent_keys:
+            sent_keys.add(key)
+            yield keyword
+
+
+def format_sse_event(data: dict, event: Optional[str] = None) -> str:
+    """
+    Formats a server-sent event with a JSON payload.
+    """
+    lines = [f"event: {event}"] if event else []
+    lines.append(f"data: {json.dumps(data, ensure_ascii=False)}")
+    return "\n".join(lines) + "\n\n"
+
+
+def stream_keywords_events(user_input: str, language: str,
+                           mode: str = KeywordModes.LOCAL):
+    """
+    Yields the server-sent events of a keyword generation: one keyword
+    event for every keyword and a final done event with their count.
+    """
+    count = 0
+    for keyword in stream_keywords_generation(user_input, language, mode):
+        count += 1
+        yield format_sse_event({"keyword": keyword})
+    yield format_sse_event({"count": count}, event="done")
+
+
+def add_article_to_keyword_corpora(article: dict) -> None:
+    """
+    Adds an article to the statistics used by the local keyword
+    extraction and categorization.
+    """
+    text = api_keyword_extraction.get_article_text(article)
+    api_keyword_extraction.CORPUS_STATISTICS.add_document(text)
+    api_keyword_clustering.KEYWORD_CORPUS.add_document(text)
+
+
+def load_keyword_corpora() -> None:
+    """
+    Loads the stored articles into the statistics used by the local
+    keyword extraction and categorization.
+    """
+    response = es_helpers.get_all_entities(Entity.ARTICLE)
+    articles = response.get(f"{esIndexes.INDEXES[Entity.ARTICLE]}_info")
+    if not response["result"] or articles is None:
+        logger.error("Could not load the keyword corpora: %s",
+                     response["message"])
+        return
+    for article in articles:
+        add_article_to_keyword_corpora(article)
+    logger.info("Loaded %d articles into the keyword corpora", len(articles))
+
+
+def handle_keywords_categorization(keywords: list,
+                                   mode: str = KeywordModes.LOCAL):
     """
-    categories = api_gpt.categorize_keywords(keywords)
+    Handles the categorization of keywords.
+
+    The local mode groups the keywords by their co-occurrence in the
+    stored articles and names every group by its most central keyword.
+    The llm mode asks GPT for the categories, and the hybrid mode asks
+    GPT only to name the local groups.
+    """
+    keywords = deduplicate_keywords(keywords)
+    if mode == KeywordModes.LLM:
+        categories = api_gpt.categorize_keywords(keywords)
+    else:
+        categories = api_keyword_clustering.cluster_keywords(keywords)
+        if mode == KeywordModes.HYBRID and categories:
+            categories = api_gpt.label_categories(categories)
     response = {
         "message": "Successfully categorized keywords",
         "code": 200,
@@ -460,3 +944,40 @@ def handle_keywords_categorization(keywords: list):
     }
     return response
 
+
+def handle_batch_categorization(
+        keyword_sets: List[api_req_cls.KeywordSet]) -> dict:
+    """
+    Handles the categorization of many keyword sets, packed into as few
+    OpenAI requests as the token budget allows.
+
+    Returns:
+        message(str): a message that contains information about
+                      the operation.
+        code(int): the result code of the operation.
+        result(bool): the result of the operation.
+        categories(dict): the categories of every keyword set, by id.
+        failed(List[str]): the ids of the keyword sets that could not
+                           be categorized.
+    """
+    keywords_by_id = {
+        keyword_set.id: deduplicate_keywords(keyword_set.keywords)
+        for keyword_set in keyword_sets
+    }
+    categories = api_gpt.categorize_keyword_sets(
+        {item_id: keywords for item_id, keywords in keywords_by_id.items()
+         if keywords})
+    for item_id, keywords in keywords_by_id.items():
+        if not keywords:
+            categories[item_id] = {}
+    failed = [item_id for item_id in keywords_by_id
+              if item_id not in categories]
+    logger.info("Categorized %d keyword sets, %d failed", len(categories),
+                len(failed))
+    return {
+        "message": "Successfully categorized keyword sets",
+        "code": 200,
+        "result": not failed,
+        "categories": categories,
+        "failed": failed
+    }
@@ -1,28 +1,241 @@
 import datetime
-from typing import List
+import email.utils
+import functools
+import re
+import threading
+import time
+import zoneinfo
+from typing import List, Optional
 
 import requests
-from echofeed.common import config_info, api_classes as api_cls
+from echofeed.common import config_info, metrics, resilience, tracing, api_classes as api_cls
+from echofeed.common.keyword_normalization import fold_text
 
+# câmpurile din pagemap-ul CSE care pot conține data publicării,
+# în ordinea în care sunt preferate
+PUBLICATION_DATE_FIELDS = [
+    ("metatags", "article:published_time"),
+    ("metatags", "og:article:published_time"),
+    ("newsarticle", "datepublished"),
+    ("article", "datepublished"),
+    ("metatags", "datepublished"),
+    ("metatags", "pubdate"),
+    ("metatags", "publishdate"),
+    ("metatags", "dc.date"),
+    ("metatags", "date"),
+    ("metatags", "article:modified_time"),
+    ("metatags", "og:updated_time"),
+    ("newsarticle", "datemodified"),
+    ("article", "datemodified"),
+]
 
-def search_google(query, num_results=10):
+DATE_FORMATS = ["%Y%m%d", "%d.%m.%Y", "%d/%m/%Y", "%b %d, %Y", "%B %d, %Y",
+                "%d %b %Y", "%d %B %Y"]
+
+ISO_DATE_PATTERN = re.compile(r"^(\d{4})-(\d{2})-(\d{2})")
+SNIPPET_DATE_PATTERN = re.compile(r"^([A-Z][a-z]{2} \d{1,2}, \d{4}) \.\.\.")
+
+
+logger = config_info.get_logger(__name__)
+
+# cota zilnică a Custom Search API se resetează la miezul nopții, ora Pacificului
+QUOTA_TIMEZONE = zoneinfo.ZoneInfo("America/Los_Angeles")
+
+
+class DailyQuotaUsage:
+    """
+    Numără interogările trimise astăzi către Custom Search API.
+    """
+
+    def __init__(self, daily_quota: int):
+        self.daily_quota = daily_quota
+        self._lock = threading.Lock()
+        self._day = None
+        self._queries = 0
+
+    def record_query(self) -> None:
+        """
+        Adaugă o interogare la consumul zilei curente.
+        """
+        today = datetime.datetime.now(QUOTA_TIMEZONE).date()
+        with self._lock:
+            if self._day != today:
+                self._day = today
+                self._queries = 0
+            self._queries += 1
+
+    def get_used_ratio(self) -> float:
+        """
+        Returnează partea din cota zilnică folosită astăzi.
+        """
+        today = datetime.datetime.now(QUOTA_TIMEZONE).date()
+        with self._lock:
+            queries = self._queries if self._day == today else 0
+        return queries / self.daily_quota
+
+
+QUOTA_USAGE = DailyQuotaUsage(config_info.GOOGLE_DAILY_QUOTA)
+metrics.GOOGLE_CSE_QUOTA_USED.set_function(
+    lambda: {(): QUOTA_USAGE.get_used_ratio()})
+
+
+class GoogleSearchError(Exception):
+    """
+    Custom Search a răspuns cu o eroare temporară (429 sau 5xx).
+    """
+
+
+GOOGLE_SEARCH = resilience.register(resilience.Dependency(
+    "google",
+    timeout_seconds=config_info.GOOGLE_TIMEOUT_SECONDS,
+    deadline_seconds=config_info.GOOGLE_DEADLINE_SECONDS,
+    max_attempts=config_info.GOOGLE_MAX_ATTEMPTS,
+    hedging=resilience.hedging_policy("google", config_info.GOOGLE_HEDGING)
+))
+# ultimele rezultate ale fiecărui query, servite cât timp Custom Search
+# nu răspunde
+GOOGLE_RESULTS_CACHE = resilience.FallbackCache(
+    "google_results", config_info.GOOGLE_FALLBACK_CACHE_SIZE)
+
+
+def request_search_results(params: dict, timeout: float) -> dict:
+    """
+    Trimite o singură cerere către Custom Search, cu timpul de așteptare
+    dat în secunde.
+    """
+    QUOTA_USAGE.record_query()
+    start_time = time.perf_counter()
+    try:
+        with tracing.span("google.search", num=params["num"],
+                          lr=params.get("lr")) as span:
+            response = requests.get(
+                config_info.GOOGLE_SEARCH_URL,
+                params=params,
+                timeout=timeout
+            )
+            if span is not None:
+                span.set_attribute("status", response.status_code)
+    except requests.RequestException:
+        metrics.GOOGLE_CSE_REQUESTS.inc("error")
+        raise
+    finally:
+        metrics.GOOGLE_CSE_DURATION.observe(time.perf_counter() - start_time)
+    metrics.GOOGLE_CSE_REQUESTS.inc(str(response.status_code))
+    logger.debug("Google CSE a răspuns cu %s", response.status_code)
+    if response.status_code == 429 or response.status_code >= 500:
+        raise GoogleSearchError(
+            f"Google CSE a răspuns cu {response.status_code}")
+    return response.json()
+
+
+def search_google(query, num_results=10, language_restrict=None):
     """
     Caută pe Google după un query dat și returnează numărul de rezultate specificat.
+    language_restrict (de ex. lang_ro) restrânge rezultatele la o limbă.
+    Cererile eșuate sunt reîncercate; dacă Custom Search nu răspunde,
+    sunt returnate ultimele rezultate ale aceluiași query sau niciun
+    rezultat.
     """
-    response = requests.get(
-        config_info.GOOGLE_SEARCH_URL,
-        params={
-            "key": config_info.GOOGLE_API_KEY,
-            "cx": config_info.GOOGLE_ENGINE_ID,
-            "q": query,
-            "num": num_results
-        }
-    )
-    print(response.status_code)
-    results = response.json()
+    params = {
+        "key": config_info.GOOGLE_API_KEY,
+        "cx": config_info.GOOGLE_ENGINE_ID,
+        "q": query,
+        "num": num_results
+    }
+    if language_restrict:
+        params["lr"] = language_restrict
+    # variantele unui query care diferă doar prin majuscule, diacritice
+    # sau spații au aceleași rezultate
+    cache_key = (fold_text(query), num_results, language_restrict)
+
+    def fallback(exception):
+        return GOOGLE_RESULTS_CACHE.get(cache_key) or {"items": []}
+
+    results = GOOGLE_SEARCH.call(
+        functools.partial(request_search_results, params),
+        fallback=fallback)
+    if results.get("items"):
+        GOOGLE_RESULTS_CACHE.put(cache_key, results)
     return results
 
 
+def parse_publication_date(value) -> Optional[datetime.date]:
+    """
+    Transformă valoarea unui metatag într-o dată. Sunt acceptate datele
+    ISO 8601 (cu sau fără oră și fus orar), datele RFC 2822 și câteva
+    formate uzuale. Datele din viitor sau dinainte de 1990 sunt ignorate.
+    """
+    if not isinstance(value, str) or not value.strip():
+        return None
+    value = value.strip()
+
+    parsed = None
+    match = ISO_DATE_PATTERN.match(value)
+    if match:
+        try:
+            parsed = datetime.date(*(int(part) for part in match.groups()))
+        except ValueError:
+            return None
+    else:
+        for date_format in DATE_FORMATS:
+            try:
+                parsed = datetime.datetime.strptime(value, date_format).date()
+                break
+            except ValueError:
+                continue
+        if parsed is None:
+            try:
+                parsed = email.utils.parsedate_to_datetime(value).date()
+            except (TypeError, ValueError, IndexError):
+                return None
+
+    today = datetime.date.today()
+    if parsed.year < 1990 or parsed > today + datetime.timedelta(days=1):
+        return None
+    return parsed
+
+
+def extract_publication_date(item: dict) -> Optional[str]:
+    """
+    Extrage data publicării unui rezultat Google din metatag-urile și
+    datele structurate din pagemap, iar în lipsa lor din începutul
+    fragmentului ("Jun 5, 2024 ..."). Returnează data în format ISO
+    (YYYY-MM-DD) sau None dacă nu a putut fi determinată.
+    """
+    pagemap = item.get('pagemap', {})
+    for section, field in PUBLICATION_DATE_FIELDS:
+        for entry in pagemap.get(section, []):
+            parsed = parse_publication_date(entry.get(field))
+            if parsed is not None:
+                return parsed.isoformat()
+
+    match = SNIPPET_DATE_PATTERN.match(item.get('snippet', ''))
+    if match:
+        parsed = parse_publication_date(match.group(1))
+        if parsed is not None:
+            return parsed.isoformat()
+    return None
+
+
+def filter_articles_by_date(articles: List[api_cls.Article],
+                            date_from: Optional[str] = None,
+                            date_to: Optional[str] = None) \
+        -> List[api_cls.Article]:
+    """
+    Păstrează articolele publicate în intervalul dat. Articolele fără dată
+    cunoscută sunt păstrate, deoarece Google le-a filtrat deja după dată.
+    """
+    filtered_articles = []
+    for article in articles:
+        if article.date:
+            if date_from and article.date < date_from:
+                continue
+            if date_to and article.date > date_to:
+                continue
+        filtered_articles.append(article)
+    return filtered_articles
+
+
 def parse_search_results(results, keywords):
     """
     Parsează rezultatele căutării Google și returnează o listă de articole.
@@ -33,9 +246,7 @@ def parse_search_results(results, keywords):
         snippet = item.get('snippet', '')
         url = item.get('link', '')
 
-        # Simulează extragerea datei articolului
-        # Într-o implementare reală, va trebui să faci request la URL și să parsezi conținutul paginii pentru a găsi data
-        date = datetime.datetime.now().date().isoformat()
+        date = extract_publication_date(item)
 
         article = api_cls.Article(
             title=title,
@@ -48,7 +259,8 @@ def parse_search_results(results, keywords):
     return articles
 
 
-def create_articles_from_search(query: str, keywords: list, num_results: int = 10) -> List[api_cls.Article]:
-    results = search_google(query, num_results)
+def create_articles_from_search(query: str, keywords: list, num_results: int = 10,
+                                language_restrict: Optional[str] = None) -> List[api_cls.Article]:
+    results = search_google(query, num_results, language_restrict)
     articles = parse_search_results(results, keywords)
     return articles
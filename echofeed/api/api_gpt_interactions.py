@@ -1,167 +1,678 @@
+import functools
 import json
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+import openai
 from openai import OpenAI
 
-from echofeed.common import config_info
+from echofeed.common import config_info, metrics, resilience, tracing
+
+# reîncercările sunt făcute de stratul de reziliență, nu de client
+client = OpenAI(api_key=config_info.OPENAI_API_KEY, max_retries=0)
+logger = config_info.get_logger(__name__)
+
+GPT_MODEL = "gpt-4o"
+
+# șabloanele de prompt sunt versionate: orice modificare a textului sau a
+# schemei crește versiunea, care apare în statisticile de tokeni
+PROMPTS = {
+    "categorize": {
+        "version": 2,
+        "system": "Grupează cuvintele cheie în categorii deduse din ele."
+    },
+    "categorize_batch": {
+        "version": 2,
+        "system": "Pentru fiecare id, grupează cuvintele cheie în"
+                  " categorii deduse din ele."
+    },
+    "label_categories": {
+        "version": 2,
+        "system": "Dă un nume scurt fiecărui grup de cuvinte cheie."
+    },
+    "generate_keywords": {
+        "version": 2,
+        "system": "Extrage cuvinte cheie pentru căutarea de știri din"
+                  " textul utilizatorului. Limba: {language}."
+    },
+    "refine_keywords": {
+        "version": 2,
+        "system": "Corectează și completează cuvintele cheie extrase din"
+                  " text, pentru căutarea de știri. Limba: {language}."
+    },
+    "search_query": {
+        "version": 3,
+        "system": "Scrie un query Google de știri în limba {language}."
+                  " Folosește toate cuvintele importante, cele relevante"
+                  " potrivite și irrelevant doar dacă lipsesc cuvinte;"
+                  " în total {min_keywords}-{max_keywords} cuvinte cheie."
+    },
+    "recommendation_query": {
+        "version": 2,
+        "system": "Scrie un query Google de știri în limba {language}"
+                  " pentru cuvintele cheie date."
+    }
+}
+
+_CATEGORIES_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "name": {"type": "string"},
+            "keywords": {"type": "array", "items": {"type": "string"}}
+        },
+        "required": ["name", "keywords"]
+    }
+}
+
+_KEYWORDS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "keywords": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["keywords"]
+}
+
+_QUERY_SCHEMA = {
+    "type": "object",
+    "properties": {"query": {"type": "string"}},
+    "required": ["query"]
+}
+
+# funcțiile pe care modelul este obligat să le apeleze, câte una pentru
+# fiecare tip de răspuns
+FUNCTIONS = {
+    "categorize": {
+        "name": "save_categories",
+        "parameters": {
+            "type": "object",
+            "properties": {"categories": _CATEGORIES_SCHEMA},
+            "required": ["categories"]
+        }
+    },
+    "categorize_batch": {
+        "name": "save_batch_categories",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "items": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "string"},
+                            "categories": _CATEGORIES_SCHEMA
+                        },
+                        "required": ["id", "categories"]
+                    }
+                }
+            },
+            "required": ["items"]
+        }
+    },
+    "label_categories": {
+        "name": "save_labels",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "labels": {
+                    "type": "array",
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "name": {"type": "string"}
+                        },
+                        "required": ["id", "name"]
+                    }
+                }
+            },
+            "required": ["labels"]
+        }
+    },
+    "generate_keywords": {"name": "save_keywords",
+                          "parameters": _KEYWORDS_SCHEMA},
+    "refine_keywords": {"name": "save_keywords",
+                        "parameters": _KEYWORDS_SCHEMA},
+    "search_query": {"name": "save_query", "parameters": _QUERY_SCHEMA},
+    "recommendation_query": {"name": "save_query",
+                             "parameters": _QUERY_SCHEMA}
+}
+
+
+def is_transient_error(exception: Exception) -> bool:
+    """
+    Spune dacă o eroare vine de la OpenAI (conexiune, timp expirat, 429
+    sau 5xx) și nu de la o cerere greșită.
+    """
+    if isinstance(exception, openai.APIStatusError):
+        return exception.status_code == 429 or exception.status_code >= 500
+    return True
 
-client = OpenAI(api_key=config_info.OPENAI_API_KEY)
 
+OPENAI = resilience.register(resilience.Dependency(
+    "openai",
+    timeout_seconds=config_info.OPENAI_TIMEOUT_SECONDS,
+    deadline_seconds=config_info.OPENAI_DEADLINE_SECONDS,
+    max_attempts=config_info.OPENAI_MAX_ATTEMPTS,
+    is_failure=is_transient_error,
+    hedging=resilience.hedging_policy("openai", config_info.OPENAI_HEDGING)
+))
 
-def categorize_keywords(keywords: list) -> dict:
-    prompt = (
-        "Împărțiți următoarele cuvinte cheie în categorii relevante. "
-        "Fiecare categorie trebuie să fie determinată automat pe baza "
-        "cuvintelor cheie furnizate. "
-        "Returnează rezultatul într-un format de dicționar JSON unde cheia"
-        " este numele categoriei și valoarea este o listă de cuvinte cheie. "
-        f"Cuvintele cheie sunt: {', '.join(keywords)}."
-    )
 
+def create_completion(timeout: float, **kwargs):
+    """
+    Trimite o singură cerere de completare, cu timpul de așteptare dat
+    în secunde.
+    """
+    return client.chat.completions.create(timeout=timeout, **kwargs)
+
+
+class TokenUsage:
+    """
+    Contorizează, pentru fiecare tip de apel, numărul de apeluri,
+    reîncercări, erori, tokenii consumați și durata apelurilor.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._usage = {}
+
+    def record(self, call_type: str, prompt_tokens: int,
+               completion_tokens: int, duration: float,
+               attempts: int, failed: bool) -> None:
+        """
+        Adaugă un apel la statistici.
+        """
+        with self._lock:
+            usage = self._usage.setdefault(call_type, {
+                "version": PROMPTS[call_type]["version"],
+                "calls": 0,
+                "retries": 0,
+                "failures": 0,
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "durations": []
+            })
+            usage["calls"] += 1
+            usage["retries"] += attempts - 1
+            usage["failures"] += int(failed)
+            usage["prompt_tokens"] += prompt_tokens
+            usage["completion_tokens"] += completion_tokens
+            usage["durations"].append(duration)
+            del usage["durations"][:-config_info.GPT_USAGE_DURATIONS_KEPT]
+        metrics.OPENAI_CALL_DURATION.observe(duration, call_type)
+        metrics.OPENAI_TOKENS.inc(call_type, "prompt", amount=prompt_tokens)
+        metrics.OPENAI_TOKENS.inc(call_type, "completion",
+                                  amount=completion_tokens)
+        if failed:
+            metrics.OPENAI_CALL_FAILURES.inc(call_type)
+
+    def get_usage(self) -> dict:
+        """
+        Returnează statisticile fiecărui tip de apel, cu media tokenilor
+        pe apel și percentila 95 a duratei, în secunde.
+        """
+        with self._lock:
+            usage = {call_type: dict(stats)
+                     for call_type, stats in self._usage.items()}
+        for stats in usage.values():
+            durations = sorted(stats.pop("durations"))
+            calls = max(stats["calls"], 1)
+            stats["avg_prompt_tokens"] = stats["prompt_tokens"] / calls
+            stats["avg_completion_tokens"] = \
+                stats["completion_tokens"] / calls
+            stats["p95_duration"] = (
+                durations[min(int(len(durations) * 0.95),
+                              len(durations) - 1)]
+                if durations else 0.0
+            )
+        return usage
+
+
+TOKEN_USAGE = TokenUsage()
+
+
+def build_messages(call_type: str, user_content: str, **prompt_args) -> list:
+    """
+    Construiește mesajele unui apel din șablonul versionat al tipului său.
+    """
+    return [
+        {
+            "role": "system",
+            "content": PROMPTS[call_type]["system"].format(**prompt_args)
+        },
+        {
+            "role": "user",
+            "content": user_content
+        }
+    ]
+
+
+def build_tools(call_type: str) -> list:
+    """
+    Returnează funcția pe care modelul trebuie să o apeleze.
+    """
+    return [{"type": "function", "function": FUNCTIONS[call_type]}]
+
+
+def call_function(call_type: str, user_content: str, max_tokens: int,
+                  temperature: float = 0.3, **prompt_args) -> dict:
+    """
+    Apelează modelul obligându-l să răspundă prin funcția tipului de
+    apel, deci răspunsul este un obiect JSON conform schemei. Un răspuns
+    invalid este reîncercat de cel mult GPT_MAX_ATTEMPTS ori.
+
+    Args:
+        call_type (str): Tipul apelului, o cheie din PROMPTS.
+        user_content (str): Mesajul utilizatorului.
+        max_tokens (int): Numărul maxim de tokeni ai răspunsului.
+        temperature (float): Temperatura modelului.
+        **prompt_args: Valorile câmpurilor din șablonul promptului.
+
+    Returns:
+        dict: Argumentele apelului de funcție, sau {} dacă toate
+              încercările au eșuat.
+    """
+    function_name = FUNCTIONS[call_type]["name"]
+    messages = build_messages(call_type, user_content, **prompt_args)
+    prompt_tokens = completion_tokens = 0
+    attempts = 0
+    result = None
+    start_time = time.perf_counter()
+
+    with tracing.span(f"openai.{call_type}") as span:
+        while result is None and attempts < config_info.GPT_MAX_ATTEMPTS:
+            attempts += 1
+            try:
+                response = OPENAI.call(functools.partial(
+                    create_completion,
+                    model=GPT_MODEL,
+                    messages=messages,
+                    tools=build_tools(call_type),
+                    tool_choice={"type": "function",
+                                 "function": {"name": function_name}},
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                ))
+            except Exception as e:
+                # erorile de conexiune au fost deja reîncercate
+                logger.warning("Apelul %s a eșuat: %s", call_type, e)
+                break
+
+            try:
+                if response.usage:
+                    prompt_tokens += response.usage.prompt_tokens
+                    completion_tokens += response.usage.completion_tokens
+                arguments = response.choices[0].message.tool_calls[0] \
+                    .function.arguments
+                parsed = json.loads(arguments)
+                if isinstance(parsed, dict):
+                    result = parsed
+
+            except Exception as e:
+                logger.warning("Răspuns invalid la apelul %s (încercarea"
+                               " %d): %s", call_type, attempts, e)
+
+        if span is not None:
+            span.attributes.update({"attempts": attempts,
+                                    "prompt_tokens": prompt_tokens,
+                                    "completion_tokens": completion_tokens,
+                                    "failed": result is None})
+
+    TOKEN_USAGE.record(call_type, prompt_tokens, completion_tokens,
+                       time.perf_counter() - start_time, attempts,
+                       result is None)
+    return result or {}
+
+
+JSON_STRING_PATTERN = re.compile(r'"(?:[^"\\]|\\.)*"')
+
+
+class JsonArrayStreamParser:
+    """
+    Extrage elementele de tip șir ale primului array JSON dintr-un text
+    primit pe bucăți, imediat ce ghilimelele de închidere ale fiecărui
+    element au sosit.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = -1
+
+    def feed(self, text: str) -> list:
+        """
+        Adaugă o bucată de text și returnează elementele complete noi.
+        """
+        self._buffer += text
+        if self._position < 0:
+            array_start = self._buffer.find("[")
+            if array_start < 0:
+                return []
+            self._position = array_start + 1
+
+        items = []
+        for match in JSON_STRING_PATTERN.finditer(self._buffer,
+                                                  self._position):
+            items.append(json.loads(match.group()))
+            self._position = match.end()
+        return items
+
+
+def stream_function_strings(call_type: str, user_content: str,
+                            max_tokens: int, temperature: float = 0.3,
+                            **prompt_args):
+    """
+    Variantă în flux a call_function pentru funcțiile al căror răspuns
+    este o listă de șiruri: fiecare șir este returnat imediat ce a fost
+    generat complet.
+
+    Yields:
+        str: Elementele listei, în ordinea generării.
+    """
+    function_name = FUNCTIONS[call_type]["name"]
+    prompt_tokens = completion_tokens = 0
+    failed = False
+    start_time = time.perf_counter()
+    parser = JsonArrayStreamParser()
+    # generatorul este reluat în alte contexte de răspunsul în flux, deci
+    # intervalul nu devine cel activ
+    span = tracing.start_detached_span(f"openai.{call_type}", stream=True)
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": "Ești un asistent care ajută la clasificarea"
-                               " cuvintelor cheie în categorii relevante."
-                },
-                {
-                    "role": "user",
-                    "content": prompt
-                }
-            ],
-            max_tokens=150,
-            n=1,
-            stop=None,
-            temperature=0.5,
-        )
-        text_response = response.choices[0].message.content.strip()
-        text_response = (text_response.replace("```json\n", "")
-                         .replace("```", ""))
-
-        categories = json.loads(text_response)
+        stream = OPENAI.call(functools.partial(
+            create_completion,
+            model=GPT_MODEL,
+            messages=build_messages(call_type, user_content, **prompt_args),
+            tools=build_tools(call_type),
+            tool_choice={"type": "function",
+                         "function": {"name": function_name}},
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+        ), hedge=False)
+        for chunk in stream:
+            if chunk.usage:
+                prompt_tokens = chunk.usage.prompt_tokens
+                completion_tokens = chunk.usage.completion_tokens
+            if not chunk.choices or not chunk.choices[0].delta.tool_calls:
+                continue
+            fragment = chunk.choices[0].delta.tool_calls[0].function.arguments
+            for item in parser.feed(fragment or ""):
+                yield str(item)
 
     except Exception as e:
-        print(f"Eroare la clasificarea cuvintelor cheie: {e}")
-        categories = {}
+        logger.warning("Eroare la apelul în flux %s: %s", call_type, e)
+        failed = True
 
-    return categories
+    finally:
+        TOKEN_USAGE.record(call_type, prompt_tokens, completion_tokens,
+                           time.perf_counter() - start_time, 1, failed)
+        if span is not None:
+            span.attributes.update({"prompt_tokens": prompt_tokens,
+                                    "completion_tokens": completion_tokens,
+                                    "failed": failed})
+            span.end()
 
 
-def extract_string_from_response(response):
+def get_token_usage() -> dict:
     """
-    Extrage un șir de caractere din răspunsul primit de la modelul GPT.
+    Returnează statisticile de tokeni ale apelurilor către model.
+    """
+    return TOKEN_USAGE.get_usage()
+
+
+def parse_categories(categories: list) -> dict:
+    """
+    Transformă lista de categorii primită de la model într-un dicționar
+    nume categorie -> cuvinte cheie, ignorând elementele invalide.
+    """
+    result = {}
+    for category in categories or []:
+        if not isinstance(category, dict):
+            continue
+        name = str(category.get("name") or "").strip()
+        keywords = [str(keyword) for keyword in category.get("keywords") or []]
+        if name and keywords:
+            result.setdefault(name, []).extend(keywords)
+    return result
+
+
+def categorize_keywords(keywords: list) -> dict:
+    """
+    Împarte cuvintele cheie în categorii deduse automat din ele.
 
     Args:
-        response (object): Obiectul de răspuns primit de la modelul GPT.
+        keywords (list): Cuvintele cheie.
 
     Returns:
-        str: Șirul de caractere extras.
+        dict: Numele categoriei -> lista de cuvinte cheie, sau {} dacă
+              apelul eșuează.
     """
-    message_content = ""
+    keywords_json = json.dumps(keywords, ensure_ascii=False)
+    arguments = call_function(
+        "categorize", keywords_json,
+        max_tokens=min(estimate_output_tokens(keywords_json),
+                       config_info.GPT_BATCH_MAX_OUTPUT_TOKENS)
+    )
+    return parse_categories(arguments.get("categories"))
 
-    if hasattr(response, 'choices') and len(response.choices) > 0:
-        message_content = response.choices[0].message.content
 
-    print(f"Mesajul extras: {message_content}")
+# the answer of a categorization is estimated to this many tokens per
+# token of its input, plus a fixed overhead
+OUTPUT_TOKENS_PER_INPUT_TOKEN = 2
+OUTPUT_EXTRA_TOKENS = 50
 
-    return message_content
 
+def estimate_output_tokens(input_text: str) -> int:
+    """
+    Estimează numărul de tokeni ai răspunsului la o clasificare.
+    """
+    return OUTPUT_TOKENS_PER_INPUT_TOKEN * estimate_tokens(input_text) \
+        + OUTPUT_EXTRA_TOKENS
 
-def extract_recommandation_queries(keywords: list, language: str) -> str:
-    keywords_str = ", ".join(keywords)
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        f"Creează un query de căutare pe Google pentru a găsi"
-                        f" articole de știri relevante bazate pe cuvintele"
-                        f" cheie furnizate de utilizator. Query-ul"
-                        f" trebuie să fie generat în limba {language}."
-                        f" Folosește cuvintele cheie primite de la utilizator"
-                        f" pentru a construi query-ul. Raspunsul sa fie exact"
-                        f" sub forma in care ar putea fi pus intr-un query de"
-                        f" cautare pe Google, fara cuvinte si caractere"
-                        f" aditionale, intr-un singur string(fara caractere"
-                        f" de tipul \" \')."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": keywords_str
-                }
-            ],
-            max_tokens=100,
-            temperature=0.5,
-        )
-        query = extract_string_from_response(response).strip('"')
-        print(query)
 
-    except Exception as e:
-        print(f"Eroare la extragerea cuvintelor cheie: {e}")
+def get_batch_token_budget() -> int:
+    """
+    Întoarce numărul maxim estimat de tokeni ai unui lot: bugetul
+    GPT_BATCH_TOKEN_BUDGET, redus astfel încât răspunsul unui lot plin
+    să încapă în GPT_BATCH_MAX_OUTPUT_TOKENS.
+    """
+    output_budget = (config_info.GPT_BATCH_MAX_OUTPUT_TOKENS
+                     - OUTPUT_EXTRA_TOKENS) // OUTPUT_TOKENS_PER_INPUT_TOKEN
+    return max(1, min(config_info.GPT_BATCH_TOKEN_BUDGET, output_budget))
 
-    return query
 
+def estimate_tokens(text: str) -> int:
+    """
+    Estimează numărul de tokeni ai unui text (aproximativ 4 caractere
+    pe token), fără a încărca tokenizerul modelului.
+    """
+    return len(text) // 4 + 1
 
-def extract_queries(important_keywords: list, relevant_keywords: list, irrelevant_keywords: list, language: str, min_keywords: int) -> str:
-    important_keywords_str = ", ".join(important_keywords)
-    relevant_keywords_str = ", ".join(relevant_keywords)
-    irrelevant_keywords_str = ", ".join(irrelevant_keywords)
 
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        f"Creează un query de căutare pe Google pentru a găsi"
-                        f" articole de știri relevante bazate pe cuvintele"
-                        f" cheie furnizate de utilizator. Numărul minim"
-                        f" de cuvinte cheie care"
-                        f" trebuie folosite este {min_keywords}, dar nu-l"
-                        f" depasi prea mult(maxim foloseste 2 cuvinte cheie in plus). Query-ul"
-                        f" trebuie să fie generat în limba {language}. Urmează acești pași"
-                        f" pentru a construi query-ul: 1. Cuvintele cheie"
-                        f" foarte importante (important_keywords) trebuie să"
-                        f" fie folosite în mod obligatoriu. 2. Din cuvintele cheie"
-                        f" relevante (relevant_keywords) trebuie să fie"
-                        f" folosite doar cele relevante celor importante și"
-                        f" nu se suprapun cu"
-                        f" cele foarte importante. 3. Cuvintele cheie"
-                        f" irelevante (irrelevant_keywords) să fie folosite"
-                        f" doar dacă nu există suficiente cuvinte cheie din"
-                        f" categoriile anterioare pentru a forma query-ul"
-                        f" complet, si in acel caz doar cele relevante cu cele"
-                        f" selectate din categoriile precedente. 4. Ai dreptul"
-                        f" de a modela query-ul folosind aceste cuvinte cheie"
-                        f" si reguli astfel incat acesta sa fie optim pentru"
-                        f" cautarea de stiri."
-                        f" Raspunsul sa fie exact sub forma in care ar putea"
-                        f" fi pus intr-un query de cautare pe Google, fara"
-                        f" cuvinte si caractere aditionale, intr-un singur"
-                        f" string(fara caractere de tipul \" \')."
-                    )
-                },
-                {
-                    "role": "user",
-                    "content": f"important_keywords: {important_keywords_str}, relevant_keywords: {relevant_keywords_str}, irrelevant_keywords: {irrelevant_keywords_str}"
-                }
-            ],
-            max_tokens=100,
-            temperature=0.5,
-        )
-        query = extract_string_from_response(response).strip('"')
-        print(query)
+def pack_keyword_batches(keyword_sets: dict, token_budget: int) -> list:
+    """
+    Împarte seturile de cuvinte cheie în loturi care nu depășesc bugetul
+    de tokeni. Un set mai mare decât bugetul formează singur un lot.
 
-    except Exception as e:
-        print(f"Eroare la extragerea cuvintelor cheie: {e}")
+    Args:
+        keyword_sets (dict): Seturile de cuvinte cheie, după id.
+        token_budget (int): Numărul maxim estimat de tokeni ai unui lot.
 
-    return query
+    Returns:
+        list: Loturile, fiecare un dicționar id -> cuvinte cheie.
+    """
+    batches = []
+    batch, batch_tokens = {}, 0
+    for item_id, keywords in keyword_sets.items():
+        item_tokens = estimate_tokens(json.dumps({item_id: keywords},
+                                                 ensure_ascii=False))
+        if batch and batch_tokens + item_tokens > token_budget:
+            batches.append(batch)
+            batch, batch_tokens = {}, 0
+        batch[item_id] = keywords
+        batch_tokens += item_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def categorize_keyword_batch(batch: dict) -> dict:
+    """
+    Clasifică toate seturile de cuvinte cheie ale unui lot printr-o
+    singură cerere.
+
+    Args:
+        batch (dict): Seturile de cuvinte cheie, după id.
+
+    Returns:
+        dict: Categoriile fiecărui id primit înapoi de la model; id-urile
+              lipsă din răspuns nu apar în rezultat.
+    """
+    batch_json = json.dumps(batch, ensure_ascii=False)
+    arguments = call_function(
+        "categorize_batch", batch_json,
+        max_tokens=min(estimate_output_tokens(batch_json),
+                       config_info.GPT_BATCH_MAX_OUTPUT_TOKENS)
+    )
+
+    results = {}
+    for item in arguments.get("items") or []:
+        if isinstance(item, dict) and str(item.get("id")) in batch:
+            results[str(item["id"])] = parse_categories(
+                item.get("categories"))
+    return results
+
+
+def categorize_batch_or_halves(batch: dict) -> dict:
+    """
+    Clasifică un lot, iar dacă niciun set nu a primit răspuns (de
+    exemplu pentru că răspunsul a fost trunchiat), îl împarte în două
+    jumătăți clasificate separat, până la seturi individuale.
+
+    Args:
+        batch (dict): Seturile de cuvinte cheie, după id.
+
+    Returns:
+        dict: Categoriile fiecărui id clasificat cu succes.
+    """
+    results = categorize_keyword_batch(batch)
+    if results or len(batch) < 2:
+        return results
+    items = list(batch.items())
+    middle = len(items) // 2
+    logger.warning("Lotul de %d seturi nu a primit răspuns, este împărțit"
+                   " în două", len(items))
+    return {**categorize_batch_or_halves(dict(items[:middle])),
+            **categorize_batch_or_halves(dict(items[middle:]))}
+
+
+def categorize_keyword_sets(keyword_sets: dict) -> dict:
+    """
+    Clasifică multe seturi de cuvinte cheie (de exemplu interesele
+    mai multor utilizatori) cu cât mai puține cereri: seturile sunt
+    grupate în loturi limitate de GPT_BATCH_TOKEN_BUDGET și de
+    GPT_BATCH_MAX_OUTPUT_TOKENS, trimise în paralel, iar răspunsurile
+    sunt separate după id. Un lot fără răspuns este reîncercat în
+    jumătăți.
+
+    Args:
+        keyword_sets (dict): Seturile de cuvinte cheie, după id.
+
+    Returns:
+        dict: Categoriile fiecărui id clasificat cu succes.
+    """
+    batches = pack_keyword_batches(keyword_sets, get_batch_token_budget())
+    if not batches:
+        return {}
+
+    categories = {}
+    with ThreadPoolExecutor(
+            max_workers=min(len(batches),
+                            config_info.GPT_BATCH_CONCURRENCY)) as executor:
+        for batch_categories in executor.map(
+                tracing.run_in_context(categorize_batch_or_halves),
+                batches):
+            categories.update(batch_categories)
+    return categories
+
+
+def label_categories(categories: dict) -> dict:
+    """
+    Denumește grupurile de cuvinte cheie formate local. Modelul primește
+    doar grupurile și întoarce câte un nume pentru fiecare, deci
+    răspunsul rămâne scurt indiferent de numărul de cuvinte cheie.
+
+    Args:
+        categories (dict): Grupurile, cu numele provizoriu drept cheie.
+
+    Returns:
+        dict: Grupurile cu numele generate, sau grupurile inițiale
+              dacă apelul eșuează.
+    """
+    groups = list(categories.values())
+    prompt = "\n".join(f"{index}: {', '.join(group[:10])}"
+                       for index, group in enumerate(groups))
+    arguments = call_function("label_categories", prompt,
+                              max_tokens=15 * len(groups) + 20)
+
+    names = {}
+    for label in arguments.get("labels") or []:
+        if isinstance(label, dict) and label.get("name"):
+            names[label.get("id")] = str(label["name"]).strip()
+    if not names:
+        return categories
+
+    labeled_categories = {}
+    for index, group in enumerate(groups):
+        labeled_categories.setdefault(names.get(index) or group[0],
+                                      []).extend(group)
+    return labeled_categories
+
+
+def extract_recommandation_queries(keywords: list, language: str) -> str:
+    """
+    Generează un query Google pentru recomandări pe baza cuvintelor cheie.
+
+    Returns:
+        str: Query-ul, sau un șir gol dacă apelul eșuează.
+    """
+    arguments = call_function("recommendation_query", ", ".join(keywords),
+                              max_tokens=100, temperature=0.5,
+                              language=language)
+    return str(arguments.get("query") or "").strip().strip('"')
+
+
+def extract_queries(important_keywords: list, relevant_keywords: list, irrelevant_keywords: list, language: str, min_keywords: int) -> str:
+    """
+    Generează un query Google pe baza celor trei categorii de cuvinte
+    cheie, folosind cel puțin min_keywords și cel mult două în plus.
+
+    Returns:
+        str: Query-ul, sau un șir gol dacă apelul eșuează.
+    """
+    user_content = json.dumps({
+        "important": important_keywords,
+        "relevant": relevant_keywords,
+        "irrelevant": irrelevant_keywords
+    }, ensure_ascii=False)
+    arguments = call_function("search_query", user_content,
+                              max_tokens=100, temperature=0.5,
+                              language=language, min_keywords=min_keywords,
+                              max_keywords=int(min_keywords or 0) + 2)
+    return str(arguments.get("query") or "").strip().strip('"')
+
+
+def parse_keywords(arguments: dict) -> list:
+    """
+    Returnează cuvintele cheie nevide din argumentele apelului.
+    """
+    return [str(keyword).strip() for keyword in arguments.get("keywords") or []
+            if str(keyword).strip()]
 
 
 def generate_keywords(user_input: str, language) -> list:
@@ -175,32 +686,62 @@ def generate_keywords(user_input: str, language) -> list:
     Returns:
         list: Lista de cuvinte cheie generate.
     """
-    keywords = []
-    try:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {
-                    "role": "system",
-                    "content": f"Genereaza cuvinte cheie pentru cautare"
-                               f" de stiri pe baza textului introdus de"
-                               f" utilizator. Nu vei scrie nimic altceva."
-                               f" Cuvintele cheie vor fi separate prin"
-                               f" virgula. Limba este {language}."
-                },
-                {
-                    "role": "user",
-                    "content": user_input
-                }
-            ],
-            max_tokens=100,
-            temperature=0.5,
-        )
-        keywords = extract_string_from_response(response).split(", ")
+    arguments = call_function("generate_keywords", user_input,
+                              max_tokens=100, temperature=0.5,
+                              language=language)
+    return parse_keywords(arguments)
 
-    except Exception as e:
-        print(f"Eroare la extragerea cuvintelor cheie: {e}")
-    return keywords
+
+def stream_keywords(user_input: str, language):
+    """
+    Variantă în flux a generate_keywords: fiecare cuvânt cheie este
+    returnat imediat ce a fost generat.
+
+    Yields:
+        str: Cuvintele cheie generate.
+    """
+    for keyword in stream_function_strings("generate_keywords", user_input,
+                                           max_tokens=100, temperature=0.5,
+                                           language=language):
+        if keyword.strip():
+            yield keyword.strip()
+
+
+def stream_refined_keywords(user_input: str, candidates: list, language):
+    """
+    Variantă în flux a refine_keywords.
+
+    Yields:
+        str: Cuvintele cheie rafinate.
+    """
+    user_content = json.dumps({"text": user_input, "keywords": candidates},
+                              ensure_ascii=False)
+    for keyword in stream_function_strings("refine_keywords", user_content,
+                                           max_tokens=100,
+                                           language=language):
+        if keyword.strip():
+            yield keyword.strip()
+
+
+def refine_keywords(user_input: str, candidates: list, language) -> list:
+    """
+    Rafinează cuvintele cheie extrase local: le corectează, le traduce
+    în limba cerută și adaugă sinonimele lipsă.
+
+    Args:
+        user_input (str): Textul introdus de utilizator.
+        candidates (list): Cuvintele cheie extrase local.
+        language (str): Limba cuvintelor cheie.
+
+    Returns:
+        list: Lista de cuvinte cheie rafinate, sau lista inițială
+              dacă apelul eșuează.
+    """
+    user_content = json.dumps({"text": user_input, "keywords": candidates},
+                              ensure_ascii=False)
+    arguments = call_function("refine_keywords", user_content,
+                              max_tokens=100, language=language)
+    return parse_keywords(arguments) or candidates
 
 
 def convert_string_to_date(date_string: str):
@@ -0,0 +1,207 @@
+"""
+Local keyword categorization, used to group keywords without calling
+OpenAI.
+
+Keywords are related when they appear in the same stored articles or
+share words. The similarities are computed with sparse matrix products
+over the article corpus and the keywords are grouped with agglomerative
+clustering; every group is named by its most central keyword.
+"""
+import threading
+from typing import Dict, Iterable, List
+
+import numpy as np
+from scipy import sparse
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.spatial.distance import squareform
+
+from echofeed.common import config_info, metrics
+from echofeed.api.api_keyword_extraction import tokenize
+
+
+class KeywordCorpus:
+    """
+    Binary article-word matrix of the stored articles. Documents are
+    added incrementally and the sparse matrix is rebuilt on the next
+    lookup.
+    """
+
+    def __init__(self):
+        self._vocabulary = {}
+        self._documents = []
+        self._matrix = None
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._documents)
+
+    def add_document(self, text: str) -> None:
+        """
+        Adds the distinct words of a document.
+
+        Args:
+            text (str): The text of the document.
+        """
+        with self._lock:
+            word_ids = {self._vocabulary.setdefault(word, len(self._vocabulary))
+                        for word in tokenize(text)}
+            self._documents.append(np.fromiter(word_ids, dtype=np.int32))
+            self._matrix = None
+
+    def add_documents(self, texts: Iterable[str]) -> None:
+        """
+        Adds the distinct words of several documents.
+        """
+        for text in texts:
+            self.add_document(text)
+
+    def get_word_id(self, word: str) -> int:
+        """
+        Returns the column of a word, or -1 if no article contains it.
+        """
+        return self._vocabulary.get(word, -1)
+
+    def get_matrix(self) -> sparse.csr_matrix:
+        """
+        Returns the articles x words matrix.
+        """
+        with self._lock:
+            metrics.record_cache_lookup("keyword_corpus_matrix",
+                                        self._matrix is not None)
+            if self._matrix is None:
+                lengths = [len(word_ids) for word_ids in self._documents]
+                indices = (np.concatenate(self._documents)
+                           if self._documents else np.empty(0, np.int32))
+                indptr = np.concatenate(([0], np.cumsum(lengths)))
+                self._matrix = sparse.csr_matrix(
+                    (np.ones(len(indices), dtype=np.float32), indices, indptr),
+                    shape=(len(self._documents), len(self._vocabulary))
+                )
+            return self._matrix
+
+
+KEYWORD_CORPUS = KeywordCorpus()
+
+
+def build_keyword_word_matrix(keyword_words: List[List[str]],
+                              vocabulary: Dict[str, int],
+                              columns_count: int) -> sparse.csr_matrix:
+    """
+    Builds the binary keywords x words matrix of a vocabulary, skipping
+    the words missing from it (mapped to -1).
+    """
+    rows, columns = [], []
+    for row, words in enumerate(keyword_words):
+        for word in set(words):
+            if vocabulary.get(word, -1) >= 0:
+                rows.append(row)
+                columns.append(vocabulary[word])
+    return sparse.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, columns)),
+        shape=(len(keyword_words), columns_count)
+    )
+
+
+def compute_cooccurrence(keyword_words: List[List[str]],
+                         corpus: KeywordCorpus) -> np.ndarray:
+    """
+    Counts the articles containing every pair of keywords. An article
+    contains a keyword when it contains all the words of the keyword.
+
+    Returns:
+        np.ndarray: keywords x keywords matrix; the diagonal holds the
+                    number of articles containing each keyword.
+    """
+    size = len(keyword_words)
+    articles = corpus.get_matrix()
+    if articles.shape[0] == 0:
+        return np.zeros((size, size))
+
+    vocabulary = {word: corpus.get_word_id(word)
+                  for words in keyword_words for word in words}
+    keywords = build_keyword_word_matrix(keyword_words, vocabulary,
+                                         articles.shape[1])
+    word_counts = np.array([len(set(words)) for words in keyword_words])
+    known = np.array([bool(words)
+                      and all(vocabulary[word] >= 0 for word in words)
+                      for words in keyword_words], dtype=bool)
+
+    matches = (articles @ keywords.T).tocoo()
+    contained = (matches.data == word_counts[matches.col]) & known[matches.col]
+    incidence = sparse.csr_matrix(
+        (np.ones(contained.sum(), dtype=np.float32),
+         (matches.row[contained], matches.col[contained])),
+        shape=(articles.shape[0], size)
+    )
+    return (incidence.T @ incidence).toarray()
+
+
+def compute_similarity(keyword_words: List[List[str]],
+                       cooccurrence: np.ndarray) -> np.ndarray:
+    """
+    Combines the cosine similarity of the keyword occurrences with the
+    Jaccard similarity of the keyword words, so keywords missing from
+    the corpus can still be grouped with keywords sharing their words.
+    """
+    frequency = np.diag(cooccurrence)
+    norms = np.sqrt(np.outer(frequency, frequency))
+    cosine = np.divide(cooccurrence, norms, out=np.zeros_like(cooccurrence),
+                       where=norms > 0)
+
+    vocabulary = {}
+    for words in keyword_words:
+        for word in words:
+            vocabulary.setdefault(word, len(vocabulary))
+    words_matrix = build_keyword_word_matrix(keyword_words, vocabulary,
+                                             len(vocabulary))
+    shared = (words_matrix @ words_matrix.T).toarray()
+    word_counts = np.asarray(words_matrix.sum(axis=1)).ravel()
+    union = word_counts[:, None] + word_counts[None, :] - shared
+    jaccard = np.divide(shared, union, out=np.zeros_like(shared),
+                        where=union > 0)
+
+    similarity = np.maximum(cosine, jaccard)
+    np.fill_diagonal(similarity, 1.0)
+    return similarity
+
+
+def cluster_keywords(keywords: List[str],
+                     corpus: KeywordCorpus = KEYWORD_CORPUS,
+                     distance_threshold: float =
+                     config_info.KEYWORD_CLUSTER_DISTANCE_THRESHOLD) \
+        -> Dict[str, List[str]]:
+    """
+    Groups keywords into categories.
+
+    Args:
+        keywords (List[str]): The keywords to group.
+        corpus (KeywordCorpus): The articles used to relate keywords.
+        distance_threshold (float): Groups are not merged above this
+                                    average distance (1 - similarity).
+
+    Returns:
+        Dict[str, List[str]]: The categories, named by their most
+                              central keyword, with their keywords.
+    """
+    unique_keywords = list(dict.fromkeys(
+        keyword.strip() for keyword in keywords if keyword.strip()))
+    if len(unique_keywords) < 2:
+        return {keyword: [keyword] for keyword in unique_keywords}
+
+    keyword_words = [tokenize(keyword) for keyword in unique_keywords]
+    cooccurrence = compute_cooccurrence(keyword_words, corpus)
+    similarity = compute_similarity(keyword_words, cooccurrence)
+
+    distances = squareform(1.0 - similarity, checks=False)
+    labels = fcluster(linkage(distances, method="average"),
+                      t=distance_threshold, criterion="distance")
+
+    frequency = np.diag(cooccurrence)
+    categories = {}
+    for label in np.unique(labels):
+        members = np.flatnonzero(labels == label)
+        centrality = similarity[np.ix_(members, members)].sum(axis=1)
+        central = members[np.lexsort((-frequency[members], -centrality))[0]]
+        categories[unique_keywords[central]] = [unique_keywords[index]
+                                                for index in members]
+    return categories
@@ -0,0 +1,206 @@
+"""
+Local statistical keyword extraction, used to generate search keywords
+without calling OpenAI.
+
+Candidate phrases are the runs of words between stopwords and
+punctuation (RAKE). Every word is scored by its degree over its
+frequency, boosted when it is capitalized inside a sentence or appears
+early (as in YAKE), and weighted by its inverse document frequency in
+the stored articles, so words common in the news corpus rank lower.
+"""
+import math
+import re
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from echofeed.common import config_info
+
+STOPWORDS = {
+    "English": frozenset("""
+        a about above after again against all also am an and any are as at
+        be because been before being below between both but by can could
+        did do does doing down during each few for from further had has
+        have having he her here hers herself him himself his how i if in
+        into is it its itself just let me more most my myself news no nor
+        not now of off on once only or other our ours ourselves out over
+        own please same she should show so some such than that the their
+        theirs them themselves then there these they this those through to
+        too under until up very want was we were what when where which
+        while who whom why will with would you your yours yourself
+        yourselves latest new recent today articles article
+    """.split()),
+    "Romanian": frozenset("""
+        a acea aceasta această aceea acei aceia acel acela acele acelea
+        acest acesta aceste acestea acestei acestia aceștia acestui acolo
+        acum ai aia aici al ale alt alta altă alte altceva altcineva am
+        ar are as aș asta astăzi astazi asupra au avea aveam avem aveți
+        azi ba bine ca că care ce cel cea cei cele cine cu cum da dacă daca
+        dar de deci despre din dintre doar după dupa ea ei el ele este
+        eu fi fie fost iar în in între intre îmi imi își isi la le li lor
+        lui mai mă ma mi mie mult multe mulți multi ne nici noi nostru
+        noastră nu o ori pe pentru peste poate pot prin să sa se său
+        sau sub sunt și si spre tot toate toți toti tu un una unei unde
+        unor unui unele unii vă va voi vreau vrea vreți stiri știri
+        ultimele articole articol
+    """.split())
+}
+
+STOPWORDS_ALL = frozenset().union(*STOPWORDS.values())
+
+WORD_PATTERN = re.compile(r"[^\W_]+(?:[-'’][^\W_]+)*")
+PHRASE_DELIMITER_PATTERN = re.compile(r"[.,;:!?()\[\]{}\"“”„«»/\\|\n\t]+")
+TOKEN_PATTERN = re.compile(r"[^\W_]+")
+
+MAX_PHRASE_WORDS = 3
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits a text into lowercase word tokens, as used for the document
+    frequencies.
+    """
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class CorpusStatistics:
+    """
+    Document frequencies of the words in the stored articles.
+    Documents can be added incrementally; until the corpus is loaded
+    every word has the same weight.
+    """
+
+    def __init__(self):
+        self._document_frequency = {}
+        self._documents = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._documents
+
+    def add_document(self, text: str) -> None:
+        """
+        Counts the distinct words of a document.
+
+        Args:
+            text (str): The text of the document.
+        """
+        words = set(tokenize(text))
+        with self._lock:
+            self._documents += 1
+            for word in words:
+                self._document_frequency[word] = \
+                    self._document_frequency.get(word, 0) + 1
+
+    def add_documents(self, texts: Iterable[str]) -> None:
+        """
+        Counts the distinct words of several documents.
+        """
+        for text in texts:
+            self.add_document(text)
+
+    def idf(self, word: str) -> float:
+        """
+        Returns the smoothed inverse document frequency of a word.
+        """
+        document_frequency = self._document_frequency.get(word.casefold(), 0)
+        return math.log((self._documents + 1) / (document_frequency + 1)) + 1
+
+
+CORPUS_STATISTICS = CorpusStatistics()
+
+
+def get_article_text(article: dict) -> str:
+    """
+    Returns the text of an article used for the document frequencies.
+    """
+    return f"{article.get('title') or ''} {article.get('content') or ''}"
+
+
+def split_candidate_phrases(text: str, stopwords: frozenset) \
+        -> List[Tuple[List[str], bool]]:
+    """
+    Splits a text into candidate phrases: runs of at most
+    MAX_PHRASE_WORDS words not interrupted by stopwords or punctuation.
+    Every phrase is returned with a flag telling if its first word
+    starts a sentence, where capitalization carries no meaning.
+    Acronyms are never stopwords, so "AI" is kept although "ai" is a
+    Romanian stopword.
+    """
+    phrases = []
+    for fragment in PHRASE_DELIMITER_PATTERN.split(text):
+        phrase = []
+        phrase_start = 0
+        for index, word in enumerate(WORD_PATTERN.findall(fragment)):
+            is_acronym = len(word) > 1 and word.isupper()
+            if ((word.casefold() in stopwords and not is_acronym)
+                    or (word.isdigit() and len(word) < 4)):
+                if phrase:
+                    phrases.append((phrase, phrase_start == 0))
+                phrase = []
+                continue
+            if not phrase:
+                phrase_start = index
+            phrase.append(word)
+            if len(phrase) == MAX_PHRASE_WORDS:
+                phrases.append((phrase, phrase_start == 0))
+                phrase = []
+        if phrase:
+            phrases.append((phrase, phrase_start == 0))
+    return phrases
+
+
+def extract_keywords(text: str, max_keywords: Optional[int] = None,
+                     statistics: CorpusStatistics = CORPUS_STATISTICS) \
+        -> List[str]:
+    """
+    Extracts the most relevant keywords of a text.
+
+    Args:
+        text (str): The text typed by the user, in English or Romanian.
+        max_keywords (int): The maximum number of keywords.
+        statistics (CorpusStatistics): The document frequencies used to
+                                       weight the words.
+
+    Returns:
+        List[str]: The keywords, most relevant first, in the form they
+                   appear in the text.
+    """
+    max_keywords = max_keywords or config_info.KEYWORD_EXTRACTION_MAX_KEYWORDS
+    phrases = split_candidate_phrases(text, STOPWORDS_ALL)
+    if not phrases:
+        return []
+
+    frequency = {}
+    degree = {}
+    first_position = {}
+    capitalized = {}
+    position = 0
+    for phrase, starts_sentence in phrases:
+        for index, word in enumerate(phrase):
+            key = word.casefold()
+            frequency[key] = frequency.get(key, 0) + 1
+            degree[key] = degree.get(key, 0) + len(phrase)
+            first_position.setdefault(key, position)
+            if word[0].isupper() and (index > 0 or not starts_sentence):
+                capitalized[key] = capitalized.get(key, 0) + 1
+            position += 1
+
+    word_scores = {}
+    for key, count in frequency.items():
+        score = degree[key] / count
+        score *= 1 + capitalized.get(key, 0) / count
+        score *= 1 + 1 / (2 + first_position[key])
+        word_scores[key] = score * statistics.idf(key)
+
+    phrase_scores = {}
+    for phrase, _ in phrases:
+        key = " ".join(word.casefold() for word in phrase)
+        if key not in phrase_scores:
+            phrase_scores[key] = (
+                sum(word_scores[word.casefold()] for word in phrase),
+                " ".join(phrase)
+            )
+
+    ranked_phrases = sorted(phrase_scores.values(),
+                            key=lambda item: -item[0])
+    return [phrase for _, phrase in ranked_phrases[:max_keywords]]
@@ -0,0 +1,199 @@
+"""
+In-memory compressed prefix trie used for keyword autocomplete.
+
+Every node keeps the most frequent terms below it, so a lookup only
+walks the prefix and reads a precomputed list, independently of the
+number of stored terms.
+"""
+import threading
+from typing import Iterable, List, Optional, Tuple
+
+from echofeed.common import config_info
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.config_info import Entity
+from echofeed.common.keyword_normalization import KEYWORD_DICTIONARY
+from echofeed.common.keyword_normalization import keyword_key
+
+logger = config_info.get_logger(__name__)
+
+
+class _TrieNode:
+    """
+    Node of the trie. The edge leading to it is labelled with a
+    string, which makes chains of single-child nodes a single node.
+    """
+    __slots__ = ("label", "children", "term", "count", "top")
+
+    def __init__(self, label: str = ""):
+        self.label = label
+        self.children = {}
+        self.term = None
+        self.count = 0
+        self.top = []
+
+
+class KeywordTrie:
+    """
+    Compressed trie of keywords ranked by frequency.
+
+    Counts only grow, which keeps the top terms of every node exact:
+    a term can only enter a node's list when its own count increases.
+    When more than max_terms terms are stored, the trie is rebuilt with
+    the most frequent ones, so memory stays bounded.
+    """
+
+    def __init__(self, top_size: int, max_terms: int):
+        self.top_size = top_size
+        self.max_terms = max_terms
+        self._root = _TrieNode()
+        self._terms = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._terms
+
+    @staticmethod
+    def _normalize(term: str) -> str:
+        return keyword_key(term)
+
+    def add(self, term: str, count: int = 1) -> None:
+        """
+        Adds occurrences of a term. All the variants of a keyword are
+        counted and suggested under its canonical form.
+
+        Args:
+            term (str): Any variant of the keyword.
+            count (int): The number of occurrences to add.
+        """
+        term = KEYWORD_DICTIONARY.canonicalize(term)
+        if not term or count <= 0:
+            return
+        with self._lock:
+            self._add(term, term, count)
+            if self._terms > self.max_terms:
+                self._prune()
+
+    def add_many(self, terms: Iterable[str]) -> None:
+        """
+        Adds one occurrence of every term.
+
+        Args:
+            terms (Iterable[str]): The keywords.
+        """
+        for term in terms or []:
+            self.add(term)
+
+    def _add(self, key: str, term: str, count: int) -> None:
+        path = [self._root]
+        node = self._root
+        remaining = key
+        while remaining:
+            child = node.children.get(remaining[0])
+            if child is None:
+                child = _TrieNode(remaining)
+                node.children[remaining[0]] = child
+                path.append(child)
+                node = child
+                break
+
+            common = 0
+            max_common = min(len(child.label), len(remaining))
+            while (common < max_common
+                   and child.label[common] == remaining[common]):
+                common += 1
+
+            if common < len(child.label):
+                middle = _TrieNode(child.label[:common])
+                middle.top = list(child.top)
+                child.label = child.label[common:]
+                middle.children[child.label[0]] = child
+                node.children[remaining[0]] = middle
+                child = middle
+
+            path.append(child)
+            node = child
+            remaining = remaining[common:]
+
+        if node.term is None:
+            node.term = term
+            self._terms += 1
+        node.count += count
+        entry = (node.count, node.term)
+        for path_node in path:
+            top = [item for item in path_node.top if item[1] != node.term]
+            top.append(entry)
+            top.sort(key=lambda item: (-item[0], item[1]))
+            path_node.top = top[:self.top_size]
+
+    def _iter_terms(self) -> List[Tuple[str, int]]:
+        terms = []
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node.term is not None:
+                terms.append((node.term, node.count))
+            stack.extend(node.children.values())
+        return terms
+
+    def _prune(self) -> None:
+        kept_terms = sorted(self._iter_terms(),
+                            key=lambda item: -item[1])
+        kept_terms = kept_terms[:int(self.max_terms * 0.8)]
+        self._root = _TrieNode()
+        self._terms = 0
+        for term, count in kept_terms:
+            self._add(self._normalize(term), term, count)
+        logger.info("Pruned keyword trie to %d terms", self._terms)
+
+    def suggest(self, prefix: str, limit: Optional[int] = None) \
+            -> List[Tuple[str, int]]:
+        """
+        Returns the most frequent terms starting with a prefix.
+
+        Args:
+            prefix (str): The typed prefix.
+            limit (int): The maximum number of suggestions.
+
+        Returns:
+            List[Tuple[str, int]]: (term, count) pairs, most frequent first.
+        """
+        limit = min(limit or self.top_size, self.top_size)
+        remaining = self._normalize(prefix)
+        node = self._root
+        while remaining:
+            child = node.children.get(remaining[0])
+            if child is None:
+                return []
+            if remaining.startswith(child.label):
+                remaining = remaining[len(child.label):]
+            elif child.label.startswith(remaining):
+                remaining = ""
+            else:
+                return []
+            node = child
+        return [(term, count) for count, term in node.top[:limit]]
+
+
+KEYWORD_TRIE = KeywordTrie(
+    top_size=config_info.AUTOCOMPLETE_TOP_SIZE,
+    max_terms=config_info.AUTOCOMPLETE_MAX_TERMS
+)
+
+
+def load_corpus_keywords(trie: KeywordTrie = KEYWORD_TRIE) -> None:
+    """
+    Fills the trie with the keywords of all stored articles and the
+    interests of all users, weighted by the number of documents. The
+    folded sub-fields are aggregated, so the spellings of a keyword come
+    back as one term.
+    """
+    sources = [(Entity.ARTICLE, "keywords.folded"),
+               (Entity.USER, "interests.folded")]
+    for entity_type, field in sources:
+        try:
+            for term, count in es_helpers.aggregate_terms(entity_type, field):
+                trie.add(term, count)
+        except Exception as exception:
+            logger.error("Encountered exception when tried to load"
+                         " %s into the keyword trie: %s", field, exception)
+    logger.info("Loaded %d keywords into the keyword trie", len(trie))
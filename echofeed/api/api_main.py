@@ -1,22 +1,231 @@
 """Main project file for api service."""
+import contextlib
+import math
+import threading
+import time
+from typing import Optional
 
 import fastapi
 import uvicorn
-from fastapi.responses import JSONResponse  # , RedirectResponse
+from fastapi.responses import FileResponse, HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse  # , RedirectResponse
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
-from echofeed.common import config_info, api_request_classes as api_req_cls
+from echofeed.common import config_info, metrics, tracing, api_request_classes as api_req_cls
+from echofeed.common import storage_backends
 from echofeed.api import api_endpoint_helpers as api_helpers
+from echofeed.api import api_gpt_interactions as api_gpt
+from echofeed.api import api_keyword_trie, api_password_pool, api_profiling
+from echofeed.api import api_rate_limiting
+from echofeed.api import api_session_tokens, api_trace_viewer, api_view_buffer
 from echofeed.common.config_info import AcceptedOperations as acceptedOps
 from echofeed.common.config_info import Entity
 from echofeed.common.config_info import ElasticsearchIndexes as esIndexes
 
+
+def load_in_background(target, name: str) -> None:
+    """Runs a loading function in a daemon thread, so the API starts
+    serving without waiting for it."""
+    threading.Thread(target=target, name=name, daemon=True).start()
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_app: fastapi.FastAPI):
+    """Prepares the storage and the background work of the API, and writes
+    the article views still buffered before the API stops."""
+    # the indexes are created with explicit mappings on Elasticsearch
+    storage_backends.get_storage_backend().bootstrap()
+    api_view_buffer.VIEW_BUFFER.start()
+    load_in_background(api_keyword_trie.load_corpus_keywords,
+                       "echofeed-keyword-trie")
+    load_in_background(api_helpers.load_keyword_corpora,
+                       "echofeed-keyword-corpora")
+    yield
+    api_view_buffer.VIEW_BUFFER.stop(
+        config_info.VIEW_SHUTDOWN_TIMEOUT_SECONDS)
+
+
 app = fastapi.FastAPI(
     title="EchoFeed API",
     description="API for EchoFeed project.",
-    version=config_info.VERSION
+    version=config_info.VERSION,
+    lifespan=lifespan
 )
 
 
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+@app.middleware("http")
+async def limit_expensive_requests(request: fastapi.Request, call_next):
+    """Rejects the requests to the expensive endpoints over the rate
+    limits of their user or IP, and bounds how many of them run at once.
+
+    Declared first, so the metrics and traces include the rejections.
+    """
+    limiter = api_rate_limiting.RATE_LIMITER
+    cost = limiter.route_costs.get(request.url.path)
+    if not cost:
+        return await call_next(request)
+    try:
+        await limiter.admit(request, cost)
+    except api_rate_limiting.RateLimited as exception:
+        metrics.RATE_LIMITED_REQUESTS.inc(request.url.path, exception.reason)
+        return rate_limited_response(exception)
+    try:
+        return await call_next(request)
+    finally:
+        limiter.admission.release()
+
+
+@app.middleware("http")
+async def record_request_metrics(request: fastapi.Request, call_next):
+    """Records the latency, status and concurrency of every request.
+
+    Requests are labelled with the route template, e.g.
+    /api/v1/articles/, never with the raw path, so the number of series
+    stays bounded.
+    """
+    metrics.HTTP_REQUESTS_IN_FLIGHT.inc()
+    start_time = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        metrics.HTTP_REQUESTS_IN_FLIGHT.dec()
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - start_time, request.method, route_path)
+        metrics.HTTP_REQUESTS.inc(request.method, route_path, str(status))
+
+
+@app.middleware("http")
+async def profile_requests(request: fastapi.Request, call_next):
+    """Profiles the requests of admins that ask for it with the X-Profile
+    header or the profile query parameter.
+    """
+    mode = api_profiling.get_requested_mode(request)
+    if mode is None or not api_profiling.is_admin_request(request):
+        return await call_next(request)
+    return await api_profiling.profile_request(request, call_next, mode)
+
+
+@app.middleware("http")
+async def trace_requests(request: fastapi.Request, call_next):
+    """Runs every request in a trace, continuing the trace of the UI when
+    the request carries a traceparent header.
+    """
+    trace_id, parent_id = tracing.parse_traceparent(
+        request.headers.get(tracing.TRACEPARENT_HEADER))
+    with tracing.start_trace(f"{request.method} {request.url.path}",
+                             trace_id, parent_id) as root:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            root.name = f"{request.method} {route.path}"
+        root.set_attribute("status", response.status_code)
+        response.headers["X-Trace-Id"] = root.trace_id
+        return response
+
+
+def require_session(
+        credentials: HTTPAuthorizationCredentials =
+        fastapi.Depends(bearer_scheme)) -> dict:
+    """Verifies the bearer token of a request and returns its claims.
+
+        The token is checked statelessly (signature and expiry time),
+        without reading the user from the database.
+
+        Raises:
+            HTTPException: 401 if the token is missing or invalid.
+    """
+    if credentials is None:
+        raise fastapi.HTTPException(
+            status_code=401,
+            detail="Missing session token",
+            headers={"WWW-Authenticate": "Bearer"}
+        )
+    try:
+        return api_session_tokens.verify_token(credentials.credentials)
+    except api_session_tokens.InvalidSessionToken as exception:
+        raise fastapi.HTTPException(
+            status_code=401,
+            detail=str(exception),
+            headers={"WWW-Authenticate": "Bearer"}
+        ) from exception
+
+
+def get_optional_session(
+        credentials: HTTPAuthorizationCredentials =
+        fastapi.Depends(bearer_scheme)) -> Optional[dict]:
+    """Returns the claims of the bearer token of a request, or None if
+        the request has no valid token.
+    """
+    if credentials is None:
+        return None
+    try:
+        return api_session_tokens.verify_token(credentials.credentials)
+    except api_session_tokens.InvalidSessionToken:
+        return None
+
+
+def require_admin_session(
+        session: dict = fastapi.Depends(require_session)) -> dict:
+    """Verifies that the bearer token belongs to an admin.
+
+        Raises:
+            HTTPException: 403 if the user is not an admin.
+    """
+    if not session.get("adm", False):
+        raise fastapi.HTTPException(status_code=403,
+                                    detail="Admin rights required")
+    return session
+
+
+def check_user_access(session: dict, user_id: str) -> None:
+    """Allows access to a user only to that user and to admins.
+
+        Raises:
+            HTTPException: 403 if the session belongs to another user.
+    """
+    if session["sub"] != user_id and not session.get("adm", False):
+        raise fastapi.HTTPException(status_code=403,
+                                    detail="Access to this user is denied")
+
+
+def saturated_response(exception: Exception) -> JSONResponse:
+    """Builds the response returned when the password pool or the view
+    buffer is full."""
+    return JSONResponse(
+        {
+            "message": str(exception),
+            "code": 503,
+            "result": False
+        },
+        status_code=503,
+        headers={"Retry-After": "1"}
+    )
+
+
+def rate_limited_response(
+        exception: api_rate_limiting.RateLimited) -> JSONResponse:
+    """Builds the response returned to a rate limited request."""
+    headers = {}
+    if exception.retry_after is not None:
+        headers["Retry-After"] = str(max(1, math.ceil(exception.retry_after)))
+    return JSONResponse(
+        {
+            "message": str(exception),
+            "code": 429,
+            "result": False
+        },
+        status_code=429,
+        headers=headers
+    )
+
+
 @app.get("/", include_in_schema=False)
 def redirect_to_docs():
     """Redirect to the API documentation."""
@@ -24,7 +233,8 @@ def redirect_to_docs():
 
 
 @app.post(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.CREATE],
-          tags=[esIndexes.INDEXES[Entity.ARTICLE]])
+          tags=[esIndexes.INDEXES[Entity.ARTICLE]],
+          dependencies=[fastapi.Depends(require_session)])
 async def create_article(request: api_req_cls.CreateArticleRequest) \
         -> JSONResponse:
     """Adds a new article instance to the database.
@@ -50,7 +260,8 @@ async def create_article(request: api_req_cls.CreateArticleRequest) \
 
 
 @app.put(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.UPDATE],
-         tags=[esIndexes.INDEXES[Entity.ARTICLE]])
+         tags=[esIndexes.INDEXES[Entity.ARTICLE]],
+         dependencies=[fastapi.Depends(require_session)])
 async def update_article(request: api_req_cls.UpdateArticleRequest) \
         -> JSONResponse:
     """Updates an article instance in the database.
@@ -75,7 +286,8 @@ async def update_article(request: api_req_cls.UpdateArticleRequest) \
 
 
 @app.delete(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.DELETE],
-            tags=[esIndexes.INDEXES[Entity.ARTICLE]])
+            tags=[esIndexes.INDEXES[Entity.ARTICLE]],
+            dependencies=[fastapi.Depends(require_admin_session)])
 async def delete_article(article_id: str) -> JSONResponse:
     """Deletes an article instance from the database.
 
@@ -94,7 +306,8 @@ async def delete_article(article_id: str) -> JSONResponse:
 
 
 @app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.GET],
-         tags=[esIndexes.INDEXES[Entity.ARTICLE]])
+         tags=[esIndexes.INDEXES[Entity.ARTICLE]],
+         dependencies=[fastapi.Depends(require_session)])
 async def get_article(article_id: str) -> JSONResponse:
     """Retrieves an article instance from the database.
 
@@ -114,10 +327,18 @@ async def get_article(article_id: str) -> JSONResponse:
 
 
 @app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.GET_ALL],
-            tags=[esIndexes.INDEXES[Entity.ARTICLE]])
-async def get_all_articles() -> JSONResponse:
+            tags=[esIndexes.INDEXES[Entity.ARTICLE]],
+            dependencies=[fastapi.Depends(require_session)])
+async def get_all_articles(date_from: Optional[str] = None,
+                           date_to: Optional[str] = None) -> JSONResponse:
     """Retrieves all article instances from the database.
 
+        Args:
+            date_from(str): Only articles published on or after this
+                            date (YYYY-MM-DD).
+            date_to(str): Only articles published on or before this
+                          date (YYYY-MM-DD).
+
         Returns:
             articles_info(dict): The information of all articles.
             message(str): a message that contains information about
@@ -126,14 +347,18 @@ async def get_all_articles() -> JSONResponse:
             result(bool): the result of the operation.
 
     """
-    response = api_helpers.get_all_articles()
+    response = api_helpers.get_all_articles(date_from, date_to)
     return JSONResponse(response)
 
 
 @app.post(acceptedOps.ROUTES[Entity.USER][acceptedOps.CREATE],
           tags=[esIndexes.INDEXES[Entity.USER]])
-async def create_user(request: api_req_cls.CreateUserRequest) -> JSONResponse:
-    """Adds a new user instance to the database.
+async def create_user(request: api_req_cls.CreateUserRequest,
+                      session: Optional[dict] =
+                      fastapi.Depends(get_optional_session)) -> JSONResponse:
+    """Adds a new user instance to the database. Only an admin can
+        create another admin; the users registering themselves are
+        created without admin rights.
 
         Args:
             request (dict):
@@ -157,13 +382,21 @@ async def create_user(request: api_req_cls.CreateUserRequest) -> JSONResponse:
                          successful.
 
     """
-    response = api_helpers.create_user(request)
+    if request.user_info.is_admin and not (session or {}).get("adm", False):
+        request.user_info.is_admin = False
+    try:
+        response = await api_password_pool.PASSWORD_POOL.run(
+            api_helpers.create_user, request)
+    except api_password_pool.PasswordPoolSaturated as exception:
+        return saturated_response(exception)
     return JSONResponse(response)
 
 
 @app.put(acceptedOps.ROUTES[Entity.USER][acceptedOps.UPDATE],
          tags=[esIndexes.INDEXES[Entity.USER]])
-async def update_user(request: api_req_cls.UpdateUserRequest) -> JSONResponse:
+async def update_user(request: api_req_cls.UpdateUserRequest,
+                      session: dict = fastapi.Depends(require_session)) \
+        -> JSONResponse:
     """Updates a user instance in the database.
 
         Args:
@@ -178,21 +411,33 @@ async def update_user(request: api_req_cls.UpdateUserRequest) -> JSONResponse:
                     viewed_articles(List[str]): The user's viewed articles.
                     liked_articles(List[str]): The liked articles of the user.
                     is_admin(bool): The admin status of the user.
+                if_seq_no(int): The sequence number the user was read at.
+                if_primary_term(int): The primary term the user was
+                                      read at.
 
         Returns:
             message(str): a message that contains information about
                           the operation.
-            code(int): the result code of the operation.
+            code(int): the result code of the operation, 409 if the
+                       user was modified since it was read.
             result(bool): the result of the operation.
+            seq_no(int): the sequence number of the updated user.
+            primary_term(int): the primary term of the updated user.
 
     """
+    check_user_access(session, request.user_id)
+    if request.user_info.is_admin and not session.get("adm", False):
+        raise fastapi.HTTPException(status_code=403,
+                                    detail="Admin rights required")
     response = api_helpers.update_user(request)
     return JSONResponse(response)
 
 
 @app.delete(acceptedOps.ROUTES[Entity.USER][acceptedOps.DELETE],
             tags=[esIndexes.INDEXES[Entity.USER]])
-async def delete_user(user_id: str) -> JSONResponse:
+async def delete_user(user_id: str,
+                      session: dict = fastapi.Depends(require_session)) \
+        -> JSONResponse:
     """Deletes a user instance from the database.
 
         Args:
@@ -205,13 +450,16 @@ async def delete_user(user_id: str) -> JSONResponse:
             result(bool): the result of the operation.
 
     """
+    check_user_access(session, user_id)
     response = api_helpers.delete_user(user_id)
     return JSONResponse(response)
 
 
 @app.get(acceptedOps.ROUTES[Entity.USER][acceptedOps.GET],
          tags=[esIndexes.INDEXES[Entity.USER]])
-async def get_user(user_id: str) -> JSONResponse:
+async def get_user(user_id: str,
+                   session: dict = fastapi.Depends(require_session)) \
+        -> JSONResponse:
     """Retrieves a user instance from the database.
 
         Args:
@@ -219,18 +467,66 @@ async def get_user(user_id: str) -> JSONResponse:
 
         Returns:
             user_info(dict): The information of the user.
+            seq_no(int): The sequence number of the user document.
+            primary_term(int): The primary term of the user document.
             message(str): a message that contains information about
                           the operation.
             code(int): the result code of the operation.
             result(bool): the result of the operation.
 
     """
+    check_user_access(session, user_id)
     response = api_helpers.get_user(user_id)
     return JSONResponse(response)
 
 
+@app.post(acceptedOps.ROUTES[Entity.USER][acceptedOps.VIEWS],
+          tags=[esIndexes.INDEXES[Entity.USER]])
+async def record_views(request: api_req_cls.RecordViewsRequest,
+                       session: dict = fastapi.Depends(require_session)) \
+        -> JSONResponse:
+    """Records the articles viewed by a user.
+
+        The views are buffered and written to the user in the background,
+        in bulk with the views of other users; reads of the user include
+        them right away.
+
+        Args:
+            request (dict):
+                user_id(str): The id of the user.
+                article_ids(List[str]): The ids of the viewed articles.
+
+        Returns:
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation, 202 once the
+                       views are buffered, 503 if the buffer is full.
+            result(bool): the result of the operation.
+            buffered(int): the number of new views, the others were
+                           already waiting.
+
+    """
+    check_user_access(session, request.user_id)
+    try:
+        buffered = api_view_buffer.VIEW_BUFFER.record(request.user_id,
+                                                      request.article_ids)
+    except api_view_buffer.ViewBufferFull as exception:
+        return saturated_response(exception)
+    return JSONResponse(
+        {
+            "message": f"Recorded {len(request.article_ids)} views of user"
+                       f" {request.user_id}",
+            "code": 202,
+            "result": True,
+            "buffered": buffered
+        },
+        status_code=202
+    )
+
+
 @app.get(acceptedOps.ROUTES[Entity.USER][acceptedOps.GET_ALL],
-         tags=[esIndexes.INDEXES[Entity.USER]])
+         tags=[esIndexes.INDEXES[Entity.USER]],
+         dependencies=[fastapi.Depends(require_admin_session)])
 async def get_all_users() -> JSONResponse:
     """Retrieves all user instances from the database.
 
@@ -253,17 +549,52 @@ async def login(username: str, password: str) -> JSONResponse:
 
         Returns:
             user_info(dict): The information of the user.
+            access_token(str): Signed token to be sent as
+                               "Authorization: Bearer <token>".
+            refresh_token(str): Token used to get new session tokens.
+            token_type(str): The authorization scheme of the tokens.
+            expires_in(int): The lifetime of the access token in seconds.
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation.
+            result(bool): the result of the operation.
+
+    """
+    try:
+        response = await api_password_pool.PASSWORD_POOL.run(
+            api_helpers.login, username, password)
+    except api_password_pool.PasswordPoolSaturated as exception:
+        return saturated_response(exception)
+    return JSONResponse(response)
+
+
+@app.post(acceptedOps.ROUTES[Entity.USER][acceptedOps.REFRESH],
+          tags=[esIndexes.INDEXES[Entity.USER]])
+async def refresh_session(request: api_req_cls.RefreshSessionRequest) \
+        -> JSONResponse:
+    """Exchanges a refresh token for new session tokens.
+
+        Args:
+            request (dict):
+                refresh_token(str): The refresh token received at login.
+
+        Returns:
+            access_token(str): The new access token.
+            refresh_token(str): The new refresh token.
+            token_type(str): The authorization scheme of the tokens.
+            expires_in(int): The lifetime of the access token in seconds.
             message(str): a message that contains information about
                           the operation.
             code(int): the result code of the operation.
             result(bool): the result of the operation.
 
     """
-    response = api_helpers.login(username, password)
+    response = api_helpers.refresh_session(request.refresh_token)
     return JSONResponse(response)
 
 
-@app.post(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.SEARCH], tags=["search"])
+@app.post(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.SEARCH], tags=["search"],
+          dependencies=[fastapi.Depends(require_session)])
 async def search_articles(request: api_req_cls.SearchArticlesRequest) -> JSONResponse:
     """Searches articles through OpenAI API and Google Search API.
 
@@ -275,7 +606,14 @@ async def search_articles(request: api_req_cls.SearchArticlesRequest) -> JSONRes
                 language(str): The language of the articles.
                 min_keywords(int): The minimum number of keywords.
                 num_results(int): The number of results.
-                date(str): The date of the articles.
+                date(str): The earliest publication date of the articles.
+                date_to(str): The latest publication date of the articles.
+                mode(str): local, external or hybrid (default); hybrid
+                           searches the stored articles first and calls
+                           OpenAI and Google only for missing results.
+                query_mode(str): template (default) builds the Google
+                                 query from the keywords, llm asks
+                                 OpenAI to compose it.
 
         Returns:
             articles_info(dict): The information of the articles.
@@ -288,12 +626,77 @@ async def search_articles(request: api_req_cls.SearchArticlesRequest) -> JSONRes
     response = api_helpers.handle_article_search(
         request.important_keywords, request.relevant_keywords,
         request.irrelevant_keywords, request.language, request.min_keywords,
-        request.num_results, request.date
+        request.num_results, request.date, request.date_to, request.mode,
+        request.query_mode
+    )
+    return JSONResponse(response)
+
+
+@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.QUERY], tags=["search"],
+         dependencies=[fastapi.Depends(require_session)])
+async def query_articles(request: api_req_cls.SearchArticlesRequest) -> JSONResponse:
+    """Searches the stored articles, without calling external services.
+
+        Args:
+            request (dict):
+                important_keywords(List[str]): Keywords that must match.
+                relevant_keywords(List[str]): Keywords that should match.
+                irrelevant_keywords(List[str]): Keywords that must not
+                                                match.
+                language(str): The language of the articles.
+                min_keywords(int): The minimum number of matching keywords.
+                num_results(int): The number of results per page.
+                date(str): The earliest publication date of the articles.
+                date_to(str): The latest publication date of the articles.
+                search_after(list): The cursor of the next page, as
+                                    returned by the previous page.
+
+        Returns:
+            articles(List[dict]): The articles, with their score and
+                                  highlighted fragments.
+            search_after(list): The cursor of the next page.
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation.
+            result(bool): the result of the operation.
+
+    """
+    response = api_helpers.handle_local_article_search(
+        request.important_keywords, request.relevant_keywords,
+        request.irrelevant_keywords, request.language, request.min_keywords,
+        request.num_results, request.date, request.date_to,
+        request.search_after
     )
     return JSONResponse(response)
 
 
-@app.post(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.RECOMMENDATION], tags=["recommendation"])
+@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.AUTOCOMPLETE],
+         tags=["search"],
+         dependencies=[fastapi.Depends(require_session)])
+async def autocomplete_keywords(
+        prefix: str,
+        limit: int = config_info.AUTOCOMPLETE_TOP_SIZE) -> JSONResponse:
+    """Suggests known keywords for the text typed by a user.
+
+        Args:
+            prefix(str): The text typed so far.
+            limit(int): The maximum number of suggestions.
+
+        Returns:
+            suggestions(List[dict]): The keywords starting with the
+                                     prefix, most frequent first.
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation.
+            result(bool): the result of the operation.
+
+    """
+    response = api_helpers.autocomplete_keywords(prefix, limit)
+    return JSONResponse(response)
+
+
+@app.post(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.RECOMMENDATION], tags=["recommendation"],
+          dependencies=[fastapi.Depends(require_session)])
 async def get_recommendation(request: api_req_cls.GetRecommendationsRequest) -> JSONResponse:
     """Gets recommendations for a user.
 
@@ -302,6 +705,9 @@ async def get_recommendation(request: api_req_cls.GetRecommendationsRequest) ->
                 keywords(List[str]): The keywords.
                 language(str): The language of the articles.
                 date(str): The date of the articles.
+                query_mode(str): template (default) builds the Google
+                                 query from the keywords, llm asks
+                                 OpenAI to compose it.
         Returns:
             articles_info(dict): The information of the articles.
             message(str): a message that contains information about
@@ -310,18 +716,23 @@ async def get_recommendation(request: api_req_cls.GetRecommendationsRequest) ->
             result(bool): the result of the operation.
     """
     response = api_helpers.handle_recommandation_search(
-        request.keywords, request.language, request.date
+        request.keywords, request.language, request.date,
+        request.query_mode
     )
     return JSONResponse(response)
 
 
-@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.KEYWORDS], tags=["keywords"])
+@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.KEYWORDS], tags=["keywords"],
+         dependencies=[fastapi.Depends(require_session)])
 async def generate_keywords(request: api_req_cls.GetKeywordsRequest) -> JSONResponse:
     """Generates keywords for a user input.
 
         Args:
             user_input(str): The user input.
             language(str): The language of the keywords.
+            mode(str): local (default) extracts the keywords without
+                       calling OpenAI, llm asks GPT for them and hybrid
+                       asks GPT to refine the local keywords.
 
         Returns:
             keywords(List[str]): The generated keywords.
@@ -332,16 +743,48 @@ async def generate_keywords(request: api_req_cls.GetKeywordsRequest) -> JSONResp
             :param request:
 
     """
-    response = api_helpers.handle_keywords_generation(request.user_input, request.language)
+    response = api_helpers.handle_keywords_generation(
+        request.user_input, request.language, request.mode)
     return JSONResponse(response)
 
 
-@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.CATEGORIES], tags=["categories"])
+@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.KEYWORDS_STREAM], tags=["keywords"],
+         dependencies=[fastapi.Depends(require_session)])
+def stream_keywords(
+        user_input: str, language: str,
+        mode: str = config_info.KeywordModes.LOCAL) -> StreamingResponse:
+    """Streams the keywords of a user input as server-sent events.
+
+        Args:
+            user_input(str): The user input.
+            language(str): The language of the keywords.
+            mode(str): local (default), llm or hybrid, as for the
+                       keywords route. In llm mode every keyword is sent
+                       as soon as GPT has generated it.
+
+        Returns:
+            A text/event-stream with a data: {"keyword": ...} event for
+            every keyword and a final "done" event with their count.
+
+    """
+    return StreamingResponse(
+        api_helpers.stream_keywords_events(user_input, language, mode),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.CATEGORIES], tags=["categories"],
+         dependencies=[fastapi.Depends(require_session)])
 async def get_categories(request: api_req_cls.GetCategoriesRequest) -> JSONResponse:
     """Gets categories for a list of keywords.
 
         Args:
             keywords(List[str]): The keywords.
+            mode(str): local (default) groups the keywords by their
+                       co-occurrence in the stored articles, llm asks GPT
+                       for the categories and hybrid asks GPT to name
+                       the local groups.
 
         Returns:
             categories(dict): The categories.
@@ -352,10 +795,143 @@ async def get_categories(request: api_req_cls.GetCategoriesRequest) -> JSONRespo
             :param request:
 
     """
-    response = api_helpers.handle_keywords_categorization(request.keywords)
+    response = api_helpers.handle_keywords_categorization(
+        request.keywords, request.mode)
     return JSONResponse(response)
 
 
+@app.post(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.CATEGORIES_BATCH],
+          tags=["categories"],
+          dependencies=[fastapi.Depends(require_admin_session)])
+async def get_categories_batch(request: api_req_cls.GetCategoriesBatchRequest) \
+        -> JSONResponse:
+    """Gets categories for many keyword sets, e.g. the interests of
+    many users, with as few OpenAI requests as possible.
+
+        Args:
+            request (dict):
+                keyword_sets(List[dict]):
+                    id(str): The id of the keyword set.
+                    keywords(List[str]): The keywords.
+
+        Returns:
+            categories(dict): The categories of every keyword set, by id.
+            failed(List[str]): The ids that could not be categorized.
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation.
+            result(bool): false if any keyword set failed.
+
+    """
+    response = api_helpers.handle_batch_categorization(
+        request.keyword_sets)
+    return JSONResponse(response)
+
+
+@app.get(acceptedOps.ROUTES[Entity.ARTICLE][acceptedOps.GPT_USAGE],
+         tags=["keywords"],
+         dependencies=[fastapi.Depends(require_admin_session)])
+async def get_gpt_usage() -> JSONResponse:
+    """Reports the OpenAI token usage since startup.
+
+        Returns:
+            usage(dict): For every call type: the prompt version, the
+                         number of calls, retries and failures, the
+                         prompt and completion tokens (total and per
+                         call) and the 95th percentile duration.
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation.
+            result(bool): the result of the operation.
+
+    """
+    response = {
+        "message": "Successfully retrieved the GPT usage",
+        "code": 200,
+        "result": True,
+        "usage": api_gpt.get_token_usage()
+    }
+    return JSONResponse(response)
+
+
+@app.get(config_info.METRICS_ROUTE, tags=["metrics"],
+         include_in_schema=False)
+def get_metrics() -> PlainTextResponse:
+    """Exposes the metrics of the service in the Prometheus text format."""
+    return PlainTextResponse(metrics.render_metrics(),
+                             media_type="text/plain; version=0.0.4")
+
+
+@app.get(config_info.DEBUG_TRACES_ROUTE, tags=["metrics"],
+         include_in_schema=False,
+         dependencies=[fastapi.Depends(require_admin_session)])
+def get_traces(limit: int = config_info.DEBUG_TRACES_SHOWN,
+               output_format: str = "html"):
+    """Shows the slowest recent requests as waterfalls of their spans.
+
+        Args:
+            limit(int): The number of traces shown.
+            output_format(str): html (default) or json.
+
+        Returns:
+            The HTML page, or the spans of every trace as JSON.
+    """
+    traces = tracing.RING_BUFFER.get_slowest_traces(limit)
+    if output_format == "json":
+        return JSONResponse({
+            "message": "Successfully retrieved the traces",
+            "code": 200,
+            "result": True,
+            "traces": traces
+        })
+    return HTMLResponse(api_trace_viewer.render_traces_page(traces))
+
+
+@app.get(config_info.DEBUG_PROFILES_ROUTE, tags=["metrics"],
+         include_in_schema=False,
+         dependencies=[fastapi.Depends(require_admin_session)])
+async def get_profiles() -> JSONResponse:
+    """Lists the stored request profiles, newest first.
+
+        Returns:
+            profiles(List[dict]): The name, size in bytes and creation
+                                  time of every profile.
+            message(str): a message that contains information about
+                          the operation.
+            code(int): the result code of the operation.
+            result(bool): the result of the operation.
+    """
+    response = {
+        "message": "Successfully retrieved the profiles",
+        "code": 200,
+        "result": True,
+        "profiles": api_profiling.PROFILE_STORE.list_profiles()
+    }
+    return JSONResponse(response)
+
+
+@app.get(f"{config_info.DEBUG_PROFILES_ROUTE}/{{profile_name}}",
+         tags=["metrics"], include_in_schema=False,
+         dependencies=[fastapi.Depends(require_admin_session)])
+async def get_profile(profile_name: str):
+    """Downloads a stored request profile.
+
+        Args:
+            profile_name(str): The name listed by /debug/profiles.
+
+        Returns:
+            The collapsed stacks or pstats file.
+    """
+    path = api_profiling.PROFILE_STORE.get_path(profile_name)
+    if path is None:
+        return JSONResponse({
+            "message": f"Profile {profile_name} not found",
+            "code": 404,
+            "result": False
+        }, status_code=404)
+    return FileResponse(path, filename=profile_name)
+
+
 if __name__ == "__main__":
     uvicorn.run(
         app=config_info.API_APP,
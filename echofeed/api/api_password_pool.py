@@ -0,0 +1,124 @@
+"""
+Bounded executor used by the API service to run the helpers that hash
+or verify passwords, so bcrypt never runs on the event loop.
+"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from echofeed.common import config_info, metrics
+
+logger = config_info.get_logger(__name__)
+
+
+class PasswordPoolSaturated(Exception):
+    """
+    Raised when the password hashing queue is full and the call is
+    rejected instead of waiting.
+    """
+
+
+class PasswordHashingPool:
+    """
+    Thread pool with a bounded queue for the password hashing helpers.
+    bcrypt releases the GIL while hashing, so the workers run in
+    parallel with each other and with the event loop.
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="echofeed-password"
+        )
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._stats = {
+            "queued": 0,
+            "running": 0,
+            "completed": 0,
+            "rejected": 0
+        }
+
+    async def run(self, func, *args, **kwargs):
+        """
+        Runs a function in the pool and waits for its result without
+        blocking the event loop.
+
+        Args:
+            func (callable): The function to run.
+            *args: Positional arguments of the function.
+            **kwargs: Keyword arguments of the function.
+
+        Returns:
+            The result of the function.
+
+        Raises:
+            PasswordPoolSaturated: if all workers are busy and the
+                                   queue is full.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self._stats["rejected"] += 1
+            logger.warning("Password hashing queue is full, rejecting call")
+            raise PasswordPoolSaturated(
+                "Too many concurrent login or registration requests,"
+                " please try again"
+            )
+
+        with self._lock:
+            self._stats["queued"] += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor,
+                functools.partial(self._execute, func, args, kwargs)
+            )
+        finally:
+            self._slots.release()
+
+    def _execute(self, func, args, kwargs):
+        """
+        Runs a function on a worker thread, keeping the queue counters.
+        """
+        with self._lock:
+            self._stats["queued"] -= 1
+            self._stats["running"] += 1
+        try:
+            return func(*args, **kwargs)
+        finally:
+            with self._lock:
+                self._stats["running"] -= 1
+                self._stats["completed"] += 1
+
+    def get_stats(self) -> dict:
+        """
+        Returns the queue depth and the counters of the pool.
+
+        Returns:
+            queued(int): calls waiting for a worker.
+            running(int): calls currently running.
+            completed(int): calls finished since startup.
+            rejected(int): calls rejected because the queue was full.
+            max_workers(int): the number of workers.
+            max_queue(int): the maximum number of waiting calls.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        stats.update({
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue
+        })
+        return stats
+
+
+PASSWORD_POOL = PasswordHashingPool(
+    max_workers=config_info.PASSWORD_HASHING_WORKERS,
+    max_queue=config_info.PASSWORD_HASHING_MAX_QUEUE
+)
+metrics.PASSWORD_POOL_CALLS.set_function(lambda: {
+    (state,): value for state, value in PASSWORD_POOL.get_stats().items()
+    if state in ("queued", "running", "completed", "rejected")
+})
@@ -0,0 +1,226 @@
+"""
+On-demand profiling of single API requests.
+
+An admin adds the X-Profile header (or the profile query parameter) to a
+request, with the value sampling or cprofile. The sampling profiler reads
+the stack of the thread handling the request every
+PROFILE_SAMPLE_INTERVAL_SECONDS and writes collapsed stacks, which
+speedscope and flamegraph.pl open directly. The cprofile mode records
+every call and writes a pstats file. Requests without the flag are not
+touched.
+
+The endpoints run their helpers on the event loop thread, so that thread
+is the one profiled; other requests handled concurrently show up in the
+profile too. Only one request is profiled at a time.
+"""
+import cProfile
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from typing import List, Optional
+
+import fastapi
+
+from echofeed.api import api_session_tokens
+from echofeed.common import config_info
+from echofeed.common.config_info import ProfilerModes
+
+PROFILE_HEADER = "X-Profile"
+PROFILE_QUERY_PARAMETER = "profile"
+PROFILE_ID_HEADER = "X-Profile-Id"
+PROFILE_EXTENSIONS = {
+    ProfilerModes.SAMPLING: "collapsed",
+    ProfilerModes.CPROFILE: "pstats"
+}
+PROFILE_NAME_PATTERN = re.compile(r"^[\w.-]+\.(collapsed|pstats)$")
+
+logger = config_info.get_logger(__name__)
+
+_PROFILING_LOCK = threading.Lock()
+
+
+def get_requested_mode(request: fastapi.Request) -> Optional[str]:
+    """
+    Returns the profiler mode asked for by a request, None if none.
+    """
+    mode = (request.headers.get(PROFILE_HEADER)
+            or request.query_params.get(PROFILE_QUERY_PARAMETER))
+    return mode if mode in PROFILE_EXTENSIONS else None
+
+
+def is_admin_request(request: fastapi.Request) -> bool:
+    """
+    Checks if a request carries the access token of an admin.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    try:
+        claims = api_session_tokens.verify_token(token)
+    except api_session_tokens.InvalidSessionToken:
+        return False
+    return bool(claims.get("adm"))
+
+
+def format_frame(frame) -> str:
+    """
+    Returns the name of a stack frame, e.g. search_entities
+    (es_interactions_helpers.py:312).
+    """
+    code = frame.f_code
+    return (f"{code.co_name} ({os.path.basename(code.co_filename)}"
+            f":{code.co_firstlineno})")
+
+
+def collapse_stack(frame) -> str:
+    """
+    Returns a stack as a collapsed line, outermost frame first.
+    """
+    names = []
+    while frame is not None:
+        names.append(format_frame(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of a thread from a background thread and counts
+    the identical stacks.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._sample,
+                                        name="echofeed-profiler",
+                                        daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.samples[collapse_stack(frame)] += 1
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def to_collapsed(self) -> str:
+        """
+        Returns the samples in the collapsed stacks format, one
+        "frame;frame;frame count" line per distinct stack.
+        """
+        return "".join(f"{stack} {count}\n"
+                       for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """
+    Directory of the recorded profiles, keeping the newest max_files.
+    """
+
+    def __init__(self, directory: str, max_files: int):
+        self.directory = directory
+        self.max_files = max_files
+
+    def new_path(self, request: fastapi.Request, mode: str) -> str:
+        """
+        Returns the path of a new profile, named after the time and the
+        request, e.g. 20240501-101500-123-POST-api-v1-articles-search.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+        timestamp = (time.strftime("%Y%m%d-%H%M%S", time.localtime(now))
+                     + f"-{int(now * 1000) % 1000:03d}")
+        path_name = re.sub(r"[^\w]+", "-", request.url.path).strip("-")
+        name = (f"{timestamp}-{request.method}-{path_name}"
+                f".{PROFILE_EXTENSIONS[mode]}")
+        return os.path.join(self.directory, name)
+
+    def prune(self) -> None:
+        """
+        Removes the oldest profiles above max_files.
+        """
+        for profile in self.list_profiles()[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.directory, profile["name"]))
+            except OSError:
+                pass
+
+    def list_profiles(self) -> List[dict]:
+        """
+        Returns the name, size and creation time of the stored profiles,
+        newest first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        profiles = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and PROFILE_NAME_PATTERN.match(entry.name):
+                stat = entry.stat()
+                profiles.append({"name": entry.name, "size": stat.st_size,
+                                 "created_at": stat.st_mtime})
+        return sorted(profiles, key=lambda profile: profile["created_at"],
+                      reverse=True)
+
+    def get_path(self, name: str) -> Optional[str]:
+        """
+        Returns the path of a stored profile, None for unknown names.
+        """
+        if not PROFILE_NAME_PATTERN.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+
+PROFILE_STORE = ProfileStore(config_info.PROFILES_DIRECTORY,
+                             config_info.PROFILES_MAX_FILES)
+
+
+async def profile_request(request: fastapi.Request, call_next, mode: str):
+    """
+    Handles a request under the profiler of the given mode and stores
+    the profile. The name of the profile is returned in the X-Profile-Id
+    header. When another request is being profiled, the request is
+    handled normally.
+    """
+    if not _PROFILING_LOCK.acquire(blocking=False):
+        return await call_next(request)
+    try:
+        path = PROFILE_STORE.new_path(request, mode)
+        if mode == ProfilerModes.CPROFILE:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.disable()
+            profiler.dump_stats(path)
+        else:
+            profiler = SamplingProfiler(
+                threading.get_ident(),
+                config_info.PROFILE_SAMPLE_INTERVAL_SECONDS)
+            profiler.start()
+            try:
+                response = await call_next(request)
+            finally:
+                profiler.stop()
+            with open(path, "w", encoding="utf-8") as profile_file:
+                profile_file.write(profiler.to_collapsed())
+        PROFILE_STORE.prune()
+    finally:
+        _PROFILING_LOCK.release()
+
+    logger.info("Profiled %s %s into %s", request.method, request.url.path,
+                path)
+    response.headers[PROFILE_ID_HEADER] = os.path.basename(path)
+    return response
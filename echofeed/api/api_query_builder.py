@@ -0,0 +1,132 @@
+"""
+Deterministic builder of the Google search queries, used instead of
+asking GPT to compose them.
+
+Important keywords are quoted, so they must appear in the results,
+relevant keywords form an OR group, irrelevant keywords are excluded
+with -"keyword" and the dates become after: and before: operators.
+The language is not part of the query; it is sent to the Custom Search
+API as the lr parameter.
+"""
+from typing import List, Optional
+
+from echofeed.common.keyword_normalization import clean_keyword, fold_keyword
+
+LANGUAGE_RESTRICTS = {
+    "English": "lang_en",
+    "Romanian": "lang_ro"
+}
+
+# keywords used above min_keywords, as GPT was asked to do
+EXTRA_KEYWORDS = 2
+
+
+def get_language_restrict(language: Optional[str]) -> Optional[str]:
+    """
+    Returns the lr parameter of the Custom Search API for a language.
+    """
+    return LANGUAGE_RESTRICTS.get(language)
+
+
+def quote_keyword(keyword: str) -> str:
+    """
+    Quotes a keyword, removing the characters with a meaning in Google
+    queries.
+    """
+    return f'"{clean_keyword(keyword)}"'
+
+
+def unique_keywords(keywords: List[str], excluded_keys: set) -> List[str]:
+    """
+    Returns the non-empty keywords whose key is not excluded, without
+    duplicates. The keys of the returned keywords are added to
+    excluded_keys. Only the case and diacritics are folded, as the
+    quoted terms are matched exactly by Google and a stemmed key would
+    drop distinct terms like "price" and "prices".
+    """
+    result = []
+    for keyword in keywords or []:
+        key = fold_keyword(keyword)
+        if key and key not in excluded_keys:
+            excluded_keys.add(key)
+            result.append(keyword)
+    return result
+
+
+def build_date_operators(date: Optional[str] = None,
+                         date_to: Optional[str] = None) -> List[str]:
+    """
+    Returns the after: and before: operators of a date range.
+    """
+    operators = []
+    if date:
+        operators.append(f"after:{date}")
+    if date_to:
+        operators.append(f"before:{date_to}")
+    return operators
+
+
+def build_search_query(important_keywords: List[str],
+                       relevant_keywords: List[str],
+                       irrelevant_keywords: List[str],
+                       min_keywords: int = 0,
+                       date: Optional[str] = None,
+                       date_to: Optional[str] = None) -> str:
+    """
+    Builds the Google query of an article search.
+
+    All important keywords are used. Relevant keywords are added to the
+    OR group until min_keywords + EXTRA_KEYWORDS keywords are used, but
+    at least one is added when there are no important keywords.
+
+    Args:
+        important_keywords (List[str]): Keywords that must appear.
+        relevant_keywords (List[str]): Keywords of which one should
+                                       appear.
+        irrelevant_keywords (List[str]): Keywords that must not appear.
+        min_keywords (int): The minimum number of keywords to use.
+        date (str): The earliest publication date (YYYY-MM-DD).
+        date_to (str): The latest publication date (YYYY-MM-DD).
+
+    Returns:
+        str: The query, e.g. '"inflation" ("euro" OR "ECB") -"sport"
+             after:2024-01-01'.
+    """
+    used_keys = set()
+    important_keywords = unique_keywords(important_keywords, used_keys)
+    relevant_keywords = unique_keywords(relevant_keywords, used_keys)
+    irrelevant_keywords = unique_keywords(irrelevant_keywords, used_keys)
+
+    max_relevant = int(min_keywords or 0) + EXTRA_KEYWORDS \
+        - len(important_keywords)
+    if not important_keywords:
+        max_relevant = max(max_relevant, 1)
+    relevant_keywords = relevant_keywords[:max(max_relevant, 0)]
+
+    terms = [quote_keyword(keyword) for keyword in important_keywords]
+    if len(relevant_keywords) == 1:
+        terms.append(quote_keyword(relevant_keywords[0]))
+    elif relevant_keywords:
+        terms.append("(" + " OR ".join(quote_keyword(keyword)
+                                        for keyword in relevant_keywords)
+                     + ")")
+    terms.extend(f"-{quote_keyword(keyword)}"
+                 for keyword in irrelevant_keywords)
+    terms.extend(build_date_operators(date, date_to))
+    return " ".join(terms)
+
+
+def build_recommendation_query(keywords: List[str],
+                               date: Optional[str] = None) -> str:
+    """
+    Builds the Google query of the recommendations: articles about any
+    of the keywords, published after a date.
+
+    Args:
+        keywords (List[str]): The keywords of a category of interests.
+        date (str): The earliest publication date (YYYY-MM-DD).
+
+    Returns:
+        str: The query.
+    """
+    return build_search_query([], keywords, [], len(keywords), date)
@@ -0,0 +1,363 @@
+"""
+Rate limiting and admission control of the expensive endpoints of the
+API service, the ones calling OpenAI or Google Custom Search.
+
+Every expensive request costs tokens (RATE_LIMIT_COSTS) from the token
+bucket of the user of its session token, or from the bucket of its
+client IP when it has no valid token. Authenticated requests are not
+limited by IP, as the UI sends the requests of all its users from its
+own host. A request finding its bucket short of tokens is rejected with
+a 429 and a Retry-After header telling when the tokens will be there.
+The admitted requests then take one of EXPENSIVE_MAX_CONCURRENT slots
+until their endpoint returns, waiting in a bounded queue while all of
+them are taken; a request rejected there gets its tokens back. The
+body of a streamed response is sent without a slot.
+
+The buckets are kept in memory, or in a SQLite database shared by the
+API workers when RATE_LIMIT_SQLITE_PATH is set.
+"""
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import fastapi
+from starlette.concurrency import run_in_threadpool
+
+from echofeed.api import api_session_tokens
+from echofeed.common import config_info, metrics
+from echofeed.common.config_info import AcceptedOperations as acceptedOps
+from echofeed.common.config_info import Entity
+
+logger = config_info.get_logger(__name__)
+
+# (key, tokens per second, burst) of the buckets a request takes from
+Bucket = Tuple[str, float, float]
+
+
+class RateLimited(Exception):
+    """
+    Raised when a request is over a rate limit or finds no free slot.
+    retry_after is None when the request costs more than a full bucket
+    and will never be admitted.
+    """
+
+    def __init__(self, message: str, retry_after: Optional[float],
+                 reason: str):
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.reason = reason
+
+
+def refill(tokens: float, updated_at: float, rate: float, burst: float,
+           now: float) -> float:
+    """
+    Returns the tokens of a bucket after refilling it since updated_at.
+    """
+    return min(burst, tokens + max(now - updated_at, 0.0) * rate)
+
+
+def take_tokens(levels: List[Tuple[Bucket, float]], cost: float) \
+        -> Tuple[float, Optional[str]]:
+    """
+    Decides whether cost tokens can be taken from every bucket, given
+    their refilled levels.
+
+    Returns:
+        tuple: 0 and None if the tokens can be taken, otherwise the
+               seconds until they can and the key of the bucket that
+               has to wait the longest.
+    """
+    wait, limiting_key = 0.0, None
+    for (key, rate, burst), tokens in levels:
+        if tokens >= cost:
+            continue
+        bucket_wait = math.inf if cost > burst or rate <= 0 \
+            else (cost - tokens) / rate
+        if bucket_wait > wait:
+            wait, limiting_key = bucket_wait, key
+    return wait, limiting_key
+
+
+class MemoryBucketStore:
+    """
+    Token buckets of a single API worker. The buckets unused for the
+    longest are dropped above max_buckets, so memory stays bounded; a
+    dropped bucket comes back full.
+    """
+    blocking = False
+
+    def __init__(self, max_buckets: int = 100000):
+        self.max_buckets = max_buckets
+        self._lock = threading.Lock()
+        # key -> (tokens, updated_at)
+        self._buckets = OrderedDict()
+
+    def take(self, buckets: List[Bucket], cost: float, now: float) \
+            -> Tuple[float, Optional[str]]:
+        """
+        Takes cost tokens from every bucket, or from none of them.
+
+        Returns:
+            tuple: see take_tokens.
+        """
+        with self._lock:
+            levels = []
+            for bucket in buckets:
+                key, rate, burst = bucket
+                tokens, updated_at = self._buckets.get(key, (burst, now))
+                levels.append((bucket, refill(tokens, updated_at, rate,
+                                              burst, now)))
+            wait, limiting_key = take_tokens(levels, cost)
+            if limiting_key is None:
+                for (key, _, _), tokens in levels:
+                    self._buckets[key] = (tokens - cost, now)
+                    self._buckets.move_to_end(key)
+                while len(self._buckets) > self.max_buckets:
+                    self._buckets.popitem(last=False)
+        return wait, limiting_key
+
+    def refund(self, buckets: List[Bucket], cost: float) -> None:
+        """
+        Gives back the tokens taken by a request that was not run.
+        """
+        with self._lock:
+            for key, _, burst in buckets:
+                if key in self._buckets:
+                    tokens, updated_at = self._buckets[key]
+                    self._buckets[key] = (min(burst, tokens + cost),
+                                          updated_at)
+
+
+class SQLiteBucketStore:
+    """
+    Token buckets in a SQLite database, shared by the API workers of a
+    host. Every take runs in one write transaction.
+    """
+    blocking = True
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            bucket_key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None,
+                                         check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA busy_timeout=1000")
+            connection.execute(self.SCHEMA)
+            self._local.connection = connection
+        return connection
+
+    def take(self, buckets: List[Bucket], cost: float, now: float) \
+            -> Tuple[float, Optional[str]]:
+        """
+        Takes cost tokens from every bucket, or from none of them.
+
+        Returns:
+            tuple: see take_tokens.
+        """
+        connection = self._connection()
+        placeholders = ", ".join("?" for _ in buckets)
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            stored = dict((key, (tokens, updated_at))
+                          for key, tokens, updated_at in connection.execute(
+                              f"SELECT bucket_key, tokens, updated_at"
+                              f" FROM rate_limit_buckets"
+                              f" WHERE bucket_key IN ({placeholders})",
+                              [key for key, _, _ in buckets]))
+            levels = []
+            for bucket in buckets:
+                key, rate, burst = bucket
+                tokens, updated_at = stored.get(key, (burst, now))
+                levels.append((bucket, refill(tokens, updated_at, rate,
+                                              burst, now)))
+            wait, limiting_key = take_tokens(levels, cost)
+            if limiting_key is None:
+                connection.executemany(
+                    "INSERT INTO rate_limit_buckets"
+                    " (bucket_key, tokens, updated_at) VALUES (?, ?, ?)"
+                    " ON CONFLICT (bucket_key) DO UPDATE SET"
+                    " tokens = excluded.tokens,"
+                    " updated_at = excluded.updated_at",
+                    [(key, tokens - cost, now)
+                     for (key, _, _), tokens in levels])
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return wait, limiting_key
+
+    def refund(self, buckets: List[Bucket], cost: float) -> None:
+        """
+        Gives back the tokens taken by a request that was not run.
+        """
+        self._connection().executemany(
+            "UPDATE rate_limit_buckets SET tokens = MIN(?, tokens + ?)"
+            " WHERE bucket_key = ?",
+            [(burst, cost, key) for key, _, burst in buckets])
+
+
+class AdmissionController:
+    """
+    Lets at most max_concurrent expensive requests run at once. The
+    others wait in a queue of at most max_queue requests, each for at
+    most queue_timeout_seconds; a request finding the queue full is
+    rejected at once.
+    """
+
+    def __init__(self, max_concurrent: int, max_queue: int,
+                 queue_timeout_seconds: float):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout_seconds = queue_timeout_seconds
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._stats = {"running": 0, "queued": 0}
+
+    async def acquire(self) -> None:
+        """
+        Takes a slot, waiting in the queue if needed.
+
+        Raises:
+            RateLimited: if the queue is full or the wait timed out.
+        """
+        if self._semaphore.locked():
+            if self._stats["queued"] >= self.max_queue:
+                raise RateLimited("Too many requests are waiting, please"
+                                  " try again", 1, "queue_full")
+            self._stats["queued"] += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(),
+                                       self.queue_timeout_seconds)
+            except asyncio.TimeoutError as exception:
+                raise RateLimited("The service is busy, please try again",
+                                  1, "queue_timeout") from exception
+            finally:
+                self._stats["queued"] -= 1
+        else:
+            await self._semaphore.acquire()
+        self._stats["running"] += 1
+
+    def release(self) -> None:
+        """
+        Frees the slot of a request that finished.
+        """
+        self._stats["running"] -= 1
+        self._semaphore.release()
+
+    def get_stats(self) -> dict:
+        """
+        Returns the number of running and queued expensive requests.
+        """
+        return dict(self._stats)
+
+
+def get_route_costs() -> dict:
+    """
+    Returns the cost in tokens of the expensive routes, by path.
+    """
+    return {acceptedOps.ROUTES[Entity.ARTICLE][operation]: cost
+            for operation, cost in config_info.RATE_LIMIT_COSTS.items()}
+
+
+def get_user_id(request: fastapi.Request) -> Optional[str]:
+    """
+    Returns the user of the session token of a request, or None if the
+    request has no valid token; the endpoint will then reject it.
+    """
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    try:
+        return api_session_tokens.verify_token(token).get("sub")
+    except api_session_tokens.InvalidSessionToken:
+        return None
+
+
+class RateLimiter:
+    """
+    Checks the buckets of the expensive requests and admits them.
+    """
+
+    def __init__(self, store, admission: AdmissionController):
+        self.store = store
+        self.admission = admission
+        self.route_costs = get_route_costs()
+
+    def get_buckets(self, request: fastapi.Request) -> List[Bucket]:
+        """
+        Returns the bucket of the user of a request, or of its client IP
+        if it has no valid session token.
+        """
+        user_id = get_user_id(request)
+        if user_id is not None:
+            return [(f"user:{user_id}",
+                     config_info.RATE_LIMIT_USER_TOKENS_PER_SECOND,
+                     config_info.RATE_LIMIT_USER_BURST)]
+        client_host = request.client.host if request.client else "unknown"
+        return [(f"ip:{client_host}",
+                 config_info.RATE_LIMIT_IP_TOKENS_PER_SECOND,
+                 config_info.RATE_LIMIT_IP_BURST)]
+
+    async def _run_store(self, method, *args):
+        if self.store.blocking:
+            return await run_in_threadpool(method, *args)
+        return method(*args)
+
+    async def admit(self, request: fastapi.Request, cost: float) -> None:
+        """
+        Takes the tokens of a request, then a slot to run it.
+
+        Raises:
+            RateLimited: if the request is rejected.
+        """
+        buckets = self.get_buckets(request)
+        wait, limiting_key = await self._run_store(
+            self.store.take, buckets, cost, time.time())
+        if limiting_key is not None:
+            reason = limiting_key.split(":", 1)[0]
+            logger.info("Rate limited %s on %s", limiting_key,
+                        request.url.path)
+            raise RateLimited("Too many requests, please try again later",
+                              None if math.isinf(wait) else wait, reason)
+        try:
+            await self.admission.acquire()
+        except RateLimited:
+            await self._run_store(self.store.refund, buckets, cost)
+            raise
+
+
+def create_rate_limiter() -> RateLimiter:
+    """
+    Creates the rate limiter of the configuration.
+    """
+    if config_info.RATE_LIMIT_SQLITE_PATH:
+        store = SQLiteBucketStore(config_info.RATE_LIMIT_SQLITE_PATH)
+    else:
+        store = MemoryBucketStore()
+    return RateLimiter(store, AdmissionController(
+        config_info.EXPENSIVE_MAX_CONCURRENT,
+        config_info.EXPENSIVE_MAX_QUEUE,
+        config_info.EXPENSIVE_QUEUE_TIMEOUT_SECONDS
+    ))
+
+
+RATE_LIMITER = create_rate_limiter()
+metrics.EXPENSIVE_REQUESTS.set_function(lambda: {
+    (state,): value
+    for state, value in RATE_LIMITER.admission.get_stats().items()
+})
@@ -0,0 +1,134 @@
+"""
+Signed session tokens issued by the API service at login.
+
+Tokens are compact JWTs signed with HMAC-SHA256, so every request can be
+authenticated by checking the signature and the expiry time, without
+reading the user from the database.
+"""
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+from echofeed.common import config_info
+
+ACCESS_TOKEN = "access"
+REFRESH_TOKEN = "refresh"
+
+TOKEN_TTL_SECONDS = {
+    ACCESS_TOKEN: config_info.ACCESS_TOKEN_TTL_SECONDS,
+    REFRESH_TOKEN: config_info.REFRESH_TOKEN_TTL_SECONDS
+}
+
+_HEADER = {"alg": "HS256", "typ": "JWT"}
+
+
+class InvalidSessionToken(Exception):
+    """
+    Raised when a session token is malformed, badly signed, expired or
+    of the wrong type.
+    """
+
+
+def _encode_segment(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _decode_segment(segment: str) -> bytes:
+    padding = "=" * (-len(segment) % 4)
+    return base64.urlsafe_b64decode(segment + padding)
+
+
+def _sign(signing_input: bytes) -> bytes:
+    return hmac.new(
+        config_info.SESSION_TOKEN_SECRET.encode("utf-8"),
+        signing_input,
+        hashlib.sha256
+    ).digest()
+
+
+def create_token(username: str, is_admin: bool, token_type: str) -> str:
+    """
+    Creates a signed token for a user.
+
+    Args:
+        username (str): The username of the user.
+        is_admin (bool): The admin status of the user.
+        token_type (str): ACCESS_TOKEN or REFRESH_TOKEN.
+
+    Returns:
+        str: The signed token.
+    """
+    issued_at = int(time.time())
+    claims = {
+        "sub": username,
+        "adm": bool(is_admin),
+        "typ": token_type,
+        "iat": issued_at,
+        "exp": issued_at + TOKEN_TTL_SECONDS[token_type]
+    }
+    signing_input = (
+        f"{_encode_segment(json.dumps(_HEADER).encode('utf-8'))}."
+        f"{_encode_segment(json.dumps(claims).encode('utf-8'))}"
+    ).encode("ascii")
+    return (f"{signing_input.decode('ascii')}."
+            f"{_encode_segment(_sign(signing_input))}")
+
+
+def create_session_tokens(username: str, is_admin: bool) -> dict:
+    """
+    Creates the access and refresh tokens returned at login.
+
+    Args:
+        username (str): The username of the user.
+        is_admin (bool): The admin status of the user.
+
+    Returns:
+        access_token(str): short lived token sent with every request.
+        refresh_token(str): long lived token used to get new tokens.
+        token_type(str): the authorization scheme of the tokens.
+        expires_in(int): the lifetime of the access token in seconds.
+    """
+    return {
+        "access_token": create_token(username, is_admin, ACCESS_TOKEN),
+        "refresh_token": create_token(username, is_admin, REFRESH_TOKEN),
+        "token_type": "bearer",
+        "expires_in": TOKEN_TTL_SECONDS[ACCESS_TOKEN]
+    }
+
+
+def verify_token(token: str, token_type: str = ACCESS_TOKEN) -> dict:
+    """
+    Verifies the signature, expiry time and type of a token.
+
+    Args:
+        token (str): The token to verify.
+        token_type (str): The expected type of the token.
+
+    Returns:
+        dict: The claims of the token (sub, adm, typ, iat, exp).
+
+    Raises:
+        InvalidSessionToken: if the token can not be trusted.
+    """
+    try:
+        header_segment, claims_segment, signature_segment = token.split(".")
+        signing_input = f"{header_segment}.{claims_segment}".encode("ascii")
+        signature = _decode_segment(signature_segment)
+    except (ValueError, UnicodeEncodeError) as exception:
+        raise InvalidSessionToken("Malformed session token") from exception
+
+    if not hmac.compare_digest(signature, _sign(signing_input)):
+        raise InvalidSessionToken("Invalid session token signature")
+
+    try:
+        claims = json.loads(_decode_segment(claims_segment))
+    except ValueError as exception:
+        raise InvalidSessionToken("Malformed session token") from exception
+
+    if claims.get("typ") != token_type:
+        raise InvalidSessionToken(f"Expected a {token_type} token")
+    if claims.get("exp", 0) <= time.time():
+        raise InvalidSessionToken("Session token has expired")
+    return claims
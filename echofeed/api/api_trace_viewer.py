@@ -0,0 +1,106 @@
+"""
+HTML viewer of the recent traces, served on /debug/traces: every trace
+is drawn as a waterfall, one bar per span, positioned and sized relative
+to the duration of its request.
+"""
+import datetime
+import html
+from typing import List
+
+from echofeed.common import tracing
+
+PAGE_STYLE = """
+body { font-family: sans-serif; margin: 24px; }
+table { border-collapse: collapse; width: 100%; margin-bottom: 32px; }
+td { padding: 2px 6px; font-size: 13px; white-space: nowrap; }
+td.timeline { width: 60%; }
+div.bar { height: 12px; background: #4a90d9; min-width: 1px; }
+div.bar.error { background: #d9534f; }
+h2 { font-size: 16px; margin-bottom: 4px; }
+span.meta { color: #666; font-size: 13px; }
+"""
+
+
+def order_spans(spans: List[dict]) -> List[tuple]:
+    """
+    Orders the spans of a trace depth first, children by start time.
+
+    Returns:
+        List[tuple]: (depth, span) pairs.
+    """
+    span_ids = {span["span_id"] for span in spans}
+    children = {}
+    roots = []
+    for span in sorted(spans, key=lambda span: span["start_time"]):
+        if span["parent_id"] in span_ids:
+            children.setdefault(span["parent_id"], []).append(span)
+        else:
+            roots.append(span)
+
+    ordered = []
+    stack = [(0, span) for span in reversed(roots)]
+    while stack:
+        depth, span = stack.pop()
+        ordered.append((depth, span))
+        stack.extend((depth + 1, child) for child
+                     in reversed(children.get(span["span_id"], [])))
+    return ordered
+
+
+def render_span_row(depth: int, span: dict, trace_start: float,
+                    trace_duration: float) -> str:
+    """
+    Renders a span as a table row with its bar in the waterfall.
+    """
+    duration = span["duration"] or 0.0
+    offset = (span["start_time"] - trace_start) / trace_duration * 100
+    width = duration / trace_duration * 100
+    attributes = ", ".join(f"{name}={value}" for name, value
+                           in span["attributes"].items())
+    title = html.escape(span["error"] or attributes, quote=True)
+    bar_class = "bar error" if span["error"] else "bar"
+    return (
+        f"<tr><td style=\"padding-left: {6 + depth * 16}px\">"
+        f"{html.escape(span['name'])}</td>"
+        f"<td>{duration * 1000:.1f} ms</td>"
+        f"<td class=\"timeline\"><div class=\"{bar_class}\" title=\"{title}\""
+        f" style=\"margin-left: {max(offset, 0):.2f}%;"
+        f" width: {min(width, 100):.2f}%\"></div></td></tr>"
+    )
+
+
+def render_trace(spans: List[dict]) -> str:
+    """
+    Renders the waterfall of a trace, titled with its duration and every
+    request of the trace.
+    """
+    roots = tracing.get_root_spans(spans)
+    trace_start = min(span["start_time"] for span in spans)
+    trace_duration = max(tracing.get_trace_duration(spans), 1e-6)
+    started_at = datetime.datetime.fromtimestamp(trace_start) \
+        .strftime("%Y-%m-%d %H:%M:%S")
+    rows = "".join(render_span_row(depth, span, trace_start, trace_duration)
+                   for depth, span in order_spans(spans))
+    requests = ", ".join(f"{html.escape(root['name'])}"
+                         f" ({root['duration'] * 1000:.1f} ms)"
+                         for root in roots)
+    return (
+        f"<h2>{trace_duration * 1000:.1f} ms &mdash; {requests}</h2>"
+        f"<span class=\"meta\">trace {spans[0]['trace_id']}, started"
+        f" {started_at}, {len(roots)} requests, {len(spans)} spans</span>"
+        f"<table>{rows}</table>"
+    )
+
+
+def render_traces_page(traces: List[List[dict]]) -> str:
+    """
+    Renders the page listing the waterfalls of the given traces.
+    """
+    body = "".join(render_trace(spans) for spans in traces) \
+        or "<p>No traces recorded yet.</p>"
+    return (
+        "<!DOCTYPE html><html><head><meta charset=\"utf-8\">"
+        "<title>EchoFeed traces</title>"
+        f"<style>{PAGE_STYLE}</style></head>"
+        f"<body><h1>Slowest recent requests</h1>{body}</body></html>"
+    )
@@ -0,0 +1,272 @@
+"""
+Write-behind buffer used by the API service to record the articles
+viewed by the users. A view is acknowledged as soon as it is buffered,
+and a background thread merges the buffered views into the user
+documents with one bulk write per flush.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Tuple
+
+from echofeed.common import config_info, metrics
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.config_info import Entity
+
+logger = config_info.get_logger(__name__)
+
+
+class ViewBufferFull(Exception):
+    """
+    Raised when the buffer holds its maximum number of views and new
+    views are rejected instead of waiting.
+    """
+
+
+class ViewEventBuffer:
+    """
+    Views waiting to be written, grouped by user. A view of an article
+    the user already has waiting is coalesced with it, so the size of
+    the buffer is its number of distinct (user, article) pairs.
+    """
+
+    def __init__(self, flush_interval_seconds: float, flush_max_events: int,
+                 max_events: int, max_backoff_seconds: float = 30.0):
+        self.flush_interval_seconds = flush_interval_seconds
+        self.flush_max_events = flush_max_events
+        self.max_events = max_events
+        self.max_backoff_seconds = max_backoff_seconds
+        # user id -> article ids, in the order they were viewed; dicts
+        # keep the order and drop the duplicates
+        self._pending: Dict[str, Dict[str, None]] = {}
+        # the views being written, counted in the size until they are
+        self._flushing: Dict[str, Dict[str, None]] = {}
+        self._size = 0
+        self._condition = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+
+    @property
+    def size(self) -> int:
+        """
+        Returns the number of views waiting to be written.
+        """
+        with self._condition:
+            return self._size
+
+    def record(self, user_id: str, article_ids: Iterable[str]) -> int:
+        """
+        Buffers the views of a user.
+
+        Args:
+            user_id (str): The id of the user.
+            article_ids (Iterable[str]): The ids of the viewed articles.
+
+        Returns:
+            int: the number of new views, the others being coalesced
+                 with views already waiting.
+
+        Raises:
+            ViewBufferFull: if the new views do not fit in the buffer.
+        """
+        article_ids = list(dict.fromkeys(article_ids))
+        with self._condition:
+            pending = self._pending.get(user_id, {})
+            flushing = self._flushing.get(user_id, {})
+            new_ids = [article_id for article_id in article_ids
+                       if article_id not in pending
+                       and article_id not in flushing]
+            if new_ids and self._size + len(new_ids) > self.max_events:
+                metrics.VIEW_EVENTS.inc("rejected", amount=len(article_ids))
+                logger.warning("View buffer is full, rejecting %d views of"
+                               " user %s", len(article_ids), user_id)
+                raise ViewBufferFull(
+                    "Too many article views waiting to be saved,"
+                    " please try again"
+                )
+            if new_ids:
+                self._pending.setdefault(user_id, {}).update(
+                    dict.fromkeys(new_ids))
+                self._size += len(new_ids)
+                if self._size >= self.flush_max_events:
+                    self._condition.notify_all()
+        metrics.VIEW_EVENTS.inc("buffered", amount=len(new_ids))
+        metrics.VIEW_EVENTS.inc("coalesced",
+                                amount=len(article_ids) - len(new_ids))
+        return len(new_ids)
+
+    def pending_views(self, user_id: str) -> List[str]:
+        """
+        Returns the articles viewed by a user that are not written yet,
+        so reads of the user can include them.
+        """
+        with self._condition:
+            return [*self._flushing.get(user_id, {}),
+                    *self._pending.get(user_id, {})]
+
+    def flush(self) -> int:
+        """
+        Writes the buffered views to the users with one bulk update and
+        returns the number of views written. Every update is conditional
+        on the version of the user read before it, so a concurrent
+        update of the user is never overwritten; views that could not be
+        written are buffered again for the next flush. Views of users
+        that no longer exist are dropped.
+        """
+        return self._flush()[0]
+
+    def _flush(self) -> Tuple[int, int]:
+        """
+        Flushes the buffer.
+
+        Returns:
+            tuple: the number of views written and the number of views
+                   buffered again.
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch, self._pending = self._pending, {}
+                self._flushing = batch
+            if not batch:
+                return 0, 0
+
+            start_time = time.perf_counter()
+            written, dropped, retry = self._write(batch)
+            metrics.VIEW_FLUSH_DURATION.observe(
+                time.perf_counter() - start_time)
+
+            with self._condition:
+                for user_id in retry:
+                    self._pending[user_id] = {
+                        **batch[user_id], **self._pending.get(user_id, {})}
+                self._flushing = {}
+                self._size -= written + dropped
+
+        retried = sum(len(batch[user_id]) for user_id in retry)
+        if not retried:
+            metrics.VIEW_FLUSHES.inc("ok")
+        else:
+            metrics.VIEW_FLUSHES.inc("partial" if written else "failed")
+            logger.warning("%d article views could not be saved and will"
+                           " be retried", retried)
+        logger.debug("Saved %d article views of %d users", written,
+                     len(batch) - len(retry))
+        return written, retried
+
+    @staticmethod
+    def _write(batch: Dict[str, Dict[str, None]]) -> Tuple[int, int, list]:
+        """
+        Merges the views of a batch into the users.
+
+        Returns:
+            tuple: the number of views written, the number of views
+                   dropped and the ids of the users to retry.
+        """
+        users = es_helpers.get_entities(Entity.USER, list(batch))
+        if not users["result"]:
+            return 0, 0, list(batch)
+
+        actions = []
+        written = dropped = 0
+        for user_id, views in batch.items():
+            user_info = users["users_info"].get(user_id)
+            if user_info is None:
+                dropped += len(views)
+                continue
+            viewed_articles = user_info.get("viewed_articles") or []
+            already_viewed = set(viewed_articles)
+            new_views = [article_id for article_id in views
+                         if article_id not in already_viewed]
+            if not new_views:
+                written += len(views)
+                continue
+            version = users["versions"][user_id]
+            actions.append({
+                "op": "update",
+                "id": user_id,
+                "document": {"viewed_articles": [*viewed_articles,
+                                                 *new_views]},
+                "if_seq_no": version["seq_no"],
+                "if_primary_term": version["primary_term"]
+            })
+
+        retry = []
+        if actions:
+            response = es_helpers.bulk_entities(Entity.USER, actions)
+            retry = [action["id"] for action in response["failed"]]
+            failed_ids = set(retry)
+            written += sum(len(batch[action["id"]]) for action in actions
+                           if action["id"] not in failed_ids)
+        if dropped:
+            logger.warning("Dropped %d article views of deleted users",
+                           dropped)
+        return written, dropped, retry
+
+    def start(self) -> None:
+        """
+        Starts the thread that flushes the buffer every
+        flush_interval_seconds, or as soon as flush_max_events views
+        wait. After a flush that could not write every view, the next
+        flush waits flush_interval_seconds, doubled after every failed
+        flush up to max_backoff_seconds, whatever the size of the
+        buffer.
+        """
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run,
+                                            name="echofeed-view-buffer",
+                                            daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        failed_flushes = 0
+        while True:
+            with self._condition:
+                delay = self.flush_interval_seconds
+                if failed_flushes:
+                    delay = min(delay * 2 ** (failed_flushes - 1),
+                                self.max_backoff_seconds)
+                deadline = time.monotonic() + delay
+                while not self._stopping and (
+                        failed_flushes
+                        or self._size < self.flush_max_events):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                if self._stopping:
+                    return
+            _, retried = self._flush()
+            # bounded, so the doubled delay stays a float
+            failed_flushes = min(failed_flushes + 1, 32) if retried else 0
+
+    def stop(self, timeout: float) -> None:
+        """
+        Stops the flushing thread and writes the views left, retrying
+        until they are all written or the timeout has passed.
+        """
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self._stopping = True
+            self._condition.notify_all()
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        while self.size and time.monotonic() < deadline:
+            if not self.flush() and self.size:
+                time.sleep(min(self.flush_interval_seconds,
+                               max(deadline - time.monotonic(), 0)))
+        if self.size:
+            logger.error("%d article views could not be saved before"
+                         " shutdown", self.size)
+
+
+VIEW_BUFFER = ViewEventBuffer(
+    flush_interval_seconds=config_info.VIEW_FLUSH_INTERVAL_SECONDS,
+    flush_max_events=config_info.VIEW_FLUSH_MAX_EVENTS,
+    max_events=config_info.VIEW_BUFFER_MAX_EVENTS,
+    max_backoff_seconds=config_info.VIEW_FLUSH_MAX_BACKOFF_SECONDS
+)
+metrics.VIEW_BUFFER_EVENTS.set_function(lambda: {(): VIEW_BUFFER.size})
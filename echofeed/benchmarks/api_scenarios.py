@@ -0,0 +1,466 @@
+"""
+Offline benchmark of the API: starts the FastAPI app against the local
+stand-ins of Elasticsearch, OpenAI and Google (fake_services), runs
+scripted scenarios and writes their latency percentiles, throughput and
+memory use to a JSON report.
+
+Scenarios:
+    bulk_ingest: articles created concurrently. It always runs first,
+                 as it fills the index read by the other scenarios.
+    login_storm: concurrent logins of different users, bounded by the
+                 password pool.
+    search_burst: concurrent hybrid searches, answered partly from the
+                  stored articles and partly through OpenAI and Google.
+    recommendation_page: the requests of the recommendations page of the
+                         UI: the user, the stored articles, the categories
+                         of their keywords and the recommendations.
+
+The API, the fakes and the clients share the process, so the numbers are
+meant to be compared between runs on the same machine, not read as
+production latencies. Pass the report of a previous run with --compare
+to print the changes.
+
+Usage:
+    python -m echofeed.benchmarks.api_scenarios [--output report.json]
+        [--compare baseline.json] [--requests 200] [--concurrency 16]
+        [--openai-latency 0.3] [--google-latency 0.2]
+"""
+import argparse
+import datetime
+import json
+import platform
+import resource
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+import uvicorn
+from openai import OpenAI
+
+from echofeed.benchmarks.fake_services import (FakeCustomSearch,
+                                               FakeElasticsearch, FakeOpenAI)
+from echofeed.common import config_info
+from echofeed.common.config_info import AcceptedOperations as acceptedOps
+from echofeed.common.config_info import Entity, SearchModes
+
+SCENARIOS = ("bulk_ingest", "login_storm", "search_burst",
+             "recommendation_page")
+TOPICS = [
+    ["inflație", "BNR", "dobânzi", "euro", "buget"],
+    ["fotbal", "Liga 1", "campionat", "transfer", "antrenor"],
+    ["alegeri", "parlament", "guvern", "coaliție", "vot"],
+    ["energie", "gaze", "electricitate", "prețuri", "facturi"],
+    ["educație", "școli", "profesori", "bacalaureat", "examen"]
+]
+PASSWORD = "benchmark-password"
+LANGUAGE = "Romanian"
+DATE = "2024-01-01"
+
+
+def percentile(values: list, share: float) -> float:
+    """
+    Returns the value below which the given share of the sorted values
+    falls, interpolating between neighbours.
+    """
+    if not values:
+        return 0.0
+    position = (len(values) - 1) * share
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+def get_memory_usage() -> dict:
+    """
+    Returns the current and the peak resident memory of the process, in
+    MiB. The current value is read from /proc and is missing elsewhere.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak_mib = peak / 1024 / (1024 if sys.platform == "darwin" else 1)
+    current_mib = None
+    try:
+        with open("/proc/self/status", encoding="utf-8") as status_file:
+            for line in status_file:
+                if line.startswith("VmRSS:"):
+                    current_mib = int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return {"rss_mib": current_mib, "peak_rss_mib": round(peak_mib, 1)}
+
+
+def get_git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                              capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class ApiServer(uvicorn.Server):
+    """
+    Uvicorn server running the API in a background thread.
+    """
+
+    def install_signal_handlers(self):
+        pass
+
+    def start_in_thread(self, timeout: float = 30.0) -> None:
+        self._thread = threading.Thread(target=self.run, name="echofeed-api",
+                                        daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.started:
+            if not self._thread.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("The API did not start")
+            time.sleep(0.05)
+
+    def stop(self) -> None:
+        self.should_exit = True
+        self._thread.join()
+
+    @property
+    def url(self) -> str:
+        host, port = self.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+
+class BenchmarkClient:
+    """
+    Calls the API over HTTP with one session per thread, so connections
+    are kept alive like in the UI.
+    """
+
+    def __init__(self, base_url: str, access_token: str):
+        self.base_url = base_url
+        self.access_token = access_token
+        self._local = threading.local()
+
+    @property
+    def session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = self._local.session = requests.Session()
+            session.headers["Authorization"] = f"Bearer {self.access_token}"
+        return session
+
+    def request(self, method: str, entity: str, operation: str,
+                **kwargs) -> requests.Response:
+        url = f"{self.base_url}{acceptedOps.ROUTES[entity][operation]}"
+        return self.session.request(method, url, **kwargs)
+
+
+def run_scenario(name: str, tasks: list, concurrency: int) -> dict:
+    """
+    Runs the tasks of a scenario on concurrency threads and measures
+    them. A task is a callable doing one scripted interaction and
+    returning True if every response was successful.
+
+    Returns:
+        dict: The latency percentiles in ms, the throughput in tasks per
+              second, the error count and the memory after the run.
+    """
+    latencies = []
+    errors = 0
+
+    def run_task(task):
+        start_time = time.perf_counter()
+        try:
+            succeeded = task()
+        except requests.RequestException:
+            succeeded = False
+        return time.perf_counter() - start_time, succeeded
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency,
+                            thread_name_prefix=f"bench-{name}") as executor:
+        for latency, succeeded in executor.map(run_task, tasks):
+            latencies.append(latency)
+            errors += not succeeded
+    elapsed = time.perf_counter() - start_time
+
+    latencies.sort()
+    return {
+        "tasks": len(tasks),
+        "concurrency": concurrency,
+        "errors": errors,
+        "duration_s": round(elapsed, 3),
+        "throughput_per_s": round(len(tasks) / elapsed, 2) if elapsed else 0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2)
+            if latencies else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99": round(percentile(latencies, 0.99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2) if latencies else 0.0
+        },
+        "memory": get_memory_usage()
+    }
+
+
+def is_successful(response: requests.Response) -> bool:
+    if response.status_code != 200:
+        return False
+    return response.json().get("result", True) is not False
+
+
+def bulk_ingest_tasks(client: BenchmarkClient, count: int) -> list:
+    def create_article(index):
+        keywords = TOPICS[index % len(TOPICS)]
+        article = {
+            "title": f"Articol {index} despre {keywords[0]}",
+            "content": f"Știri despre {', '.join(keywords)}. " * 20,
+            "url": f"https://news.example.com/articol-{index}",
+            "date": f"2024-0{index % 9 + 1}-1{index % 10}",
+            "keywords": keywords
+        }
+        return is_successful(client.request(
+            "POST", Entity.ARTICLE, acceptedOps.CREATE,
+            json={"article_info": article}))
+
+    return [lambda index=index: create_article(index) for index in range(count)]
+
+
+def create_users(client: BenchmarkClient, count: int) -> list:
+    """
+    Creates the users logging in during the login storm and returns
+    their usernames.
+    """
+    usernames = [f"benchmark-user-{index}" for index in range(count)]
+
+    def create_user(index):
+        user = {
+            "username": usernames[index],
+            "first_name": "Bench",
+            "last_name": f"User {index}",
+            "birthday": "1990-01-01",
+            "location": "București",
+            "interests": TOPICS[index % len(TOPICS)],
+            "password": PASSWORD
+        }
+        client.request("POST", Entity.USER, acceptedOps.CREATE,
+                       json={"user_info": user})
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(create_user, range(count)))
+    return usernames
+
+
+def login_storm_tasks(client: BenchmarkClient, usernames: list,
+                      count: int) -> list:
+    def login(username):
+        return is_successful(client.request(
+            "GET", Entity.USER, acceptedOps.LOGIN,
+            params={"username": username, "password": PASSWORD}))
+
+    return [lambda username=usernames[index % len(usernames)]: login(username)
+            for index in range(count)]
+
+
+def search_burst_tasks(client: BenchmarkClient, count: int) -> list:
+    def search(index):
+        keywords = TOPICS[index % len(TOPICS)]
+        request = {
+            "important_keywords": keywords[:2],
+            "relevant_keywords": keywords[2:],
+            "irrelevant_keywords": [],
+            "language": LANGUAGE,
+            "min_keywords": 3,
+            "num_results": 10,
+            "date": DATE,
+            "mode": SearchModes.HYBRID
+        }
+        return is_successful(client.request(
+            "POST", Entity.ARTICLE, acceptedOps.SEARCH, json=request))
+
+    return [lambda index=index: search(index) for index in range(count)]
+
+
+def recommendation_page_tasks(client: BenchmarkClient, usernames: list,
+                              count: int) -> list:
+    def load_page(username):
+        user = client.request("GET", Entity.USER, acceptedOps.GET,
+                              params={"user_id": username})
+        articles = client.request("GET", Entity.ARTICLE,
+                                  acceptedOps.GET_ALL)
+        keywords = sorted({keyword for article
+                           in articles.json().get("articles_info") or []
+                           for keyword in article.get("keywords") or []})
+        categories = client.request("GET", Entity.ARTICLE,
+                                    acceptedOps.CATEGORIES,
+                                    json={"keywords": keywords[:50]})
+        category_keywords = next(
+            iter(categories.json().get("categories", {}).values()), keywords)
+        recommendations = client.request(
+            "POST", Entity.ARTICLE, acceptedOps.RECOMMENDATION,
+            json={"keywords": category_keywords[:5], "language": LANGUAGE,
+                  "date": DATE})
+        return all(is_successful(response) for response
+                   in (user, articles, categories, recommendations))
+
+    return [lambda username=usernames[index % len(usernames)]:
+            load_page(username) for index in range(count)]
+
+
+def compare_reports(baseline: dict, current: dict) -> str:
+    """
+    Returns a table of the changes between two reports, per scenario.
+    """
+    lines = [f"{'scenario':<22}{'metric':<18}{'baseline':>12}"
+             f"{'current':>12}{'change':>10}"]
+    for name, result in current["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        metrics = [(f"{key} ms", previous["latency_ms"][key],
+                    result["latency_ms"][key])
+                   for key in ("p50", "p95", "p99")]
+        metrics.append(("throughput/s", previous["throughput_per_s"],
+                        result["throughput_per_s"]))
+        metrics.append(("errors", previous["errors"], result["errors"]))
+        metrics.append(("peak rss MiB", previous["memory"]["peak_rss_mib"],
+                        result["memory"]["peak_rss_mib"]))
+        for metric, before, after in metrics:
+            change = f"{(after - before) / before * 100:+.1f}%" \
+                if before else "-"
+            lines.append(f"{name:<22}{metric:<18}{before:>12}{after:>12}"
+                         f"{change:>10}")
+    return "\n".join(lines)
+
+
+def configure_services(elasticsearch: FakeElasticsearch, openai: FakeOpenAI,
+                       custom_search: FakeCustomSearch,
+                       bcrypt_rounds: int, log_level: str) -> None:
+    """
+    Points the API to the fake services. Must run before the API modules
+    are imported, as some of them read the configuration at import.
+    """
+    config_info.LOG_LEVEL = log_level
+    config_info.ELASTICSEARCH_URL = elasticsearch.url
+    config_info.GOOGLE_SEARCH_URL = f"{custom_search.url}/customsearch/v1"
+    config_info.BCRYPT_ROUNDS = bcrypt_rounds
+    # one user and one IP send every request, the rate limits would
+    # reject most of them; the admission control is still measured
+    for name in ("RATE_LIMIT_USER_TOKENS_PER_SECOND", "RATE_LIMIT_USER_BURST",
+                 "RATE_LIMIT_IP_TOKENS_PER_SECOND", "RATE_LIMIT_IP_BURST"):
+        setattr(config_info, name, 1e9)
+
+    from echofeed.api import api_gpt_interactions as api_gpt
+    api_gpt.client = OpenAI(api_key="benchmark",
+                            base_url=f"{openai.url}/v1", max_retries=0)
+
+
+def run_benchmarks(args) -> dict:
+    elasticsearch = FakeElasticsearch().start()
+    openai = FakeOpenAI(args.openai_latency).start()
+    custom_search = FakeCustomSearch(args.google_latency).start()
+    configure_services(elasticsearch, openai, custom_search,
+                       args.bcrypt_rounds, args.log_level)
+
+    from echofeed.api import api_main, api_session_tokens
+    server = ApiServer(uvicorn.Config(api_main.app, host="127.0.0.1", port=0,
+                                      log_level="warning"))
+    server.start_in_thread()
+    access_token = api_session_tokens.create_session_tokens(
+        "benchmark-admin", True)["access_token"]
+    client = BenchmarkClient(server.url, access_token)
+
+    results = {}
+    try:
+        scenarios = args.scenarios or SCENARIOS
+        # the other scenarios read the ingested articles
+        results["bulk_ingest"] = run_scenario(
+            "bulk_ingest", bulk_ingest_tasks(client, args.requests),
+            args.concurrency)
+        usernames = create_users(client, args.users)
+        if "login_storm" in scenarios:
+            results["login_storm"] = run_scenario(
+                "login_storm",
+                login_storm_tasks(client, usernames, args.requests),
+                args.concurrency)
+        if "search_burst" in scenarios:
+            results["search_burst"] = run_scenario(
+                "search_burst", search_burst_tasks(client, args.requests),
+                args.concurrency)
+        if "recommendation_page" in scenarios:
+            results["recommendation_page"] = run_scenario(
+                "recommendation_page",
+                recommendation_page_tasks(client, usernames, args.requests),
+                args.concurrency)
+    finally:
+        server.stop()
+        for service in (elasticsearch, openai, custom_search):
+            service.stop()
+
+    return {
+        "meta": {
+            "git_commit": get_git_commit(),
+            "created_at": datetime.datetime.now().isoformat(
+                timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "settings": {
+                "requests": args.requests,
+                "concurrency": args.concurrency,
+                "users": args.users,
+                "openai_latency_s": args.openai_latency,
+                "google_latency_s": args.google_latency,
+                "bcrypt_rounds": args.bcrypt_rounds,
+                "log_level": args.log_level
+            }
+        },
+        "scenarios": results
+    }
+
+
+def parse_arguments(arguments=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--output", default="benchmark-report.json",
+                        help="Where the JSON report is written.")
+    parser.add_argument("--compare",
+                        help="A previous report to compare the run with.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS,
+                        help="The scenarios to run, all by default.")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="Scripted interactions per scenario.")
+    parser.add_argument("--concurrency", type=int, default=16,
+                        help="Clients running the interactions at once.")
+    parser.add_argument("--users", type=int, default=20,
+                        help="Users created for the login storm.")
+    parser.add_argument("--openai-latency", type=float, default=0.3,
+                        help="Seconds the fake OpenAI waits per call.")
+    parser.add_argument("--google-latency", type=float, default=0.2,
+                        help="Seconds the fake Google waits per query.")
+    parser.add_argument("--bcrypt-rounds", type=int,
+                        default=config_info.BCRYPT_ROUNDS,
+                        help="The bcrypt cost of the created users.")
+    parser.add_argument("--log-level", default="WARNING",
+                        help="The log level of the API during the run.")
+    return parser.parse_args(arguments)
+
+
+def main(arguments=None):
+    args = parse_arguments(arguments)
+    report = run_benchmarks(args)
+    with open(args.output, "w", encoding="utf-8") as report_file:
+        json.dump(report, report_file, indent=2, ensure_ascii=False)
+    print(f"Report written to {args.output}")
+
+    for name, result in report["scenarios"].items():
+        latency = result["latency_ms"]
+        print(f"{name:<22} p50 {latency['p50']:>9.1f} ms"
+              f"  p95 {latency['p95']:>9.1f} ms"
+              f"  p99 {latency['p99']:>9.1f} ms"
+              f"  {result['throughput_per_s']:>8.1f}/s"
+              f"  errors {result['errors']}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as baseline_file:
+            print(compare_reports(json.load(baseline_file), report))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,553 @@
+"""
+Local stand-ins for the services the API depends on, used by the
+benchmarks: an in-memory Elasticsearch, an OpenAI chat completions
+server and a Google Custom Search endpoint.
+
+They implement only what EchoFeed sends and answer the same shapes as
+the real services, so the API code runs unchanged. The OpenAI and Google
+servers wait a configurable latency before answering, to stand in for
+the network and the model.
+"""
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlparse
+
+from echofeed.common.keyword_normalization import fold_keyword
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text) -> list:
+    """
+    Returns the lowercase words of a text, or of the strings of a list.
+    """
+    if isinstance(text, list):
+        return [token for item in text for token in tokenize(item)]
+    return TOKEN_PATTERN.findall(str(text).lower()) if text else []
+
+
+class JsonRequestHandler(BaseHTTPRequestHandler):
+    """
+    Request handler dispatching every method to handle(method, path,
+    params, body) of the server's service. Responses are JSON, or
+    server-sent events when the service returns a list of chunks.
+    """
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _dispatch(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw_body = self.rfile.read(length) if length else b""
+        url = urlparse(self.path)
+        if url.path.endswith("/_bulk"):
+            # newline delimited JSON
+            body = [json.loads(line) for line in raw_body.splitlines()
+                    if line.strip()]
+        else:
+            body = json.loads(raw_body) if raw_body else None
+        params = {key: values[-1]
+                  for key, values in parse_qs(url.query).items()}
+        status, payload = self.server.service.handle(method, url.path,
+                                                     params, body)
+        headers = dict(self.server.service.headers)
+        if isinstance(payload, list):
+            data = "".join(f"data: {json.dumps(chunk)}\n\n"
+                           for chunk in payload) + "data: [DONE]\n\n"
+            data = data.encode("utf-8")
+            headers["Content-Type"] = "text/event-stream"
+        else:
+            data = b"" if method == "HEAD" else \
+                json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_PUT(self):
+        self._dispatch("PUT")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def do_HEAD(self):
+        self._dispatch("HEAD")
+
+
+class FakeService:
+    """
+    Base class of the fake services: runs a threaded HTTP server on a
+    free local port.
+    """
+    headers = {"Content-Type": "application/json"}
+
+    def __init__(self):
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeService":
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0),
+                                           JsonRequestHandler)
+        self._server.daemon_threads = True
+        self._server.service = self
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name=type(self).__name__,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, method: str, path: str, params: dict,
+               body: Optional[dict]) -> tuple:
+        raise NotImplementedError
+
+
+class FakeElasticsearch(FakeService):
+    """
+    In-memory Elasticsearch: documents, aliases, the index API calls of
+    the bootstrap and a subset of the query DSL (match_all, match, term,
+    multi_match, bool, range), sorting, search_after and composite terms
+    aggregations, which fold the values of the .folded sub-fields. A
+    document scores the number of query words it contains, weighted by
+    the field boosts.
+    """
+    headers = {
+        "Content-Type": "application/vnd.elasticsearch+json;"
+                        " compatible-with=8",
+        "X-Elastic-Product": "Elasticsearch"
+    }
+
+    def __init__(self):
+        super().__init__()
+        self.indexes = {}
+        self.aliases = {}
+        self._seq_no = itertools.count()
+        self._lock = threading.Lock()
+
+    def resolve(self, name: str) -> str:
+        return self.aliases.get(name, name)
+
+    def handle(self, method, path, params, body):
+        parts = [part for part in path.split("/") if part]
+        if not parts:
+            return 200, {"version": {"number": "8.13.0"},
+                         "tagline": "You Know, for Search"}
+        if parts[0] == "_index_template":
+            return 200, {"acknowledged": True}
+        if parts[0] == "_alias":
+            index = self.aliases.get(parts[1])
+            if index is None:
+                return 404, {"error": "alias missing", "status": 404}
+            return 200, {index: {"aliases": {parts[1]: {}}}}
+        if parts[0] == "_bulk":
+            return self.bulk(None, body)
+        if parts[0] == "_aliases":
+            for action in body.get("actions", []):
+                for kind, spec in action.items():
+                    if kind == "add":
+                        self.aliases[spec["alias"]] = spec["index"]
+                    elif kind == "remove":
+                        self.aliases.pop(spec["alias"], None)
+            return 200, {"acknowledged": True}
+
+        index = self.resolve(parts[0])
+        if len(parts) == 1:
+            if method == "HEAD":
+                return (200 if index in self.indexes else 404), {}
+            if method == "PUT":
+                self.indexes.setdefault(index, {})
+                return 200, {"acknowledged": True, "index": index}
+            if method == "DELETE":
+                self.indexes.pop(index, None)
+                return 200, {"acknowledged": True}
+        endpoint = parts[1]
+        if endpoint == "_alias":
+            self.aliases[parts[2]] = index
+            return 200, {"acknowledged": True}
+        if endpoint == "_search":
+            return self.search(index, params, body or {})
+        if endpoint == "_mget":
+            return 200, {"docs": [self.get_document(index, document_id)[1]
+                                  for document_id in body["ids"]]}
+        if endpoint == "_bulk":
+            return self.bulk(index, body)
+        if endpoint == "_refresh":
+            return 200, {}
+        document_id = "/".join(parts[2:])
+        if endpoint in ("_doc", "_create") and method in ("PUT", "POST"):
+            op_type = "create" if endpoint == "_create" \
+                else params.get("op_type", "index")
+            return self.index_document(index, document_id, body, op_type)
+        if endpoint == "_doc" and method == "GET":
+            return self.get_document(index, document_id)
+        if endpoint == "_doc" and method == "DELETE":
+            return self.delete_document(index, document_id)
+        if endpoint == "_update":
+            return self.update_document(index, document_id, body, params)
+        return 400, {"error": f"unsupported {method} {path}", "status": 400}
+
+    def _document_response(self, index, document_id, document, **extra):
+        return {"_index": index, "_id": document_id,
+                "_version": document["version"],
+                "_seq_no": document["seq_no"], "_primary_term": 1, **extra}
+
+    def index_document(self, index, document_id, source, op_type):
+        with self._lock:
+            documents = self.indexes.setdefault(index, {})
+            existing = documents.get(document_id)
+            if existing is not None and op_type == "create":
+                return 409, {"error": {"type": "version_conflict_engine"
+                                               "_exception"},
+                             "status": 409}
+            documents[document_id] = document = {
+                "source": source,
+                "seq_no": next(self._seq_no),
+                "version": existing["version"] + 1 if existing else 1
+            }
+        return 201, self._document_response(index, document_id, document,
+                                            result="created")
+
+    def get_document(self, index, document_id):
+        document = self.indexes.get(index, {}).get(document_id)
+        if document is None:
+            return 404, {"_index": index, "_id": document_id,
+                         "found": False}
+        return 200, self._document_response(index, document_id, document,
+                                            found=True,
+                                            _source=document["source"])
+
+    def delete_document(self, index, document_id):
+        with self._lock:
+            document = self.indexes.get(index, {}).pop(document_id, None)
+        if document is None:
+            return 404, {"result": "not_found", "status": 404}
+        return 200, self._document_response(index, document_id, document,
+                                            result="deleted")
+
+    def update_document(self, index, document_id, body, params):
+        with self._lock:
+            document = self.indexes.get(index, {}).get(document_id)
+            if document is None:
+                return 404, {"error": {"type": "document_missing"
+                                               "_exception"},
+                             "status": 404}
+            if_seq_no = params.get("if_seq_no")
+            if if_seq_no is not None and int(if_seq_no) != document["seq_no"]:
+                return 409, {"error": {"type": "version_conflict_engine"
+                                               "_exception"},
+                             "status": 409}
+            document["source"] = {**document["source"], **body["doc"]}
+            document["seq_no"] = next(self._seq_no)
+            document["version"] += 1
+        return 200, self._document_response(index, document_id, document,
+                                            result="updated")
+
+    def bulk(self, default_index, lines):
+        items = []
+        lines = iter(lines)
+        for line in lines:
+            op, metadata = next(iter(line.items()))
+            index = self.resolve(metadata.get("_index", default_index))
+            document_id = metadata["_id"]
+            if op == "delete":
+                status, result = self.delete_document(index, document_id)
+            elif op == "update":
+                status, result = self.update_document(index, document_id,
+                                                      next(lines), metadata)
+            else:
+                status, result = self.index_document(index, document_id,
+                                                     next(lines), op)
+            if status >= 300:
+                result = {"_id": document_id, "status": status,
+                          "error": result.get("error", result)}
+            items.append({op: result})
+        return 200, {"took": 1, "items": items,
+                     "errors": any("error" in next(iter(item.values()))
+                                   for item in items)}
+
+    @staticmethod
+    def field_values(source: dict, field: str):
+        """
+        Returns the value of a field, mapping subfields such as title.ro
+        or keywords.text to their parent field.
+        """
+        field = field.split("^", 1)[0]
+        if field in source:
+            return source[field]
+        return source.get(field.split(".", 1)[0])
+
+    def score(self, source: dict, query: dict) -> Optional[float]:
+        """
+        Returns the score of a document for a query, None if it does not
+        match.
+        """
+        kind, spec = next(iter(query.items()))
+        if kind == "match_all":
+            return 1.0
+        if kind in ("match", "term"):
+            field, value = next(iter(spec.items()))
+            if isinstance(value, dict):
+                value = value.get("query", value.get("value"))
+            words = set(tokenize(self.field_values(source, field)))
+            query_words = tokenize(value)
+            matched = sum(word in words for word in query_words)
+            return float(matched) if matched else None
+        if kind == "multi_match":
+            query_words = tokenize(spec["query"])
+            best = None
+            for field in spec.get("fields", []):
+                boost = float(field.split("^", 1)[1]) if "^" in field else 1.0
+                words = set(tokenize(self.field_values(source, field)))
+                matched = sum(word in words for word in query_words)
+                if spec.get("operator") == "and" \
+                        and matched < len(query_words):
+                    continue
+                if matched:
+                    best = max(best or 0.0, matched * boost)
+            return best
+        if kind == "range":
+            field, bounds = next(iter(spec.items()))
+            value = self.field_values(source, field)
+            if value is None:
+                return None
+            if "gte" in bounds and value < bounds["gte"]:
+                return None
+            if "lte" in bounds and value > bounds["lte"]:
+                return None
+            return 0.0
+        if kind == "bool":
+            total = 0.0
+            for clause in spec.get("must", []):
+                clause_score = self.score(source, clause)
+                if clause_score is None:
+                    return None
+                total += clause_score
+            for clause in spec.get("filter", []):
+                if self.score(source, clause) is None:
+                    return None
+            for clause in spec.get("must_not", []):
+                if self.score(source, clause) is not None:
+                    return None
+            should_scores = [self.score(source, clause)
+                             for clause in spec.get("should", [])]
+            matched = [value for value in should_scores if value is not None]
+            default_minimum = 0 if spec.get("must") or spec.get("filter") \
+                else 1 if should_scores else 0
+            if len(matched) < spec.get("minimum_should_match",
+                                       default_minimum):
+                return None
+            return total + sum(matched)
+        raise ValueError(f"Unsupported query {kind}")
+
+    @staticmethod
+    def sort_key(hit: dict, sort: list) -> list:
+        values = []
+        for criterion in sort:
+            if criterion == "_score":
+                values.append(hit["_score"])
+                continue
+            field = next(iter(criterion))
+            values.append(hit["_source"].get(field))
+        return values
+
+    @staticmethod
+    def ordering_key(values: list, sort: list) -> tuple:
+        """
+        Turns the sort values of a hit into a key sorting the hits in the
+        requested orders, missing values last.
+        """
+        key = []
+        for value, criterion in zip(values, sort):
+            descending = criterion == "_score" or \
+                next(iter(criterion.values())).get("order") == "desc"
+            if value is None:
+                key.append((1, 0))
+            elif isinstance(value, (int, float)):
+                key.append((0, -value if descending else value))
+            else:
+                text = str(value)
+                key.append((0, tuple(-ord(character) for character in text)
+                            + (1,) if descending else text))
+        return tuple(key)
+
+    def search(self, index, params, body):
+        start_time = time.perf_counter()
+        documents = list(self.indexes.get(index, {}).items())
+        query = body.get("query") or {"match_all": {}}
+        hits = []
+        for document_id, document in documents:
+            score = self.score(document["source"], query)
+            if score is not None:
+                hits.append({"_index": index, "_id": document_id,
+                             "_score": score, "_source": document["source"]})
+
+        if "aggs" in body:
+            return 200, {"took": 1, "hits": {"hits": []},
+                         "aggregations": self.aggregate(hits, body["aggs"])}
+
+        sort = body.get("sort")
+        if sort:
+            for hit in hits:
+                hit["sort"] = self.sort_key(hit, sort)
+            hits.sort(key=lambda hit: self.ordering_key(hit["sort"], sort))
+            if body.get("search_after"):
+                after = self.ordering_key(body["search_after"], sort)
+                hits = [hit for hit in hits
+                        if self.ordering_key(hit["sort"], sort) > after]
+        else:
+            hits.sort(key=lambda hit: -hit["_score"])
+
+        size = int(body.get("size", params.get("size", 10)))
+        hits = hits[:size]
+        source_fields = body.get("_source") or body.get("source")
+        if isinstance(source_fields, list):
+            for hit in hits:
+                hit["_source"] = {field: hit["_source"].get(field)
+                                  for field in source_fields
+                                  if field in hit["_source"]}
+        took = int((time.perf_counter() - start_time) * 1000)
+        return 200, {"took": took, "timed_out": False,
+                     "hits": {"hits": hits}}
+
+    def aggregate(self, hits, aggs):
+        name, spec = next(iter(aggs.items()))
+        composite = spec["composite"]
+        source_name, source_spec = next(iter(composite["sources"][0].items()))
+        field = source_spec["terms"]["field"]
+        counts = {}
+        for hit in hits:
+            values = self.field_values(hit["_source"], field) or []
+            values = values if isinstance(values, list) else [values]
+            if field.endswith(".folded"):
+                values = [fold_keyword(value) for value in values]
+            for value in set(values):
+                counts[value] = counts.get(value, 0) + 1
+        after = (composite.get("after") or {}).get(source_name)
+        keys = sorted(key for key in counts if after is None or key > after)
+        keys = keys[:composite.get("size", 10)]
+        buckets = [{"key": {source_name: key}, "doc_count": counts[key]}
+                   for key in keys]
+        result = {"buckets": buckets}
+        if buckets:
+            result["after_key"] = buckets[-1]["key"]
+        return {name: result}
+
+
+class FakeOpenAI(FakeService):
+    """
+    OpenAI chat completions server answering every forced function call
+    with canned arguments built from the request, after a latency.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    @staticmethod
+    def build_arguments(function_name: str, user_content: str) -> dict:
+        words = [word for word in tokenize(user_content) if len(word) > 3]
+        keywords = list(dict.fromkeys(words))[:8] or ["news"]
+        if function_name == "save_keywords":
+            return {"keywords": keywords}
+        if function_name == "save_categories":
+            return {"categories": [{"name": keywords[0].title(),
+                                    "keywords": keywords}]}
+        if function_name == "save_batch_categories":
+            items = json.loads(user_content)
+            return {"items": [{"id": item["id"], "categories": [
+                {"name": "General", "keywords": item["keywords"]}]}
+                for item in items]}
+        if function_name == "save_labels":
+            groups = json.loads(user_content)
+            return {"labels": [{"id": group["id"], "name": f"Group {index}"}
+                               for index, group in enumerate(groups)]}
+        return {"query": " ".join(keywords)}
+
+    def handle(self, method, path, params, body):
+        time.sleep(self.latency)
+        function_name = body["tool_choice"]["function"]["name"]
+        user_content = body["messages"][-1]["content"]
+        arguments = json.dumps(self.build_arguments(function_name,
+                                                    user_content))
+        usage = {"prompt_tokens": len(json.dumps(body)) // 4,
+                 "completion_tokens": len(arguments) // 4,
+                 "total_tokens": (len(json.dumps(body))
+                                  + len(arguments)) // 4}
+        tool_call = {"id": "call_benchmark", "type": "function",
+                     "function": {"name": function_name,
+                                  "arguments": arguments}}
+        completion = {"id": "chatcmpl-benchmark", "created": int(time.time()),
+                      "model": body["model"]}
+        if body.get("stream"):
+            chunks = []
+            for start in range(0, len(arguments), 16):
+                delta_call = {"index": 0, "function": {
+                    "arguments": arguments[start:start + 16]}}
+                if start == 0:
+                    delta_call.update(id="call_benchmark", type="function")
+                    delta_call["function"]["name"] = function_name
+                chunks.append({**completion,
+                               "object": "chat.completion.chunk",
+                               "choices": [{"index": 0, "delta": {
+                                   "tool_calls": [delta_call]},
+                                   "finish_reason": None}]})
+            chunks.append({**completion, "object": "chat.completion.chunk",
+                           "choices": [], "usage": usage})
+            return 200, chunks
+        return 200, {**completion, "object": "chat.completion",
+                     "choices": [{"index": 0, "finish_reason": "stop",
+                                  "message": {"role": "assistant",
+                                              "content": None,
+                                              "tool_calls": [tool_call]}}],
+                     "usage": usage}
+
+
+class FakeCustomSearch(FakeService):
+    """
+    Google Custom Search endpoint returning num results for any query,
+    after a latency. The same query always returns the same links.
+    """
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__()
+        self.latency = latency
+
+    def handle(self, method, path, params, body):
+        time.sleep(self.latency)
+        query = params.get("q", "")
+        words = tokenize(query)
+        items = []
+        for index in range(int(params.get("num", 10))):
+            slug = "-".join(words[:4] + [str(index)])
+            items.append({
+                "title": f"{' '.join(words[:4]).title()} {index}",
+                "link": f"https://news.example.com/{slug}",
+                "snippet": f"Article {index} about {' '.join(words)}.",
+                "pagemap": {"metatags": [{
+                    "article:published_time": "2024-05-0"
+                                              f"{index % 9 + 1}T10:00:00Z"
+                }]}
+            })
+        return 200, {"kind": "customsearch#search", "items": items}
@@ -0,0 +1,207 @@
+"""
+Compares the prompt tokens of the GPT calls before and after the move to
+compact, versioned prompts answered through function calling.
+
+The version 1 prompts are the free text prompts previously sent by
+api_gpt_interactions. Tokens are estimated offline with the same
+heuristic used for batching (about 4 characters per token). The
+function schemas are part of the prompt too; OpenAI shows them to the
+model as TypeScript declarations, so they are counted in that form.
+With --live, every call type is also sent to OpenAI once and the token
+usage reported by the API is printed.
+
+Usage:
+    python -m echofeed.benchmarks.gpt_prompt_tokens [--live]
+"""
+import argparse
+import json
+
+from echofeed.api import api_gpt_interactions as api_gpt
+
+LANGUAGE = "Romanian"
+KEYWORDS = ["inflație", "BNR", "dobânzi", "euro", "buget", "deficit",
+            "fotbal", "Liga 1", "alegeri", "parlament"]
+IMPORTANT_KEYWORDS = ["inflație", "BNR"]
+RELEVANT_KEYWORDS = ["dobânzi", "euro", "buget"]
+IRRELEVANT_KEYWORDS = ["fotbal"]
+MIN_KEYWORDS = 3
+USER_INPUT = "Vreau știri despre inflație și deciziile BNR privind dobânzile"
+KEYWORD_SETS = {"user1": KEYWORDS[:5], "user2": KEYWORDS[5:]}
+GROUPS = [KEYWORDS[:6], KEYWORDS[6:8], KEYWORDS[8:]]
+GROUPS_TEXT = "\n".join(f"{index}: {', '.join(group)}"
+                        for index, group in enumerate(GROUPS))
+
+LEGACY_PROMPTS = {
+    "categorize": [
+        "Ești un asistent care ajută la clasificarea cuvintelor cheie în"
+        " categorii relevante.",
+        "Împărțiți următoarele cuvinte cheie în categorii relevante."
+        " Fiecare categorie trebuie să fie determinată automat pe baza"
+        " cuvintelor cheie furnizate. Returnează rezultatul într-un format"
+        " de dicționar JSON unde cheia este numele categoriei și valoarea"
+        f" este o listă de cuvinte cheie. Cuvintele cheie sunt:"
+        f" {', '.join(KEYWORDS)}."
+    ],
+    "categorize_batch": [
+        "Primești un obiect JSON în care fiecare cheie este un id, iar"
+        " valoarea este o listă de cuvinte cheie. Pentru fiecare id,"
+        " împarte cuvintele cheie în categorii relevante. Returnează un"
+        " obiect JSON cu aceleași id-uri, în care valoarea fiecărui id este"
+        " un dicționar cu numele categoriei drept cheie și lista de cuvinte"
+        " cheie drept valoare.",
+        json.dumps(KEYWORD_SETS, ensure_ascii=False)
+    ],
+    "label_categories": [
+        "Dă un nume scurt fiecărui grup de cuvinte cheie. Returnează doar"
+        " un obiect JSON în care cheia este numărul grupului și valoarea"
+        " este numele.",
+        GROUPS_TEXT
+    ],
+    "generate_keywords": [
+        "Genereaza cuvinte cheie pentru cautare de stiri pe baza textului"
+        " introdus de utilizator. Nu vei scrie nimic altceva. Cuvintele"
+        f" cheie vor fi separate prin virgula. Limba este {LANGUAGE}.",
+        USER_INPUT
+    ],
+    "refine_keywords": [
+        "Primesti un text si cuvinte cheie extrase din el. Corecteaza si"
+        " completeaza cuvintele cheie pentru cautare de stiri. Nu vei scrie"
+        " nimic altceva. Cuvintele cheie vor fi separate prin virgula."
+        f" Limba este {LANGUAGE}.",
+        f"Text: {USER_INPUT}\nCuvinte cheie: {', '.join(KEYWORDS[:3])}"
+    ],
+    "search_query": [
+        "Creează un query de căutare pe Google pentru a găsi articole de"
+        " știri relevante bazate pe cuvintele cheie furnizate de"
+        " utilizator. Numărul minim de cuvinte cheie care trebuie folosite"
+        f" este {MIN_KEYWORDS}, dar nu-l depasi prea mult(maxim foloseste 2"
+        " cuvinte cheie in plus). Query-ul trebuie să fie generat în limba"
+        f" {LANGUAGE}. Urmează acești pași pentru a construi query-ul: 1."
+        " Cuvintele cheie foarte importante (important_keywords) trebuie să"
+        " fie folosite în mod obligatoriu. 2. Din cuvintele cheie relevante"
+        " (relevant_keywords) trebuie să fie folosite doar cele relevante"
+        " celor importante și nu se suprapun cu cele foarte importante. 3."
+        " Cuvintele cheie irelevante (irrelevant_keywords) să fie folosite"
+        " doar dacă nu există suficiente cuvinte cheie din categoriile"
+        " anterioare pentru a forma query-ul complet, si in acel caz doar"
+        " cele relevante cu cele selectate din categoriile precedente. 4."
+        " Ai dreptul de a modela query-ul folosind aceste cuvinte cheie si"
+        " reguli astfel incat acesta sa fie optim pentru cautarea de stiri."
+        " Raspunsul sa fie exact sub forma in care ar putea fi pus intr-un"
+        " query de cautare pe Google, fara cuvinte si caractere aditionale,"
+        " intr-un singur string(fara caractere de tipul \" ').",
+        f"important_keywords: {', '.join(IMPORTANT_KEYWORDS)},"
+        f" relevant_keywords: {', '.join(RELEVANT_KEYWORDS)},"
+        f" irrelevant_keywords: {', '.join(IRRELEVANT_KEYWORDS)}"
+    ],
+    "recommendation_query": [
+        "Creează un query de căutare pe Google pentru a găsi articole de"
+        " știri relevante bazate pe cuvintele cheie furnizate de"
+        f" utilizator. Query-ul trebuie să fie generat în limba {LANGUAGE}."
+        " Folosește cuvintele cheie primite de la utilizator pentru a"
+        " construi query-ul. Raspunsul sa fie exact sub forma in care ar"
+        " putea fi pus intr-un query de cautare pe Google, fara cuvinte si"
+        " caractere aditionale, intr-un singur string(fara caractere de"
+        " tipul \" ').",
+        ", ".join(KEYWORDS)
+    ]
+}
+
+CURRENT_PROMPTS = {
+    "categorize": (json.dumps(KEYWORDS, ensure_ascii=False), {}),
+    "categorize_batch": (json.dumps(KEYWORD_SETS, ensure_ascii=False), {}),
+    "label_categories": (GROUPS_TEXT, {}),
+    "generate_keywords": (USER_INPUT, {"language": LANGUAGE}),
+    "refine_keywords": (
+        json.dumps({"text": USER_INPUT, "keywords": KEYWORDS[:3]},
+                   ensure_ascii=False),
+        {"language": LANGUAGE}
+    ),
+    "search_query": (
+        json.dumps({"important": IMPORTANT_KEYWORDS,
+                    "relevant": RELEVANT_KEYWORDS,
+                    "irrelevant": IRRELEVANT_KEYWORDS}, ensure_ascii=False),
+        {"language": LANGUAGE, "min_keywords": MIN_KEYWORDS,
+         "max_keywords": MIN_KEYWORDS + 2}
+    ),
+    "recommendation_query": (", ".join(KEYWORDS), {"language": LANGUAGE})
+}
+
+
+def estimate_legacy_tokens(call_type: str) -> int:
+    """
+    Estimates the prompt tokens of a version 1 call.
+    """
+    return sum(api_gpt.estimate_tokens(text)
+               for text in LEGACY_PROMPTS[call_type])
+
+
+def render_schema(schema: dict) -> str:
+    """
+    Renders a JSON schema as a TypeScript type, e.g. {keywords: string[]}.
+    """
+    if schema["type"] == "array":
+        return f"{render_schema(schema['items'])}[]"
+    if schema["type"] == "object":
+        properties = ", ".join(
+            f"{name}: {render_schema(property_schema)}"
+            for name, property_schema in schema["properties"].items())
+        return f"{{{properties}}}"
+    return "number" if schema["type"] == "integer" else schema["type"]
+
+
+def render_function(call_type: str) -> str:
+    """
+    Renders the function of a call type as shown to the model.
+    """
+    function = api_gpt.FUNCTIONS[call_type]
+    return (f"namespace functions {{\ntype {function['name']} ="
+            f" (_: {render_schema(function['parameters'])}) => any;\n}}")
+
+
+def estimate_current_tokens(call_type: str) -> int:
+    """
+    Estimates the prompt tokens of a current call, function included.
+    """
+    user_content, prompt_args = CURRENT_PROMPTS[call_type]
+    messages = api_gpt.build_messages(call_type, user_content, **prompt_args)
+    return (sum(api_gpt.estimate_tokens(message["content"])
+                for message in messages)
+            + api_gpt.estimate_tokens(render_function(call_type)))
+
+
+def run_live_calls() -> None:
+    """
+    Sends every call type once and prints the usage reported by OpenAI.
+    """
+    api_gpt.categorize_keywords(KEYWORDS)
+    api_gpt.categorize_keyword_batch(KEYWORD_SETS)
+    api_gpt.label_categories({group[0]: group for group in GROUPS})
+    api_gpt.generate_keywords(USER_INPUT, LANGUAGE)
+    api_gpt.refine_keywords(USER_INPUT, KEYWORDS[:3], LANGUAGE)
+    api_gpt.extract_queries(IMPORTANT_KEYWORDS, RELEVANT_KEYWORDS,
+                            IRRELEVANT_KEYWORDS, LANGUAGE, MIN_KEYWORDS)
+    api_gpt.extract_recommandation_queries(KEYWORDS, LANGUAGE)
+    print(json.dumps(api_gpt.get_token_usage(), indent=2))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--live", action="store_true",
+                        help="also send the calls to OpenAI")
+    args = parser.parse_args()
+
+    print(f"{'call type':<22}{'v1':>8}{'current':>10}{'reduction':>12}")
+    for call_type in LEGACY_PROMPTS:
+        legacy_tokens = estimate_legacy_tokens(call_type)
+        current_tokens = estimate_current_tokens(call_type)
+        reduction = 1 - current_tokens / legacy_tokens
+        print(f"{call_type:<22}{legacy_tokens:>8}{current_tokens:>10}"
+              f"{reduction:>11.0%}")
+
+    if args.live:
+        run_live_calls()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,9 @@
 Module containing classes used for the API service
 """
 from typing import List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, field_validator
+
+from echofeed.common.keyword_normalization import deduplicate_keywords
 
 
 class Article(BaseModel):
@@ -12,9 +14,20 @@ class Article(BaseModel):
     title: str
     content: str
     url: str
-    date: str
+    date: Optional[str] = None
     keywords: Optional[List[str]]
 
+    @field_validator("keywords")
+    @classmethod
+    def clean_keywords(cls, keywords: Optional[List[str]]) \
+            -> Optional[List[str]]:
+        """
+        Stores every keyword once, in its first spelling.
+        """
+        if keywords is None:
+            return None
+        return deduplicate_keywords(keywords)
+
 
 class User(BaseModel):
     """
@@ -30,3 +43,11 @@ class User(BaseModel):
     liked_articles: List[str] = []
     is_admin: bool = False
     password: str
+
+    @field_validator("interests")
+    @classmethod
+    def clean_interests(cls, interests: List[str]) -> List[str]:
+        """
+        Stores every interest once, in its first spelling.
+        """
+        return deduplicate_keywords(interests)
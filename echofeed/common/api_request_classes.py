@@ -1,8 +1,8 @@
 """Module containing request classes definitions for echofeed api service"""
-from typing import List
+from typing import List, Optional, Tuple, Union
 from pydantic import BaseModel
 
-from echofeed.common import api_classes as api_cls
+from echofeed.common import api_classes as api_cls, config_info
 
 
 class CreateArticleRequest(BaseModel):
@@ -29,10 +29,29 @@ class UpdateArticleRequest(BaseModel):
 
 class UpdateUserRequest(BaseModel):
     """
-    Request class for update user operations
+    Request class for update user operations. The optional sequence
+    number and primary term make the update conditional on the version
+    of the user document the caller has read.
     """
     user_id: str
     user_info: api_cls.User
+    if_seq_no: Optional[int] = None
+    if_primary_term: Optional[int] = None
+
+
+class RecordViewsRequest(BaseModel):
+    """
+    Request class for recording the articles viewed by a user
+    """
+    user_id: str
+    article_ids: List[str]
+
+
+class RefreshSessionRequest(BaseModel):
+    """
+    Request class for exchanging a refresh token for new session tokens
+    """
+    refresh_token: str
 
 
 class GetAllFromList(BaseModel):
@@ -45,7 +64,11 @@ class GetAllFromList(BaseModel):
 class SearchArticlesRequest(BaseModel):
     """
     Request class for searching articles through
-    openai api and google search api
+    openai api and google search api, or through the stored articles.
+    mode is one of SearchModes (local, external or hybrid),
+    query_mode is one of QueryModes (template or llm) and search_after
+    is the cursor returned by the previous page of a stored articles
+    search: its score, date and url.
     """
     important_keywords: list
     relevant_keywords: list
@@ -54,6 +77,11 @@ class SearchArticlesRequest(BaseModel):
     min_keywords: int
     num_results: int
     date: str
+    date_to: Optional[str] = None
+    search_after: Optional[Tuple[float, Optional[Union[int, str]], str]] \
+        = None
+    query_mode: str = config_info.QueryModes.TEMPLATE
+    mode: str = config_info.SearchModes.HYBRID
 
 
 class SearchArticlesResponse(BaseModel):
@@ -71,6 +99,7 @@ class GetRecommendationsRequest(BaseModel):
     keywords: list
     language: str
     date: str
+    query_mode: str = config_info.QueryModes.TEMPLATE
 
 
 class GetRecommendationsResponse(BaseModel):
@@ -86,6 +115,7 @@ class GetKeywordsRequest(BaseModel):
     """
     user_input: str
     language: str
+    mode: str = config_info.KeywordModes.LOCAL
 
 
 class GetKeywordsResponse(BaseModel):
@@ -100,6 +130,7 @@ class GetCategoriesRequest(BaseModel):
     Request class for getting keyword categories
     """
     keywords: List[str]
+    mode: str = config_info.KeywordModes.LOCAL
 
 
 class GetCategoriesResponse(BaseModel):
@@ -108,3 +139,18 @@ class GetCategoriesResponse(BaseModel):
     """
     categories: dict
 
+
+class KeywordSet(BaseModel):
+    """
+    A set of keywords identified by an id, e.g. the interests of a user
+    """
+    id: str
+    keywords: List[str]
+
+
+class GetCategoriesBatchRequest(BaseModel):
+    """
+    Request class for getting the keyword categories of many keyword
+    sets at once
+    """
+    keyword_sets: List[KeywordSet]
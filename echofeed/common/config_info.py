@@ -1,26 +1,164 @@
 """Confirguration information for the echofeed application."""
 import hashlib
 import logging
-import sys
+import os
+import tempfile
 
 import bcrypt
 
+from echofeed.common import logging_pipeline
+
 VERSION = "v1"
 HOST = "127.0.0.1"
 API_PORT = 8080
 API_APP = "api_main:app"
 API_URL = f"http://127.0.0.1:{API_PORT}"
+# Prometheus scrape endpoint, outside the versioned API routes
+METRICS_ROUTE = "/metrics"
+# the traces of the last TRACE_BUFFER_SIZE requests are kept in memory;
+# set TRACE_FILE_PATH to also append every span to a JSON lines file
+TRACE_BUFFER_SIZE = 500
+TRACE_FILE_PATH = None
+DEBUG_TRACES_ROUTE = "/debug/traces"
+DEBUG_TRACES_SHOWN = 20
+# requests of admins carrying an X-Profile header or a profile query
+# parameter are profiled; the last PROFILES_MAX_FILES profiles are kept
+DEBUG_PROFILES_ROUTE = "/debug/profiles"
+PROFILES_DIRECTORY = os.path.join(tempfile.gettempdir(), "echofeed-profiles")
+PROFILES_MAX_FILES = 50
+PROFILE_SAMPLE_INTERVAL_SECONDS = 0.002
 
 UI_PORT = 8081
+USER_CACHE_TTL_SECONDS = 30
 
 OPENAI_API_KEY = 'your_openai_api_key'
 GOOGLE_API_KEY = 'your_google_api_key'
 GOOGLE_ENGINE_ID = '11530c2a1693b4f75'
 GOOGLE_SEARCH_URL = 'https://www.googleapis.com/customsearch/v1'
+# Custom Search queries allowed per day, reset at midnight Pacific time
+GOOGLE_DAILY_QUOTA = 100
 
 ELASTICSEARCH_URL = "http://127.0.0.1:9200"
 # ELASTICSEARCH_URL = "http://localhost:9200"
 
+# every call to a dependency gets a timeout per attempt and a deadline
+# for all its attempts; failed attempts are retried with exponential
+# backoff and jitter, up to the maximum attempts
+GOOGLE_TIMEOUT_SECONDS = 5.0
+GOOGLE_DEADLINE_SECONDS = 12.0
+GOOGLE_MAX_ATTEMPTS = 3
+# Google results kept to be served while Custom Search is down
+GOOGLE_FALLBACK_CACHE_SIZE = 500
+OPENAI_TIMEOUT_SECONDS = 20.0
+OPENAI_DEADLINE_SECONDS = 45.0
+OPENAI_MAX_ATTEMPTS = 2
+STORAGE_TIMEOUT_SECONDS = 5.0
+STORAGE_DEADLINE_SECONDS = 10.0
+STORAGE_MAX_ATTEMPTS = 3
+RETRY_BACKOFF_BASE_SECONDS = 0.2
+RETRY_BACKOFF_MAX_SECONDS = 2.0
+# Google and OpenAI requests still running after the HEDGE_PERCENTILE
+# of their recent latencies are sent again, and the first answer wins;
+# at most about HEDGE_BUDGET_RATIO of the calls are hedged
+GOOGLE_HEDGING = False
+OPENAI_HEDGING = False
+HEDGE_PERCENTILE = 0.9
+HEDGE_BUDGET_RATIO = 0.05
+# after this many consecutive failed calls a dependency is considered
+# down and its calls fail fast for BREAKER_RESET_SECONDS
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30.0
+
+# where articles and users are stored: "elasticsearch", or "sqlite" for
+# an embedded database in SQLITE_DATABASE_PATH (see StorageBackends)
+STORAGE_BACKEND = "elasticsearch"
+SQLITE_DATABASE_PATH = "echofeed.sqlite3"
+
+# article views are buffered and written to the users in bulk every
+# VIEW_FLUSH_INTERVAL_SECONDS, or as soon as VIEW_FLUSH_MAX_EVENTS views
+# wait; new views are rejected while VIEW_BUFFER_MAX_EVENTS views wait.
+# After a failed flush the next one waits twice as long as the previous
+# wait, up to VIEW_FLUSH_MAX_BACKOFF_SECONDS
+VIEW_FLUSH_INTERVAL_SECONDS = 1.0
+VIEW_FLUSH_MAX_EVENTS = 500
+VIEW_BUFFER_MAX_EVENTS = 20000
+VIEW_FLUSH_MAX_BACKOFF_SECONDS = 30.0
+VIEW_SHUTDOWN_TIMEOUT_SECONDS = 10.0
+
+# the endpoints calling OpenAI or Google cost tokens, by operation, from
+# the bucket of the user, or of the client IP for requests without a
+# valid session token, refilled at the given rates up to the bursts; a
+# request short of tokens gets a 429
+RATE_LIMIT_COSTS = {
+    "search": 5,
+    "recommendation": 5,
+    "keywords": 2,
+    "keywords_stream": 2,
+    "categories": 3,
+    "categories_batch": 10
+}
+RATE_LIMIT_USER_TOKENS_PER_SECOND = 1.0
+RATE_LIMIT_USER_BURST = 30
+RATE_LIMIT_IP_TOKENS_PER_SECOND = 3.0
+RATE_LIMIT_IP_BURST = 90
+# a SQLite file shared by the API workers, None to keep the buckets of
+# every worker in memory
+RATE_LIMIT_SQLITE_PATH = None
+# expensive requests running at once, and waiting for at most
+# EXPENSIVE_QUEUE_TIMEOUT_SECONDS; above both, requests get a 429
+EXPENSIVE_MAX_CONCURRENT = 8
+EXPENSIVE_MAX_QUEUE = 32
+EXPENSIVE_QUEUE_TIMEOUT_SECONDS = 5.0
+
+# bcrypt work factor; stored hashes with a different cost are upgraded
+# on the next successful login
+BCRYPT_ROUNDS = 12
+PASSWORD_HASHING_WORKERS = 4
+PASSWORD_HASHING_MAX_QUEUE = 64
+
+SESSION_TOKEN_SECRET = 'your_session_token_secret'
+ACCESS_TOKEN_TTL_SECONDS = 15 * 60
+REFRESH_TOKEN_TTL_SECONDS = 7 * 24 * 60 * 60
+
+# in hybrid search, stored articles scoring below this fraction of the
+# best stored article are not counted as good hits
+HYBRID_SEARCH_MIN_RELATIVE_SCORE = 0.3
+
+# keyword autocomplete keeps this many suggestions per prefix and drops
+# the least frequent keywords above AUTOCOMPLETE_MAX_TERMS
+AUTOCOMPLETE_TOP_SIZE = 10
+AUTOCOMPLETE_MAX_TERMS = 200000
+
+KEYWORD_EXTRACTION_MAX_KEYWORDS = 8
+KEYWORD_DICTIONARY_MAX_SIZE = 500000
+
+# batched GPT categorization: estimated input tokens per request (lowered
+# when a full batch's answer would not fit the output cap), output tokens
+# cap and number of requests sent in parallel
+GPT_BATCH_TOKEN_BUDGET = 3000
+GPT_BATCH_MAX_OUTPUT_TOKENS = 4000
+GPT_BATCH_CONCURRENCY = 4
+# a GPT call whose answer does not match its schema is tried again up
+# to GPT_MAX_ATTEMPTS times in total
+GPT_MAX_ATTEMPTS = 2
+GPT_USAGE_DURATIONS_KEPT = 1000
+# keyword groups with an average distance (1 - similarity) above this
+# value are not merged into one category
+KEYWORD_CLUSTER_DISTANCE_THRESHOLD = 0.8
+
+LOGGER_NAME = "echofeed"
+LOG_LEVEL = "INFO"
+# levels of single modules, e.g.
+# {"echofeed.common.es_interactions_helpers": "DEBUG"}
+LOG_LEVELS = {}
+# share of the records kept, by level
+LOG_SAMPLE_RATES = {"DEBUG": 0.1}
+LOG_MAX_MESSAGE_LENGTH = 2000
+# logged containers show their first LOG_MAX_PAYLOAD_ITEMS items and
+# logged strings their first LOG_MAX_PAYLOAD_STRING characters
+LOG_MAX_PAYLOAD_ITEMS = 10
+LOG_MAX_PAYLOAD_STRING = 200
+
 LOGGING_FORMAT = (
     "[%(asctime)s] [PID: %(process)d] [%(filename)s] "
     "[%(funcName)s: %(lineno)s] [%(levelname)s] %(message)s"
@@ -28,7 +166,7 @@ LOGGING_FORMAT = (
 
 
 def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password.encode('utf-8'), salt)
     return hashed.decode('utf-8')
 
@@ -37,22 +175,33 @@ def check_password(password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
 
 
-def get_logger():
+def password_needs_rehash(hashed_password: str) -> bool:
     """
-    Generates logger instance, logging messages in a specified format
+    Checks if a bcrypt hash was generated with a work factor other than
+    the configured one. Hashes look like $2b$<cost>$<salt and hash>.
     """
-    logger = logging.getLogger("echofeed")
-    logger.setLevel(logging.INFO)
-
-    formatter = logging.Formatter(LOGGING_FORMAT)
+    try:
+        cost = int(hashed_password.split('$')[2])
+    except (IndexError, ValueError):
+        return True
+    return cost != BCRYPT_ROUNDS
 
-    handler = logging.StreamHandler(sys.stdout)
-    handler.setFormatter(formatter)
 
-    logger.handlers.clear()
-    logger.addHandler(handler)
-
-    return logger
+def get_logger(name: str = LOGGER_NAME) -> logging.Logger:
+    """
+    Returns a logger of the services, e.g. get_logger(__name__). The
+    first call starts the asynchronous logging pipeline; the loggers
+    named echofeed.* go through it.
+    """
+    logging_pipeline.setup_logging(
+        LOGGER_NAME, LOGGING_FORMAT, LOG_LEVEL,
+        logger_levels=LOG_LEVELS,
+        sample_rates=LOG_SAMPLE_RATES,
+        max_message_length=LOG_MAX_MESSAGE_LENGTH,
+        max_payload_items=LOG_MAX_PAYLOAD_ITEMS,
+        max_payload_string=LOG_MAX_PAYLOAD_STRING
+    )
+    return logging.getLogger(name)
 
 
 class Entity:
@@ -63,6 +212,48 @@ class Entity:
     USER = "user"
 
 
+class SearchModes:
+    """
+    Class used to define constants for the article search modes
+    """
+    LOCAL = "local"
+    EXTERNAL = "external"
+    HYBRID = "hybrid"
+
+
+class KeywordModes:
+    """
+    Class used to define constants for the keyword generation modes
+    """
+    LOCAL = "local"
+    LLM = "llm"
+    HYBRID = "hybrid"
+
+
+class ProfilerModes:
+    """
+    Class used to define constants for the request profiler modes
+    """
+    SAMPLING = "sampling"
+    CPROFILE = "cprofile"
+
+
+class StorageBackends:
+    """
+    Class used to define constants for the storage backends
+    """
+    ELASTICSEARCH = "elasticsearch"
+    SQLITE = "sqlite"
+
+
+class QueryModes:
+    """
+    Class used to define constants for the Google query building modes
+    """
+    TEMPLATE = "template"
+    LLM = "llm"
+
+
 class ElasticsearchIndexes:
     """
     Class used to define constants for elasticsearch indexes
@@ -71,6 +262,12 @@ class ElasticsearchIndexes:
         Entity.ARTICLE: "articles",
         Entity.USER: "users"
     }
+    # the indexes above are aliases of <alias>_v<version>; bump a version
+    # after changing its mapping in es_index_bootstrap
+    VERSIONS = {
+        Entity.ARTICLE: 2,
+        Entity.USER: 2
+    }
 
 
 class AcceptedOperations:
@@ -82,12 +279,19 @@ class AcceptedOperations:
     DELETE = "delete"
     GET = "get"
     LOGIN = "login"
+    REFRESH = "refresh"
+    VIEWS = "views"
     GET_ALL = "get_all"
     GET_BY_USER = "get_by_user"
     SEARCH = "search"
+    QUERY = "query"
+    AUTOCOMPLETE = "autocomplete"
     RECOMMENDATION = "recommendation"
     KEYWORDS = "keywords"
+    KEYWORDS_STREAM = "keywords_stream"
     CATEGORIES = "categories"
+    CATEGORIES_BATCH = "categories_batch"
+    GPT_USAGE = "gpt_usage"
 
     ROUTES = {
         Entity.ARTICLE: {
@@ -98,9 +302,14 @@ class AcceptedOperations:
             GET_ALL: f"/api/{VERSION}/articles/all/",
             GET_BY_USER: f"/api/{VERSION}/articles/users/",
             SEARCH: f"/api/{VERSION}/articles/search",
+            QUERY: f"/api/{VERSION}/articles/query",
+            AUTOCOMPLETE: f"/api/{VERSION}/articles/autocomplete",
             RECOMMENDATION: f"/api/{VERSION}/articles/recommendation",
             KEYWORDS: f"/api/{VERSION}/articles/keywords",
-            CATEGORIES: f"/api/{VERSION}/articles/categories"
+            KEYWORDS_STREAM: f"/api/{VERSION}/articles/keywords/stream",
+            CATEGORIES: f"/api/{VERSION}/articles/categories",
+            CATEGORIES_BATCH: f"/api/{VERSION}/articles/categories/batch",
+            GPT_USAGE: f"/api/{VERSION}/articles/gpt/usage"
 
         },
         Entity.USER: {
@@ -109,6 +318,8 @@ class AcceptedOperations:
             DELETE: f"/api/{VERSION}/users/",
             GET: f"/api/{VERSION}/users/",
             LOGIN: f"/api/{VERSION}/users/login",
+            REFRESH: f"/api/{VERSION}/users/refresh",
+            VIEWS: f"/api/{VERSION}/users/views",
             GET_ALL: f"/api/{VERSION}/users/all/",
         }
     }
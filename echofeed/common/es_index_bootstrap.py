@@ -0,0 +1,243 @@
+"""
+A module that creates the Elasticsearch indexes of the application with
+explicit mappings, before any document is written.
+
+Every entity is stored in a versioned index (e.g. articles_v1) reached
+through an alias with the name used by the rest of the code (articles).
+The settings and mappings are registered as index templates, so bumping
+the version in config_info creates the new index with the new mapping,
+copies the documents into it and moves the alias atomically.
+"""
+from echofeed.common import config_info
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.config_info import ElasticsearchIndexes as EsIndexes
+from echofeed.common.config_info import Entity
+
+logger = config_info.get_logger(__name__)
+
+DATE_FORMAT = "strict_date_optional_time||epoch_millis"
+
+# folds the keywords like keyword_normalization.fold_keyword, so their
+# spellings are one term in the aggregations of the folded sub-fields
+NORMALIZER_SETTINGS = {
+    "echofeed_folded": {
+        "type": "custom",
+        "filter": ["trim", "lowercase", "asciifolding"]
+    }
+}
+
+ANALYSIS_SETTINGS = {
+    "filter": {
+        "english_stop": {"type": "stop", "stopwords": "_english_"},
+        "english_stemmer": {"type": "stemmer", "language": "english"},
+        "english_possessive_stemmer": {
+            "type": "stemmer",
+            "language": "possessive_english"
+        },
+        "romanian_stop": {"type": "stop", "stopwords": "_romanian_"},
+        "romanian_stemmer": {"type": "stemmer", "language": "romanian"}
+    },
+    "analyzer": {
+        "echofeed_english": {
+            "tokenizer": "standard",
+            "filter": ["english_possessive_stemmer", "lowercase",
+                       "english_stop", "english_stemmer", "asciifolding"]
+        },
+        "echofeed_romanian": {
+            "tokenizer": "standard",
+            "filter": ["lowercase", "romanian_stop", "romanian_stemmer",
+                       "asciifolding"]
+        }
+    },
+    "normalizer": NORMALIZER_SETTINGS
+}
+
+
+def _folded_field() -> dict:
+    """
+    Keyword sub-field matching and aggregating the values of its parent
+    field whatever their case and diacritics.
+    """
+    return {"type": "keyword", "normalizer": "echofeed_folded"}
+
+
+def _text_field() -> dict:
+    """
+    Full text field analyzed in English, with a Romanian sub-field.
+    """
+    return {
+        "type": "text",
+        "analyzer": "echofeed_english",
+        "fields": {
+            "ro": {"type": "text", "analyzer": "echofeed_romanian"}
+        }
+    }
+
+
+INDEX_MAPPINGS = {
+    Entity.ARTICLE: {
+        "dynamic": False,
+        "properties": {
+            "title": {
+                **_text_field(),
+                "fields": {
+                    "ro": {"type": "text", "analyzer": "echofeed_romanian"},
+                    "keyword": {"type": "keyword", "ignore_above": 512}
+                }
+            },
+            "content": _text_field(),
+            "url": {"type": "keyword", "ignore_above": 2048},
+            "date": {
+                "type": "date",
+                "format": DATE_FORMAT,
+                "ignore_malformed": True
+            },
+            "keywords": {
+                "type": "keyword",
+                "fields": {
+                    "folded": _folded_field(),
+                    "text": {"type": "text", "analyzer": "echofeed_english"}
+                }
+            }
+        }
+    },
+    Entity.USER: {
+        "dynamic": False,
+        "properties": {
+            "username": {"type": "keyword"},
+            "last_name": {"type": "keyword"},
+            "first_name": {"type": "keyword"},
+            "birthday": {
+                "type": "date",
+                "format": DATE_FORMAT,
+                "ignore_malformed": True
+            },
+            "location": {"type": "keyword"},
+            "interests": {
+                "type": "keyword",
+                "fields": {"folded": _folded_field()}
+            },
+            "viewed_articles": {"type": "keyword"},
+            "liked_articles": {"type": "keyword"},
+            "is_admin": {"type": "boolean"},
+            "password": {
+                "type": "keyword",
+                "index": False,
+                "doc_values": False
+            }
+        }
+    }
+}
+
+INDEX_SETTINGS = {
+    Entity.ARTICLE: {
+        "number_of_shards": 1,
+        "analysis": ANALYSIS_SETTINGS
+    },
+    Entity.USER: {
+        "number_of_shards": 1,
+        "analysis": {"normalizer": NORMALIZER_SETTINGS}
+    }
+}
+
+
+def get_versioned_index(entity_type: str) -> str:
+    """
+    Returns the name of the current versioned index of an entity.
+    """
+    return (f"{EsIndexes.INDEXES[entity_type]}"
+            f"_v{EsIndexes.VERSIONS[entity_type]}")
+
+
+def put_index_template(es_client, entity_type: str) -> None:
+    """
+    Registers the settings and mappings of an entity as an index
+    template matching all its versioned indexes.
+    """
+    alias = EsIndexes.INDEXES[entity_type]
+    es_client.indices.put_index_template(
+        name=f"echofeed-{alias}",
+        index_patterns=[f"{alias}_v*"],
+        priority=100,
+        version=EsIndexes.VERSIONS[entity_type],
+        template={
+            "settings": INDEX_SETTINGS[entity_type],
+            "mappings": INDEX_MAPPINGS[entity_type]
+        }
+    )
+
+
+def bootstrap_index(es_client, entity_type: str) -> None:
+    """
+    Makes sure the alias of an entity points to its current versioned
+    index, creating the index and migrating older data when needed.
+
+    Older data is either a legacy index created by dynamic mapping under
+    the alias name, which is deleted once copied, or a previous versioned
+    index, which is kept so the alias can be moved back.
+    """
+    alias = EsIndexes.INDEXES[entity_type]
+    target_index = get_versioned_index(entity_type)
+
+    put_index_template(es_client, entity_type)
+    if not es_client.indices.exists(index=target_index):
+        es_client.options(ignore_status=400).indices.create(
+            index=target_index)
+        logger.info("Created index %s", target_index)
+
+    if es_client.indices.exists_alias(name=alias):
+        current_indexes = list(es_client.indices.get_alias(name=alias).keys())
+        if current_indexes == [target_index]:
+            return
+        old_indexes = [index for index in current_indexes
+                       if index != target_index]
+        es_client.reindex(
+            source={"index": old_indexes},
+            dest={"index": target_index, "op_type": "create"},
+            conflicts="proceed",
+            refresh=True,
+            wait_for_completion=True
+        )
+        es_client.indices.update_aliases(actions=[
+            *[{"remove": {"index": index, "alias": alias}}
+              for index in old_indexes],
+            {"add": {"index": target_index, "alias": alias}}
+        ])
+        logger.info("Moved alias %s from %s to %s", alias, old_indexes,
+                    target_index)
+        return
+
+    if es_client.indices.exists(index=alias):
+        es_client.reindex(
+            source={"index": alias},
+            dest={"index": target_index, "op_type": "create"},
+            conflicts="proceed",
+            refresh=True,
+            wait_for_completion=True
+        )
+        es_client.indices.delete(index=alias)
+        logger.info("Migrated legacy index %s into %s", alias, target_index)
+
+    es_client.indices.put_alias(index=target_index, name=alias)
+    logger.info("Created alias %s for %s", alias, target_index)
+
+
+def bootstrap_indexes() -> bool:
+    """
+    Bootstraps the indexes of all entities. Errors are logged and do not
+    stop the service, so the API can start before Elasticsearch.
+    """
+    es_client = es_helpers.get_elasticsearch_client()
+    if es_client is None:
+        return False
+
+    result = True
+    for entity_type in EsIndexes.INDEXES:
+        try:
+            bootstrap_index(es_client, entity_type)
+        except Exception as exception:
+            logger.error("Encountered exception when tried to bootstrap"
+                         " the %s index: %s", EsIndexes.INDEXES[entity_type],
+                         exception)
+            result = False
+    return result
@@ -1,16 +1,58 @@
 """
-A module that contains helper functions for interacting with Elasticsearch.
+A module that contains helper functions for interacting with the
+database: Elasticsearch, or the backend selected in the configuration
+(see storage_backends).
 """
+import sqlite3
 import uuid
-from typing import Optional
+from typing import List, Optional
 
-import requests
-from elasticsearch import Elasticsearch
+from elasticsearch import ApiError, Elasticsearch, TransportError
 
-from echofeed.common import config_info
+from echofeed.common import config_info, metrics, resilience
+from echofeed.common import storage_backends, tracing
 from echofeed.common.config_info import ElasticsearchIndexes as EsIndexes
 
-logger = config_info.get_logger()
+logger = config_info.get_logger(__name__)
+
+
+def is_storage_failure(exception: Exception) -> bool:
+    """
+    Tells whether an exception means that the storage is unavailable: a
+    connection error or timeout, an overloaded or failing Elasticsearch
+    node, or a locked or interrupted SQLite database. Bad requests,
+    missing or conflicting documents and programming errors are not
+    retried and do not open the breaker.
+    """
+    if isinstance(exception, ApiError):
+        return exception.meta.status == 429 or exception.meta.status >= 500
+    return isinstance(exception, (TransportError, sqlite3.OperationalError,
+                                  OSError))
+
+
+STORAGE = resilience.register(resilience.Dependency(
+    "storage",
+    timeout_seconds=config_info.STORAGE_TIMEOUT_SECONDS,
+    deadline_seconds=config_info.STORAGE_DEADLINE_SECONDS,
+    max_attempts=config_info.STORAGE_MAX_ATTEMPTS,
+    is_failure=is_storage_failure
+))
+
+
+def call_backend(operation: str, index: str, func, retry: bool = True):
+    """
+    Traces and times a call of the storage backend, made through its
+    circuit breaker. Failed calls are retried unless retry is False;
+    every attempt is limited to its timeout by the backend.
+    """
+    def attempt(timeout: float):
+        with storage_backends.request_timeout(timeout):
+            return func()
+
+    backend_name = storage_backends.get_storage_backend().name
+    with tracing.span(f"{backend_name}.{operation}", index=index), \
+            metrics.track_storage(backend_name, operation):
+        return STORAGE.call(attempt, retry=retry)
 
 
 def get_elasticsearch_client() -> Optional[Elasticsearch]:
@@ -19,11 +61,17 @@ def get_elasticsearch_client() -> Optional[Elasticsearch]:
     information from the configuration module.
     """
     try:
-        es_client = Elasticsearch(config_info.ELASTICSEARCH_URL)
-        logger.info("Generated Elasticsearch client")
+        # the requests are retried by call_backend, not by the client
+        es_client = Elasticsearch(
+            config_info.ELASTICSEARCH_URL,
+            request_timeout=config_info.STORAGE_TIMEOUT_SECONDS,
+            max_retries=0,
+            retry_on_timeout=False
+        )
+        logger.debug("Generated Elasticsearch client")
     except Exception as exception:
-        logger.error(f"Encountered exception when tried to generate"
-                     f" Elasticsearch client: {exception}")
+        logger.error("Encountered exception when tried to generate"
+                     " Elasticsearch client: %s", exception)
         es_client = None
     return es_client
 
@@ -48,16 +96,15 @@ def create_entity(entity_type: str,
         f"{entity_type}_id": None
     }
     try:
-        es_client = get_elasticsearch_client()
-        new_entity = es_client.index(
-            index=entity_index,
-            id=entity_id,
-            document=entity_info,
-            op_type="create"
-        )
-        new_entity_dict = dict(new_entity)
-        response[f"{entity_type}_id"] = new_entity_dict["_id"]
-        logger.info(f"Added {entity_type} in the database: {new_entity_dict}")
+        backend = storage_backends.get_storage_backend()
+        # a repeated create would fail on the document it created
+        new_entity_id = call_backend(
+            "index", entity_index,
+            lambda: backend.create(entity_index, entity_id, entity_info),
+            retry=False)
+        response[f"{entity_type}_id"] = new_entity_id
+        logger.info("Added %s %s in the database", entity_type,
+                    new_entity_id)
 
     except Exception as exception:
         exception_message = (
@@ -74,26 +121,48 @@ def create_entity(entity_type: str,
     return response
 
 
-def update_entity(entity_type: str, entity_id: str, entity_info: dict) -> dict:
+def update_entity(entity_type: str, entity_id: str, entity_info: dict,
+                  if_seq_no: Optional[int] = None,
+                  if_primary_term: Optional[int] = None) -> dict:
     """
     Modifies an entity instance in the database.
+
+    When if_seq_no and if_primary_term are given, the update is only
+    applied if the stored document is still at that version, otherwise
+    the operation fails with a 409 code.
     """
     entity_index = EsIndexes.INDEXES[entity_type]
     response = {
         "message": f"Successfully updated {entity_type} in the database",
         "code": 200,
-        "result": True
+        "result": True,
+        "seq_no": None,
+        "primary_term": None
     }
     try:
-        es_client = get_elasticsearch_client()
-        updated_entity = es_client.update(
-            index=entity_index,
-            id=entity_id,
-            body={"doc": entity_info}
+        backend = storage_backends.get_storage_backend()
+        # a repeated conditional update would fail on its own version
+        updated_entity = call_backend(
+            "update", entity_index,
+            lambda: backend.update(entity_index, entity_id, entity_info,
+                                   if_seq_no, if_primary_term),
+            retry=if_seq_no is None)
+        response["seq_no"] = updated_entity["_seq_no"]
+        response["primary_term"] = updated_entity["_primary_term"]
+        logger.info("Updated %s %s in the database", entity_type,
+                    entity_id)
+
+    except storage_backends.DocumentConflict as exception:
+        exception_message = (
+            f"Version conflict when trying to update"
+            f" {entity_type} in the database: {exception}"
         )
-        updated_entity_dict = dict(updated_entity)
-        logger.info(f"Updated {entity_type} in the database:"
-                    f" {updated_entity_dict}")
+        logger.warning(exception_message)
+        response.update({
+            "message": exception_message,
+            "code": 409,
+            "result": False
+        })
 
     except Exception as exception:
         exception_message = (
@@ -121,12 +190,14 @@ def delete_entity(entity_type: str, entity_id: str) -> dict:
     }
 
     try:
-        es_client = get_elasticsearch_client()
-        es_client.delete(
-            index=EsIndexes.INDEXES[entity_type],
-            id=entity_id
-        )
-        logger.info(f"Deleted {entity_type} from the database")
+        backend = storage_backends.get_storage_backend()
+        call_backend(
+            "delete", EsIndexes.INDEXES[entity_type],
+            lambda: backend.delete(EsIndexes.INDEXES[entity_type],
+                                   entity_id),
+            retry=False)
+        logger.info("Deleted %s %s from the database", entity_type,
+                    entity_id)
 
     except Exception as exception:
         exception_message = (
@@ -150,18 +221,21 @@ def get_entity(entity_type: str, entity_id: str) -> dict:
         "message": f"Successfully retrieved {entity_type} from the database",
         "code": 200,
         "result": True,
-        f"{entity_type}_info": None
+        f"{entity_type}_info": None,
+        "seq_no": None,
+        "primary_term": None
     }
 
     try:
-        es_client = get_elasticsearch_client()
-        entity = es_client.get(
-            index=EsIndexes.INDEXES[entity_type],
-            id=entity_id
-        )
-        response[f"{entity_type}_info"] = entity.body["_source"]
-        logger.info(f"Retrieved entity from the database:"
-                    f" {response[f'{entity_type}_info']}")
+        backend = storage_backends.get_storage_backend()
+        entity = call_backend(
+            "get", EsIndexes.INDEXES[entity_type],
+            lambda: backend.get(EsIndexes.INDEXES[entity_type], entity_id))
+        response[f"{entity_type}_info"] = entity["_source"]
+        response["seq_no"] = entity.get("_seq_no")
+        response["primary_term"] = entity.get("_primary_term")
+        logger.debug("Retrieved %s %s from the database", entity_type,
+                     entity_id)
 
     except Exception as exception:
         exception_message = (
@@ -177,9 +251,26 @@ def get_entity(entity_type: str, entity_id: str) -> dict:
     return response
 
 
-def get_all_entities(entity_type: str) -> dict:
+def build_date_range_query(field: str, date_from: Optional[str] = None,
+                           date_to: Optional[str] = None) -> Optional[dict]:
     """
-    Gets all entities of the same type from elasticsearch index
+    Builds a range query on a date field, with inclusive bounds.
+    Returns None when no bound is given.
+    """
+    bounds = {}
+    if date_from:
+        bounds["gte"] = date_from
+    if date_to:
+        bounds["lte"] = date_to
+    if not bounds:
+        return None
+    return {"range": {field: bounds}}
+
+
+def get_all_entities(entity_type: str, query: Optional[dict] = None) -> dict:
+    """
+    Gets all entities of the same type from the database, optionally
+    restricted by a query.
     """
     response = {
         "message": f"Successfully retrieved {EsIndexes.INDEXES[entity_type]}"
@@ -191,10 +282,10 @@ def get_all_entities(entity_type: str) -> dict:
 
     try:
         response[f"{EsIndexes.INDEXES[entity_type]}_info"] = None
-        entities_list = requests.get(
-            url=f"{config_info.ELASTICSEARCH_URL}"
-                f"/{EsIndexes.INDEXES[entity_type]}/_search?pretty&size=10000"
-        ).json()["hits"]["hits"]
+        backend = storage_backends.get_storage_backend()
+        entities_list = call_backend(
+            "search", EsIndexes.INDEXES[entity_type],
+            lambda: backend.get_all(EsIndexes.INDEXES[entity_type], query))
 
         response[f"{EsIndexes.INDEXES[entity_type]}_info"] = []
         for entity in entities_list:
@@ -204,8 +295,8 @@ def get_all_entities(entity_type: str) -> dict:
             response[f"{EsIndexes.INDEXES[entity_type]}_info"].append(
                 entity_dict
             )
-        logger.info(f"Retrieved all {EsIndexes.INDEXES[entity_type]} from"
-                    f" the database")
+        logger.info("Retrieved %d %s from the database",
+                    len(entities_list), EsIndexes.INDEXES[entity_type])
 
     except Exception as exception:
         exception_message = (
@@ -222,6 +313,105 @@ def get_all_entities(entity_type: str) -> dict:
     return response
 
 
+def get_entities(entity_type: str, entity_ids: List[str]) -> dict:
+    """
+    Retrieves many entity instances by id in a single request. Missing
+    entities are returned as None; versions holds the seq_no and
+    primary_term of the found ones, for conditional writes.
+    """
+    entity_index = EsIndexes.INDEXES[entity_type]
+    response = {
+        "message": f"Successfully retrieved {entity_index} from the database",
+        "code": 200,
+        "result": True,
+        f"{entity_index}_info": {entity_id: None for entity_id in entity_ids},
+        "versions": {}
+    }
+    try:
+        backend = storage_backends.get_storage_backend()
+        entities = call_backend(
+            "mget", entity_index,
+            lambda: backend.mget(entity_index, list(entity_ids)))
+        for entity in entities:
+            response[f"{entity_index}_info"][entity["_id"]] = entity["_source"]
+            response["versions"][entity["_id"]] = {
+                "seq_no": entity.get("_seq_no"),
+                "primary_term": entity.get("_primary_term")
+            }
+        logger.debug("Retrieved %d of %d %s from the database",
+                     len(entities), len(entity_ids), entity_index)
+
+    except Exception as exception:
+        exception_message = (
+            f"Encountered an exception when trying to retrieve"
+            f" {entity_index} from the database: {exception}"
+        )
+        logger.error(exception_message)
+        response.update({
+            "message": exception_message,
+            "code": 424,
+            "result": False
+        })
+
+    return response
+
+
+def bulk_entities(entity_type: str, actions: List[dict]) -> dict:
+    """
+    Applies many writes to the entities of a type in a single request.
+    Every action has an op (create, index, update or delete), an id and,
+    except for delete, a document; see StorageBackend.bulk.
+
+    Returns:
+        message(str): a message that contains information about
+                      the operation.
+        code(int): the result code of the operation.
+        result(bool): False if any action failed.
+        failed(List[dict]): the failed actions, each with an error.
+    """
+    entity_index = EsIndexes.INDEXES[entity_type]
+    response = {
+        "message": f"Successfully applied {len(actions)} changes to"
+                   f" {entity_index}",
+        "code": 200,
+        "result": True,
+        "failed": []
+    }
+    try:
+        backend = storage_backends.get_storage_backend()
+        response["failed"] = call_backend(
+            "bulk", entity_index,
+            lambda: backend.bulk(entity_index, actions), retry=False)
+        if response["failed"]:
+            response.update({
+                "message": f"{len(response['failed'])} of {len(actions)}"
+                           f" changes to {entity_index} failed",
+                "code": 207,
+                "result": False
+            })
+            logger.warning("%d of %d changes to %s failed",
+                           len(response["failed"]), len(actions),
+                           entity_index)
+        else:
+            logger.info("Applied %d changes to %s", len(actions),
+                        entity_index)
+
+    except Exception as exception:
+        exception_message = (
+            f"Encountered an exception when trying to apply changes to"
+            f" {entity_index}: {exception}"
+        )
+        logger.error(exception_message)
+        response.update({
+            "message": exception_message,
+            "code": 424,
+            "result": False,
+            "failed": list(actions)
+        })
+
+    return response
+
+
 def get_entities_by_user(user_id: str, entity_type: str) -> dict:
     """
     Retrieves all entity instances of the same type that belong to a user.
@@ -234,14 +424,14 @@ def get_entities_by_user(user_id: str, entity_type: str) -> dict:
         f"{entity_type}s": []
     }
     try:
-        es_client = get_elasticsearch_client()
-        search_results = es_client.search(
-            index=entity_index,
-            body={"query": {"match": {"user_id": user_id}}}
-        )
-        response[f"{entity_type}s"] = search_results["hits"]["hits"]
-        logger.info(f"Retrieved {entity_type} from the database:"
-                    f" {search_results}")
+        backend = storage_backends.get_storage_backend()
+        search_results = call_backend(
+            "search", entity_index,
+            lambda: backend.search(entity_index,
+                                   {"match": {"user_id": user_id}}, size=10))
+        response[f"{entity_type}s"] = search_results["hits"]
+        logger.info("Retrieved %d %s of user %s from the database",
+                    len(response[f"{entity_type}s"]), entity_type, user_id)
 
     except Exception as exception:
         exception_message = (
@@ -256,3 +446,73 @@ def get_entities_by_user(user_id: str, entity_type: str) -> dict:
         })
 
     return response
+
+
+def search_entities(entity_type: str, query: dict, size: int,
+                    sort: Optional[list] = None,
+                    search_after: Optional[list] = None,
+                    highlight: Optional[dict] = None,
+                    source: Optional[list] = None) -> dict:
+    """
+    Runs a search query against the index of an entity type and returns
+    one page of hits. Pages are chained with search_after, using the
+    cursor returned with the previous page.
+    """
+    entity_index = EsIndexes.INDEXES[entity_type]
+    response = {
+        "message": f"Successfully searched {entity_index} in the database",
+        "code": 200,
+        "result": True,
+        f"{entity_index}_info": [],
+        "search_after": None
+    }
+    try:
+        backend = storage_backends.get_storage_backend()
+        search_results = call_backend(
+            "search", entity_index,
+            lambda: backend.search(entity_index, query, size, sort,
+                                   search_after, highlight, source))
+        hits = search_results["hits"]
+        for hit in hits:
+            entity_dict = hit["_source"]
+            entity_dict[f"{entity_type}_id"] = hit["_id"]
+            entity_dict["score"] = hit.get("_score")
+            entity_dict["highlight"] = hit.get("highlight", {})
+            response[f"{entity_index}_info"].append(entity_dict)
+        if sort and len(hits) == size:
+            response["search_after"] = hits[-1]["sort"]
+        logger.debug("Searched %s: %d hits in %s ms", entity_index,
+                     len(hits), search_results["took"])
+
+    except Exception as exception:
+        exception_message = (
+            f"Encountered an exception when trying to search"
+            f" {entity_index} in the database: {exception}"
+        )
+        logger.error(exception_message)
+        response.update({
+            "message": exception_message,
+            "code": 424,
+            "result": False
+        })
+
+    return response
+
+
+def aggregate_terms(entity_type: str, field: str, batch_size: int = 1000):
+    """
+    Yields every distinct value of a keyword field together with the
+    number of documents containing it. The values are paged, so the
+    whole vocabulary is never held in a single response.
+    """
+    entity_index = EsIndexes.INDEXES[entity_type]
+    backend = storage_backends.get_storage_backend()
+    after = None
+    while True:
+        buckets, after = call_backend(
+            "search", entity_index,
+            lambda: backend.aggregate_terms(entity_index, field,
+                                            batch_size, after))
+        yield from buckets
+        if after is None:
+            break
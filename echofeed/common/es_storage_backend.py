@@ -0,0 +1,144 @@
+"""
+Storage backend keeping the articles and users in Elasticsearch.
+"""
+from elasticsearch import ConflictError, NotFoundError
+
+from echofeed.common import es_index_bootstrap
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.storage_backends import (DocumentConflict,
+                                              DocumentNotFound,
+                                              StorageBackend,
+                                              get_request_timeout)
+
+
+class ElasticsearchBackend(StorageBackend):
+    """
+    Stores every entity in the index aliased with its name, created with
+    explicit mappings by es_index_bootstrap.
+    """
+    name = "elasticsearch"
+
+    def bootstrap(self) -> bool:
+        return es_index_bootstrap.bootstrap_indexes()
+
+    @staticmethod
+    def _client():
+        es_client = es_helpers.get_elasticsearch_client()
+        if es_client is None:
+            raise ConnectionError("No Elasticsearch client")
+        timeout = get_request_timeout()
+        if timeout is not None:
+            es_client = es_client.options(request_timeout=timeout)
+        return es_client
+
+    def create(self, index, document_id, document):
+        try:
+            created = self._client().index(index=index, id=document_id,
+                                           document=document,
+                                           op_type="create")
+        except ConflictError as exception:
+            raise DocumentConflict(str(exception)) from exception
+        return created["_id"]
+
+    def get(self, index, document_id):
+        try:
+            return dict(self._client().get(index=index, id=document_id))
+        except NotFoundError as exception:
+            raise DocumentNotFound(str(exception)) from exception
+
+    def update(self, index, document_id, fields, if_seq_no=None,
+               if_primary_term=None):
+        concurrency_params = {}
+        if if_seq_no is not None and if_primary_term is not None:
+            concurrency_params = {
+                "if_seq_no": if_seq_no,
+                "if_primary_term": if_primary_term
+            }
+        try:
+            updated = self._client().update(index=index, id=document_id,
+                                            body={"doc": fields},
+                                            **concurrency_params)
+        except ConflictError as exception:
+            raise DocumentConflict(str(exception)) from exception
+        except NotFoundError as exception:
+            raise DocumentNotFound(str(exception)) from exception
+        return {"_seq_no": updated.get("_seq_no"),
+                "_primary_term": updated.get("_primary_term")}
+
+    def delete(self, index, document_id):
+        try:
+            self._client().delete(index=index, id=document_id)
+        except NotFoundError as exception:
+            raise DocumentNotFound(str(exception)) from exception
+
+    def mget(self, index, document_ids):
+        if not document_ids:
+            return []
+        response = self._client().mget(index=index, ids=document_ids)
+        return [dict(document) for document in response["docs"]
+                if document.get("found")]
+
+    def search(self, index, query, size, sort=None, search_after=None,
+               highlight=None, source=None):
+        search_params = {
+            "query": query or {"match_all": {}},
+            "size": size,
+            "track_total_hits": False
+        }
+        if sort:
+            search_params["sort"] = sort
+        if search_after:
+            search_params["search_after"] = search_after
+        if highlight:
+            search_params["highlight"] = highlight
+        if source:
+            search_params["source"] = source
+        response = self._client().search(index=index, **search_params)
+        return {"hits": response["hits"]["hits"], "took": response["took"]}
+
+    def bulk(self, index, actions):
+        if not actions:
+            return []
+        operations = []
+        for action in actions:
+            op = action["op"]
+            metadata = {"_index": index, "_id": action["id"]}
+            if action.get("if_seq_no") is not None \
+                    and action.get("if_primary_term") is not None:
+                metadata.update(if_seq_no=action["if_seq_no"],
+                                if_primary_term=action["if_primary_term"])
+            operations.append({op: metadata})
+            if op == "update":
+                operations.append({"doc": action["document"]})
+            elif op != "delete":
+                operations.append(action["document"])
+        response = self._client().bulk(operations=operations)
+        if not response["errors"]:
+            return []
+        failed = []
+        for action, item in zip(actions, response["items"]):
+            result = next(iter(item.values()))
+            if "error" in result:
+                failed.append({**action, "error": str(result["error"])})
+        return failed
+
+    def aggregate_terms(self, index, field, size, after=None):
+        # the values are paged with a composite aggregation
+        composite = {
+            "size": size,
+            "sources": [{"term": {"terms": {"field": field}}}]
+        }
+        if after:
+            composite["after"] = after
+        response = self._client().search(
+            index=index,
+            size=0,
+            aggs={"terms": {"composite": composite}}
+        )
+        aggregation = response["aggregations"]["terms"]
+        buckets = [(bucket["key"]["term"], bucket["doc_count"])
+                   for bucket in aggregation["buckets"]]
+        after_key = aggregation.get("after_key")
+        if len(buckets) < size:
+            after_key = None
+        return buckets, after_key
@@ -0,0 +1,206 @@
+"""
+Normalization of the keywords coming from GPT, the UI and Google, so
+variants like "București", "Bucuresti" and "bucurești " are the same
+keyword everywhere.
+
+Three forms are used:
+    clean_keyword: the keyword as displayed, without extra whitespace
+                   and surrounding punctuation.
+    fold_keyword: casefolded and without diacritics, used to compare
+                  texts and prefixes.
+    keyword_key: folded and lightly stemmed, used to recognize the
+                 variants of a keyword.
+
+The stored keywords and interests keep the spelling they were sent
+with. Elasticsearch indexes their folded form in the keywords.folded and
+interests.folded sub-fields, with a normalizer doing what fold_keyword
+does to a cleaned keyword; the aggregations and caches use that form.
+The keys name the variants of a keyword in the dictionary, and neither
+form depends on the order the keywords are seen in.
+"""
+import re
+import threading
+import unicodedata
+from typing import Iterable, List, Optional
+
+from echofeed.common import config_info, metrics
+
+# the comma-below letters are the correct Romanian ones, the cedilla
+# letters are still common in older texts
+DIACRITIC_REPLACEMENTS = str.maketrans({
+    "ș": "s", "ş": "s", "Ș": "S", "Ş": "S",
+    "ț": "t", "ţ": "t", "Ț": "T", "Ţ": "T"
+})
+
+PUNCTUATION_PATTERN = re.compile(r"[^\w\s&+#.-]|_")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+EDGE_PUNCTUATION = " -"
+
+# (suffix, replacement) of the Romanian genitive and dative endings,
+# longest first; the shorter endings, like "-ul" or "-le", are left
+# alone as they also end many English words (Seoul, Apple, cable)
+ROMANIAN_SUFFIXES = (("urilor", "uri"), ("ilor", "i"), ("elor", "e"),
+                     ("ului", ""))
+# (suffix, replacement) of the English plurals with a changed ending;
+# the other plurals only lose their final "s"
+ENGLISH_SUFFIXES = (("sses", "ss"), ("xes", "x"), ("ies", "y"))
+# endings of singular words that look like plurals
+SINGULAR_ENDINGS = ("ss", "us", "is")
+# words ending in "s" that are not the plural of another keyword
+INVARIANT_WORDS = frozenset({
+    "news", "series", "species", "means", "politics", "economics",
+    "physics", "mathematics", "statistics", "analytics", "ethics"
+})
+MIN_STEM_LENGTH = 3
+MIN_ROMANIAN_STEM_LENGTH = 4
+
+
+def clean_keyword(keyword: str) -> str:
+    """
+    Removes the punctuation around and inside a keyword and collapses
+    its whitespace, keeping its case and diacritics.
+    """
+    keyword = unicodedata.normalize("NFC", keyword or "")
+    keyword = PUNCTUATION_PATTERN.sub(" ", keyword)
+    keyword = WHITESPACE_PATTERN.sub(" ", keyword).strip(EDGE_PUNCTUATION)
+    # a final dot ends a sentence, unless the keyword is an abbreviation
+    # like "U.S."
+    if keyword.endswith(".") and "." not in keyword[:-1]:
+        keyword = keyword.rstrip(".").strip(EDGE_PUNCTUATION)
+    return keyword
+
+
+def fold_diacritics(text: str) -> str:
+    """
+    Replaces the letters with diacritics by their base letters.
+    """
+    text = unicodedata.normalize("NFKD", text.translate(DIACRITIC_REPLACEMENTS))
+    return "".join(character for character in text
+                   if not unicodedata.combining(character))
+
+
+def fold_text(text: str) -> str:
+    """
+    Returns a text casefolded, without diacritics and with its whitespace
+    collapsed, e.g. a search query.
+    """
+    text = WHITESPACE_PATTERN.sub(" ", text or "").strip()
+    return fold_diacritics(text).casefold()
+
+
+def fold_keyword(keyword: str) -> str:
+    """
+    Returns the cleaned keyword, casefolded and without diacritics.
+    """
+    return fold_text(clean_keyword(keyword))
+
+
+def stem_word(word: str) -> str:
+    """
+    Removes the Romanian genitive and dative endings and the English
+    plural endings from a folded word. The rules are conservative:
+    a variant left unmerged only costs a duplicate, while two merged
+    keywords lose one of them.
+    """
+    if word in INVARIANT_WORDS:
+        return word
+    for suffix, replacement in ROMANIAN_SUFFIXES:
+        stem = f"{word[:-len(suffix)]}{replacement}"
+        if word.endswith(suffix) and len(stem) >= MIN_ROMANIAN_STEM_LENGTH:
+            return stem
+    for suffix, replacement in ENGLISH_SUFFIXES:
+        stem = f"{word[:-len(suffix)]}{replacement}"
+        if word.endswith(suffix) and len(stem) >= MIN_STEM_LENGTH:
+            return stem
+    if (word.endswith("s") and not word.endswith(SINGULAR_ENDINGS)
+            and len(word) > MIN_STEM_LENGTH):
+        return word[:-1]
+    return word
+
+
+def keyword_key(keyword: str) -> str:
+    """
+    Returns the key shared by all the variants of a keyword. Hyphens
+    separate words, so "Cluj-Napoca" and "Cluj Napoca" share the key.
+    """
+    words = fold_keyword(keyword).replace("-", " ").split()
+    return " ".join(stem_word(word) for word in words)
+
+
+def deduplicate_keywords(keywords: Optional[Iterable[str]]) -> List[str]:
+    """
+    Returns the cleaned keywords without empty keywords and variants of
+    an earlier keyword, in their original order and spelling.
+    """
+    unique_keywords = {}
+    for keyword in keywords or []:
+        keyword = clean_keyword(keyword)
+        key = keyword_key(keyword)
+        if key:
+            unique_keywords.setdefault(key, keyword)
+    return list(unique_keywords.values())
+
+
+class KeywordDictionary:
+    """
+    Keyword dictionary of a process: maps the key of every known keyword
+    to an integer id, used to count and suggest the variants of a keyword
+    as one. The canonical form of an id is its key, so it is the same in
+    every process, whatever order the variants were seen in. Once
+    max_size keywords are known, new keywords get no id.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._ids = {}
+        self._keywords = []
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._keywords)
+
+    def get_id(self, keyword: str) -> Optional[int]:
+        """
+        Returns the id of a keyword, registering it if it is new.
+
+        Args:
+            keyword (str): Any variant of the keyword.
+
+        Returns:
+            int: The id, None for empty keywords or a full dictionary.
+        """
+        key = keyword_key(keyword)
+        if not key:
+            return None
+        keyword_id = self._ids.get(key)
+        metrics.record_cache_lookup("keyword_dictionary",
+                                    keyword_id is not None)
+        if keyword_id is not None:
+            return keyword_id
+        with self._lock:
+            keyword_id = self._ids.get(key)
+            if keyword_id is None and len(self._keywords) < self.max_size:
+                keyword_id = len(self._keywords)
+                self._keywords.append(key)
+                self._ids[key] = keyword_id
+        return keyword_id
+
+    def get_keyword(self, keyword_id: int) -> str:
+        """
+        Returns the canonical form of a keyword id.
+        """
+        return self._keywords[keyword_id]
+
+    def canonicalize(self, keyword: str) -> str:
+        """
+        Returns the canonical form of a keyword, registering it if it is
+        new.
+        """
+        keyword_id = self.get_id(keyword)
+        if keyword_id is None:
+            return keyword_key(keyword)
+        return self._keywords[keyword_id]
+
+
+KEYWORD_DICTIONARY = KeywordDictionary(
+    max_size=config_info.KEYWORD_DICTIONARY_MAX_SIZE)
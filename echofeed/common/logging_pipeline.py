@@ -0,0 +1,230 @@
+"""
+Asynchronous logging pipeline of the services.
+
+Loggers only put records on a queue; a listener thread formats them and
+writes them to stdout, so a request never waits for the console. To keep
+the caller's cost bounded, the arguments of %-style messages are turned
+into short representations before being queued: containers show their
+first items only, long strings are cut and the values of sensitive keys
+(passwords, tokens, keys) are replaced. The listener also masks bcrypt
+hashes and session tokens found in the final text.
+
+Records can be sampled: the rate of a level applies to every record of
+that level, and a record can carry its own rate with
+extra={"sample_rate": 0.01}.
+"""
+import atexit
+import itertools
+import logging
+import logging.handlers
+import queue
+import random
+import re
+import reprlib
+import sys
+import threading
+from typing import Dict, Optional
+
+REDACTED = "<redacted>"
+SENSITIVE_KEYS = frozenset({"password", "hashed_password", "access_token",
+                            "refresh_token", "authorization", "api_key",
+                            "secret"})
+SENSITIVE_PATTERNS = (
+    # bcrypt hashes
+    re.compile(r"\$2[aby]?\$\d{2}\$[./A-Za-z0-9]{53}"),
+    # session tokens, JWTs
+    re.compile(r"eyJ[\w-]+\.[\w-]+\.[\w-]+"),
+    # OpenAI API keys
+    re.compile(r"sk-[\w-]{20,}")
+)
+
+_PIPELINE_LOCK = threading.Lock()
+_LISTENER = None
+
+
+def redact_text(text: str) -> str:
+    """
+    Masks the secrets recognizable in a text.
+    """
+    for pattern in SENSITIVE_PATTERNS:
+        text = pattern.sub(REDACTED, text)
+    return text
+
+
+class PayloadRepr(reprlib.Repr):
+    """
+    Bounded representation of the logged values: at most max_items items
+    of every container, max_string characters of every string and
+    max_level levels of nesting, with the sensitive keys redacted.
+    Building it costs the same for a 10 item and a 10k item response.
+    """
+
+    def __init__(self, max_items: int, max_string: int, max_level: int):
+        super().__init__()
+        self.maxdict = self.maxlist = self.maxtuple = max_items
+        self.maxset = self.maxfrozenset = self.maxdeque = max_items
+        self.maxarray = max_items
+        self.maxstring = self.maxother = max_string
+        self.maxlevel = max_level
+
+    def repr_dict(self, x, level):
+        if not x:
+            return "{}"
+        if level <= 0:
+            return "{...}"
+        pieces = []
+        for key in itertools.islice(x, self.maxdict):
+            if isinstance(key, str) and key.lower() in SENSITIVE_KEYS:
+                value = REDACTED
+            else:
+                value = self.repr1(x[key], level - 1)
+            pieces.append(f"{self.repr1(key, level - 1)}: {value}")
+        if len(x) > self.maxdict:
+            pieces.append(f"... ({len(x)} items)")
+        return "{" + ", ".join(pieces) + "}"
+
+    def shorten(self, value) -> object:
+        """
+        Returns the value to queue instead of a logged argument.
+        """
+        if value is None or isinstance(value, (bool, int, float)):
+            return value
+        if isinstance(value, str):
+            if len(value) <= self.maxstring:
+                return value
+            return f"{value[:self.maxstring]}... ({len(value)} chars)"
+        if isinstance(value, BaseException):
+            return self.shorten(f"{type(value).__name__}: {value}")
+        return self.repr(value)
+
+
+class AsyncQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queues the records with their arguments shortened. The message is
+    formatted later, on the listener thread.
+    """
+
+    def __init__(self, record_queue, payload_repr: PayloadRepr):
+        super().__init__(record_queue)
+        self.payload_repr = payload_repr
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, dict):
+            # logging passes a single mapping argument as the args, both
+            # for %(name)s messages and for logging a dict with %s
+            if "%(" in str(record.msg):
+                record.args = {
+                    key: REDACTED if key.lower() in SENSITIVE_KEYS
+                    else self.payload_repr.shorten(value)
+                    for key, value in record.args.items()
+                }
+            else:
+                record.args = (self.payload_repr.shorten(record.args),)
+        elif record.args:
+            record.args = tuple(self.payload_repr.shorten(arg)
+                                for arg in record.args)
+        if record.exc_info:
+            # the traceback refers to the frames of the caller, so it is
+            # rendered before the record leaves the thread
+            record.exc_text = logging.Formatter().formatException(
+                record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class RedactingFormatter(logging.Formatter):
+    """
+    Formats the records, masks the secrets left in the text and cuts
+    messages longer than max_length characters.
+    """
+
+    def __init__(self, fmt: str, max_length: int):
+        super().__init__(fmt)
+        self.max_length = max_length
+
+    def format(self, record: logging.LogRecord) -> str:
+        text = redact_text(super().format(record))
+        if len(text) > self.max_length:
+            text = f"{text[:self.max_length]}... ({len(text)} chars)"
+        return text
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a random share of the records of every level.
+    """
+
+    def __init__(self, sample_rates: Dict[int, float]):
+        super().__init__()
+        self.sample_rates = sample_rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            rate = self.sample_rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+def setup_logging(root_name: str, fmt: str, level: str,
+                  logger_levels: Optional[Dict[str, str]] = None,
+                  sample_rates: Optional[Dict[str, float]] = None,
+                  max_message_length: int = 2000,
+                  max_payload_items: int = 10,
+                  max_payload_string: int = 200,
+                  stream=None) -> None:
+    """
+    Starts the pipeline of a logger hierarchy. Later calls do nothing, so
+    every module can ask for its logger at import.
+
+    Args:
+        root_name (str): The logger whose records go through the pipeline,
+                         together with its children.
+        fmt (str): The format of the lines.
+        level (str): The level of root_name.
+        logger_levels (dict): Levels of the child loggers, by name.
+        sample_rates (dict): The share of records kept, by level name.
+        max_message_length (int): The longest line written.
+        max_payload_items (int): Container items shown per argument.
+        max_payload_string (int): Characters shown per string argument.
+        stream: Where the lines are written, stdout by default.
+    """
+    global _LISTENER
+    with _PIPELINE_LOCK:
+        if _LISTENER is not None:
+            return
+
+        record_queue = queue.SimpleQueue()
+        queue_handler = AsyncQueueHandler(
+            record_queue,
+            PayloadRepr(max_payload_items, max_payload_string, max_level=3))
+        queue_handler.addFilter(SamplingFilter({
+            logging.getLevelName(level_name): rate
+            for level_name, rate in (sample_rates or {}).items()
+        }))
+
+        root_logger = logging.getLogger(root_name)
+        root_logger.setLevel(level)
+        root_logger.handlers.clear()
+        root_logger.addHandler(queue_handler)
+        root_logger.propagate = False
+        for logger_name, logger_level in (logger_levels or {}).items():
+            logging.getLogger(logger_name).setLevel(logger_level)
+
+        stream_handler = logging.StreamHandler(stream or sys.stdout)
+        stream_handler.setFormatter(
+            RedactingFormatter(fmt, max_message_length))
+        _LISTENER = logging.handlers.QueueListener(record_queue,
+                                                   stream_handler)
+        _LISTENER.start()
+        atexit.register(stop_logging)
+
+
+def stop_logging() -> None:
+    """
+    Writes the queued records and stops the listener thread.
+    """
+    global _LISTENER
+    with _PIPELINE_LOCK:
+        if _LISTENER is not None:
+            _LISTENER.stop()
+            _LISTENER = None
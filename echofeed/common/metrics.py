@@ -0,0 +1,453 @@
+"""
+In-process metrics of the API service, exposed on /metrics in the
+Prometheus text format.
+
+Every metric keeps one shard of values per thread, so recording a value
+never takes a lock: a thread only writes to its own shard and the
+shards are merged when the metrics are scraped. A lock is only taken the
+first time a thread records a value of a metric, to register its shard.
+The shards of finished threads are folded into one retired shard at
+scrape time, so short-lived pool threads do not accumulate.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# latency buckets in seconds, from a cached lookup to a slow GPT call
+DEFAULT_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+                           2.5, 5.0, 10.0, 30.0)
+
+
+def escape_label_value(value: str) -> str:
+    """
+    Escapes a label value as required by the Prometheus text format.
+    """
+    return (str(value).replace("\\", "\\\\").replace("\n", "\\n")
+            .replace('"', '\\"'))
+
+
+def format_labels(label_names: Iterable[str], label_values: Iterable[str],
+                  extra: str = "") -> str:
+    """
+    Formats the labels of a sample, e.g. {route="/metrics",method="GET"}.
+    """
+    labels = [f'{name}="{escape_label_value(value)}"'
+              for name, value in zip(label_names, label_values)]
+    if extra:
+        labels.append(extra)
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+
+def format_value(value: float) -> str:
+    """
+    Formats a sample value, without a fractional part for integers.
+    """
+    if value == int(value):
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class of the metrics: a name, a help text, label names and the
+    per-thread shards of values.
+    """
+    metric_type = "untyped"
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Tuple[str, ...] = (),
+                 registry: Optional["MetricsRegistry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._shards_lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def _shard(self) -> dict:
+        """
+        Returns the values recorded by the current thread.
+        """
+        try:
+            return self._local.values
+        except AttributeError:
+            values = {}
+            with self._shards_lock:
+                self._shards.append((threading.current_thread(), values))
+            self._local.values = values
+            return values
+
+    def _check_labels(self, label_values: tuple) -> None:
+        if len(label_values) != len(self.label_names):
+            raise ValueError(f"{self.name} expects the labels"
+                             f" {self.label_names}, got {label_values}")
+
+    @staticmethod
+    def _merge(total, value):
+        """
+        Adds a value recorded by a shard to a total, None if there is no
+        total yet.
+        """
+        return value if total is None else total + value
+
+    def _merge_shard(self, values: dict, shard: dict) -> None:
+        for label_values, value in shard.items():
+            values[label_values] = self._merge(values.get(label_values),
+                                               value)
+
+    def _snapshots(self) -> list:
+        """
+        Returns a copy of every shard, after folding the shards of the
+        finished threads into the retired shard. dict.copy does not
+        release the GIL, so a shard is never read while its thread
+        resizes it.
+        """
+        with self._shards_lock:
+            live_shards = []
+            for thread, shard in self._shards:
+                if thread.is_alive():
+                    live_shards.append((thread, shard))
+                else:
+                    self._merge_shard(self._retired, shard)
+            self._shards = live_shards
+            snapshots = [self._retired.copy()]
+        return snapshots + [shard.copy() for _, shard in live_shards]
+
+    def collect(self) -> Dict[tuple, float]:
+        """
+        Returns the value of every label combination, summed over the
+        shards.
+        """
+        values = {}
+        for shard in self._snapshots():
+            self._merge_shard(values, shard)
+        return values
+
+    def render(self) -> list:
+        """
+        Returns the lines of the metric in the Prometheus text format.
+        """
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}"
+                         f"{format_labels(self.label_names, label_values)}"
+                         f" {format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """
+    A value that only increases, e.g. the number of requests.
+    """
+    metric_type = "counter"
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        """
+        Increases the counter of a label combination.
+        """
+        self._check_labels(label_values)
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that goes up and down, e.g. the requests in flight. Instead
+    of being increased, a gauge can also be read from a function when
+    the metrics are scraped.
+    """
+    metric_type = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._function = None
+
+    def inc(self, *label_values, amount: float = 1) -> None:
+        """
+        Increases the gauge of a label combination.
+        """
+        self._check_labels(label_values)
+        shard = self._shard()
+        shard[label_values] = shard.get(label_values, 0) + amount
+
+    def dec(self, *label_values, amount: float = 1) -> None:
+        """
+        Decreases the gauge of a label combination.
+        """
+        self.inc(*label_values, amount=-amount)
+
+    def set_function(self, function: Callable[[], Dict[tuple, float]]) \
+            -> None:
+        """
+        Reads the gauge from a function returning the value of every
+        label combination, e.g. {("queued",): 3}.
+        """
+        self._function = function
+
+    def collect(self) -> Dict[tuple, float]:
+        if self._function is not None:
+            return dict(self._function())
+        return super().collect()
+
+
+class Histogram(Metric):
+    """
+    Distribution of observed values, e.g. latencies, counted in
+    cumulative buckets.
+    """
+    metric_type = "histogram"
+
+    def __init__(self, name: str, documentation: str,
+                 label_names: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_LATENCY_BUCKETS,
+                 registry: Optional["MetricsRegistry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, label_names, registry)
+
+    def observe(self, value: float, *label_values) -> None:
+        """
+        Records a value. A shard keeps, for every label combination, the
+        non-cumulative bucket counts followed by the sum and the count.
+        """
+        self._check_labels(label_values)
+        shard = self._shard()
+        counts = shard.get(label_values)
+        if counts is None:
+            counts = [0] * (len(self.buckets) + 2)
+            shard[label_values] = counts
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        counts[-2] += value
+        counts[-1] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """
+        Observes the duration of a block, in seconds.
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start_time, *label_values)
+
+    @staticmethod
+    def _merge(total, value):
+        # the counts are copied, the thread of a shard keeps updating them
+        if total is None:
+            return list(value)
+        return [first + second for first, second in zip(total, value)]
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}",
+                 f"# TYPE {self.name} {self.metric_type}"]
+        for label_values, counts in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = format_labels(self.label_names, label_values,
+                                       f'le="{format_value(bound)}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.label_names, label_values,
+                                   'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels}"
+                         f" {format_value(counts[-1])}")
+            labels = format_labels(self.label_names, label_values)
+            lines.append(f"{self.name}_sum{labels}"
+                         f" {format_value(counts[-2])}")
+            lines.append(f"{self.name}_count{labels}"
+                         f" {format_value(counts[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    The metrics exposed on /metrics.
+    """
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> None:
+        """
+        Adds a metric to the registry.
+
+        Raises:
+            ValueError: if a metric with the same name is registered.
+        """
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already"
+                                 f" registered")
+            self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        """
+        Returns all the metrics in the Prometheus text format.
+        """
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+HTTP_REQUEST_DURATION = Histogram(
+    "echofeed_http_request_duration_seconds",
+    "Duration of the API requests, by route.",
+    ("method", "route"))
+HTTP_REQUESTS = Counter(
+    "echofeed_http_requests_total",
+    "API requests, by route and status code.",
+    ("method", "route", "status"))
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    "echofeed_http_requests_in_flight",
+    "API requests being handled.")
+
+STORAGE_OPERATION_DURATION = Histogram(
+    "echofeed_storage_operation_duration_seconds",
+    "Duration of the storage backend calls, by backend (elasticsearch or"
+    " sqlite) and operation.",
+    ("backend", "operation"))
+STORAGE_OPERATION_ERRORS = Counter(
+    "echofeed_storage_operation_errors_total",
+    "Storage backend calls that raised an exception, by backend and"
+    " operation.",
+    ("backend", "operation"))
+
+OPENAI_CALL_DURATION = Histogram(
+    "echofeed_openai_call_duration_seconds",
+    "Duration of the OpenAI calls, retries included, by function.",
+    ("function",))
+OPENAI_TOKENS = Counter(
+    "echofeed_openai_tokens_total",
+    "OpenAI tokens used, by function and kind (prompt or completion).",
+    ("function", "kind"))
+OPENAI_CALL_FAILURES = Counter(
+    "echofeed_openai_call_failures_total",
+    "OpenAI calls without a valid answer, by function.",
+    ("function",))
+
+GOOGLE_CSE_DURATION = Histogram(
+    "echofeed_google_cse_request_duration_seconds",
+    "Duration of the Google Custom Search requests.")
+GOOGLE_CSE_REQUESTS = Counter(
+    "echofeed_google_cse_requests_total",
+    "Google Custom Search requests, by status code.",
+    ("status",))
+GOOGLE_CSE_QUOTA_USED = Gauge(
+    "echofeed_google_cse_quota_used_ratio",
+    "Share of the daily Google Custom Search quota used today.")
+
+CACHE_REQUESTS = Counter(
+    "echofeed_cache_requests_total",
+    "Cache lookups, by cache and result (hit or miss).",
+    ("cache", "result"))
+
+PASSWORD_POOL_CALLS = Gauge(
+    "echofeed_password_pool_calls",
+    "Password hashing calls, by state (queued, running, completed,"
+    " rejected).",
+    ("state",))
+
+VIEW_EVENTS = Counter(
+    "echofeed_view_events_total",
+    "Article views received by the write-behind buffer, by result"
+    " (buffered, coalesced or rejected).",
+    ("result",))
+VIEW_BUFFER_EVENTS = Gauge(
+    "echofeed_view_buffer_events",
+    "Article views waiting to be written to the users.")
+VIEW_FLUSHES = Counter(
+    "echofeed_view_flushes_total",
+    "Bulk writes of the buffered views, by result (ok, partial or"
+    " failed).",
+    ("result",))
+VIEW_FLUSH_DURATION = Histogram(
+    "echofeed_view_flush_duration_seconds",
+    "Duration of the bulk writes of the buffered views.")
+
+BREAKER_STATE = Gauge(
+    "echofeed_circuit_breaker_state",
+    "State of the circuit breaker of each dependency: 0 closed, 1 half"
+    " open, 2 open.",
+    ("dependency",))
+BREAKER_TRANSITIONS = Counter(
+    "echofeed_circuit_breaker_transitions_total",
+    "Circuit breaker state changes, by dependency and new state.",
+    ("dependency", "state"))
+BREAKER_REJECTIONS = Counter(
+    "echofeed_circuit_breaker_rejections_total",
+    "Calls rejected because the circuit breaker of their dependency was"
+    " open.",
+    ("dependency",))
+DEPENDENCY_RETRIES = Counter(
+    "echofeed_dependency_retries_total",
+    "Failed attempts retried, by dependency.",
+    ("dependency",))
+DEPENDENCY_FALLBACKS = Counter(
+    "echofeed_dependency_fallbacks_total",
+    "Calls answered with a cached or degraded result, by dependency.",
+    ("dependency",))
+
+HEDGED_CALLS = Counter(
+    "echofeed_hedged_calls_total",
+    "Calls of the dependencies with a hedging policy, by dependency and"
+    " outcome (not_hedged, hedged or over_budget).",
+    ("dependency", "outcome"))
+HEDGE_RESULTS = Counter(
+    "echofeed_hedge_results_total",
+    "Hedged calls by dependency and result: won when the hedge answered"
+    " first, lost when the first request did, failed when both failed.",
+    ("dependency", "result"))
+
+RATE_LIMITED_REQUESTS = Counter(
+    "echofeed_rate_limited_requests_total",
+    "Expensive requests rejected with a 429, by route and reason (user,"
+    " ip, queue_full or queue_timeout).",
+    ("route", "reason"))
+EXPENSIVE_REQUESTS = Gauge(
+    "echofeed_expensive_requests",
+    "Expensive requests by state (running or queued).",
+    ("state",))
+
+
+@contextmanager
+def track_storage(backend: str, operation: str):
+    """
+    Observes the duration of a storage backend call and counts it as an
+    error if it raises.
+    """
+    start_time = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STORAGE_OPERATION_ERRORS.inc(backend, operation)
+        raise
+    finally:
+        STORAGE_OPERATION_DURATION.observe(time.perf_counter() - start_time,
+                                           backend, operation)
+
+
+def record_cache_lookup(cache: str, hit: bool) -> None:
+    """
+    Counts a lookup of a cache, used to compute its hit ratio.
+    """
+    CACHE_REQUESTS.inc(cache, "hit" if hit else "miss")
+
+
+def render_metrics() -> str:
+    """
+    Returns the metrics of the service in the Prometheus text format.
+    """
+    return REGISTRY.render()
@@ -0,0 +1,405 @@
+"""
+Timeouts, retries and circuit breakers shared by the calls to the
+external dependencies: Google Custom Search, OpenAI and the storage
+backend.
+
+Every dependency has a Dependency object. A call gets a timeout per
+attempt and a deadline for all its attempts; failed attempts are retried
+with exponential backoff and full jitter while the deadline allows it.
+After BREAKER_FAILURE_THRESHOLD consecutive failed calls the circuit
+breaker of the dependency opens and calls fail fast with CircuitOpen,
+or get their fallback, until BREAKER_RESET_SECONDS have passed; then a
+single trial call decides whether the breaker closes again.
+
+A dependency can also hedge its calls (see HedgingPolicy): an attempt
+still running after the usual latency of the dependency is duplicated,
+and the first answer wins.
+"""
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Optional
+
+from echofeed.common import config_info, metrics, tracing
+
+logger = config_info.get_logger(__name__)
+
+
+class CircuitOpen(Exception):
+    """
+    Raised instead of calling a dependency whose circuit breaker is
+    open.
+    """
+
+
+class BreakerStates:
+    """
+    Class used to define constants for the circuit breaker states, with
+    the values of the state gauge
+    """
+    CLOSED = "closed"
+    HALF_OPEN = "half_open"
+    OPEN = "open"
+
+    GAUGE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class CircuitBreaker:
+    """
+    Counts the consecutive failed calls of a dependency, each after all
+    its attempts, and rejects the calls while the dependency is
+    considered down.
+    """
+
+    def __init__(self, name: str, failure_threshold: int,
+                 reset_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self._lock = threading.Lock()
+        self._state = BreakerStates.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._state
+
+    def before_call(self) -> None:
+        """
+        Lets a call through, or raises CircuitOpen. Once reset_seconds
+        have passed since the breaker opened, one trial call is let
+        through at a time.
+        """
+        with self._lock:
+            if self._state == BreakerStates.OPEN \
+                    and time.monotonic() - self._opened_at \
+                    >= self.reset_seconds:
+                self._transition(BreakerStates.HALF_OPEN)
+            if self._state == BreakerStates.CLOSED:
+                return
+            if self._state == BreakerStates.HALF_OPEN \
+                    and not self._trial_running:
+                self._trial_running = True
+                return
+        metrics.BREAKER_REJECTIONS.inc(self.name)
+        raise CircuitOpen(f"{self.name} is unavailable, its circuit breaker"
+                          f" is open")
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            if self._state != BreakerStates.CLOSED:
+                self._transition(BreakerStates.CLOSED)
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self._state == BreakerStates.HALF_OPEN \
+                    or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+                if self._state != BreakerStates.OPEN:
+                    self._transition(BreakerStates.OPEN)
+
+    def _transition(self, state: str) -> None:
+        """
+        Changes the state; the lock must be held.
+        """
+        log = logger.warning if state == BreakerStates.OPEN else logger.info
+        log("Circuit breaker of %s: %s -> %s", self.name, self._state, state)
+        self._state = state
+        metrics.BREAKER_TRANSITIONS.inc(self.name, state)
+
+
+def backoff_delay(attempt: int, base_seconds: float,
+                  max_seconds: float) -> float:
+    """
+    Returns the wait before retrying after a failed attempt (1 for the
+    first): a random value up to base_seconds * 2 ** (attempt - 1),
+    capped at max_seconds, so the retries of many callers spread out.
+    """
+    return random.uniform(0, min(max_seconds,
+                                 base_seconds * 2 ** (attempt - 1)))
+
+
+class HedgingPolicy:
+    """
+    Sends a second, identical request when the first one has not
+    answered within the hedge_percentile of the recent latencies of the
+    dependency, and returns the first answer. The requests run on a
+    thread pool; the slower one runs to its end and its answer is
+    dropped.
+
+    Every call adds budget_ratio to a budget of at most budget_max hedges
+    and every hedge spends one, so at most about budget_ratio of the
+    calls are hedged even when the dependency slows down as a whole.
+    """
+
+    def __init__(self, name: str, hedge_percentile: float,
+                 budget_ratio: float, budget_max: float = 10.0,
+                 min_samples: int = 20, samples_kept: int = 500,
+                 min_delay_seconds: float = 0.05, max_workers: int = 16):
+        self.name = name
+        self.hedge_percentile = hedge_percentile
+        self.budget_ratio = budget_ratio
+        self.budget_max = budget_max
+        self.min_samples = min_samples
+        self.min_delay_seconds = min_delay_seconds
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=samples_kept)
+        self._budget = budget_max
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=f"echofeed-hedge-{name}"
+        )
+
+    def hedge_delay(self) -> Optional[float]:
+        """
+        Returns how long to wait for the first request before hedging,
+        or None while too few latencies are known.
+        """
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            return None
+        index = min(int(len(latencies) * self.hedge_percentile),
+                    len(latencies) - 1)
+        return max(latencies[index], self.min_delay_seconds)
+
+    def _spend_budget(self) -> bool:
+        with self._lock:
+            if self._budget < 1:
+                return False
+            self._budget -= 1
+            return True
+
+    def _timed(self, func: Callable, *args):
+        """
+        Runs a request and keeps its latency if it succeeds; failures
+        are often fast and would lower the percentile.
+        """
+        start_time = time.perf_counter()
+        result = func(*args)
+        with self._lock:
+            self._latencies.append(time.perf_counter() - start_time)
+        return result
+
+    def run(self, func: Callable, *args):
+        """
+        Runs a request, hedged if it is slow and the budget allows it.
+
+        Returns:
+            The result of the first request to succeed.
+
+        Raises:
+            Exception: the exception of the first request, if every
+                       request failed.
+        """
+        with self._lock:
+            self._budget = min(self.budget_max,
+                               self._budget + self.budget_ratio)
+        delay = self.hedge_delay()
+        if delay is None:
+            metrics.HEDGED_CALLS.inc(self.name, "not_hedged")
+            return self._timed(func, *args)
+
+        primary = self._executor.submit(
+            tracing.run_in_context(self._timed), func, *args)
+        done, _ = wait([primary], timeout=delay)
+        if done:
+            metrics.HEDGED_CALLS.inc(self.name, "not_hedged")
+            return primary.result()
+        if not self._spend_budget():
+            metrics.HEDGED_CALLS.inc(self.name, "over_budget")
+            return primary.result()
+
+        metrics.HEDGED_CALLS.inc(self.name, "hedged")
+        logger.debug("Hedging a %s request after %.3fs", self.name, delay)
+        hedge = self._executor.submit(
+            tracing.run_in_context(self._timed), func, *args)
+        pending = {primary, hedge}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    metrics.HEDGE_RESULTS.inc(
+                        self.name, "won" if future is hedge else "lost")
+                    return future.result()
+        metrics.HEDGE_RESULTS.inc(self.name, "failed")
+        return primary.result()
+
+
+def hedging_policy(name: str, enabled: bool) -> Optional[HedgingPolicy]:
+    """
+    Returns a hedging policy with the configured percentile and budget,
+    or None if hedging is not enabled for the dependency.
+    """
+    if not enabled:
+        return None
+    return HedgingPolicy(name, config_info.HEDGE_PERCENTILE,
+                         config_info.HEDGE_BUDGET_RATIO)
+
+
+class Dependency:
+    """
+    The timeout, retry and circuit breaker policy of an external
+    dependency.
+    """
+
+    def __init__(self, name: str, timeout_seconds: float,
+                 deadline_seconds: float, max_attempts: int,
+                 is_failure: Callable[[Exception], bool] = None,
+                 is_retryable: Callable[[Exception], bool] = None,
+                 hedging: Optional[HedgingPolicy] = None):
+        """
+        Args:
+            name (str): The name of the dependency, used in the metrics.
+            timeout_seconds (float): The timeout of one attempt.
+            deadline_seconds (float): The time all the attempts of a
+                                      call may take.
+            max_attempts (int): The attempts of a retried call.
+            is_failure (callable): Tells whether an exception means that
+                                   the dependency failed, as opposed to
+                                   an expected error such as a missing
+                                   document. Defaults to every exception.
+            is_retryable (callable): Tells whether a failure is worth
+                                     retrying. Defaults to every failure.
+            hedging (HedgingPolicy): Hedges the slow attempts; None to
+                                     never hedge.
+        """
+        self.name = name
+        self.timeout_seconds = timeout_seconds
+        self.deadline_seconds = deadline_seconds
+        self.max_attempts = max_attempts
+        self.is_failure = is_failure or (lambda exception: True)
+        self.is_retryable = is_retryable or (lambda exception: True)
+        self.hedging = hedging
+        self.breaker = CircuitBreaker(name,
+                                      config_info.BREAKER_FAILURE_THRESHOLD,
+                                      config_info.BREAKER_RESET_SECONDS)
+
+    def call(self, func: Callable[[float], object], retry: bool = True,
+             fallback: Optional[Callable[[Exception], object]] = None,
+             hedge: bool = True):
+        """
+        Calls a dependency through its circuit breaker, retrying the
+        failed attempts.
+
+        Args:
+            func (callable): Makes one attempt; receives the timeout of
+                             the attempt in seconds.
+            retry (bool): False for calls that are not safe to repeat,
+                          e.g. creating a document.
+            fallback (callable): Returns the result used when the call
+                                 fails or the breaker is open; receives
+                                 the exception.
+            hedge (bool): False for calls that must not be sent twice,
+                          e.g. streamed answers.
+
+        Returns:
+            The result of func, or of fallback.
+
+        Raises:
+            CircuitOpen: if the breaker is open and there is no fallback.
+            Exception: the last exception of func, if there is no
+                       fallback.
+        """
+        try:
+            self.breaker.before_call()
+        except CircuitOpen as exception:
+            if fallback is None:
+                raise
+            metrics.DEPENDENCY_FALLBACKS.inc(self.name)
+            return fallback(exception)
+
+        deadline = time.monotonic() + self.deadline_seconds
+        max_attempts = self.max_attempts if retry else 1
+        attempt = 0
+        while True:
+            attempt += 1
+            timeout = min(self.timeout_seconds,
+                          max(deadline - time.monotonic(), 0.001))
+            try:
+                if hedge and self.hedging is not None:
+                    result = self.hedging.run(func, timeout)
+                else:
+                    result = func(timeout)
+            except Exception as exception:
+                if not self.is_failure(exception):
+                    self.breaker.record_success()
+                    raise
+                delay = backoff_delay(attempt,
+                                      config_info.RETRY_BACKOFF_BASE_SECONDS,
+                                      config_info.RETRY_BACKOFF_MAX_SECONDS)
+                if attempt < max_attempts and self.is_retryable(exception) \
+                        and time.monotonic() + delay < deadline:
+                    metrics.DEPENDENCY_RETRIES.inc(self.name)
+                    logger.info("Retrying %s in %.2fs after attempt %d"
+                                " failed: %s", self.name, delay, attempt,
+                                exception)
+                    time.sleep(delay)
+                    continue
+                self.breaker.record_failure()
+                if fallback is None:
+                    raise
+                metrics.DEPENDENCY_FALLBACKS.inc(self.name)
+                logger.warning("%s failed, using its fallback: %s",
+                               self.name, exception)
+                return fallback(exception)
+            self.breaker.record_success()
+            return result
+
+
+class FallbackCache:
+    """
+    The last successful results of a dependency, by request, served
+    while the dependency is down. The least recently used results are
+    dropped above max_size.
+    """
+
+    def __init__(self, name: str, max_size: int):
+        self.name = name
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._results = OrderedDict()
+
+    def put(self, key, result) -> None:
+        with self._lock:
+            self._results[key] = result
+            self._results.move_to_end(key)
+            while len(self._results) > self.max_size:
+                self._results.popitem(last=False)
+
+    def get(self, key):
+        """
+        Returns the cached result of a request, or None.
+        """
+        with self._lock:
+            result = self._results.get(key)
+            if result is not None:
+                self._results.move_to_end(key)
+        metrics.record_cache_lookup(self.name, result is not None)
+        return result
+
+
+DEPENDENCIES = {}
+
+
+def register(dependency: Dependency) -> Dependency:
+    """
+    Adds a dependency to the breaker state metric and returns it.
+    """
+    DEPENDENCIES[dependency.name] = dependency
+    return dependency
+
+
+metrics.BREAKER_STATE.set_function(lambda: {
+    (name,): BreakerStates.GAUGE_VALUES[dependency.breaker.state]
+    for name, dependency in list(DEPENDENCIES.items())
+})
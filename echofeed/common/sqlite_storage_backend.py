@@ -0,0 +1,581 @@
+"""
+Storage backend keeping the articles and users in an embedded SQLite
+database, for small deployments and test runs without an Elasticsearch
+node.
+
+Documents are stored as JSON, with their text fields copied into an FTS5
+table (diacritics folded, so "inflatie" finds "inflație"). Queries are
+compiled from the subset of the Elasticsearch query DSL used by the API
+(match_all, match, term, terms, multi_match, range and bool) into SQL,
+and full text matches are scored with BM25 like in Elasticsearch. Field
+boosts are kept, the language analyzers are not: title and title.ro
+search the same column. The folded keyword sub-fields are computed with
+fold_keyword, like the normalizer of the Elasticsearch mappings.
+"""
+import json
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from echofeed.common.keyword_normalization import fold_keyword
+from echofeed.common.storage_backends import (DocumentConflict,
+                                              DocumentNotFound,
+                                              StorageBackend,
+                                              get_request_timeout)
+
+# the busy timeout of the calls made without a timeout
+DEFAULT_BUSY_TIMEOUT_MS = 5000
+# virtual machine instructions run between two checks of the timeout
+PROGRESS_CHECK_INSTRUCTIONS = 10000
+
+# the columns of the full text table, and the fields searching them
+FULL_TEXT_COLUMNS = ("title", "content", "keywords")
+FULL_TEXT_FIELDS = {
+    "title": "title",
+    "title.ro": "title",
+    "content": "content",
+    "content.ro": "content",
+    "keywords.text": "keywords"
+}
+# the sub-fields holding the folded values of a keyword field
+FOLDED_SUBFIELD = ".folded"
+TOKEN_PATTERN = re.compile(r"\w+")
+FIELD_NAME_PATTERN = re.compile(r"^[\w.]+$")
+HIGHLIGHT_TAGS = ("<em>", "</em>")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    document_index TEXT NOT NULL,
+    document_id TEXT NOT NULL,
+    source TEXT NOT NULL,
+    seq_no INTEGER NOT NULL,
+    PRIMARY KEY (document_index, document_id)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS documents_fts USING fts5(
+    title, content, keywords,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+CREATE TABLE IF NOT EXISTS sequence (value INTEGER NOT NULL);
+INSERT INTO sequence SELECT -1 WHERE NOT EXISTS (SELECT 1 FROM sequence);
+"""
+
+
+def json_path(field: str) -> str:
+    """
+    Returns the JSON path of a document field, e.g. $.date.
+    """
+    if not FIELD_NAME_PATTERN.match(field):
+        raise ValueError(f"Invalid field name {field}")
+    return f"$.{field}"
+
+
+def value_expression(field: str) -> Tuple[str, str]:
+    """
+    Returns the JSON path of a field and the SQL expression of its values
+    in json_each, folded for the folded sub-fields.
+    """
+    if field.endswith(FOLDED_SUBFIELD):
+        return (json_path(field[:-len(FOLDED_SUBFIELD)]),
+                "fold_keyword(value)")
+    return json_path(field), "value"
+
+
+def sql_fold_keyword(value):
+    """
+    The fold_keyword SQL function, leaving the non-text values as they
+    are.
+    """
+    return fold_keyword(value) if isinstance(value, str) else value
+
+
+def to_sql_value(value):
+    """
+    Returns a query value as stored by SQLite's JSON functions, which
+    read true and false as 1 and 0.
+    """
+    return int(value) if isinstance(value, bool) else value
+
+
+def full_text_expression(text: str, columns: List[str],
+                         operator: str = "or") -> Optional[str]:
+    """
+    Returns the FTS5 expression matching the words of a text in the
+    given columns, None if the text has no words.
+    """
+    words = TOKEN_PATTERN.findall(str(text).lower())
+    if not words:
+        return None
+    joined = f" {operator.upper()} ".join(f'"{word}"' for word in words)
+    return f"{{{' '.join(columns)}}} : ({joined})"
+
+
+class QueryCompiler:
+    """
+    Compiles a query into a condition on the documents table, aliased d,
+    returned with its parameters. The clauses that score the documents
+    are collected on the way: the full text expressions, scored with
+    BM25, and the exact value conditions, worth 1 each.
+    """
+
+    def __init__(self):
+        self.scoring_expressions = []
+        self.scoring_conditions = []
+        self.boosts = {column: 1.0 for column in FULL_TEXT_COLUMNS}
+
+    def compile(self, query: Optional[dict],
+                scoring: bool = True) -> Tuple[str, list]:
+        if not query:
+            return "1", []
+        kind, spec = next(iter(query.items()))
+        if kind == "match_all":
+            return "1", []
+        if kind == "bool":
+            return self._compile_bool(spec, scoring)
+        if kind == "multi_match":
+            return self._compile_full_text(spec["query"], spec["fields"],
+                                           spec.get("operator", "or"),
+                                           scoring)
+        if kind == "match":
+            field, value = next(iter(spec.items()))
+            operator = "or"
+            if isinstance(value, dict):
+                operator = value.get("operator", "or")
+                value = value["query"]
+            if field in FULL_TEXT_FIELDS:
+                return self._compile_full_text(value, [field], operator,
+                                               scoring)
+            return self._compile_values(field, [value], scoring)
+        if kind == "term":
+            field, value = next(iter(spec.items()))
+            if isinstance(value, dict):
+                value = value["value"]
+            return self._compile_values(field, [value], scoring)
+        if kind == "terms":
+            field, values = next(iter(spec.items()))
+            return self._compile_values(field, values, scoring)
+        if kind == "range":
+            return self._compile_range(*next(iter(spec.items())))
+        raise ValueError(f"Unsupported query {kind}")
+
+    def _compile_bool(self, spec: dict, scoring: bool) -> Tuple[str, list]:
+        conditions = []
+        params = []
+        for clause in spec.get("must", []):
+            condition, clause_params = self.compile(clause, scoring)
+            conditions.append(condition)
+            params.extend(clause_params)
+        for clause in spec.get("filter", []):
+            condition, clause_params = self.compile(clause, scoring=False)
+            conditions.append(condition)
+            params.extend(clause_params)
+        for clause in spec.get("must_not", []):
+            condition, clause_params = self.compile(clause, scoring=False)
+            conditions.append(f"NOT {condition}")
+            params.extend(clause_params)
+        should = [self.compile(clause, scoring)
+                  for clause in spec.get("should", [])]
+        if should:
+            default_minimum = 0 if spec.get("must") or spec.get("filter") \
+                else 1
+            minimum = int(spec.get("minimum_should_match", default_minimum))
+            if minimum > 0:
+                conditions.append(f"({' + '.join(condition for condition, _ in should)})"
+                                  f" >= {minimum}")
+                for _, clause_params in should:
+                    params.extend(clause_params)
+        if not conditions:
+            return "1", []
+        return f"({' AND '.join(conditions)})", params
+
+    def _compile_full_text(self, text, fields: List[str], operator: str,
+                           scoring: bool) -> Tuple[str, list]:
+        columns = []
+        for field in fields:
+            name, _, boost = field.partition("^")
+            column = FULL_TEXT_FIELDS.get(name)
+            if column is None:
+                raise ValueError(f"{name} is not a full text field")
+            if column not in columns:
+                columns.append(column)
+            if scoring and boost:
+                self.boosts[column] = max(self.boosts[column], float(boost))
+        expression = full_text_expression(text, columns, operator)
+        if expression is None:
+            return "0", []
+        if scoring:
+            self.scoring_expressions.append(
+                full_text_expression(text, columns))
+        return ("(d.rowid IN (SELECT rowid FROM documents_fts"
+                " WHERE documents_fts MATCH ?))", [expression])
+
+    def _compile_values(self, field: str, values: list,
+                        scoring: bool) -> Tuple[str, list]:
+        # json_each goes through arrays and returns scalars as they are
+        path, expression = value_expression(field)
+        if expression != "value":
+            values = [sql_fold_keyword(value) for value in values]
+        placeholders = ", ".join("?" for _ in values)
+        condition = (f"(EXISTS (SELECT 1 FROM json_each(d.source, ?)"
+                     f" WHERE {expression} IN ({placeholders})))")
+        params = [path, *map(to_sql_value, values)]
+        if scoring:
+            self.scoring_conditions.append((condition, params))
+        return condition, params
+
+    @staticmethod
+    def _compile_range(field: str, bounds: dict) -> Tuple[str, list]:
+        operators = {"gte": ">=", "gt": ">", "lte": "<=", "lt": "<"}
+        conditions = []
+        params = []
+        for bound, value in bounds.items():
+            if bound in operators:
+                conditions.append(f"json_extract(d.source, ?)"
+                                  f" {operators[bound]} ?")
+                params.extend([json_path(field), to_sql_value(value)])
+        # a missing field never matches, also under a must_not
+        return f"(COALESCE({' AND '.join(conditions) or '1'}, 0))", params
+
+
+def cursor_condition(sort_columns: List[str], descending: List[bool],
+                     search_after: list) -> Tuple[str, list]:
+    """
+    Returns the condition selecting the rows sorted after a search_after
+    cursor, with its parameters: the rows equal to the cursor on the
+    first columns and after it on the next one. Missing values sort
+    last, like in Elasticsearch.
+    """
+    alternatives = []
+    params = []
+    for position, (column, value) in enumerate(zip(sort_columns,
+                                                   search_after)):
+        if value is None:
+            # nothing sorts after a missing value on this column
+            continue
+        conditions = [f"{previous} IS ?"
+                      for previous in sort_columns[:position]]
+        operator = "<" if descending[position] else ">"
+        conditions.append(f"({column} {operator} ? OR {column} IS NULL)")
+        alternatives.append(f"({' AND '.join(conditions)})")
+        params.extend([*search_after[:position], value])
+    return f"({' OR '.join(alternatives) or '0'})", params
+
+
+class SQLiteBackend(StorageBackend):
+    """
+    Stores the documents of all indexes in one SQLite database, opened
+    once per thread.
+    """
+    name = "sqlite"
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._schema_lock = threading.Lock()
+        self._schema_created = False
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, isolation_level=None,
+                                         check_same_thread=False)
+            connection.row_factory = sqlite3.Row
+            connection.create_function("fold_keyword", 1, sql_fold_keyword,
+                                       deterministic=True)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+            self._local.busy_timeout_ms = None
+        self._apply_timeout(connection)
+        if not self._schema_created:
+            with self._schema_lock:
+                if not self._schema_created:
+                    connection.executescript(SCHEMA)
+                    self._schema_created = True
+        return connection
+
+    def _apply_timeout(self, connection: sqlite3.Connection) -> None:
+        """
+        Limits the wait for the database lock and the statements of the
+        call starting now to the timeout of the thread; a statement
+        running past it is interrupted with an OperationalError.
+        """
+        timeout = get_request_timeout()
+        busy_timeout_ms = DEFAULT_BUSY_TIMEOUT_MS if timeout is None \
+            else max(int(timeout * 1000), 1)
+        if busy_timeout_ms != self._local.busy_timeout_ms:
+            connection.execute(f"PRAGMA busy_timeout={busy_timeout_ms}")
+            self._local.busy_timeout_ms = busy_timeout_ms
+        if timeout is None:
+            connection.set_progress_handler(None, 0)
+            return
+        deadline = time.monotonic() + timeout
+        connection.set_progress_handler(
+            lambda: time.monotonic() > deadline, PROGRESS_CHECK_INSTRUCTIONS)
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Runs a block in a write transaction, taking the database lock at
+        the start so the checks and writes of the block are atomic.
+        """
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+            connection.execute("COMMIT")
+        except BaseException:
+            # the rollback must run even after the timeout
+            connection.set_progress_handler(None, 0)
+            if connection.in_transaction:
+                connection.execute("ROLLBACK")
+            raise
+
+    def bootstrap(self) -> bool:
+        self._connection()
+        return True
+
+    @staticmethod
+    def _next_seq_no(connection: sqlite3.Connection) -> int:
+        return connection.execute(
+            "UPDATE sequence SET value = value + 1 RETURNING value"
+        ).fetchone()[0]
+
+    @staticmethod
+    def _full_text_values(document: dict) -> list:
+        values = []
+        for column in FULL_TEXT_COLUMNS:
+            value = document.get(column)
+            if isinstance(value, list):
+                value = " ; ".join(str(item) for item in value)
+            values.append(value or "")
+        return values
+
+    @staticmethod
+    def _hit(index: str, row: sqlite3.Row) -> dict:
+        return {"_index": index, "_id": row["document_id"],
+                "_source": json.loads(row["source"]),
+                "_seq_no": row["seq_no"], "_primary_term": 1}
+
+    def _find(self, connection, index, document_id) -> Optional[sqlite3.Row]:
+        return connection.execute(
+            "SELECT rowid, document_id, source, seq_no FROM documents"
+            " WHERE document_index = ? AND document_id = ?",
+            (index, document_id)).fetchone()
+
+    def _write(self, connection, index, document_id, document,
+               existing: Optional[sqlite3.Row]) -> int:
+        """
+        Inserts or replaces a document and its full text row, returning
+        its new sequence number.
+        """
+        seq_no = self._next_seq_no(connection)
+        source = json.dumps(document, ensure_ascii=False)
+        if existing is None:
+            rowid = connection.execute(
+                "INSERT INTO documents (document_index, document_id, source,"
+                " seq_no) VALUES (?, ?, ?, ?)",
+                (index, document_id, source, seq_no)).lastrowid
+        else:
+            rowid = existing["rowid"]
+            connection.execute(
+                "UPDATE documents SET source = ?, seq_no = ? WHERE rowid = ?",
+                (source, seq_no, rowid))
+            connection.execute("DELETE FROM documents_fts WHERE rowid = ?",
+                               (rowid,))
+        connection.execute(
+            "INSERT INTO documents_fts (rowid, title, content, keywords)"
+            " VALUES (?, ?, ?, ?)",
+            (rowid, *self._full_text_values(document)))
+        return seq_no
+
+    def _remove(self, connection, existing: sqlite3.Row) -> None:
+        connection.execute("DELETE FROM documents WHERE rowid = ?",
+                           (existing["rowid"],))
+        connection.execute("DELETE FROM documents_fts WHERE rowid = ?",
+                           (existing["rowid"],))
+
+    def create(self, index, document_id, document):
+        with self._transaction() as connection:
+            if self._find(connection, index, document_id) is not None:
+                raise DocumentConflict(f"{index}/{document_id} already"
+                                       f" exists")
+            self._write(connection, index, document_id, document, None)
+        return document_id
+
+    def get(self, index, document_id):
+        row = self._find(self._connection(), index, document_id)
+        if row is None:
+            raise DocumentNotFound(f"{index}/{document_id} not found")
+        return self._hit(index, row)
+
+    def update(self, index, document_id, fields, if_seq_no=None,
+               if_primary_term=None):
+        with self._transaction() as connection:
+            existing = self._find(connection, index, document_id)
+            if existing is None:
+                raise DocumentNotFound(f"{index}/{document_id} not found")
+            if if_seq_no is not None and if_primary_term is not None \
+                    and (if_seq_no != existing["seq_no"]
+                         or if_primary_term != 1):
+                raise DocumentConflict(
+                    f"{index}/{document_id} is at seq_no"
+                    f" {existing['seq_no']}, not {if_seq_no}")
+            document = {**json.loads(existing["source"]), **fields}
+            seq_no = self._write(connection, index, document_id, document,
+                                 existing)
+        return {"_seq_no": seq_no, "_primary_term": 1}
+
+    def delete(self, index, document_id):
+        with self._transaction() as connection:
+            existing = self._find(connection, index, document_id)
+            if existing is None:
+                raise DocumentNotFound(f"{index}/{document_id} not found")
+            self._remove(connection, existing)
+
+    def mget(self, index, document_ids):
+        if not document_ids:
+            return []
+        placeholders = ", ".join("?" for _ in document_ids)
+        rows = self._connection().execute(
+            f"SELECT document_id, source, seq_no FROM documents"
+            f" WHERE document_index = ? AND document_id IN ({placeholders})",
+            (index, *document_ids)).fetchall()
+        hits = {row["document_id"]: self._hit(index, row) for row in rows}
+        return [hits[document_id] for document_id in document_ids
+                if document_id in hits]
+
+    def search(self, index, query, size, sort=None, search_after=None,
+               highlight=None, source=None):
+        start_time = time.perf_counter()
+        compiler = QueryCompiler()
+        where, where_params = compiler.compile(query)
+
+        # parameters in the order of their placeholders in the statement
+        columns = ["d.document_id", "d.source", "d.seq_no"]
+        column_params = []
+        join = ""
+        join_params = []
+        score_parts = []
+        if compiler.scoring_expressions:
+            weights = ", ".join(str(compiler.boosts[column])
+                                for column in FULL_TEXT_COLUMNS)
+            snippets = "".join(
+                f", snippet(documents_fts, {position}, '{HIGHLIGHT_TAGS[0]}',"
+                f" '{HIGHLIGHT_TAGS[1]}', '...', 24) AS {column}_highlight"
+                for position, column in enumerate(FULL_TEXT_COLUMNS))
+            join = (f" LEFT JOIN (SELECT rowid, -bm25(documents_fts,"
+                    f" {weights}) AS score{snippets} FROM documents_fts"
+                    f" WHERE documents_fts MATCH ?) AS s"
+                    f" ON s.rowid = d.rowid")
+            join_params.append(" OR ".join(
+                f"({expression})"
+                for expression in compiler.scoring_expressions))
+            score_parts.append("COALESCE(s.score, 0.0)")
+        for condition, condition_params in compiler.scoring_conditions:
+            score_parts.append(condition)
+            column_params.extend(condition_params)
+        columns.append(f"({' + '.join(score_parts) or '1.0'}) AS score")
+        if compiler.scoring_expressions:
+            columns.extend(f"s.{column}_highlight"
+                           for column in FULL_TEXT_COLUMNS)
+
+        order_by = []
+        sort_columns = []
+        descending = []
+        for position, criterion in enumerate(sort or []):
+            if criterion == "_score":
+                sort_columns.append("score")
+                descending.append(True)
+                order_by.append("score DESC")
+                continue
+            field, options = next(iter(criterion.items()))
+            direction = "DESC" if options.get("order") == "desc" else "ASC"
+            columns.append(f"json_extract(d.source, ?) AS sort_{position}")
+            column_params.append(json_path(field))
+            sort_columns.append(f"sort_{position}")
+            descending.append(direction == "DESC")
+            order_by.extend([f"sort_{position} IS NULL",
+                             f"sort_{position} {direction}"])
+        if not sort:
+            order_by.append("score DESC")
+
+        # the sort columns are computed in the inner query, so the
+        # cursor is compared to them in the outer one
+        statement = (f"SELECT * FROM (SELECT {', '.join(columns)}"
+                     f" FROM documents AS d{join}"
+                     f" WHERE d.document_index = ? AND {where})")
+        params = [*column_params, *join_params, index, *where_params]
+        if search_after and sort:
+            condition, condition_params = cursor_condition(
+                sort_columns, descending, list(search_after))
+            statement += f" WHERE {condition}"
+            params.extend(condition_params)
+        statement += f" ORDER BY {', '.join(order_by)} LIMIT ?"
+        params.append(size)
+        rows = self._connection().execute(statement, params)
+
+        hits = []
+        for row in rows:
+            sort_values = [row[column] for column in sort_columns]
+            hit = self._hit(index, row)
+            hit["_score"] = row["score"]
+            if sort:
+                hit["sort"] = sort_values
+            if highlight and compiler.scoring_expressions:
+                hit["highlight"] = {
+                    field: [row[f"{FULL_TEXT_FIELDS[field]}_highlight"]]
+                    for field in highlight.get("fields", {})
+                    if field in FULL_TEXT_FIELDS and HIGHLIGHT_TAGS[0]
+                    in (row[f"{FULL_TEXT_FIELDS[field]}_highlight"] or "")
+                }
+            if source:
+                hit["_source"] = {field: hit["_source"][field]
+                                  for field in source
+                                  if field in hit["_source"]}
+            hits.append(hit)
+        took = int((time.perf_counter() - start_time) * 1000)
+        return {"hits": hits, "took": took}
+
+    def bulk(self, index, actions):
+        failed = []
+        with self._transaction() as connection:
+            for action in actions:
+                op, document_id = action["op"], action["id"]
+                existing = self._find(connection, index, document_id)
+                if op == "create" and existing is not None:
+                    failed.append({**action, "error": "document exists"})
+                elif op in ("update", "delete") and existing is None:
+                    failed.append({**action, "error": "document missing"})
+                elif action.get("if_seq_no") is not None \
+                        and action.get("if_primary_term") is not None \
+                        and (existing is None
+                             or action["if_seq_no"] != existing["seq_no"]
+                             or action["if_primary_term"] != 1):
+                    failed.append({**action, "error": "version conflict"})
+                elif op == "delete":
+                    self._remove(connection, existing)
+                elif op == "update":
+                    document = {**json.loads(existing["source"]),
+                                **action["document"]}
+                    self._write(connection, index, document_id, document,
+                                existing)
+                elif op in ("create", "index"):
+                    self._write(connection, index, document_id,
+                                action["document"], existing)
+                else:
+                    failed.append({**action, "error": f"unknown op {op}"})
+        return failed
+
+    def aggregate_terms(self, index, field, size, after=None):
+        path, expression = value_expression(field)
+        rows = self._connection().execute(
+            f"SELECT {expression} AS term, COUNT(DISTINCT d.rowid)"
+            f" AS doc_count FROM documents AS d, json_each(d.source, ?)"
+            f" WHERE d.document_index = ? AND value IS NOT NULL"
+            f" AND (? IS NULL OR term > ?)"
+            f" GROUP BY term ORDER BY term LIMIT ?",
+            (path, index, after, after, size)).fetchall()
+        buckets = [(row["term"], row["doc_count"]) for row in rows]
+        return buckets, buckets[-1][0] if len(buckets) == size else None
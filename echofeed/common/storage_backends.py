@@ -0,0 +1,212 @@
+"""
+Storage interface of the articles and users.
+
+es_interactions_helpers builds the responses of the API on top of a
+StorageBackend, chosen with config_info.STORAGE_BACKEND: Elasticsearch
+(es_storage_backend), or an embedded SQLite database with FTS5 full text
+search (sqlite_storage_backend) for small deployments and test runs.
+
+Documents are stored in indexes named after the entities (articles,
+users). Queries are written in the Elasticsearch query DSL, which every
+backend has to understand, and documents are returned as Elasticsearch
+hits: dicts with _id, _source, _seq_no and _primary_term, plus _score,
+sort and highlight for search hits.
+"""
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Optional, Tuple
+
+from echofeed.common import config_info
+from echofeed.common.config_info import StorageBackends
+
+# get_all returns at most this many documents, like a single
+# Elasticsearch search page
+GET_ALL_LIMIT = 10000
+
+
+# the timeout of the calls made by the current thread, see request_timeout
+_REQUEST_TIMEOUTS = threading.local()
+
+
+@contextmanager
+def request_timeout(timeout_seconds: Optional[float]):
+    """
+    Limits the backend calls made by the current thread in the block to
+    timeout_seconds each; the backends give up on the calls taking
+    longer, raising the error of a timed out request.
+    """
+    previous = getattr(_REQUEST_TIMEOUTS, "seconds", None)
+    _REQUEST_TIMEOUTS.seconds = timeout_seconds
+    try:
+        yield
+    finally:
+        _REQUEST_TIMEOUTS.seconds = previous
+
+
+def get_request_timeout() -> Optional[float]:
+    """
+    Returns the timeout of the backend calls of the current thread, None
+    for the backend's default.
+    """
+    return getattr(_REQUEST_TIMEOUTS, "seconds", None)
+
+
+class StorageError(Exception):
+    """
+    Base class of the errors raised by the storage backends.
+    """
+
+
+class DocumentNotFound(StorageError):
+    """
+    Raised when a document does not exist.
+    """
+
+
+class DocumentConflict(StorageError):
+    """
+    Raised when a created document already exists, or when a conditional
+    update finds a newer version of the document.
+    """
+
+
+class StorageBackend(ABC):
+    """
+    Interface of the storage backends.
+    """
+    name = None
+
+    @abstractmethod
+    def bootstrap(self) -> bool:
+        """
+        Creates the indexes and their schema. Returns False if the
+        storage could not be prepared; the API starts anyway.
+        """
+
+    @abstractmethod
+    def create(self, index: str, document_id: str, document: dict) -> str:
+        """
+        Stores a new document and returns its id.
+
+        Raises:
+            DocumentConflict: if a document with the same id exists.
+        """
+
+    @abstractmethod
+    def get(self, index: str, document_id: str) -> dict:
+        """
+        Returns the hit of a document.
+
+        Raises:
+            DocumentNotFound: if the document does not exist.
+        """
+
+    @abstractmethod
+    def update(self, index: str, document_id: str, fields: dict,
+               if_seq_no: Optional[int] = None,
+               if_primary_term: Optional[int] = None) -> dict:
+        """
+        Merges fields into a document and returns its new _seq_no and
+        _primary_term. With if_seq_no and if_primary_term, the update
+        is only applied to that version of the document.
+
+        Raises:
+            DocumentNotFound: if the document does not exist.
+            DocumentConflict: if the document has a different version.
+        """
+
+    @abstractmethod
+    def delete(self, index: str, document_id: str) -> None:
+        """
+        Removes a document.
+
+        Raises:
+            DocumentNotFound: if the document does not exist.
+        """
+
+    @abstractmethod
+    def mget(self, index: str, document_ids: List[str]) -> List[dict]:
+        """
+        Returns the hits of the existing documents among document_ids,
+        in the order of the ids.
+        """
+
+    @abstractmethod
+    def search(self, index: str, query: Optional[dict], size: int,
+               sort: Optional[list] = None,
+               search_after: Optional[list] = None,
+               highlight: Optional[dict] = None,
+               source: Optional[list] = None) -> dict:
+        """
+        Runs a query and returns one page of hits.
+
+        Returns:
+            hits(List[dict]): the hits, with _score, and with sort when
+                              sort is given.
+            took(int): the duration of the search in milliseconds.
+        """
+
+    def get_all(self, index: str, query: Optional[dict] = None) -> List[dict]:
+        """
+        Returns the hits of all the documents matching a query, or of
+        the whole index, up to GET_ALL_LIMIT.
+        """
+        return self.search(index, query, GET_ALL_LIMIT)["hits"]
+
+    @abstractmethod
+    def bulk(self, index: str, actions: List[dict]) -> List[dict]:
+        """
+        Applies many writes at once. Every action is a dict with an op
+        (create, index, update or delete), an id and, except for delete,
+        a document; index replaces the whole document and update merges
+        it. Like update, an action with if_seq_no and if_primary_term
+        is only applied to that version of the document. A failed action
+        does not stop the others.
+
+        Returns:
+            List[dict]: the failed actions, each with an error.
+        """
+
+    @abstractmethod
+    def aggregate_terms(self, index: str, field: str, size: int,
+                        after=None) -> Tuple[List[tuple], object]:
+        """
+        Returns a page of the distinct values of a field, in order, with
+        the number of documents containing each.
+
+        Returns:
+            tuple: the (value, count) pairs of up to size values after
+                   the after cursor, and the cursor of the next page,
+                   None after the last page.
+        """
+
+
+_BACKEND_LOCK = threading.Lock()
+_BACKENDS = {}
+
+
+def get_storage_backend() -> StorageBackend:
+    """
+    Returns the backend selected by config_info.STORAGE_BACKEND,
+    created on first use.
+    """
+    key = (config_info.STORAGE_BACKEND, config_info.SQLITE_DATABASE_PATH)
+    backend = _BACKENDS.get(key)
+    if backend is not None:
+        return backend
+    with _BACKEND_LOCK:
+        backend = _BACKENDS.get(key)
+        if backend is None:
+            if config_info.STORAGE_BACKEND == StorageBackends.SQLITE:
+                from echofeed.common import sqlite_storage_backend
+                backend = sqlite_storage_backend.SQLiteBackend(
+                    config_info.SQLITE_DATABASE_PATH)
+            elif config_info.STORAGE_BACKEND == StorageBackends.ELASTICSEARCH:
+                from echofeed.common import es_storage_backend
+                backend = es_storage_backend.ElasticsearchBackend()
+            else:
+                raise ValueError(f"Unknown storage backend"
+                                 f" {config_info.STORAGE_BACKEND}")
+            _BACKENDS[key] = backend
+    return backend
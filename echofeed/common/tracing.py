@@ -0,0 +1,269 @@
+"""
+Lightweight request tracing, from the UI through the API to
+Elasticsearch, OpenAI and Google.
+
+A trace is a tree of spans sharing a trace id. The current span is kept
+in a context variable, so it follows the request through async code and
+through the threads started with run_in_context. The trace id travels
+between the UI and the API in a W3C traceparent header. Finished spans
+are sent to the exporters: an in-memory ring buffer of the recent
+traces, read by /debug/traces, and optionally a JSON lines file.
+"""
+import contextvars
+import json
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import List, Optional
+
+from echofeed.common import config_info
+
+TRACEPARENT_HEADER = "traceparent"
+TRACEPARENT_PATTERN = re.compile(
+    r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_CURRENT_SPAN = contextvars.ContextVar("echofeed_current_span", default=None)
+
+
+class Span:
+    """
+    A timed operation of a trace.
+    """
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_time",
+                 "duration", "attributes", "error", "_start_counter")
+
+    def __init__(self, name: str, trace_id: str,
+                 parent_id: Optional[str] = None, **attributes):
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start_time = time.time()
+        self.duration = None
+        self.attributes = attributes
+        self.error = None
+        self._start_counter = time.perf_counter()
+
+    def set_attribute(self, name: str, value) -> None:
+        """
+        Adds an attribute to the span, e.g. the number of hits.
+        """
+        self.attributes[name] = value
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        """
+        Ends the span and sends it to the exporters.
+        """
+        self.duration = time.perf_counter() - self._start_counter
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        for exporter in EXPORTERS:
+            exporter.export(self)
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_time": self.start_time,
+            "duration": self.duration,
+            "attributes": self.attributes,
+            "error": self.error
+        }
+
+
+class RingBufferExporter:
+    """
+    Keeps the spans of the last max_traces traces in memory.
+    """
+
+    def __init__(self, max_traces: int):
+        self.max_traces = max_traces
+        self._traces = OrderedDict()
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        with self._lock:
+            spans = self._traces.get(span.trace_id)
+            if spans is None:
+                spans = self._traces[span.trace_id] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span.to_dict())
+
+    def get_traces(self) -> List[List[dict]]:
+        """
+        Returns the spans of every trace in the buffer, in start order.
+        """
+        with self._lock:
+            traces = [list(spans) for spans in self._traces.values()]
+        return [sorted(spans, key=lambda span: span["start_time"])
+                for spans in traces]
+
+    def get_slowest_traces(self, limit: int) -> List[List[dict]]:
+        """
+        Returns the longest traces, slowest first. A trace continued by
+        several requests, like a UI handler calling the API many times,
+        lasts from the start of its first span to the end of its last
+        one. Traces without a finished root span are skipped.
+        """
+        finished = []
+        for spans in self.get_traces():
+            if get_root_spans(spans):
+                finished.append((get_trace_duration(spans), spans))
+        finished.sort(key=lambda item: item[0], reverse=True)
+        return [spans for _, spans in finished[:limit]]
+
+
+class FileExporter:
+    """
+    Appends every span to a JSON lines file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def export(self, span: Span) -> None:
+        line = json.dumps(span.to_dict(), ensure_ascii=False, default=str)
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as traces_file:
+                traces_file.write(line + "\n")
+
+
+RING_BUFFER = RingBufferExporter(config_info.TRACE_BUFFER_SIZE)
+EXPORTERS = [RING_BUFFER]
+if config_info.TRACE_FILE_PATH:
+    EXPORTERS.append(FileExporter(config_info.TRACE_FILE_PATH))
+
+
+def get_root_spans(spans: List[dict]) -> List[dict]:
+    """
+    Returns the finished spans of a trace that have no parent in it, one
+    per request of the trace, in start order.
+    """
+    span_ids = {span["span_id"] for span in spans}
+    return sorted((span for span in spans
+                   if span["parent_id"] not in span_ids
+                   and span["duration"] is not None),
+                  key=lambda span: span["start_time"])
+
+
+def get_trace_duration(spans: List[dict]) -> float:
+    """
+    Returns the time from the start of the first span of a trace to the
+    end of its last finished span.
+    """
+    trace_start = min(span["start_time"] for span in spans)
+    trace_end = max(span["start_time"] + (span["duration"] or 0.0)
+                    for span in spans)
+    return trace_end - trace_start
+
+
+def get_current_span() -> Optional[Span]:
+    """
+    Returns the active span, None outside a trace.
+    """
+    return _CURRENT_SPAN.get()
+
+
+def parse_traceparent(header: Optional[str]) -> tuple:
+    """
+    Returns the trace id and the parent span id of a traceparent header,
+    or (None, None) if it is missing or invalid.
+    """
+    match = TRACEPARENT_PATTERN.match((header or "").strip().lower())
+    if match is None:
+        return None, None
+    return match.group(1), match.group(2)
+
+
+def get_trace_headers() -> dict:
+    """
+    Returns the traceparent header propagating the active span, empty
+    outside a trace.
+    """
+    span = get_current_span()
+    if span is None:
+        return {}
+    return {TRACEPARENT_HEADER: f"00-{span.trace_id}-{span.span_id}-01"}
+
+
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None,
+                parent_id: Optional[str] = None, **attributes):
+    """
+    Starts the root span of a trace, or continues the trace of a caller
+    when its ids are given, and makes it the active span.
+
+    Yields:
+        Span: The root span.
+    """
+    root = Span(name, trace_id or secrets.token_hex(16), parent_id,
+                **attributes)
+    token = _CURRENT_SPAN.set(root)
+    error = None
+    try:
+        yield root
+    except BaseException as exception:
+        error = exception
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        root.end(error)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Runs a block in a child span of the active span. Outside a trace the
+    block runs untraced and None is yielded, so spans cost nothing in
+    background work.
+
+    Yields:
+        Span: The child span, or None.
+    """
+    parent = get_current_span()
+    if parent is None:
+        yield None
+        return
+    child = Span(name, parent.trace_id, parent.span_id, **attributes)
+    token = _CURRENT_SPAN.set(child)
+    error = None
+    try:
+        yield child
+    except BaseException as exception:
+        error = exception
+        raise
+    finally:
+        _CURRENT_SPAN.reset(token)
+        child.end(error)
+
+
+def start_detached_span(name: str, **attributes) -> Optional[Span]:
+    """
+    Starts a child span of the active span without activating it, for
+    work that is resumed in other contexts, like a generator consumed
+    by a streaming response. The caller must end it.
+    """
+    parent = get_current_span()
+    if parent is None:
+        return None
+    return Span(name, parent.trace_id, parent.span_id, **attributes)
+
+
+def run_in_context(func):
+    """
+    Wraps a function so it runs in a copy of the current context, e.g.
+    when submitted to a thread pool, keeping the active span.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        return context.copy().run(func, *args, **kwargs)
+
+    return run
@@ -310,3 +310,52 @@ def test_hash_password():
         'utf-8')), "Primul hash nu este valid pentru parola originală"
     assert bcrypt.checkpw(password.encode('utf-8'), hash2.encode(
         'utf-8')), "Al doilea hash nu este valid pentru parola originală"
+
+
+def test_password_needs_rehash():
+    """Test password_needs_rehash function."""
+    current_hash = config_info.hash_password("test_password")
+    old_cost_hash = bcrypt.hashpw(
+        b"test_password", bcrypt.gensalt(rounds=4)).decode('utf-8')
+
+    assert config_info.password_needs_rehash(current_hash) is False
+    assert config_info.password_needs_rehash(old_cost_hash) is True
+    assert config_info.password_needs_rehash("not a bcrypt hash") is True
+
+
+def test_build_keyword_tiers_query():
+    """Test build_keyword_tiers_query function."""
+    query = api_helpers.build_keyword_tiers_query(
+        important_keywords=["alegeri"],
+        relevant_keywords=["parlament", "guvern", "buget"],
+        irrelevant_keywords=["sport"],
+        language="Romanian",
+        min_keywords=3,
+        date="2024-06-01"
+    )["bool"]
+
+    assert len(query["must"]) == 1
+    assert len(query["should"]) == 3
+    assert len(query["must_not"]) == 1
+    assert query["minimum_should_match"] == 2
+    assert query["filter"] == [{"range": {"date": {"gte": "2024-06-01"}}}]
+
+
+def test_merge_and_rank_articles():
+    """Test merge_articles and rank_articles functions."""
+    local_article = api_cls.Article(
+        title="Buget", content="guvern", url="https://www.news.ro/a/",
+        date="2024-06-01", keywords=[])
+    duplicate_article = api_cls.Article(
+        title="Buget", content="guvern", url="http://news.ro/a?utm=1",
+        date="2024-06-01", keywords=[])
+    external_article = api_cls.Article(
+        title="Alegeri si buget", content="guvern", url="https://b.ro",
+        date="2024-05-01", keywords=[])
+
+    merged = api_helpers.merge_articles([local_article],
+                                        [duplicate_article, external_article])
+    assert merged == [local_article, external_article]
+
+    ranked = api_helpers.rank_articles(merged, ["alegeri"], ["guvern"], [])
+    assert ranked == [external_article, local_article]
@@ -0,0 +1,45 @@
+"""Unit tests for the Google search helpers."""
+from echofeed.api import api_google_search as api_search
+from echofeed.common import api_classes as api_cls
+
+
+def test_extract_publication_date_prefers_published_time():
+    """Test that the published time is preferred over the updated time."""
+    item = {
+        "pagemap": {
+            "metatags": [{
+                "og:updated_time": "2024-06-07T08:00:00+03:00",
+                "article:published_time": "2024-06-05T10:20:30Z"
+            }]
+        }
+    }
+    assert api_search.extract_publication_date(item) == "2024-06-05"
+
+
+def test_extract_publication_date_fallbacks():
+    """Test structured data, snippet and missing date handling."""
+    news_item = {
+        "pagemap": {"newsarticle": [{"datepublished": "05.06.2024"}]}
+    }
+    snippet_item = {"snippet": "Jun 5, 2024 ... Breaking news"}
+    unknown_item = {
+        "pagemap": {"metatags": [{"og:updated_time": "not a date"}]},
+        "snippet": "No date here"
+    }
+
+    assert api_search.extract_publication_date(news_item) == "2024-06-05"
+    assert api_search.extract_publication_date(snippet_item) == "2024-06-05"
+    assert api_search.extract_publication_date(unknown_item) is None
+
+
+def test_filter_articles_by_date():
+    """Test that only articles with a date outside the range are dropped."""
+    articles = [
+        api_cls.Article(title=title, content="", url="", date=date,
+                        keywords=[])
+        for title, date in [("old", "2024-01-01"), ("new", "2024-06-05"),
+                            ("unknown", None)]
+    ]
+
+    filtered = api_search.filter_articles_by_date(articles, "2024-06-01")
+    assert [article.title for article in filtered] == ["new", "unknown"]
@@ -0,0 +1,179 @@
+"""Unit tests for the GPT interactions."""
+import json
+from types import SimpleNamespace
+
+from echofeed.api import api_gpt_interactions as api_gpt
+
+
+class FakeCompletions:
+    """Returns the given function arguments, one per call."""
+
+    def __init__(self, arguments):
+        self.arguments = list(arguments)
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        tool_call = SimpleNamespace(
+            function=SimpleNamespace(arguments=self.arguments.pop(0)))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(
+                message=SimpleNamespace(tool_calls=[tool_call]))],
+            usage=SimpleNamespace(prompt_tokens=40, completion_tokens=10)
+        )
+
+
+def use_fake_client(monkeypatch, arguments):
+    completions = FakeCompletions(arguments)
+    monkeypatch.setattr(api_gpt, "client", SimpleNamespace(
+        chat=SimpleNamespace(completions=completions)))
+    monkeypatch.setattr(api_gpt, "TOKEN_USAGE", api_gpt.TokenUsage())
+    return completions
+
+
+def test_pack_keyword_batches_respects_budget():
+    """Test that batches stay under the budget and keep every set."""
+    keyword_sets = {f"user{index}": ["economy", "sport", "music"]
+                    for index in range(10)}
+    batches = api_gpt.pack_keyword_batches(keyword_sets, token_budget=30)
+
+    assert len(batches) > 1
+    assert {item_id for batch in batches for item_id in batch} \
+        == set(keyword_sets)
+    for batch in batches:
+        assert sum(api_gpt.estimate_tokens(json.dumps({item_id: keywords}))
+                   for item_id, keywords in batch.items()) <= 30
+
+
+def test_pack_keyword_batches_oversized_set():
+    """Test that a set larger than the budget gets its own batch."""
+    batches = api_gpt.pack_keyword_batches(
+        {"small": ["a"], "large": ["keyword"] * 100, "last": ["b"]},
+        token_budget=20
+    )
+    assert batches == [{"small": ["a"]}, {"large": ["keyword"] * 100},
+                       {"last": ["b"]}]
+
+
+def test_categorize_keyword_sets_merges_batches(monkeypatch):
+    """Test that the answers of all batches are split back by id."""
+    monkeypatch.setattr(api_gpt.config_info, "GPT_BATCH_TOKEN_BUDGET", 10)
+
+    def categorize_keyword_batch(batch):
+        return {item_id: {"Category": keywords}
+                for item_id, keywords in batch.items() if item_id != "b"}
+
+    monkeypatch.setattr(api_gpt, "categorize_keyword_batch",
+                        categorize_keyword_batch)
+    categories = api_gpt.categorize_keyword_sets(
+        {"a": ["sport"], "b": ["music"], "c": ["economy"]})
+    assert categories == {"a": {"Category": ["sport"]},
+                          "c": {"Category": ["economy"]}}
+
+
+def test_batch_budget_fits_output_cap(monkeypatch):
+    """Test that a full batch's answer fits the output tokens cap."""
+    monkeypatch.setattr(api_gpt.config_info, "GPT_BATCH_TOKEN_BUDGET", 3000)
+    monkeypatch.setattr(api_gpt.config_info,
+                        "GPT_BATCH_MAX_OUTPUT_TOKENS", 1000)
+    keyword_sets = {f"user{index}": ["economy", "sport", "music"]
+                    for index in range(200)}
+    batches = api_gpt.pack_keyword_batches(
+        keyword_sets, api_gpt.get_batch_token_budget())
+
+    assert len(batches) > 1
+    for batch in batches:
+        assert api_gpt.estimate_output_tokens(json.dumps(batch)) <= 1000
+
+
+def test_failed_batch_is_retried_in_halves(monkeypatch):
+    """Test that a batch without an answer is split until sets succeed."""
+    batches = []
+
+    def categorize_keyword_batch(batch):
+        batches.append(sorted(batch))
+        if len(batch) > 1:
+            return {}
+        return {item_id: {"Category": keywords}
+                for item_id, keywords in batch.items() if item_id != "b"}
+
+    monkeypatch.setattr(api_gpt, "categorize_keyword_batch",
+                        categorize_keyword_batch)
+    categories = api_gpt.categorize_keyword_sets(
+        {"a": ["sport"], "b": ["music"], "c": ["economy"]})
+
+    assert categories == {"a": {"Category": ["sport"]},
+                          "c": {"Category": ["economy"]}}
+    assert batches[0] == ["a", "b", "c"]
+    assert ["b"] in batches
+
+
+def test_function_call_output_is_parsed(monkeypatch):
+    """Test that the forced function call is parsed and accounted."""
+    completions = use_fake_client(monkeypatch, [
+        '{"categories": [{"name": "Economie", "keywords": ["BNR", "euro"]},'
+        ' {"name": "", "keywords": ["x"]}]}'
+    ])
+    categories = api_gpt.categorize_keywords(["BNR", "euro"])
+
+    assert categories == {"Economie": ["BNR", "euro"]}
+    assert completions.calls[0]["tool_choice"]["function"]["name"] \
+        == "save_categories"
+    usage = api_gpt.get_token_usage()["categorize"]
+    assert usage["calls"] == 1
+    assert usage["prompt_tokens"] == 40
+    assert usage["version"] == api_gpt.PROMPTS["categorize"]["version"]
+
+
+def test_malformed_output_is_retried(monkeypatch):
+    """Test that an invalid answer is retried and then succeeds."""
+    use_fake_client(monkeypatch, ['{"keywords": ["BNR"', '{"keywords": ["BNR"]}'])
+    assert api_gpt.generate_keywords("BNR", "Romanian") == ["BNR"]
+    usage = api_gpt.get_token_usage()["generate_keywords"]
+    assert usage["retries"] == 1
+    assert usage["failures"] == 0
+    assert usage["prompt_tokens"] == 80
+
+
+def stream_chunks(fragments):
+    for fragment in fragments:
+        tool_call = SimpleNamespace(
+            function=SimpleNamespace(arguments=fragment))
+        yield SimpleNamespace(
+            choices=[SimpleNamespace(delta=SimpleNamespace(tool_calls=[tool_call]))],
+            usage=None)
+    yield SimpleNamespace(
+        choices=[],
+        usage=SimpleNamespace(prompt_tokens=30, completion_tokens=12))
+
+
+def test_array_stream_parser_yields_complete_items():
+    """Test that items are returned as soon as they are complete."""
+    parser = api_gpt.JsonArrayStreamParser()
+    assert parser.feed('{"keywords": ["infla') == []
+    assert parser.feed('ție", "B') == ["inflație"]
+    assert parser.feed('NR", "say \\"hi') == ["BNR"]
+    assert parser.feed('\\""]}') == ['say "hi"']
+
+
+def test_stream_keywords_yields_incrementally(monkeypatch):
+    """Test that the streamed keywords arrive before the stream ends."""
+    completions = use_fake_client(monkeypatch, [])
+    fragments = ['{"keywords": ["BNR", "eu', 'ro", " "', ']}']
+    received = []
+
+    def create(**kwargs):
+        completions.calls.append(kwargs)
+        for chunk in stream_chunks(fragments):
+            received.append(chunk)
+            yield chunk
+
+    monkeypatch.setattr(completions, "create", lambda **kwargs: create(**kwargs))
+    keywords = api_gpt.stream_keywords("BNR", "Romanian")
+
+    assert next(keywords) == "BNR"
+    assert len(received) == 1
+    assert list(keywords) == ["euro"]
+    assert completions.calls[0]["stream"] is True
+    usage = api_gpt.get_token_usage()["generate_keywords"]
+    assert usage["completion_tokens"] == 12
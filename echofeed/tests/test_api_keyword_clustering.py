@@ -0,0 +1,47 @@
+"""Unit tests for the local keyword categorization."""
+from echofeed.api.api_keyword_clustering import KeywordCorpus, cluster_keywords
+
+ARTICLES = [
+    "Football league results and transfers",
+    "Champions League football final",
+    "Tennis final at Wimbledon",
+    "Wimbledon tennis champion",
+    "Inflation rises as the central bank raises interest rates",
+    "Central bank interest rates decision",
+    "Presidential elections campaign in Romania",
+    "Elections in Romania: presidential vote"
+]
+
+
+def test_cluster_keywords_by_cooccurrence():
+    """Test that keywords found in the same articles are grouped."""
+    corpus = KeywordCorpus()
+    corpus.add_documents(ARTICLES)
+
+    categories = cluster_keywords(
+        ["football", "league", "tennis", "Wimbledon", "inflation",
+         "interest rates", "central bank", "elections", "Romania",
+         "quantum"],
+        corpus=corpus
+    )
+    groups = sorted(sorted(group) for group in categories.values())
+    assert groups == [["Romania", "elections"], ["Wimbledon", "tennis"],
+                      ["central bank", "inflation", "interest rates"],
+                      ["football", "league"], ["quantum"]]
+    assert categories["interest rates"] == ["inflation", "interest rates",
+                                            "central bank"]
+
+
+def test_cluster_keywords_sharing_words_without_corpus():
+    """Test that keywords missing from the corpus are grouped by words."""
+    categories = cluster_keywords(
+        ["climate change", "climate policy", "jazz"], corpus=KeywordCorpus())
+    groups = sorted(sorted(group) for group in categories.values())
+    assert groups == [["climate change", "climate policy"], ["jazz"]]
+
+
+def test_cluster_keywords_small_inputs():
+    """Test empty inputs, single keywords and duplicates."""
+    assert cluster_keywords([], corpus=KeywordCorpus()) == {}
+    assert cluster_keywords(["sport", " sport "], corpus=KeywordCorpus()) \
+        == {"sport": ["sport"]}
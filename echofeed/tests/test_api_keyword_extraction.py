@@ -0,0 +1,49 @@
+"""Unit tests for the local keyword extraction."""
+from echofeed.api import api_keyword_extraction
+from echofeed.api.api_keyword_extraction import CorpusStatistics
+
+
+def test_extract_keywords_english():
+    """Test that stopwords split the text into ranked phrases."""
+    keywords = api_keyword_extraction.extract_keywords(
+        "I want the latest news about the Romanian elections and"
+        " inflation in Europe",
+        statistics=CorpusStatistics()
+    )
+    assert keywords[0] == "Romanian elections"
+    assert set(keywords) == {"Romanian elections", "Europe", "inflation"}
+
+
+def test_extract_keywords_romanian_keeps_acronyms():
+    """Test Romanian stopwords and acronyms that look like stopwords."""
+    keywords = api_keyword_extraction.extract_keywords(
+        "Vreau știri despre alegerile prezidențiale din România și AI",
+        statistics=CorpusStatistics()
+    )
+    assert "alegerile prezidențiale" in keywords
+    assert "România" in keywords
+    assert "AI" in keywords
+    assert not {"Vreau", "știri", "despre"} & set(keywords)
+
+
+def test_corpus_statistics_lower_common_words():
+    """Test that words frequent in the corpus are ranked lower."""
+    statistics = CorpusStatistics()
+    statistics.add_documents(["football results", "football transfers",
+                              "football league", "tennis final"])
+    assert statistics.idf("football") < statistics.idf("tennis")
+
+    keywords = api_keyword_extraction.extract_keywords(
+        "football, tennis", statistics=statistics)
+    assert keywords == ["tennis", "football"]
+
+
+def test_extract_keywords_limit_and_empty_input():
+    """Test the maximum number of keywords and inputs without keywords."""
+    keywords = api_keyword_extraction.extract_keywords(
+        "oil, gas, coal, wind, solar", max_keywords=2,
+        statistics=CorpusStatistics()
+    )
+    assert len(keywords) == 2
+    assert api_keyword_extraction.extract_keywords(
+        "the news about it", statistics=CorpusStatistics()) == []
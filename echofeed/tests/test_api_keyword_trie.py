@@ -0,0 +1,66 @@
+"""Unit tests for the keyword autocomplete trie."""
+from echofeed.api.api_keyword_trie import KeywordTrie
+
+
+def test_suggest_returns_most_frequent_terms():
+    """Test that suggestions are ranked by frequency and limited."""
+    trie = KeywordTrie(top_size=3, max_terms=100)
+    trie.add("economy", 5)
+    trie.add("ecology", 2)
+    trie.add("education", 7)
+    trie.add("elections", 1)
+    trie.add("sport", 9)
+
+    assert trie.suggest("ec") == [("economy", 5), ("ecology", 2)]
+    assert trie.suggest("e") == [("education", 7), ("economy", 5),
+                                 ("ecology", 2)]
+    assert trie.suggest("e", limit=1) == [("education", 7)]
+    assert trie.suggest("x") == []
+
+
+def test_suggest_matches_inside_compressed_edges():
+    """Test prefixes that end in the middle of an edge or past a term."""
+    trie = KeywordTrie(top_size=5, max_terms=100)
+    trie.add("Bucharest")
+    trie.add("bucharest")
+    trie.add("Budget deficit")
+
+    assert trie.suggest("BUCH") == [("bucharest", 2)]
+    assert trie.suggest("budget  d") == [("budget deficit", 1)]
+    assert trie.suggest("bucharesti") == []
+    assert len(trie) == 2
+
+
+def test_counts_update_incrementally():
+    """Test that a term rises in the ranking when its count grows."""
+    trie = KeywordTrie(top_size=1, max_terms=100)
+    trie.add("inflation", 3)
+    trie.add("interest rates", 1)
+    assert trie.suggest("in") == [("inflation", 3)]
+
+    trie.add_many(["interest rates"] * 3)
+    assert trie.suggest("in") == [("interest rate", 4)]
+    assert trie.suggest("inf") == [("inflation", 3)]
+
+
+def test_trie_is_bounded():
+    """Test that the least frequent terms are dropped above the limit."""
+    trie = KeywordTrie(top_size=5, max_terms=10)
+    for index in range(11):
+        trie.add(f"term {index:02d}", index + 1)
+
+    assert len(trie) <= 10
+    assert trie.suggest("term 10") == [("term 10", 11)]
+    assert trie.suggest("term 00") == []
+
+
+def test_variants_share_one_canonical_term():
+    """Test that the variants of a keyword are suggested as one term."""
+    for terms in (["Alegerilor", "alegeri", "ALEGERI"],
+                  ["ALEGERI", "alegeri", "Alegerilor"]):
+        trie = KeywordTrie(top_size=5, max_terms=100)
+        for term in terms:
+            trie.add(term, 2)
+
+        assert trie.suggest("Alegerilor") == [("alegeri", 6)]
+        assert trie.suggest("ale") == [("alegeri", 6)]
@@ -0,0 +1,35 @@
+"""Unit tests for the password hashing pool."""
+import asyncio
+import threading
+
+import pytest
+
+from echofeed.api.api_password_pool import (PasswordHashingPool,
+                                            PasswordPoolSaturated)
+
+
+def test_pool_runs_function():
+    """Test that the pool returns the result of the function."""
+    pool = PasswordHashingPool(max_workers=1, max_queue=1)
+
+    result = asyncio.run(pool.run(sum, [1, 2, 3]))
+
+    assert result == 6
+    assert pool.get_stats()["completed"] == 1
+
+
+def test_pool_rejects_when_saturated():
+    """Test that calls are rejected once workers and queue are full."""
+    pool = PasswordHashingPool(max_workers=1, max_queue=0)
+    release = threading.Event()
+
+    async def scenario():
+        blocked = asyncio.ensure_future(pool.run(release.wait))
+        await asyncio.sleep(0.05)
+        with pytest.raises(PasswordPoolSaturated):
+            await pool.run(sum, [1])
+        release.set()
+        await blocked
+
+    asyncio.run(scenario())
+    assert pool.get_stats()["rejected"] == 1
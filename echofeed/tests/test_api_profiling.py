@@ -0,0 +1,69 @@
+"""Unit tests for the request profiling."""
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+from echofeed.api import api_profiling, api_session_tokens
+
+
+def busy_search(seconds):
+    end_time = time.perf_counter() + seconds
+    while time.perf_counter() < end_time:
+        sum(range(1000))
+
+
+def test_sampling_profiler_collapses_stacks():
+    """Test that the stacks of the profiled thread are counted."""
+    profiler = api_profiling.SamplingProfiler(threading.get_ident(), 0.001)
+    profiler.start()
+    busy_search(0.1)
+    profiler.stop()
+
+    lines = profiler.to_collapsed().splitlines()
+    assert lines
+    stack, count = lines[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert stack.split(";")[-1].startswith("busy_search (test_api_profiling.py")
+
+
+def test_profile_store_keeps_the_newest_files(tmp_path):
+    """Test the listing and the bound of the profiles directory."""
+    store = api_profiling.ProfileStore(str(tmp_path), max_files=2)
+    request = SimpleNamespace(method="POST",
+                              url=SimpleNamespace(path="/api/v1/articles/search"))
+    for index in range(3):
+        path = store.new_path(request, "sampling")
+        path = path.replace(".collapsed", f"-{index}.collapsed")
+        with open(path, "w", encoding="utf-8") as profile_file:
+            profile_file.write("main 1\n")
+        os.utime(path, (index, index))
+    store.prune()
+
+    names = [profile["name"] for profile in store.list_profiles()]
+    assert len(names) == 2
+    assert names[0].endswith("POST-api-v1-articles-search-2.collapsed")
+    assert store.get_path(names[0]) is not None
+    assert store.get_path("../secret.collapsed") is None
+
+
+def test_only_admins_can_profile():
+    """Test that the profiling flag is honoured for admins only."""
+    def request_with(token, mode):
+        return SimpleNamespace(
+            headers={"Authorization": f"Bearer {token}",
+                     api_profiling.PROFILE_HEADER: mode},
+            query_params={})
+
+    admin = api_session_tokens.create_session_tokens("admin", True)
+    user = api_session_tokens.create_session_tokens("ana", False)
+    assert api_profiling.get_requested_mode(
+        request_with(admin["access_token"], "cprofile")) == "cprofile"
+    assert api_profiling.get_requested_mode(
+        request_with(admin["access_token"], "other")) is None
+    assert api_profiling.is_admin_request(
+        request_with(admin["access_token"], "sampling"))
+    assert not api_profiling.is_admin_request(
+        request_with(user["access_token"], "sampling"))
+    assert not api_profiling.is_admin_request(
+        request_with("invalid", "sampling"))
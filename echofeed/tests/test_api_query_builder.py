@@ -0,0 +1,48 @@
+"""Unit tests for the Google query builder."""
+from echofeed.api import api_query_builder
+
+
+def test_build_search_query_tiers_and_dates():
+    """Test the quoted, OR grouped and excluded keyword tiers."""
+    query = api_query_builder.build_search_query(
+        ["inflation"], ["euro", "ECB", "interest rates"], ["sport"],
+        min_keywords=1, date="2024-01-01", date_to="2024-06-30"
+    )
+    assert query == ('"inflation" ("euro" OR "ECB") -"sport"'
+                     ' after:2024-01-01 before:2024-06-30')
+
+
+def test_build_search_query_sanitizes_and_deduplicates():
+    """Test that quotes and repeated keywords can not break the query."""
+    query = api_query_builder.build_search_query(
+        ['"Bucharest"', "bucharest "], ["Bucharest", "traffic"],
+        ['-"protest" OR'], min_keywords=0
+    )
+    assert query == '"Bucharest" "traffic" -"protest OR"'
+
+    query = api_query_builder.build_search_query([], ["traffic"], [])
+    assert query == '"traffic"'
+
+
+def test_build_search_query_keeps_similar_keywords():
+    """Test that only case and diacritic variants are deduplicated."""
+    query = api_query_builder.build_search_query(
+        ["SEO", "Seoul", "București", "bucuresti"], ["news", "new"],
+        ["app", "Apple", "prices", "price"], min_keywords=3
+    )
+    assert query == ('"SEO" "Seoul" "București" ("news" OR "new")'
+                     ' -"app" -"Apple" -"prices" -"price"')
+
+
+def test_build_recommendation_query():
+    """Test that recommendations search any of the keywords."""
+    query = api_query_builder.build_recommendation_query(
+        ["football", "tennis"], "2024-05-01")
+    assert query == '("football" OR "tennis") after:2024-05-01'
+    assert api_query_builder.build_recommendation_query([]) == ""
+
+
+def test_get_language_restrict():
+    """Test the lr parameter of the supported languages."""
+    assert api_query_builder.get_language_restrict("Romanian") == "lang_ro"
+    assert api_query_builder.get_language_restrict("Klingon") is None
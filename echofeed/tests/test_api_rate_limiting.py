@@ -0,0 +1,144 @@
+"""Unit tests for the rate limiting of the expensive endpoints."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from echofeed.api import api_rate_limiting, api_session_tokens
+from echofeed.api.api_rate_limiting import RateLimited
+from echofeed.common import config_info
+
+BUCKETS = [("user:ana", 1.0, 10.0), ("ip:127.0.0.1", 2.0, 4.0)]
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    """Every bucket store, starting empty."""
+    if request.param == "memory":
+        return api_rate_limiting.MemoryBucketStore()
+    return api_rate_limiting.SQLiteBucketStore(
+        str(tmp_path / "rate_limits.sqlite3"))
+
+
+def test_buckets_limit_and_refill(store):
+    """Test the bursts, the Retry-After and the refill of the buckets."""
+    assert store.take(BUCKETS, 3, now=100.0) == (0.0, None)
+    # the IP bucket has 1 token left, the user bucket 7
+    assert store.take(BUCKETS, 3, now=100.0) == (1.0, "ip:127.0.0.1")
+    assert store.take(BUCKETS, 3, now=101.0) == (0.0, None)
+    assert store.take(BUCKETS, 5, now=200.0) == (float("inf"),
+                                                  "ip:127.0.0.1")
+
+
+def test_rejected_take_takes_nothing(store):
+    """Test that a request short of tokens in a bucket takes from none."""
+    user_bucket = [BUCKETS[0]]
+    assert store.take(user_bucket, 8, now=100.0) == (0.0, None)
+    assert store.take(BUCKETS, 3, now=100.0) == (1.0, "user:ana")
+    # the IP bucket is still full
+    assert store.take([BUCKETS[1]], 4, now=100.0) == (0.0, None)
+
+
+def test_memory_store_stays_bounded():
+    """Test that the least recently used buckets are dropped."""
+    store = api_rate_limiting.MemoryBucketStore(max_buckets=2)
+    for key in ("ip:1", "ip:2", "ip:3"):
+        store.take([(key, 1.0, 5.0)], 5, now=100.0)
+
+    assert list(store._buckets) == ["ip:2", "ip:3"]
+    assert store.take([("ip:1", 1.0, 5.0)], 5, now=100.0) == (0.0, None)
+
+
+def test_admission_queue_is_bounded():
+    """Test the queue of the requests waiting for a slot."""
+    admission = api_rate_limiting.AdmissionController(
+        max_concurrent=1, max_queue=1, queue_timeout_seconds=0.05)
+
+    async def scenario():
+        await admission.acquire()
+        waiting = asyncio.ensure_future(admission.acquire())
+        await asyncio.sleep(0)
+        assert admission.get_stats() == {"running": 1, "queued": 1}
+        with pytest.raises(RateLimited) as full:
+            await admission.acquire()
+        with pytest.raises(RateLimited) as timeout:
+            await waiting
+        admission.release()
+        await admission.acquire()
+        return full.value.reason, timeout.value.reason
+
+    assert asyncio.run(scenario()) == ("queue_full", "queue_timeout")
+    assert admission.get_stats() == {"running": 1, "queued": 0}
+
+
+def make_request(username=None, host="127.0.0.1"):
+    """A request of the UI host, with the session token of a user."""
+    headers = {}
+    if username is not None:
+        token = api_session_tokens.create_session_tokens(
+            username, False)["access_token"]
+        headers["Authorization"] = f"Bearer {token}"
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host),
+                           url=SimpleNamespace(path="/api/v1/articles/search"))
+
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """A rate limiter with buckets of two requests and a single slot."""
+    for name, value in (("RATE_LIMIT_USER_TOKENS_PER_SECOND", 0.001),
+                        ("RATE_LIMIT_USER_BURST", 10),
+                        ("RATE_LIMIT_IP_TOKENS_PER_SECOND", 0.001),
+                        ("RATE_LIMIT_IP_BURST", 10)):
+        monkeypatch.setattr(config_info, name, value)
+    return api_rate_limiting.RateLimiter(
+        api_rate_limiting.MemoryBucketStore(),
+        api_rate_limiting.AdmissionController(
+            max_concurrent=1, max_queue=0, queue_timeout_seconds=0.05))
+
+
+def test_users_of_one_host_have_their_own_buckets(limiter):
+    """Test that the users of the UI are not limited by its IP."""
+    async def scenario():
+        for user in range(40):
+            await limiter.admit(make_request(f"user{user}"), 5)
+            limiter.admission.release()
+        await limiter.admit(make_request("user0"), 5)
+        limiter.admission.release()
+        with pytest.raises(RateLimited) as user_limited:
+            await limiter.admit(make_request("user0"), 5)
+        for _ in range(2):
+            await limiter.admit(make_request(), 5)
+            limiter.admission.release()
+        with pytest.raises(RateLimited) as ip_limited:
+            await limiter.admit(make_request(), 5)
+        return user_limited.value.reason, ip_limited.value.reason
+
+    assert asyncio.run(scenario()) == ("user", "ip")
+
+
+def test_rejected_requests_keep_their_tokens(limiter):
+    """Test the refund of a request finding no slot, and oversized costs."""
+    async def scenario():
+        await limiter.admit(make_request("ana"), 5)
+        with pytest.raises(RateLimited) as queue_full:
+            await limiter.admit(make_request("ana"), 5)
+        limiter.admission.release()
+        await limiter.admit(make_request("ana"), 5)
+        limiter.admission.release()
+        with pytest.raises(RateLimited) as oversized:
+            await limiter.admit(make_request("dan"), 11)
+        return queue_full.value.reason, oversized.value.retry_after
+
+    assert asyncio.run(scenario()) == ("queue_full", None)
+
+
+def test_sqlite_refund(tmp_path):
+    """Test that refunded tokens never exceed the burst."""
+    store = api_rate_limiting.SQLiteBucketStore(
+        str(tmp_path / "rate_limits.sqlite3"))
+    store.take(BUCKETS, 3, now=100.0)
+    store.refund(BUCKETS, 3)
+    store.refund(BUCKETS, 3)
+    assert store.take(BUCKETS, 4, now=100.0) == (0.0, None)
+    assert store.take(BUCKETS, 1, now=100.0) == (0.5, "ip:127.0.0.1")
+
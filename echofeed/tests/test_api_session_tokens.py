@@ -0,0 +1,77 @@
+"""Unit tests for the signed session tokens."""
+import pytest
+
+from echofeed.api import api_session_tokens as tokens
+
+
+def test_access_token_round_trip():
+    """Test that a created access token verifies to its claims."""
+    session = tokens.create_session_tokens("test_username", True)
+
+    claims = tokens.verify_token(session["access_token"])
+    assert claims["sub"] == "test_username"
+    assert claims["adm"] is True
+    assert session["token_type"] == "bearer"
+
+
+def test_tampered_token_is_rejected():
+    """Test that changing the claims invalidates the signature."""
+    token = tokens.create_token("test_username", False, tokens.ACCESS_TOKEN)
+    admin_token = tokens.create_token("test_username", True,
+                                      tokens.ACCESS_TOKEN)
+    header, _, signature = token.split(".")
+    forged = f"{header}.{admin_token.split('.')[1]}.{signature}"
+
+    with pytest.raises(tokens.InvalidSessionToken):
+        tokens.verify_token(forged)
+    with pytest.raises(tokens.InvalidSessionToken):
+        tokens.verify_token("not a token")
+
+
+def test_token_type_and_expiry_are_checked(monkeypatch):
+    """Test that refresh tokens and expired tokens are rejected."""
+    refresh_token = tokens.create_token("test_username", False,
+                                        tokens.REFRESH_TOKEN)
+    with pytest.raises(tokens.InvalidSessionToken):
+        tokens.verify_token(refresh_token)
+    assert tokens.verify_token(refresh_token, tokens.REFRESH_TOKEN)
+
+    monkeypatch.setitem(tokens.TOKEN_TTL_SECONDS, tokens.ACCESS_TOKEN, -1)
+    expired_token = tokens.create_token("test_username", False,
+                                        tokens.ACCESS_TOKEN)
+    with pytest.raises(tokens.InvalidSessionToken):
+        tokens.verify_token(expired_token)
+
+
+def test_self_registered_admin_gets_no_admin_claim(monkeypatch, tmp_path):
+    """Test that only an admin session can create an admin."""
+    from fastapi.testclient import TestClient
+
+    from echofeed.api import api_main
+    from echofeed.common import config_info
+    from echofeed.common.config_info import AcceptedOperations as ops
+    from echofeed.common.config_info import Entity, StorageBackends
+    monkeypatch.setattr(config_info, "STORAGE_BACKEND", StorageBackends.SQLITE)
+    monkeypatch.setattr(config_info, "SQLITE_DATABASE_PATH",
+                        str(tmp_path / "echofeed.sqlite3"))
+    monkeypatch.setattr(config_info, "BCRYPT_ROUNDS", 4)
+    client = TestClient(api_main.app)
+    admin_token = tokens.create_session_tokens("admin", True)["access_token"]
+
+    def register_and_login(username, headers):
+        user_info = {"username": username, "last_name": "Pop",
+                     "first_name": "Ana", "birthday": "2000-01-01",
+                     "location": "Iasi", "is_admin": True,
+                     "password": "parola"}
+        client.post(ops.ROUTES[Entity.USER][ops.CREATE], json={"user_info": user_info},
+                    headers=headers)
+        session = client.get(ops.ROUTES[Entity.USER][ops.LOGIN],
+                             params={"username": username,
+                                     "password": "parola"}).json()
+        return tokens.verify_token(session["access_token"])["adm"]
+
+    assert register_and_login("ana", {}) is False
+    assert register_and_login("dan", {"Authorization": "Bearer forged"}) \
+        is False
+    assert register_and_login(
+        "ion", {"Authorization": f"Bearer {admin_token}"}) is True
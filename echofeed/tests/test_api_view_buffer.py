@@ -0,0 +1,131 @@
+"""Unit tests for the write-behind buffer of the article views."""
+import time
+
+import pytest
+
+from echofeed.api import api_endpoint_helpers as api_helpers
+from echofeed.api import api_view_buffer
+from echofeed.common import config_info
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.config_info import Entity, StorageBackends
+
+
+@pytest.fixture(autouse=True)
+def sqlite_storage(monkeypatch, tmp_path):
+    """Stores the users in an empty SQLite database."""
+    monkeypatch.setattr(config_info, "STORAGE_BACKEND", StorageBackends.SQLITE)
+    monkeypatch.setattr(config_info, "SQLITE_DATABASE_PATH",
+                        str(tmp_path / "echofeed.sqlite3"))
+    for username in ("ana", "dan"):
+        es_helpers.create_entity(Entity.USER, {"username": username,
+                                               "viewed_articles": ["vechi"]})
+
+
+@pytest.fixture
+def view_buffer(monkeypatch):
+    """A buffer flushed only by hand, also used by the API helpers."""
+    buffer = api_view_buffer.ViewEventBuffer(
+        flush_interval_seconds=3600, flush_max_events=1000, max_events=4)
+    monkeypatch.setattr(api_view_buffer, "VIEW_BUFFER", buffer)
+    return buffer
+
+
+def viewed_articles(user_id: str) -> list:
+    return es_helpers.get_entity(Entity.USER, user_id)["user_info"][
+        "viewed_articles"]
+
+
+def test_views_are_coalesced_and_flushed(view_buffer):
+    """Test that duplicate views are buffered once and written in bulk."""
+    assert view_buffer.record("ana", ["bnr", "euro", "bnr"]) == 2
+    assert view_buffer.record("ana", ["euro"]) == 0
+    assert view_buffer.record("dan", ["vechi"]) == 1
+    assert view_buffer.size == 3
+    assert viewed_articles("ana") == ["vechi"]
+
+    assert view_buffer.flush() == 3
+    assert view_buffer.size == 0
+    assert viewed_articles("ana") == ["vechi", "bnr", "euro"]
+    assert viewed_articles("dan") == ["vechi"]
+
+
+def test_full_buffer_rejects_new_views(view_buffer):
+    """Test the backpressure of the buffer."""
+    view_buffer.record("ana", ["a", "b", "c"])
+
+    with pytest.raises(api_view_buffer.ViewBufferFull):
+        view_buffer.record("dan", ["d", "e"])
+    assert view_buffer.record("ana", ["a"]) == 0
+    assert view_buffer.record("dan", ["d"]) == 1
+    assert view_buffer.size == 4
+
+
+def test_conflicting_views_are_retried(view_buffer, monkeypatch):
+    """Test that a user updated during a flush keeps both changes."""
+    bulk_entities = es_helpers.bulk_entities
+
+    def update_then_bulk(entity_type, actions):
+        es_helpers.update_entity(Entity.USER, "ana",
+                                 {"viewed_articles": ["vechi", "nou"]})
+        monkeypatch.setattr(es_helpers, "bulk_entities", bulk_entities)
+        return bulk_entities(entity_type, actions)
+
+    monkeypatch.setattr(es_helpers, "bulk_entities", update_then_bulk)
+    view_buffer.record("ana", ["bnr"])
+
+    assert view_buffer.flush() == 0
+    assert view_buffer.pending_views("ana") == ["bnr"]
+    assert view_buffer.flush() == 1
+    assert viewed_articles("ana") == ["vechi", "nou", "bnr"]
+
+
+def test_failed_flushes_back_off(view_buffer, monkeypatch):
+    """Test that a full buffer is not flushed in a loop while storage fails."""
+    attempts = []
+
+    def failing_get_entities(entity_type, entity_ids):
+        attempts.append(time.monotonic())
+        return {"result": False, "message": "storage down", "code": 503}
+
+    monkeypatch.setattr(es_helpers, "get_entities", failing_get_entities)
+    view_buffer.flush_interval_seconds = 0.05
+    view_buffer.flush_max_events = 1
+    view_buffer.record("ana", ["bnr"])
+    view_buffer.start()
+    time.sleep(0.5)
+    view_buffer.stop(timeout=0)
+
+    # flushes after about 0, 0.05, 0.15 and 0.35 seconds
+    assert 3 <= len(attempts) <= 5
+    assert view_buffer.pending_views("ana") == ["bnr"]
+
+
+def test_views_of_deleted_users_are_dropped(view_buffer):
+    """Test that a flush does not recreate a deleted user."""
+    view_buffer.record("ion", ["bnr"])
+
+    assert view_buffer.flush() == 0
+    assert view_buffer.size == 0
+    assert es_helpers.get_entity(Entity.USER, "ion")["code"] == 404
+
+
+def test_pending_views_are_read_and_saved_on_stop(view_buffer):
+    """Test that reads include the buffered views and stop writes them."""
+    view_buffer.start()
+    view_buffer.record("ana", ["bnr"])
+
+    assert api_helpers.get_user("ana")["user_info"]["viewed_articles"] == [
+        "vechi", "bnr"]
+    view_buffer.stop(timeout=5)
+    assert view_buffer.size == 0
+    assert viewed_articles("ana") == ["vechi", "bnr"]
+
+
+def test_api_lifespan_flushes_views_on_shutdown(view_buffer):
+    """Test that the API starts the buffer and flushes it when stopping."""
+    from fastapi.testclient import TestClient
+
+    from echofeed.api import api_main
+    with TestClient(api_main.app):
+        assert view_buffer.record("ana", ["bnr"]) == 1
+    assert viewed_articles("ana") == ["vechi", "bnr"]
@@ -0,0 +1,105 @@
+"""Unit tests for the fake services and the reports of the benchmarks."""
+import pytest
+
+from echofeed.benchmarks import api_scenarios
+from echofeed.benchmarks.fake_services import FakeElasticsearch
+from echofeed.common import config_info, es_index_bootstrap
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.config_info import Entity
+
+
+@pytest.fixture
+def fake_elasticsearch(monkeypatch):
+    """Starts a fake Elasticsearch with bootstrapped indexes."""
+    service = FakeElasticsearch().start()
+    monkeypatch.setattr(config_info, "ELASTICSEARCH_URL", service.url)
+    es_index_bootstrap.bootstrap_indexes()
+    yield service
+    service.stop()
+
+
+def create_article(title: str, keywords: list, date: str) -> None:
+    article = {"title": title, "content": " ".join(keywords),
+               "url": f"https://news.example.com/{title}", "date": date,
+               "keywords": keywords}
+    es_helpers.create_entity(Entity.ARTICLE, article)
+
+
+def test_fake_elasticsearch_documents(fake_elasticsearch):
+    """Test create, get and conditional update through the ES helpers."""
+    create_article("bnr", ["inflație", "BNR"], "2024-05-01")
+    duplicate = es_helpers.create_entity(
+        Entity.ARTICLE, {"title": "bnr", "keywords": []})
+    article = es_helpers.get_entity(Entity.ARTICLE, "bnr")
+
+    assert duplicate["article_id"] is None
+    assert article["article_info"]["keywords"] == ["inflație", "BNR"]
+    assert fake_elasticsearch.aliases["articles"].startswith("articles")
+
+    stale = es_helpers.update_entity(
+        Entity.ARTICLE, "bnr", {"date": "2024-05-02"},
+        if_seq_no=article["seq_no"] + 100,
+        if_primary_term=article["primary_term"])
+    updated = es_helpers.update_entity(
+        Entity.ARTICLE, "bnr", {"date": "2024-05-02"},
+        if_seq_no=article["seq_no"],
+        if_primary_term=article["primary_term"])
+
+    assert stale["code"] == 409
+    assert updated["result"] is True
+    assert es_helpers.get_entity(Entity.ARTICLE, "bnr")["article_info"][
+        "date"] == "2024-05-02"
+    assert es_helpers.get_entity(Entity.ARTICLE, "missing")["code"] == 404
+
+
+def test_fake_elasticsearch_search(fake_elasticsearch):
+    """Test scoring, filters, sorting with search_after and aggregations."""
+    create_article("a", ["inflație", "BNR"], "2024-05-01")
+    create_article("b", ["inflație"], "2024-05-03")
+    create_article("c", ["inflație"], "2024-05-02")
+    create_article("d", ["fotbal"], "2024-05-04")
+    query = {"bool": {
+        "should": [{"match": {"keywords": "inflație"}},
+                   {"match": {"keywords": "BNR"}}],
+        "filter": [es_helpers.build_date_range_query("date", "2024-05-01")],
+        "minimum_should_match": 1
+    }}
+    sort = ["_score", {"date": {"order": "desc"}}]
+
+    first_page = es_helpers.search_entities(Entity.ARTICLE, query, 2, sort)
+    second_page = es_helpers.search_entities(
+        Entity.ARTICLE, query, 2, sort, first_page["search_after"])
+
+    assert [article["title"] for article
+            in first_page["articles_info"]] == ["a", "b"]
+    assert [article["title"] for article
+            in second_page["articles_info"]] == ["c"]
+    assert dict(es_helpers.aggregate_terms(Entity.ARTICLE, "keywords",
+                                           batch_size=2)) == {
+        "BNR": 1, "fotbal": 1, "inflație": 3}
+
+
+def test_percentile_interpolates():
+    """Test the percentiles of the benchmark reports."""
+    values = [0.1, 0.2, 0.3, 0.4, 0.5]
+
+    assert api_scenarios.percentile(values, 0.5) == 0.3
+    assert api_scenarios.percentile(values, 0.95) == pytest.approx(0.48)
+    assert api_scenarios.percentile([], 0.99) == 0.0
+
+
+def test_compare_reports():
+    """Test that the changes between two runs are listed per scenario."""
+    def report(p50, throughput):
+        return {"scenarios": {"search_burst": {
+            "latency_ms": {"p50": p50, "p95": p50 * 2, "p99": p50 * 3},
+            "throughput_per_s": throughput, "errors": 0,
+            "memory": {"peak_rss_mib": 100.0}
+        }}}
+
+    table = api_scenarios.compare_reports(report(100.0, 10.0),
+                                          report(50.0, 20.0))
+
+    assert "-50.0%" in table
+    assert "+100.0%" in table
+    assert table.count("search_burst") == 6
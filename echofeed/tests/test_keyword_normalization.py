@@ -0,0 +1,59 @@
+"""Unit tests for the keyword normalization."""
+from echofeed.common import keyword_normalization
+from echofeed.common.api_classes import Article
+from echofeed.common.keyword_normalization import KeywordDictionary
+
+
+def test_fold_keyword():
+    """Test casefolding, diacritics and punctuation cleanup."""
+    assert keyword_normalization.fold_keyword(" Bucureşti ") == "bucuresti"
+    assert keyword_normalization.fold_keyword("BUCUREȘTI!") == "bucuresti"
+    assert keyword_normalization.fold_keyword("Țară  (mea)") == "tara mea"
+    assert keyword_normalization.clean_keyword("economy.") == "economy"
+    assert keyword_normalization.clean_keyword("U.S.") == "U.S."
+    assert keyword_normalization.clean_keyword("C++") == "C++"
+    assert keyword_normalization.fold_text(" Știri  BNR\n") == "stiri bnr"
+
+
+def test_keyword_key_merges_inflections():
+    """Test that the light stemmer merges plural and article forms."""
+    key = keyword_normalization.keyword_key
+    assert key("Elections") == key("election")
+    assert key("prices") == key("price")
+    assert key("alegerilor") == key("Alegeri")
+    assert key("guvernului") == key("Guvern")
+    assert key("businesses") == key("business")
+    assert key("policies") == key("policy")
+    assert key("bus") == "bus"
+
+
+def test_keyword_key_keeps_distinct_words_apart():
+    """Test that words sharing a prefix or an ending are not merged."""
+    key = keyword_normalization.keyword_key
+    for word, other_word in (("SEO", "Seoul"), ("app", "Apple"),
+                             ("new", "news"), ("cab", "cable"),
+                             ("sail", "sailor"), ("politic", "politics")):
+        assert key(word) != key(other_word)
+
+
+def test_keyword_dictionary_maps_variants_to_one_id():
+    """Test that variants share an id and a form independent of order."""
+    dictionary = KeywordDictionary(max_size=2)
+    assert dictionary.get_id("București") == 0
+    assert dictionary.get_id("bucuresti ") == 0
+    assert dictionary.canonicalize("BUCUREȘTI") == "bucuresti"
+    assert dictionary.get_id("Sports") == 1
+    assert dictionary.canonicalize("sport") == "sport"
+    assert dictionary.get_id("jazz") is None
+    assert dictionary.canonicalize("jazz!") == "jazz"
+    assert len(dictionary) == 2
+
+
+def test_article_keywords_keep_their_spelling():
+    """Test that articles store their keywords once, as they were sent."""
+    article = Article(title="title", content="content", url="url",
+                      keywords=["cluj napoca", "Cluj-Napoca", "SEO",
+                                "Seoul", " prices", "price", ""])
+    assert article.keywords == ["cluj napoca", "SEO", "Seoul", "prices"]
+    assert keyword_normalization.deduplicate_keywords(
+        ["Cluj-Napoca", "cluj napoca"]) == ["Cluj-Napoca"]
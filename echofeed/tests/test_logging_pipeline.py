@@ -0,0 +1,75 @@
+"""Unit tests for the asynchronous logging pipeline."""
+import io
+import logging
+
+from echofeed.common import config_info, logging_pipeline
+
+
+def test_payload_repr_is_bounded_and_redacted():
+    """Test that big responses are shortened and secrets hidden."""
+    payload_repr = logging_pipeline.PayloadRepr(max_items=3, max_string=20,
+                                                max_level=3)
+    response = {
+        "user_info": {"username": "ana", "password": "$2b$12$secret"},
+        "articles_info": [{"title": str(index)} for index in range(10000)]
+    }
+    text = payload_repr.shorten(response)
+
+    assert "$2b$12$secret" not in text
+    assert "'password': <redacted>" in text
+    assert "'9999'" not in text
+    assert len(text) < 300
+    assert payload_repr.shorten("x" * 50) == f"{'x' * 20}... (50 chars)"
+    assert payload_repr.shorten(7) == 7
+
+
+def test_formatter_masks_hashes_and_tokens():
+    """Test that secrets left in the text are masked."""
+    formatter = logging_pipeline.RedactingFormatter("%(message)s",
+                                                    max_length=100)
+    password_hash = "$2b$12$" + "a" * 53
+    record = logging.LogRecord("echofeed", logging.INFO, __file__, 1,
+                               "hash %s token %s", (password_hash,
+                                                    "eyJa.eyJb.sig"), None)
+    assert formatter.format(record) == "hash <redacted> token <redacted>"
+
+
+def test_sampling_filter():
+    """Test the level rates and the per record rate."""
+    sampling_filter = logging_pipeline.SamplingFilter({logging.DEBUG: 0.0})
+    debug = logging.LogRecord("echofeed", logging.DEBUG, __file__, 1, "d",
+                              None, None)
+    info = logging.LogRecord("echofeed", logging.INFO, __file__, 1, "i",
+                             None, None)
+    assert not sampling_filter.filter(debug)
+    assert sampling_filter.filter(info)
+    info.sample_rate = 0.0
+    assert not sampling_filter.filter(info)
+
+
+def test_pipeline_writes_from_the_listener_thread():
+    """Test that records go through the queue to the stream."""
+    stream = io.StringIO()
+    logging_pipeline.stop_logging()
+    try:
+        logging_pipeline.setup_logging(
+            "echofeed", "%(name)s %(levelname)s %(message)s", "INFO",
+            logger_levels={"echofeed.quiet": "ERROR"}, stream=stream)
+        # later calls keep the first configuration
+        logging_pipeline.setup_logging("echofeed", "%(message)s", "DEBUG")
+
+        logger = logging.getLogger("echofeed.test")
+        logger.info("Retrieved %d users: %s", 2, {"password": "secret"})
+        logger.info("Response: %s", {"users": ["ana", "ion"]})
+        logger.debug("not logged")
+        logging.getLogger("echofeed.quiet").warning("not logged")
+        logging_pipeline.stop_logging()
+
+        assert stream.getvalue() == ("echofeed.test INFO Retrieved 2 users:"
+                                     " {'password': <redacted>}\n"
+                                     "echofeed.test INFO Response:"
+                                     " {'users': ['ana', 'ion']}\n")
+    finally:
+        logging_pipeline.stop_logging()
+        logging.getLogger("echofeed.quiet").setLevel(logging.NOTSET)
+        config_info.get_logger()
@@ -0,0 +1,102 @@
+"""Unit tests for the metrics subsystem."""
+import threading
+
+import pytest
+
+from echofeed.common import metrics
+
+
+def test_counter_is_summed_across_threads():
+    """Test that the per-thread shards are merged when collected."""
+    registry = metrics.MetricsRegistry()
+    counter = metrics.Counter("test_calls_total", "Calls.", ("operation",),
+                              registry=registry)
+
+    def record():
+        for _ in range(1000):
+            counter.inc("search")
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    counter.inc("get", amount=2)
+
+    assert counter.collect() == {("search",): 4000, ("get",): 2}
+    assert 'test_calls_total{operation="search"} 4000' \
+        in registry.render().splitlines()
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test the buckets, sum and count of a histogram."""
+    registry = metrics.MetricsRegistry()
+    histogram = metrics.Histogram("test_duration_seconds", "Durations.",
+                                  buckets=(0.1, 1.0), registry=registry)
+    for value in (0.05, 0.5, 0.7, 3.0):
+        histogram.observe(value)
+
+    lines = registry.render().splitlines()
+    assert 'test_duration_seconds_bucket{le="0.1"} 1' in lines
+    assert 'test_duration_seconds_bucket{le="1"} 3' in lines
+    assert 'test_duration_seconds_bucket{le="+Inf"} 4' in lines
+    assert "test_duration_seconds_sum 4.25" in lines
+    assert "test_duration_seconds_count 4" in lines
+
+
+def test_gauge_function_and_label_escaping():
+    """Test gauges read from a function and escaped label values."""
+    registry = metrics.MetricsRegistry()
+    gauge = metrics.Gauge("test_queue", "Queue.", ("state",),
+                          registry=registry)
+    gauge.set_function(lambda: {('say "hi"',): 3})
+    assert 'test_queue{state="say \\"hi\\""} 3' \
+        in registry.render().splitlines()
+
+
+def test_labels_and_names_are_checked():
+    """Test that wrong labels and duplicate names are rejected."""
+    registry = metrics.MetricsRegistry()
+    counter = metrics.Counter("test_total", "Total.", ("route",),
+                              registry=registry)
+    with pytest.raises(ValueError):
+        counter.inc()
+    with pytest.raises(ValueError):
+        metrics.Counter("test_total", "Total.", registry=registry)
+
+
+def test_shards_of_finished_threads_are_folded():
+    """Test that short-lived threads do not leave a shard each behind."""
+    registry = metrics.MetricsRegistry()
+    counter = metrics.Counter("test_calls_total", "Calls.",
+                              registry=registry)
+    histogram = metrics.Histogram("test_duration_seconds", "Durations.",
+                                  buckets=(1.0,), registry=registry)
+
+    def record():
+        counter.inc()
+        histogram.observe(0.5)
+
+    for _ in range(50):
+        thread = threading.Thread(target=record)
+        thread.start()
+        thread.join()
+    record()
+
+    assert counter.collect() == {(): 51}
+    assert histogram.collect() == {(): [51, 25.5, 51]}
+    assert len(counter._shards) == len(histogram._shards) == 1
+    record()
+    assert histogram.collect() == {(): [52, 26.0, 52]}
+
+
+def test_track_storage_counts_errors():
+    """Test that a failing storage call is timed and counted."""
+    labels = ("sqlite", "delete")
+    errors_before = metrics.STORAGE_OPERATION_ERRORS.collect().get(labels, 0)
+    with pytest.raises(RuntimeError):
+        with metrics.track_storage(*labels):
+            raise RuntimeError("unavailable")
+    assert metrics.STORAGE_OPERATION_ERRORS.collect()[labels] \
+        == errors_before + 1
+    assert metrics.STORAGE_OPERATION_DURATION.collect()[labels][-1] >= 1
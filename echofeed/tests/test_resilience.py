@@ -0,0 +1,212 @@
+"""Unit tests for the timeouts, retries, circuit breakers and hedging."""
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+import elasticsearch
+import pytest
+import requests
+
+from echofeed.api import api_google_search as api_search
+from echofeed.common import config_info, resilience
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.resilience import BreakerStates
+
+
+@pytest.fixture(autouse=True)
+def fast_policy(monkeypatch):
+    """Opens the breakers after two failures and retries at once."""
+    monkeypatch.setattr(config_info, "BREAKER_FAILURE_THRESHOLD", 2)
+    monkeypatch.setattr(config_info, "BREAKER_RESET_SECONDS", 60)
+    monkeypatch.setattr(config_info, "RETRY_BACKOFF_BASE_SECONDS", 0)
+
+
+class FlakyCall:
+    """Raises the given exceptions, one per attempt, then succeeds."""
+
+    def __init__(self, *exceptions):
+        self.exceptions = list(exceptions)
+        self.timeouts = []
+
+    def __call__(self, timeout):
+        self.timeouts.append(timeout)
+        if self.exceptions:
+            raise self.exceptions.pop(0)
+        return "ok"
+
+
+def make_dependency(**kwargs):
+    return resilience.Dependency("test", timeout_seconds=1.0,
+                                 deadline_seconds=10.0, max_attempts=3,
+                                 **kwargs)
+
+
+def test_failed_attempts_are_retried():
+    """Test the retries, their timeouts and the backoff bounds."""
+    dependency = make_dependency()
+    call = FlakyCall(ConnectionError(), ConnectionError())
+
+    assert dependency.call(call) == "ok"
+    assert call.timeouts == [1.0, 1.0, 1.0]
+    assert dependency.breaker.state == BreakerStates.CLOSED
+    for attempt in range(1, 10):
+        assert 0 <= resilience.backoff_delay(attempt, 0.2, 2.0) \
+            <= min(2.0, 0.2 * 2 ** (attempt - 1))
+
+
+def test_unsafe_and_expected_errors_are_not_retried():
+    """Test retry=False and the exceptions that are not failures."""
+    dependency = make_dependency(
+        is_failure=lambda exception: not isinstance(exception, KeyError))
+
+    with pytest.raises(ConnectionError):
+        dependency.call(FlakyCall(ConnectionError()), retry=False)
+    call = FlakyCall(KeyError("missing"))
+    with pytest.raises(KeyError):
+        dependency.call(call)
+    assert len(call.timeouts) == 1
+    assert dependency.breaker.state == BreakerStates.CLOSED
+
+
+def test_breaker_opens_fails_fast_and_recovers(monkeypatch):
+    """Test the breaker states and the fallback of an open breaker."""
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    dependency = make_dependency()
+
+    with pytest.raises(ConnectionError):
+        dependency.call(FlakyCall(*[ConnectionError()] * 3))
+    assert dependency.breaker.state == BreakerStates.CLOSED
+    with pytest.raises(ConnectionError):
+        dependency.call(FlakyCall(ConnectionError()), retry=False)
+    assert dependency.breaker.state == BreakerStates.OPEN
+
+    call = FlakyCall()
+    with pytest.raises(resilience.CircuitOpen):
+        dependency.call(call)
+    assert dependency.call(call, fallback=lambda exception: "cached") \
+        == "cached"
+    assert call.timeouts == []
+
+    now[0] += 61
+    with pytest.raises(ConnectionError):
+        dependency.call(FlakyCall(ConnectionError()), retry=False)
+    assert dependency.breaker.state == BreakerStates.OPEN
+
+    now[0] += 61
+    assert dependency.call(call) == "ok"
+    assert dependency.breaker.state == BreakerStates.CLOSED
+
+
+def test_google_results_are_served_while_down(monkeypatch):
+    """Test that a failing Custom Search serves the cached results."""
+    monkeypatch.setattr(api_search, "GOOGLE_SEARCH", make_dependency())
+    monkeypatch.setattr(api_search, "GOOGLE_RESULTS_CACHE",
+                        resilience.FallbackCache("google_results", 10))
+    responses = [SimpleNamespace(status_code=200,
+                                 json=lambda: {"items": [{"title": "BNR"}]}),
+                 SimpleNamespace(status_code=503, json=dict),
+                 *[requests.ConnectionError()] * 5]
+
+    def get(url, params, timeout):
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    monkeypatch.setattr(api_search.requests, "get", get)
+
+    assert api_search.search_google("bnr")["items"] == [{"title": "BNR"}]
+    assert api_search.search_google(" BNR ")["items"] == [{"title": "BNR"}]
+    assert api_search.search_google("euro") == {"items": []}
+    assert responses == []
+    # the breaker is open, Custom Search is not called
+    assert api_search.search_google("bnr")["items"] == [{"title": "BNR"}]
+
+
+def test_storage_client_errors_are_not_outages(monkeypatch):
+    """Test that bad requests are neither retried nor open the breaker."""
+    monkeypatch.setattr(es_helpers, "STORAGE", make_dependency(
+        is_failure=es_helpers.is_storage_failure))
+    calls = []
+
+    def bad_request():
+        calls.append(None)
+        raise elasticsearch.BadRequestError(
+            "failed to parse search_after", SimpleNamespace(status=400), {})
+
+    for _ in range(5):
+        with pytest.raises(elasticsearch.BadRequestError):
+            es_helpers.call_backend("search", "articles", bad_request)
+    assert len(calls) == 5
+    assert es_helpers.STORAGE.breaker.state == BreakerStates.CLOSED
+
+    is_failure = es_helpers.is_storage_failure
+    assert is_failure(elasticsearch.ConnectionTimeout("timed out"))
+    assert is_failure(elasticsearch.ApiError(
+        "unavailable", SimpleNamespace(status=503), {}))
+    assert is_failure(sqlite3.OperationalError("database is locked"))
+    assert not is_failure(TypeError("'<' not supported"))
+    assert not is_failure(ValueError("Invalid field name"))
+
+
+def warmed_policy(**kwargs):
+    """A hedging policy whose requests usually answer in about 10 ms."""
+    policy = resilience.HedgingPolicy("test", hedge_percentile=0.9,
+                                      min_samples=5, **kwargs)
+    for _ in range(5):
+        policy.run(lambda: None)
+    policy._latencies.extend([0.01] * 5)
+    return policy
+
+
+def test_slow_request_is_hedged():
+    """Test that a stalled request is duplicated and the hedge wins."""
+    policy = warmed_policy(budget_ratio=1.0)
+    release = threading.Event()
+    calls = []
+
+    def request(query):
+        calls.append(query)
+        if len(calls) == 1:
+            release.wait(5)
+            return "slow"
+        return "fast"
+
+    assert policy.hedge_delay() == pytest.approx(0.05)
+    assert policy.run(request, "bnr") == "fast"
+    assert calls == ["bnr", "bnr"]
+    release.set()
+
+
+def test_hedges_stay_within_budget():
+    """Test that slow requests are not hedged once the budget is spent."""
+    policy = warmed_policy(budget_ratio=0.0, budget_max=1.0)
+    calls = []
+
+    def request():
+        calls.append(threading.current_thread().name)
+        time.sleep(0.1)
+        return len(calls)
+
+    policy.run(request)
+    calls.clear()
+    assert policy.run(request) == 1
+    assert len(calls) == 1
+
+
+def test_failed_request_waits_for_hedge():
+    """Test that the hedge answers when the first request fails."""
+    policy = warmed_policy(budget_ratio=1.0)
+    calls = []
+
+    def request():
+        calls.append(None)
+        if len(calls) == 1:
+            time.sleep(0.1)
+            raise ConnectionError()
+        time.sleep(0.2)
+        return "hedge"
+
+    assert policy.run(request) == "hedge"
@@ -0,0 +1,259 @@
+"""Tests run against every storage backend, through the database helpers.
+
+The Elasticsearch backend runs against the in-memory stand-in of the
+benchmarks, so the suite needs no Elasticsearch node.
+"""
+import sqlite3
+import time
+
+import pytest
+
+from echofeed.api import api_endpoint_helpers as api_helpers
+from echofeed.benchmarks.fake_services import FakeElasticsearch
+from echofeed.common import config_info, sqlite_storage_backend
+from echofeed.common import storage_backends
+from echofeed.common import es_interactions_helpers as es_helpers
+from echofeed.common.config_info import Entity, StorageBackends
+
+ARTICLES = [
+    ("bnr-inflatie", ["inflatie", "bnr", "dobanzi"], "2024-05-01"),
+    ("bnr-euro", ["bnr", "euro"], "2024-05-03"),
+    ("inflatie-preturi", ["inflatie", "preturi"], "2024-05-02"),
+    ("fotbal", ["fotbal", "liga"], "2024-05-04"),
+    ("inflatie-veche", ["inflatie"], "2023-01-01")
+]
+
+
+@pytest.fixture(params=[StorageBackends.SQLITE, StorageBackends.ELASTICSEARCH])
+def backend(request, monkeypatch, tmp_path):
+    """Selects a storage backend with bootstrapped, empty indexes."""
+    monkeypatch.setattr(config_info, "STORAGE_BACKEND", request.param)
+    monkeypatch.setattr(config_info, "SQLITE_DATABASE_PATH",
+                        str(tmp_path / "echofeed.sqlite3"))
+    service = None
+    if request.param == StorageBackends.ELASTICSEARCH:
+        service = FakeElasticsearch().start()
+        monkeypatch.setattr(config_info, "ELASTICSEARCH_URL", service.url)
+        # the backend reads the URL on every call, so it can be cached
+    selected = storage_backends.get_storage_backend()
+    assert selected.bootstrap()
+    yield selected
+    if service is not None:
+        service.stop()
+
+
+@pytest.fixture
+def articles(backend):
+    """Stores the test articles."""
+    for title, keywords, date in ARTICLES:
+        es_helpers.create_entity(Entity.ARTICLE, {
+            "title": title.replace("-", " "),
+            "content": f"Știri despre {' și '.join(keywords)}.",
+            "url": f"https://news.example.com/{title}",
+            "date": date,
+            "keywords": keywords
+        }, entity_id=title)
+
+
+def test_create_get_and_delete(backend):
+    """Test the single document operations and their errors."""
+    user = {"username": "ana", "interests": ["bnr"], "is_admin": False}
+
+    created = es_helpers.create_entity(Entity.USER, user)
+    duplicate = es_helpers.create_entity(Entity.USER, user)
+    stored = es_helpers.get_entity(Entity.USER, "ana")
+
+    assert created["user_id"] == "ana"
+    assert duplicate["result"] is False
+    assert stored["user_info"] == user
+    assert stored["seq_no"] is not None
+
+    assert es_helpers.delete_entity(Entity.USER, "ana")["result"] is True
+    assert es_helpers.delete_entity(Entity.USER, "ana")["result"] is False
+    assert es_helpers.get_entity(Entity.USER, "ana")["code"] == 404
+
+
+def test_conditional_update(backend):
+    """Test that an update on a stale version is rejected."""
+    es_helpers.create_entity(Entity.USER, {"username": "ana",
+                                           "viewed_articles": []})
+    stored = es_helpers.get_entity(Entity.USER, "ana")
+
+    updated = es_helpers.update_entity(
+        Entity.USER, "ana", {"viewed_articles": ["bnr-euro"]},
+        stored["seq_no"], stored["primary_term"])
+    stale = es_helpers.update_entity(
+        Entity.USER, "ana", {"viewed_articles": []},
+        stored["seq_no"], stored["primary_term"])
+
+    assert updated["result"] is True
+    assert updated["seq_no"] > stored["seq_no"]
+    assert stale["code"] == 409
+    assert es_helpers.get_entity(Entity.USER, "ana")["user_info"] == {
+        "username": "ana", "viewed_articles": ["bnr-euro"]}
+
+
+def test_get_entities_and_bulk(backend):
+    """Test retrieving many documents and applying many writes at once."""
+    result = es_helpers.bulk_entities(Entity.USER, [
+        {"op": "create", "id": "ana", "document": {"username": "ana"}},
+        {"op": "create", "id": "dan", "document": {"username": "dan"}},
+        {"op": "index", "id": "ion", "document": {"username": "ion"}}
+    ])
+    assert result["result"] is True
+
+    result = es_helpers.bulk_entities(Entity.USER, [
+        {"op": "update", "id": "ana", "document": {"location": "Iași"}},
+        {"op": "delete", "id": "dan"},
+        {"op": "create", "id": "ion", "document": {"username": "ion"}},
+        {"op": "update", "id": "missing", "document": {"location": ""}}
+    ])
+    users = es_helpers.get_entities(Entity.USER, ["ana", "dan", "ion"])
+
+    assert result["result"] is False
+    assert [action["id"] for action in result["failed"]] == ["ion",
+                                                             "missing"]
+    assert users["users_info"] == {
+        "ana": {"username": "ana", "location": "Iași"},
+        "dan": None,
+        "ion": {"username": "ion"}
+    }
+
+
+def test_conditional_bulk_update(backend):
+    """Test that a bulk update on a stale version fails alone."""
+    es_helpers.bulk_entities(Entity.USER, [
+        {"op": "create", "id": "ana", "document": {"username": "ana"}},
+        {"op": "create", "id": "dan", "document": {"username": "dan"}}
+    ])
+    versions = es_helpers.get_entities(Entity.USER, ["ana", "dan"])["versions"]
+    es_helpers.update_entity(Entity.USER, "dan", {"location": "Cluj"})
+
+    result = es_helpers.bulk_entities(Entity.USER, [
+        {"op": "update", "id": user_id, "document": {"location": "Iași"},
+         "if_seq_no": versions[user_id]["seq_no"],
+         "if_primary_term": versions[user_id]["primary_term"]}
+        for user_id in ("ana", "dan")
+    ])
+    users = es_helpers.get_entities(Entity.USER, ["ana", "dan"])["users_info"]
+
+    assert [action["id"] for action in result["failed"]] == ["dan"]
+    assert users["ana"]["location"] == "Iași"
+    assert users["dan"]["location"] == "Cluj"
+
+
+def test_get_all_with_date_range(backend, articles):
+    """Test listing the documents of an index, optionally filtered."""
+    all_articles = es_helpers.get_all_entities(Entity.ARTICLE)
+    recent_articles = es_helpers.get_all_entities(
+        Entity.ARTICLE,
+        es_helpers.build_date_range_query("date", "2024-05-02", "2024-05-03"))
+
+    assert len(all_articles["articles_info"]) == len(ARTICLES)
+    assert sorted(article["article_id"] for article
+                  in recent_articles["articles_info"]) == [
+        "bnr-euro", "inflatie-preturi"]
+
+
+def test_local_article_search(backend, articles):
+    """Test the keyword tiers query, its date filter and its pages."""
+    first_page = api_helpers.handle_local_article_search(
+        ["inflatie"], ["bnr", "dobanzi"], ["preturi"], "English", 1, 1,
+        date="2024-01-01")
+    second_page = api_helpers.handle_local_article_search(
+        ["inflatie"], ["bnr", "dobanzi"], ["preturi"], "English", 1, 1,
+        date="2024-01-01", search_after=first_page["search_after"])
+
+    assert first_page["result"] is True
+    assert [article["article_id"] for article
+            in first_page["articles"]] == ["bnr-inflatie"]
+    assert first_page["articles"][0]["score"] > 0
+    # only one article matches the important and a relevant keyword
+    assert second_page["articles"] == []
+
+
+def test_search_pages_cover_all_hits(backend, articles):
+    """Test that chained pages return every hit once, in sort order."""
+    query = {"bool": {"should": [{"match": {"keywords": "inflatie"}},
+                                 {"match": {"keywords": "bnr"}}]}}
+    sort = ["_score", {"date": {"order": "desc", "missing": "_last"}},
+            {"url": {"order": "asc"}}]
+    seen = []
+    search_after = None
+    while True:
+        page = es_helpers.search_entities(Entity.ARTICLE, query, 2, sort,
+                                          search_after)
+        seen.extend(article["article_id"] for article
+                    in page["articles_info"])
+        search_after = page["search_after"]
+        if search_after is None:
+            break
+
+    assert sorted(seen) == ["bnr-euro", "bnr-inflatie", "inflatie-preturi",
+                            "inflatie-veche"]
+    assert seen[0] == "bnr-inflatie"
+
+
+def test_pages_of_equal_and_missing_sort_values(backend):
+    """Test paging one hit at a time through ties and missing dates."""
+    for position in range(6):
+        es_helpers.create_entity(Entity.ARTICLE, {
+            "title": f"stire {position}",
+            "content": "Știri.",
+            "url": f"https://news.example.com/{position}",
+            "date": "2024-05-01" if position % 2 else None,
+            "keywords": ["stiri"]
+        })
+    sort = [{"date": {"order": "desc", "missing": "_last"}},
+            {"url": {"order": "asc"}}]
+    seen = []
+    search_after = None
+    while True:
+        page = es_helpers.search_entities(Entity.ARTICLE, None, 1, sort,
+                                          search_after)
+        seen.extend(article["title"] for article in page["articles_info"])
+        search_after = page["search_after"]
+        if search_after is None:
+            break
+
+    assert seen == ["stire 1", "stire 3", "stire 5", "stire 0", "stire 2",
+                    "stire 4"]
+
+
+def test_aggregate_terms(backend, articles):
+    """Test counting the values of a keyword field across pages."""
+    counts = dict(es_helpers.aggregate_terms(Entity.ARTICLE, "keywords",
+                                             batch_size=3))
+
+    assert counts == {"bnr": 2, "dobanzi": 1, "euro": 1, "fotbal": 1,
+                      "inflatie": 3, "liga": 1, "preturi": 1}
+
+
+def test_folded_keywords_are_one_term(backend):
+    """Test that the spellings of a keyword are aggregated as one term."""
+    for user_id, interests in (("ana", ["București", "BNR"]),
+                               ("dan", ["bucuresti"]),
+                               ("ion", ["BUCUREȘTI"])):
+        es_helpers.create_entity(Entity.USER, {"username": user_id,
+                                               "interests": interests},
+                                 entity_id=user_id)
+
+    counts = dict(es_helpers.aggregate_terms(Entity.USER,
+                                             "interests.folded"))
+    assert counts == {"bnr": 1, "bucuresti": 3}
+
+
+def test_sqlite_calls_stop_at_their_timeout(tmp_path):
+    """Test that a SQLite statement running past its timeout is stopped."""
+    backend = sqlite_storage_backend.SQLiteBackend(
+        str(tmp_path / "echofeed.sqlite3"))
+    slow_query = ("WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL"
+                  " SELECT i + 1 FROM n) SELECT COUNT(*) FROM n")
+
+    with storage_backends.request_timeout(0.05):
+        start_time = time.monotonic()
+        with pytest.raises(sqlite3.OperationalError):
+            backend._connection().execute(slow_query).fetchone()
+        assert time.monotonic() - start_time < 2
+        assert backend.create("articles", "a", {"title": "a"}) == "a"
+    assert backend.get("articles", "a")["_source"] == {"title": "a"}
@@ -0,0 +1,110 @@
+"""Unit tests for the request tracing."""
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from echofeed.api import api_trace_viewer
+from echofeed.common import tracing
+
+
+def use_ring_buffer(monkeypatch, max_traces=10):
+    """Exports the spans only to a new ring buffer."""
+    ring_buffer = tracing.RingBufferExporter(max_traces)
+    monkeypatch.setattr(tracing, "EXPORTERS", [ring_buffer])
+    return ring_buffer
+
+
+def test_spans_are_nested_in_the_active_trace(monkeypatch):
+    """Test that child spans, also in pool threads, join the trace."""
+    ring_buffer = use_ring_buffer(monkeypatch)
+
+    def search():
+        with tracing.span("elasticsearch.search", index="articles"):
+            pass
+
+    with tracing.start_trace("POST /search") as root:
+        with tracing.span("openai.search_query") as child:
+            search()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            executor.submit(tracing.run_in_context(search)).result()
+    assert tracing.get_current_span() is None
+
+    spans = {span["span_id"]: span for span in ring_buffer.get_traces()[0]}
+    assert len(spans) == 4
+    assert {span["trace_id"] for span in spans.values()} == {root.trace_id}
+    parents = sorted(spans[span["parent_id"]]["name"]
+                     for span in spans.values()
+                     if span["name"] == "elasticsearch.search")
+    assert parents == ["POST /search", "openai.search_query"]
+    assert spans[child.span_id]["parent_id"] == root.span_id
+
+
+def test_spans_outside_a_trace_are_not_recorded(monkeypatch):
+    """Test that background work is not traced."""
+    ring_buffer = use_ring_buffer(monkeypatch)
+    with tracing.span("elasticsearch.get") as span:
+        assert span is None
+    assert ring_buffer.get_traces() == []
+
+
+def test_traceparent_round_trip(monkeypatch):
+    """Test that the trace of a caller is continued."""
+    use_ring_buffer(monkeypatch)
+    with tracing.start_trace("ui search") as ui_root:
+        header = tracing.get_trace_headers()[tracing.TRACEPARENT_HEADER]
+    trace_id, parent_id = tracing.parse_traceparent(header)
+    assert (trace_id, parent_id) == (ui_root.trace_id, ui_root.span_id)
+    assert tracing.parse_traceparent("invalid") == (None, None)
+
+
+def test_ring_buffer_keeps_the_slowest_recent_traces(monkeypatch):
+    """Test the eviction of old traces and the ordering by duration."""
+    ring_buffer = use_ring_buffer(monkeypatch, max_traces=2)
+    for name, duration in [("a", 0.3), ("b", 0.1), ("c", 0.2)]:
+        root = tracing.Span(name, tracing.secrets.token_hex(16))
+        root._start_counter -= duration
+        root.end()
+
+    slowest = ring_buffer.get_slowest_traces(limit=5)
+    assert [spans[0]["name"] for spans in slowest] == ["c", "b"]
+
+
+def export_span(ring_buffer, name, trace_id, start_time, duration,
+                parent_id=None):
+    """Exports a finished span with the given start and duration."""
+    span = tracing.Span(name, trace_id, parent_id)
+    span.start_time = start_time
+    span.duration = duration
+    ring_buffer.export(span)
+
+
+def test_traces_of_many_requests_are_ranked_as_a_whole(monkeypatch):
+    """Test a UI trace calling the API many times against a slow request."""
+    ring_buffer = use_ring_buffer(monkeypatch)
+    ui_trace_id = tracing.secrets.token_hex(16)
+    ui_handler = tracing.secrets.token_hex(8)
+    for position, duration in enumerate([0.01, 0.3, 0.02]):
+        export_span(ring_buffer, f"GET /req{position}", ui_trace_id,
+                    1000.0 + position * 0.3, duration, parent_id=ui_handler)
+    export_span(ring_buffer, "GET /slow", tracing.secrets.token_hex(16),
+                1000.0, 0.5)
+
+    slowest = ring_buffer.get_slowest_traces(limit=2)
+    assert [len(tracing.get_root_spans(spans)) for spans in slowest] == [3, 1]
+    assert tracing.get_trace_duration(slowest[0]) == pytest.approx(0.62)
+    page = api_trace_viewer.render_traces_page(slowest)
+    assert "620.0 ms &mdash; GET /req0 (10.0 ms), GET /req1 (300.0 ms)," \
+           " GET /req2 (20.0 ms)" in page
+
+
+def test_waterfall_page_escapes_names(monkeypatch):
+    """Test that the viewer renders every span of a trace."""
+    ring_buffer = use_ring_buffer(monkeypatch)
+    with tracing.start_trace("GET /<script>"):
+        with tracing.span("google.search"):
+            pass
+    page = api_trace_viewer.render_traces_page(
+        ring_buffer.get_slowest_traces(limit=1))
+    assert "GET /&lt;script&gt;" in page
+    assert "google.search" in page
+    assert page.count("class=\"bar") == 2
@@ -0,0 +1,34 @@
+"""Unit tests for the UI user document cache."""
+from echofeed.ui.ui_user_cache import UserDocumentCache
+
+
+def test_cache_returns_stored_version():
+    """Test that a stored user is returned together with its version."""
+    cache = UserDocumentCache(ttl_seconds=30)
+    cache.put("session", {"username": "test"}, seq_no=3, primary_term=1)
+
+    entry = cache.get("session")
+    assert entry["user_info"] == {"username": "test"}
+    assert entry["seq_no"] == 3
+    assert entry["primary_term"] == 1
+
+
+def test_cache_returns_copies():
+    """Test that modifying a returned user does not alter the cache."""
+    cache = UserDocumentCache(ttl_seconds=30)
+    cache.put("session", {"liked_articles": []}, seq_no=0, primary_term=1)
+
+    cache.get("session")["user_info"]["liked_articles"].append("article")
+    assert cache.get("session")["user_info"]["liked_articles"] == []
+
+
+def test_cache_expires_and_invalidates():
+    """Test that expired and invalidated entries are not returned."""
+    cache = UserDocumentCache(ttl_seconds=-1)
+    cache.put("session", {"username": "test"}, seq_no=0, primary_term=1)
+    assert cache.get("session") is None
+
+    cache = UserDocumentCache(ttl_seconds=30)
+    cache.put("session", {"username": "test"}, seq_no=0, primary_term=1)
+    cache.invalidate("session")
+    assert cache.get("session") is None
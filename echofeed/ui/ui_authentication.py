@@ -15,23 +15,19 @@ def home_page() -> None:
     if not app.storage.user.get('authenticated', False):
         return RedirectResponse('/login')
 
-    response = requests.get(
-        f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-        params={'user_id': app.storage.user.get("username", "")}
-    )
+    user = ui_helpers.get_user_info()
 
-    if response.status_code != 200:
+    if user is None:
         ui.notify('Failed to fetch user information', color='negative')
         return
 
-    user = response.json().get('user_info', {})
     liked_articles = user.get('liked_articles', [])
     trending_articles = []
 
     for article_id in liked_articles:
         article_response = requests.get(
             f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET]}",
-            params={'article_id': article_id}
+            params={'article_id': article_id}, headers=ui_helpers.auth_headers()
         )
         if article_response.status_code != 200:
             continue
@@ -53,7 +49,7 @@ def home_page() -> None:
                             'text-lg')
                         ui.label(article.get('content', '')).classes(
                             'text-sm')
-                        ui.label(article.get('date', '')).classes(
+                        ui.label(article.get('date') or '').classes(
                             'text-xs')
                         with ui.button(on_click=lambda
                                 url=article.get('url',
@@ -85,6 +81,7 @@ def login_page() -> None:
                     'authenticated': True,
                     'is_admin': user_info.get('is_admin', False)
                 })
+                ui_helpers.store_session_tokens(data)
                 ui.notify('Login successful', color='positive')
                 ui.navigate.to(app.storage.user.get('referrer_path', '/'))
             else:
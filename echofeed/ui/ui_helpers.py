@@ -1,8 +1,22 @@
+import functools
+import inspect
+import json
+import time
+from typing import Optional
+
+import httpx
 from nicegui import ui, app
 import requests
-from echofeed.common import config_info, api_request_classes, api_classes
+from echofeed.common import config_info, tracing, api_request_classes, api_classes
+from echofeed.ui.ui_user_cache import USER_CACHE
 
 API_BASE_URL = f"http://{config_info.HOST}:{config_info.API_PORT}"
+# access tokens are refreshed this many seconds before they expire
+TOKEN_REFRESH_MARGIN_SECONDS = 30
+# the keywords page streams the local keywords first, then those added
+# by GPT
+KEYWORDS_STREAM_MODE = config_info.KeywordModes.HYBRID
+KEYWORDS_STREAM_TIMEOUT_SECONDS = 30
 
 
 def page_header():
@@ -39,11 +53,77 @@ def page_header():
         with ui.button('', on_click=lambda: ui.navigate.to('/profile')).classes('w-full'):
             ui.icon('account_circle').classes('mr-2')
             ui.label('Profile')
-        with ui.button('', on_click=lambda: (app.storage.user.clear(), ui.navigate.to('/login'))).classes('w-full'):
+        with ui.button('', on_click=lambda: (invalidate_user_info(), app.storage.user.clear(), ui.navigate.to('/login'))).classes('w-full'):
             ui.icon('logout').classes('mr-2')
             ui.label('Log out')
 
 
+def store_session_tokens(data: dict) -> None:
+    """
+    Saves the session tokens returned by the login or refresh endpoints
+    in the user storage.
+    """
+    app.storage.user.update({
+        'access_token': data.get('access_token', ''),
+        'refresh_token': data.get('refresh_token', ''),
+        'access_token_expires_at': time.time() + data.get('expires_in', 0)
+    })
+
+
+def refresh_session_tokens() -> bool:
+    """
+    Exchanges the stored refresh token for new session tokens.
+    If the refresh token is rejected the session is marked as
+    unauthenticated, so the next page load goes to the login page.
+    """
+    request = api_request_classes.RefreshSessionRequest(
+        refresh_token=app.storage.user.get('refresh_token', ''))
+    response = requests.post(
+        f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.REFRESH]}",
+        json=request.dict())
+    data = response.json() if response.status_code == 200 else {}
+    if not data.get('result', False):
+        app.storage.user['authenticated'] = False
+        return False
+    store_session_tokens(data)
+    return True
+
+
+def auth_headers() -> dict:
+    """
+    Returns the headers that authenticate the logged in user against
+    the API, refreshing the access token when it is about to expire.
+    """
+    expires_at = app.storage.user.get('access_token_expires_at', 0)
+    if expires_at - time.time() < TOKEN_REFRESH_MARGIN_SECONDS:
+        refresh_session_tokens()
+    return {
+        'Authorization': f"Bearer {app.storage.user.get('access_token', '')}",
+        **tracing.get_trace_headers()
+    }
+
+
+def traced(name: str):
+    """
+    Runs a page or an event handler in a trace, so the API requests it
+    makes share one trace id and show up together in /debug/traces.
+    """
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with tracing.start_trace(f"ui {name}"):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with tracing.start_trace(f"ui {name}"):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
 def get_or_create_article(article):
     new_article = api_classes.Article(
         title=article.title,
@@ -54,13 +134,13 @@ def get_or_create_article(article):
     )
     response = requests.get(
         f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET]}",
-        params={'article_id': article.title})
+        params={'article_id': article.title}, headers=auth_headers())
     if response.json().get("article_info", {}) is None:
         request = api_request_classes.CreateArticleRequest(
             article_info=new_article)
         response = requests.post(
             f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.CREATE]}",
-            json=request.dict())
+            json=request.dict(), headers=auth_headers())
     if response.status_code == 200:
         ui.notify('Article found or added in the database',
                   color='positive')
@@ -69,6 +149,22 @@ def get_or_create_article(article):
                   color='negative')
 
 
+def notify_rate_limited(response) -> bool:
+    """
+    Asks the user to wait when the API rejected a request over its rate
+    limits.
+
+    Returns:
+        bool: True if the request was rate limited.
+    """
+    if response.status_code != 429:
+        return False
+    retry_after = response.headers.get('Retry-After')
+    when = f'in {retry_after} seconds' if retry_after else 'later'
+    ui.notify(f'Too many requests, please try again {when}', color='warning')
+    return True
+
+
 def generate_keywords(user_input: str, language: str):
     request = api_request_classes.GetKeywordsRequest(
         user_input=user_input,
@@ -76,6 +172,152 @@ def generate_keywords(user_input: str, language: str):
     )
     response = requests.get(
         f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.KEYWORDS]}",
-        json=request.dict())
+        json=request.dict(), headers=auth_headers())
+    if notify_rate_limited(response):
+        return []
     keywords = response.json().get("keywords", [])
     return keywords
+
+
+async def stream_keywords(user_input: str, language: str,
+                          mode: str = KEYWORDS_STREAM_MODE):
+    """
+    Yields the keywords of a user input as the API streams them, so they
+    can be displayed before the generation ends. When the stream cannot
+    be opened or breaks, the missing keywords are requested all at once.
+    """
+    sent_keywords = set()
+    url = f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.KEYWORDS_STREAM]}"
+    params = {'user_input': user_input, 'language': language, 'mode': mode}
+    try:
+        async with httpx.AsyncClient(timeout=KEYWORDS_STREAM_TIMEOUT_SECONDS) as client:
+            async with client.stream('GET', url, params=params,
+                                     headers=auth_headers()) as response:
+                if notify_rate_limited(response):
+                    return
+                if response.status_code != 200:
+                    raise httpx.HTTPStatusError(
+                        'Keyword stream refused', request=response.request,
+                        response=response)
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith('event:'):
+                        event = line[len('event:'):].strip()
+                    elif line.startswith('data:'):
+                        if event == 'done':
+                            return
+                        keyword = json.loads(line[len('data:'):])['keyword']
+                        sent_keywords.add(keyword)
+                        yield keyword
+                    elif not line:
+                        event = None
+    except httpx.HTTPError:
+        for keyword in generate_keywords(user_input, language):
+            if keyword not in sent_keywords:
+                yield keyword
+
+
+def suggest_keywords(prefix: str, limit: int = 10) -> list:
+    """
+    Returns known keywords starting with the given prefix, most frequent
+    first. Failures return no suggestions, so typing is never blocked.
+    """
+    if not prefix.strip():
+        return []
+    try:
+        response = requests.get(
+            f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.AUTOCOMPLETE]}",
+            params={'prefix': prefix, 'limit': limit}, headers=auth_headers(),
+            timeout=1)
+    except requests.RequestException:
+        return []
+    if response.status_code != 200:
+        return []
+    return [suggestion["keyword"]
+            for suggestion in response.json().get("suggestions", [])]
+
+
+def get_user_info(refresh: bool = False) -> Optional[dict]:
+    """
+    Returns the document of the logged in user, served from the session
+    cache while it is fresh and read from the API otherwise.
+    The returned dict is a copy and can be modified freely.
+    """
+    session_id = app.storage.browser.get('id')
+    username = app.storage.user.get("username", "")
+    if not refresh:
+        entry = USER_CACHE.get(session_id)
+        if entry and entry["user_info"].get("username") == username:
+            return entry["user_info"]
+
+    response = requests.get(
+        f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
+        params={'user_id': username}, headers=auth_headers())
+    if response.status_code != 200:
+        return None
+    data = response.json()
+    user_info = data.get("user_info")
+    if not user_info:
+        USER_CACHE.invalidate(session_id)
+        return None
+    USER_CACHE.put(session_id, user_info, data.get("seq_no"),
+                   data.get("primary_term"))
+    return user_info
+
+
+def update_user_info(user: api_classes.User) -> bool:
+    """
+    Writes a user document to the API. Updates of the logged in user
+    are made conditional on the cached version and written through the
+    session cache; on a version mismatch the cache entry is dropped so
+    the next read fetches the current document.
+    """
+    session_id = app.storage.browser.get('id')
+    is_session_user = user.username == app.storage.user.get("username", "")
+    entry = USER_CACHE.get(session_id) if is_session_user else None
+
+    request = api_request_classes.UpdateUserRequest(
+        user_id=user.username,
+        user_info=user,
+        if_seq_no=entry["seq_no"] if entry else None,
+        if_primary_term=entry["primary_term"] if entry else None)
+    response = requests.put(
+        f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}",
+        json=request.dict(), headers=auth_headers())
+
+    data = response.json() if response.status_code == 200 else {}
+    if not data.get("result", False):
+        if is_session_user:
+            USER_CACHE.invalidate(session_id)
+        return False
+    if is_session_user:
+        USER_CACHE.put(session_id, user.model_dump(), data.get("seq_no"),
+                       data.get("primary_term"))
+    return True
+
+
+def record_article_view(article_id: str) -> bool:
+    """
+    Records that the logged in user viewed an article. The API buffers
+    the view and writes it in the background, so the click does not wait
+    for the user document to be rewritten. The cached user is dropped,
+    since the write changes its version.
+    """
+    request = api_request_classes.RecordViewsRequest(
+        user_id=app.storage.user.get("username", ""),
+        article_ids=[article_id])
+    try:
+        response = requests.post(
+            f"{API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.VIEWS]}",
+            json=request.dict(), headers=auth_headers(), timeout=2)
+    except requests.RequestException:
+        return False
+    invalidate_user_info()
+    return response.status_code == 202
+
+
+def invalidate_user_info() -> None:
+    """
+    Drops the cached document of the logged in user.
+    """
+    USER_CACHE.invalidate(app.storage.browser.get('id'))
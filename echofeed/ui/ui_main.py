@@ -11,6 +11,7 @@ app.add_middleware(ui_auth_middleware.AuthMiddleware)
 
 
 def with_header(page_func):
+    @ui_helpers.traced(f"page {page_func.__name__}")
     def wrapper():
         ui_helpers.page_header()
         page_func()
@@ -47,24 +48,28 @@ def search_page() -> None:
                 language = value
                 ui.notify(f'{language} selected', color='positive')
 
-            def on_generate_button_click():
+            @ui_helpers.traced("generate keywords")
+            async def on_generate_button_click():
                 generate_button.set_text('Generating...')
-                keywords = ui_helpers.generate_keywords(user_input.value, language)
-                display_keywords(keywords)
+                await display_keywords(
+                    ui_helpers.stream_keywords(user_input.value, language))
                 generate_button.set_text('Regenerate Keywords')
 
-            def display_keywords(keywords):
+            async def display_keywords(keywords):
                 for button in keyword_buttons.values():
                     button.delete()
                 keyword_buttons.clear()
 
-                if not keywords:
+                # the buttons are added as the keywords arrive
+                async for keyword in keywords:
+                    if keyword in keyword_buttons:
+                        continue
+                    keyword_button = ui.button(keyword, on_click=lambda e, kw=keyword: toggle_keyword(kw))
+                    keyword_button.classes('w-1/2 mt-2')
+                    keyword_buttons[keyword] = keyword_button
+
+                if not keyword_buttons:
                     ui.notify("No keywords generated")
-                else:
-                    for keyword in keywords:
-                        keyword_button = ui.button(keyword, on_click=lambda e, kw=keyword: toggle_keyword(kw))
-                        keyword_button.classes('w-1/2 mt-2')
-                        keyword_buttons[keyword] = keyword_button
 
             def toggle_keyword(keyword):
                 if keyword in important_keywords:
@@ -104,7 +109,16 @@ def search_page() -> None:
                 ui.item('Romanian', on_click=lambda: set_language('Romanian'))
 
             ui.label('Please insert anything that you would like to see news on, in any language').classes('text-md')
-            user_input = ui.input('Search').classes('w-1/2')
+            def on_user_input_change(event):
+                # complete the last typed word with known keywords
+                text = event.value or ''
+                last_word = text.split(' ')[-1]
+                typed = text[:len(text) - len(last_word)]
+                user_input.set_autocomplete(
+                    [typed + keyword for keyword in ui_helpers.suggest_keywords(last_word)])
+
+            user_input = ui.input('Search', autocomplete=[],
+                                  on_change=on_user_input_change).classes('w-1/2')
 
             generate_button = ui.button('Generate Keywords', on_click=on_generate_button_click).classes('mt-4 q-pa-md')
             with generate_button:
@@ -125,6 +139,7 @@ def search_page() -> None:
             ui.tooltip('Number of articles to be displayed. Choosing too'
                        ' many might result into a failed search.').classes('cursor-pointer')
 
+        @ui_helpers.traced("search")
         def on_search_button_click():
             request = api_request_classes.SearchArticlesRequest(
                 important_keywords=important_keywords,
@@ -137,8 +152,10 @@ def search_page() -> None:
             )
             response = requests.post(
                 f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.SEARCH]}",
-                json=request.dict()
+                json=request.dict(), headers=ui_helpers.auth_headers()
             )
+            if ui_helpers.notify_rate_limited(response):
+                return
             articles = []
             if response.status_code == 200:
                 articles = response.json().get('articles', {})
@@ -170,9 +187,8 @@ def search_results_page():
     ui.button('Back to search', on_click=lambda: ui.navigate.to('/search-news')).classes('q-pa-md')
 
     def on_click_like(article):
-        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}", params={'user_id': app.storage.user.get("username", "")})
-        if response.status_code == 200:
-            user_info = response.json().get("user_info", {})
+        user_info = ui_helpers.get_user_info()
+        if user_info is not None:
             liked_articles = user_info.get("liked_articles", [])
             if article.title not in liked_articles:
                 new_article = api_classes.Article(
@@ -184,13 +200,13 @@ def search_results_page():
                 )
                 response = requests.get(
                     f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET]}",
-                    params={'article_id': article.title})
+                    params={'article_id': article.title}, headers=ui_helpers.auth_headers())
                 if response.json().get("article_info", {}) is None:
                     request = api_request_classes.CreateArticleRequest(
                         article_info=new_article)
                     response = requests.post(
                         f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.CREATE]}",
-                        json=request.dict())
+                        json=request.dict(), headers=ui_helpers.auth_headers())
                 if response.status_code == 200:
                     ui.notify('Article found or added in the database',
                               color='positive')
@@ -210,11 +226,7 @@ def search_results_page():
                 is_admin=user_info.get("is_admin", False),
                 password=user_info.get("password", "")
             )
-            request = api_request_classes.UpdateUserRequest(
-                user_id=user_info.get("username", ""),
-                user_info=updated_user)
-            response = requests.put(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}", json=request.dict())
-            if response.status_code == 200:
+            if ui_helpers.update_user_info(updated_user):
                 ui.notify('Article liked', color='positive')
                 app.storage.user.update({'liked_articles': liked_articles})
             else:
@@ -223,32 +235,16 @@ def search_results_page():
             ui.notify('Failed to fetch user data', color='negative')
 
     def on_click_read_more(article):
-        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}", params={'user_id': app.storage.user.get("username", "")})
-        if response.status_code == 200:
-            user_info = response.json().get("user_info", {})
+        user_info = ui_helpers.get_user_info()
+        if user_info is not None:
             viewed_articles = user_info.get("viewed_articles", [])
             if article.title not in viewed_articles:
                 ui_helpers.get_or_create_article(article)
-                viewed_articles.append(article.title)
-                updated_user = api_classes.User(
-                    username=user_info.get("username", ""),
-                    last_name=user_info.get("last_name", ""),
-                    first_name=user_info.get("first_name", ""),
-                    birthday=user_info.get("birthday", ""),
-                    location=user_info.get("location", ""),
-                    interests=user_info.get("interests", []),
-                    viewed_articles=viewed_articles,
-                    liked_articles=user_info.get("liked_articles", []),
-                    is_admin=user_info.get("is_admin", False),
-                    password=user_info.get("password", "")
-                )
-                request = api_request_classes.UpdateUserRequest(
-                    user_id=user_info.get("username", ""),
-                    user_info=updated_user)
-                response = requests.put(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}", json=request.dict())
-                if response.status_code == 200:
+                if ui_helpers.record_article_view(article.title):
                     ui.notify('Article viewed', color='positive')
-                    app.storage.user.update({'viewed_articles': viewed_articles})
+                    viewed_articles.append(article.title)
+                    app.storage.user.update(
+                        {'viewed_articles': viewed_articles})
                 else:
                     ui.notify('Failed to view article', color='negative')
         ui.navigate.to(article.url, new_tab=True)
@@ -258,7 +254,7 @@ def search_results_page():
         for article in articles:
             with ui.card().classes('w-full mx-auto q-pa-md'):
                 ui.label(article.title).classes('text-lg')
-                ui.label(article.date).classes('text-sm')
+                ui.label(article.date or '').classes('text-sm')
                 ui.label(article.content).classes('text-md')
                 ui.icon('favorite').on('click', lambda e, a=article: on_click_like(a)).classes('cursor-pointer text-2xl')
                 with ui.button(on_click=lambda e, a=article: on_click_read_more(a)).classes('mt-4 q-pa-md'):
@@ -270,34 +266,13 @@ def search_results_page():
 @with_header
 def liked_articles_page():
     def on_click_read_more(article):
-        response = requests.get(
-            f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-            params={'user_id': app.storage.user.get("username", "")})
-        if response.status_code == 200:
-            user_info = response.json().get("user_info", {})
+        user_info = ui_helpers.get_user_info()
+        if user_info is not None:
             viewed_articles = user_info.get("viewed_articles", [])
             if article.title not in viewed_articles:
-                viewed_articles.append(article.title)
-                updated_user = api_classes.User(
-                    username=user_info.get("username", ""),
-                    last_name=user_info.get("last_name", ""),
-                    first_name=user_info.get("first_name", ""),
-                    birthday=user_info.get("birthday", ""),
-                    location=user_info.get("location", ""),
-                    interests=user_info.get("interests", []),
-                    viewed_articles=viewed_articles,
-                    liked_articles=user_info.get("liked_articles", []),
-                    is_admin=user_info.get("is_admin", False),
-                    password=user_info.get("password", "")
-                )
-                request = api_request_classes.UpdateUserRequest(
-                    user_id=user_info.get("username", ""),
-                    user_info=updated_user)
-                response = requests.put(
-                    f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}",
-                    json=request.dict())
-                if response.status_code == 200:
+                if ui_helpers.record_article_view(article.title):
                     ui.notify('Article viewed', color='positive')
+                    viewed_articles.append(article.title)
                     app.storage.user.update(
                         {'viewed_articles': viewed_articles})
                 else:
@@ -305,11 +280,8 @@ def liked_articles_page():
         ui.navigate.to(article.url, new_tab=True)
 
     def on_click_remove(article):
-        response = requests.get(
-            f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-            params={'user_id': app.storage.user.get("username", "")})
-        if response.status_code == 200:
-            user_info = response.json().get("user_info", {})
+        user_info = ui_helpers.get_user_info()
+        if user_info is not None:
             liked_articles = user_info.get("liked_articles", [])
             if article in liked_articles:
                 liked_articles.remove(article)
@@ -325,13 +297,7 @@ def liked_articles_page():
                     is_admin=user_info.get("is_admin", False),
                     password=user_info.get("password", "")
                 )
-                request = api_request_classes.UpdateUserRequest(
-                    user_id=user_info.get("username", ""),
-                    user_info=updated_user)
-                response = requests.put(
-                    f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}",
-                    json=request.dict())
-                if response.status_code == 200:
+                if ui_helpers.update_user_info(updated_user):
                     ui.notify('Article removed from liked list',
                               color='positive')
                     ui.navigate.reload()
@@ -351,13 +317,10 @@ def liked_articles_page():
             'items-center w-full mx-auto'):
         ui.markdown('Liked articles').classes('text-2xl mb-4')
 
-        response = requests.get(
-            f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-            params={'user_id': app.storage.user.get("username", "")})
+        user_info = ui_helpers.get_user_info()
 
-        if response.status_code == 200:
-            liked_articles = response.json().get("user_info", {}).get(
-                "liked_articles", [])
+        if user_info is not None:
+            liked_articles = user_info.get("liked_articles", [])
             if not liked_articles:
                 ui.notify('You have not liked any articles yet',
                           color='negative')
@@ -365,7 +328,7 @@ def liked_articles_page():
                 for article_id in liked_articles:
                     response = requests.get(
                         f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET]}",
-                        params={'article_id': article_id})
+                        params={'article_id': article_id}, headers=ui_helpers.auth_headers())
                     article_data = response.json().get("article_info", {})
 
                     if article_data:
@@ -373,7 +336,7 @@ def liked_articles_page():
                         with ui.card().classes(
                                 'w-full max-w-screen-lg mx-auto q-pa-md'):
                             ui.label(article.title).classes('text-lg')
-                            ui.label(article.date).classes('text-sm')
+                            ui.label(article.date or '').classes('text-sm')
                             ui.label(article.content).classes('text-md')
                             with ui.row().classes('items-center'):
                                 with ui.button('', on_click=lambda e,
@@ -419,13 +382,7 @@ def viewed_articles_page():
             is_admin=user_info.get("is_admin", False),
             password=user_info.get("password", "")
         )
-        request = api_request_classes.UpdateUserRequest(
-            user_id=user_info.get("username", ""),
-            user_info=updated_user)
-        response = requests.put(
-            f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}",
-            json=request.dict())
-        if response.status_code == 200:
+        if ui_helpers.update_user_info(updated_user):
             ui.notify('Viewed articles cleared', color='positive')
             ui.navigate.reload()
         else:
@@ -434,11 +391,8 @@ def viewed_articles_page():
     with ui.column().classes(
             'items-center w-full mx-auto'):
         ui.markdown('Viewed articles').classes('text-2xl mb-4')
-        response = requests.get(
-            f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-            params={'user_id': app.storage.user.get("username", "")})
-        if response.status_code == 200:
-            user_info = response.json().get("user_info", {})
+        user_info = ui_helpers.get_user_info()
+        if user_info is not None:
             liked_articles = user_info.get("viewed_articles", [])
             with ui.dialog() as dialog, ui.card().classes('items-center'):
                 ui.label('Are you sure you want to clear your viewed articles?')
@@ -460,7 +414,7 @@ def viewed_articles_page():
                 for article in liked_articles:
                     response = requests.get(
                         f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET]}",
-                        params={'article_id': article})
+                        params={'article_id': article}, headers=ui_helpers.auth_headers())
                     if response.status_code == 200:
                         retrieved_article = response.json().get("article_info",
                                                                 {})
@@ -471,7 +425,7 @@ def viewed_articles_page():
                                                                '')).classes(
                                     'text-lg')
                                 ui.label(
-                                    retrieved_article.get('date', '')).classes(
+                                    retrieved_article.get('date') or '').classes(
                                     'text-sm')
                                 ui.label(retrieved_article.get('content',
                                                                '')).classes(
@@ -493,13 +447,11 @@ def recommendations_page():
     with ui.column().classes('absolute-center items-center w-full max-w-screen-lg mx-auto'):
         ui.markdown('Recommended articles').classes('text-2xl mb-4')
 
-        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}", params={'user_id': app.storage.user.get("username", "")})
-        data = response.json()
-        user_info = data.get("user_info", {})
+        user_info = ui_helpers.get_user_info() or {}
         user_articles = user_info.get("liked_articles", [])
 
         articles_keywords = []
-        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET_ALL]}")
+        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET_ALL]}", headers=ui_helpers.auth_headers())
         all_articles = response.json().get("articles_info", [])
         recommended_articles = []
         selected_category = ""
@@ -516,11 +468,8 @@ def recommendations_page():
             selected_category = category
 
         def on_click_like(article):
-            response = requests.get(
-                f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-                params={'user_id': app.storage.user.get("username", "")})
-            if response.status_code == 200:
-                user_info = response.json().get("user_info", {})
+            user_info = ui_helpers.get_user_info()
+            if user_info is not None:
                 liked_articles = user_info.get("liked_articles", [])
                 if article.title not in liked_articles:
                     new_article = api_classes.Article(
@@ -532,13 +481,13 @@ def recommendations_page():
                     )
                     response = requests.get(
                         f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.GET]}",
-                        params={'article_id': article.title})
+                        params={'article_id': article.title}, headers=ui_helpers.auth_headers())
                     if response.json().get("article_info", {}) is None:
                         request = api_request_classes.CreateArticleRequest(
                             article_info=new_article)
                         response = requests.post(
                             f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.CREATE]}",
-                            json=request.dict())
+                            json=request.dict(), headers=ui_helpers.auth_headers())
                     if response.status_code == 200:
                         ui.notify('Article found or added in the database',
                                   color='positive')
@@ -559,13 +508,7 @@ def recommendations_page():
                     is_admin=user_info.get("is_admin", False),
                     password=user_info.get("password", "")
                 )
-                request = api_request_classes.UpdateUserRequest(
-                    user_id=user_info.get("username", ""),
-                    user_info=updated_user)
-                response = requests.put(
-                    f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}",
-                    json=request.dict())
-                if response.status_code == 200:
+                if ui_helpers.update_user_info(updated_user):
                     ui.notify('Article liked', color='positive')
                     app.storage.user.update({'liked_articles': liked_articles})
                 else:
@@ -574,41 +517,21 @@ def recommendations_page():
                 ui.notify('Failed to fetch user data', color='negative')
 
         def on_click_read_more(article):
-            response = requests.get(
-                f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}",
-                params={'user_id': app.storage.user.get("username", "")})
-            if response.status_code == 200:
-                user_info = response.json().get("user_info", {})
+            user_info = ui_helpers.get_user_info()
+            if user_info is not None:
                 viewed_articles = user_info.get("viewed_articles", [])
                 if article.title not in viewed_articles:
                     ui_helpers.get_or_create_article(article)
-                    viewed_articles.append(article.title)
-                    updated_user = api_classes.User(
-                        username=user_info.get("username", ""),
-                        last_name=user_info.get("last_name", ""),
-                        first_name=user_info.get("first_name", ""),
-                        birthday=user_info.get("birthday", ""),
-                        location=user_info.get("location", ""),
-                        interests=user_info.get("interests", []),
-                        viewed_articles=viewed_articles,
-                        liked_articles=user_info.get("liked_articles", []),
-                        is_admin=user_info.get("is_admin", False),
-                        password=user_info.get("password", "")
-                    )
-                    request = api_request_classes.UpdateUserRequest(
-                        user_id=user_info.get("username", ""),
-                        user_info=updated_user)
-                    response = requests.put(
-                        f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}",
-                        json=request.dict())
-                    if response.status_code == 200:
+                    if ui_helpers.record_article_view(article.title):
                         ui.notify('Article viewed', color='positive')
+                        viewed_articles.append(article.title)
                         app.storage.user.update(
                             {'viewed_articles': viewed_articles})
                     else:
                         ui.notify('Failed to view article', color='negative')
             ui.navigate.to(article.url, new_tab=True)
 
+        @ui_helpers.traced("recommendations")
         def show_recommendations():
             request = api_request_classes.GetRecommendationsRequest(
                 keywords=categories[selected_category],
@@ -617,7 +540,9 @@ def recommendations_page():
 
             response = requests.post(
                 f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.RECOMMENDATION]}",
-                json=request.dict())
+                json=request.dict(), headers=ui_helpers.auth_headers())
+            if ui_helpers.notify_rate_limited(response):
+                return
             if response.status_code == 200:
                 recommended_articles_dict = response.json().get('articles', [])
                 recommended_articles  = [api_classes.Article(**article) for article in recommended_articles_dict]
@@ -625,7 +550,7 @@ def recommendations_page():
                 for article in recommended_articles:
                     with ui.card().classes('w-full mx-auto q-pa-md'):
                         ui.label(article.title).classes('text-lg')
-                        ui.label(article.date).classes('text-sm')
+                        ui.label(article.date or '').classes('text-sm')
                         ui.label(article.content).classes('text-md')
                         ui.icon('favorite').on('click',
                                                lambda e, a=article: on_click_like(
@@ -643,7 +568,8 @@ def recommendations_page():
             keywords=articles_keywords)
         response = requests.get(
             f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.ARTICLE][config_info.AcceptedOperations.CATEGORIES]}",
-            json=request.dict())
+            json=request.dict(), headers=ui_helpers.auth_headers())
+        ui_helpers.notify_rate_limited(response)
         categories = response.json().get('categories', {})
 
         with ui.row():
@@ -679,7 +605,7 @@ def users_page():
 
     def on_click_remove():
         user_id = user.get("username", "")
-        response = requests.delete(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.DELETE]}", params={'user_id': user_id})
+        response = requests.delete(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.DELETE]}", params={'user_id': user_id}, headers=ui_helpers.auth_headers())
         if response.status_code == 200:
             ui.notify('User removed', color='positive')
             ui.navigate.reload()
@@ -699,16 +625,12 @@ def users_page():
             is_admin=not user.get("is_admin", False),
             password=user.get("password", "")
         )
-        request = api_request_classes.UpdateUserRequest(
-            user_id=user.get("username", ""),
-            user_info=updated_user)
-        response = requests.put(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}", json=request.dict())
-        if response.status_code == 200:
+        if ui_helpers.update_user_info(updated_user):
             ui.notify(f"Admin status changed for user {user.get('username', '')}", color='positive')
 
     with ui.column().classes('items-center w-1/3 mx-auto'):
         ui.markdown('Users').classes('text-3xl mb-4')
-        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET_ALL]}")
+        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET_ALL]}", headers=ui_helpers.auth_headers())
         if response.status_code == 200:
             users = response.json().get("users_info", [])
             if not users:
@@ -734,19 +656,19 @@ def profile_page() -> None:
                     f' **{app.storage.user.get("username", "")}**!').classes(
             'text-2xl mb-4')
 
-        response = requests.get(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.GET]}", params={'user_id': app.storage.user.get("username", "")})
+        data = ui_helpers.get_user_info()
 
         def remove_account():
-            response = requests.delete(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.DELETE]}", params={'user_id': app.storage.user.get("username", "")})
+            response = requests.delete(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.DELETE]}", params={'user_id': app.storage.user.get("username", "")}, headers=ui_helpers.auth_headers())
             if response.status_code == 200:
+                ui_helpers.invalidate_user_info()
                 app.storage.user.clear()
                 ui.notify('Account removed', color='positive')
                 ui.navigate.to('/login')
             else:
                 ui.notify('Failed to remove account', color='negative')
 
-        if response.status_code == 200:
-            data = response.json().get("user_info", {})
+        if data is not None:
             with ui.column().classes('items-center'):
                 ui.markdown('You are an **admin**' if data.get("is_admin", False) else 'You are **not** an **admin**').classes('text-lg')
                 with ui.column():
@@ -790,32 +712,29 @@ def profile_page() -> None:
             if (updated_birthday == ""):
                 updated_birthday.value = user.get("birthday", "")
 
-            request = api_request_classes.UpdateUserRequest(
-                user_id=user.get("username", ""),
-                user_info=api_classes.User(
-                    username=user.get("username", ""),
-                    last_name=updated_last_name.value,
-                    first_name=updated_first_name.value,
-                    birthday=updated_birthday,
-                    location=updated_location.value,
-                    interests=user.get("interests", []),
-                    viewed_articles=user.get("viewed_articles", []),
-                    liked_articles=user.get("liked_articles", []),
-                    is_admin=user.get("is_admin", False),
-                    password=user.get("password", "")
-                )
+            updated_user = api_classes.User(
+                username=user.get("username", ""),
+                last_name=updated_last_name.value,
+                first_name=updated_first_name.value,
+                birthday=updated_birthday,
+                location=updated_location.value,
+                interests=user.get("interests", []),
+                viewed_articles=user.get("viewed_articles", []),
+                liked_articles=user.get("liked_articles", []),
+                is_admin=user.get("is_admin", False),
+                password=user.get("password", "")
             )
-            response = requests.put(f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.UPDATE]}", json=request.dict())
-            if response.status_code == 200:
+            if ui_helpers.update_user_info(updated_user):
                 ui.notify('Account updated', color='positive')
                 ui.navigate.reload()
 
         def on_click_remove_account(user):
             response = requests.delete(
                 f"{ui_helpers.API_BASE_URL}{config_info.AcceptedOperations.ROUTES[config_info.Entity.USER][config_info.AcceptedOperations.DELETE]}",
-                params={'user_id': user.get("username", "")}
+                params={'user_id': user.get("username", "")}, headers=ui_helpers.auth_headers()
             )
             if response.status_code == 200:
+                ui_helpers.invalidate_user_info()
                 app.storage.user.clear()
                 ui.notify('Account removed', color='positive')
                 ui.navigate.to('/login')
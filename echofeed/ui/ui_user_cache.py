@@ -0,0 +1,86 @@
+"""
+Per-session cache of the logged in user's document, used by the UI
+click handlers to avoid reading the user from the API on every click.
+"""
+import copy
+import time
+from typing import Optional
+
+from echofeed.common import config_info
+
+
+class UserDocumentCache:
+    """
+    Keeps the user document of every UI session together with the
+    version (sequence number and primary term) it was read at.
+    Entries expire after a short TTL and are replaced on every
+    successful write, so the cache never serves a document older
+    than the last write made by the same session.
+    """
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._entries = {}
+
+    def get(self, session_id: str) -> Optional[dict]:
+        """
+        Returns a copy of the cached entry of a session, or None if
+        there is no entry or it has expired.
+
+        Args:
+            session_id (str): The id of the browser session.
+
+        Returns:
+            dict: user_info, seq_no and primary_term of the cached user.
+        """
+        entry = self._entries.get(session_id)
+        if entry is None:
+            return None
+        if time.monotonic() - entry["cached_at"] > self.ttl_seconds:
+            self._entries.pop(session_id, None)
+            return None
+        return copy.deepcopy(entry)
+
+    def put(self, session_id: str, user_info: dict,
+            seq_no: Optional[int], primary_term: Optional[int]) -> None:
+        """
+        Stores the user document of a session at the given version.
+
+        Args:
+            session_id (str): The id of the browser session.
+            user_info (dict): The user document.
+            seq_no (int): The sequence number of the document.
+            primary_term (int): The primary term of the document.
+        """
+        self._evict_expired()
+        self._entries[session_id] = {
+            "user_info": copy.deepcopy(user_info),
+            "seq_no": seq_no,
+            "primary_term": primary_term,
+            "cached_at": time.monotonic()
+        }
+
+    def invalidate(self, session_id: str) -> None:
+        """
+        Drops the cached user document of a session.
+
+        Args:
+            session_id (str): The id of the browser session.
+        """
+        self._entries.pop(session_id, None)
+
+    def _evict_expired(self) -> None:
+        """
+        Removes the entries of sessions that have not been used
+        within the TTL, so abandoned sessions do not pile up.
+        """
+        now = time.monotonic()
+        expired = [
+            session_id for session_id, entry in self._entries.items()
+            if now - entry["cached_at"] > self.ttl_seconds
+        ]
+        for session_id in expired:
+            del self._entries[session_id]
+
+
+USER_CACHE = UserDocumentCache(config_info.USER_CACHE_TTL_SECONDS)